@@ -0,0 +1,189 @@
+"""
+Comparativa del historial de las cadenas antes (últimos 4 mensajes completos) y después (resumen incremental + mensajes
+recientes dentro del presupuesto de tokens) en conversaciones de 20 turnos.
+Para cada turno se mide el tamaño en tokens del prompt de clasificación y el tiempo de construcción del historial.
+    - Modo por defecto (sin red): el resumen se sustituye por un resumen extractivo de los mensajes del usuario.
+    - --live: el resumen lo genera 'summary_chain' y se mide además la latencia de 'classification_chain' con cada historial.
+    - --export: usa conversaciones reales de un export JSON de la colección 'messages' en lugar de la conversación sintética.
+
+SCRIPT DE EJECUCIÓN: "python -m src.benchmarks.history_window_benchmark --turns 20"
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+from src.core.settings import settings
+from src.utils.tokens import count_tokens, truncate_tokens
+from src.schemas.message import MessageModel, ConversationSummaryModel
+from src.logic.router_chain import Router_chain
+from src.logic.summary_chain import SummaryChain
+from src.logic.tool_utilities.history_window import build_history, format_history, history_entry, pending_summary_messages
+
+USER_TURNS = [
+    "Hola, soy Marta",
+    "Busco un piso en alquiler en Oviedo",
+    "De tres dormitorios y que no pase de 900 euros",
+    "Mejor que tenga ascensor y garaje",
+    "Háblame más del segundo",
+    "¿Tiene calefacción central?",
+    "¿Y cuántos metros útiles tiene?",
+    "¿Hay alguno parecido en Gijón?",
+    "El de la calle Uría me interesa",
+    "¿Está cerca de algún colegio?",
+    "¿Qué gastos de comunidad tiene?",
+    "¿Cómo funciona la fianza en un alquiler?",
+    "¿Y qué documentación me pediríais?",
+    "Vale, quiero visitar el de la calle Uría",
+    "¿Qué horario tenéis para las visitas?",
+    "¿Dónde está vuestra oficina de Oviedo?",
+    "¿Podéis enviarme más fotos?",
+    "Busca ahora algo en venta en Avilés por menos de 150.000",
+    "El primero tiene buena pinta, ¿tiene terraza?",
+    "Gracias, eso es todo por hoy",
+]
+
+BOT_ANSWER = (
+    "Claro, Marta. He revisado los inmuebles disponibles que encajan con lo que buscas. {detail} Todos ellos cuentan con "
+    "buena orientación y están en zonas bien comunicadas, con transporte público, comercios y servicios a pocos minutos. "
+    "Si quieres, puedo darte más detalles de cualquiera de ellos, como la distribución, el estado de conservación, los "
+    "gastos de comunidad o la disponibilidad para visitarlo. También puedo ayudarte a comparar varias opciones o a "
+    "ajustar la búsqueda si prefieres otra zona, otro rango de precio o más dormitorios. ¿Qué te gustaría hacer ahora?"
+)
+
+
+# ------CONVERSACIONES------
+def synthetic_conversation(turns: int) -> List[Tuple[str, str, str]]:
+    conversation = []
+    for index in range(turns):
+        user = USER_TURNS[index % len(USER_TURNS)]
+        bot = BOT_ANSWER.format(detail=f"Respecto a tu consulta «{user}», te resumo lo más relevante de cada inmueble.")
+        conversation.append((user, bot, "busqueda"))
+    return conversation
+
+
+def exported_conversations(path: str, turns: int) -> List[List[Tuple[str, str, str]]]:
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read().strip()
+    documents = json.loads(content) if content.startswith("[") else [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    conversations = []
+    for document in documents:
+        messages = document.get("messages", [])
+        pairs = [
+            (user.get("content") or "", bot.get("content") or "", (bot.get("metadata") or {}).get("tool"))
+            for user, bot in zip(messages, messages[1:]) if not user.get("is_bot") and bot.get("is_bot")
+        ]
+        if len(pairs) >= turns:
+            conversations.append(pairs[:turns])
+    return conversations
+
+
+# ------RESUMEN------
+async def fold_summary(summary: ConversationSummaryModel, pending: List[MessageModel], live: bool) -> Tuple[ConversationSummaryModel, float]:
+    """Incorpora los mensajes pendientes al resumen. Devuelve el resumen y la latencia de la actualización."""
+    start = time.perf_counter()
+    if live:
+        content = await SummaryChain.summary_chain.ainvoke({
+            "previous_summary": summary.content or "Sin resumen previo.",
+            "messages": format_history([history_entry(message, settings.memory.message_max_tokens) for message in pending]),
+        })
+    else:
+        # Resumen extractivo: los mensajes del usuario, que concentran los criterios de la conversación
+        content = " ".join([summary.content] + [f"El usuario dijo: {m.content}." for m in pending if not m.is_bot]).strip()
+    content = truncate_tokens(content, settings.memory.summary_max_tokens)
+
+    updated = ConversationSummaryModel(
+        content=content,
+        summarized_until=summary.summarized_until + len(pending),
+        tokens=count_tokens(content),
+    )
+    return updated, time.perf_counter() - start
+
+
+# ------INFORME------
+def classification_tokens(history: str, input: str) -> int:
+    return count_tokens(Router_chain.classification_prompt.format(input=input, history=history, valid_values="[]"))
+
+
+async def classification_latency(history: str, input: str) -> float:
+    start = time.perf_counter()
+    await Router_chain.classification_chain.ainvoke({"input": input, "history": history, "valid_values": "[]"})
+    return time.perf_counter() - start
+
+
+async def run_conversation(conversation: List[Tuple[str, str, str]], live: bool) -> Dict[str, List[float]]:
+    stats: Dict[str, List[float]] = {key: [] for key in ("before", "after", "build_ms", "summary_s", "before_s", "after_s")}
+    messages: List[MessageModel] = []
+    summary = ConversationSummaryModel()
+
+    for user, bot, tool in conversation:
+        # Historial previo al turno
+        before = json.dumps([history_entry(message) for message in messages[-4:]])
+        start = time.perf_counter()
+        after = format_history(build_history(messages, summary))
+        stats["build_ms"].append((time.perf_counter() - start) * 1000)
+
+        stats["before"].append(classification_tokens(before, user))
+        stats["after"].append(classification_tokens(after, user))
+        if live:
+            stats["before_s"].append(await classification_latency(before, user))
+            stats["after_s"].append(await classification_latency(after, user))
+
+        # Registro del turno y actualización del resumen (en producción, en segundo plano)
+        messages.append(MessageModel(content=user, is_bot=False, tokens=count_tokens(user)))
+        messages.append(MessageModel(content=bot, is_bot=True, metadata={"tool": tool}, tokens=count_tokens(bot)))
+        pending = pending_summary_messages(messages, summary)
+        if pending:
+            summary, latency = await fold_summary(summary, pending, live)
+            stats["summary_s"].append(latency)
+    return stats
+
+
+def describe(values: List[float]) -> str:
+    if not values:
+        return "-"
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"mean {statistics.mean(values):.1f} | p95 {p95:.1f} | max {max(values):.1f}"
+
+
+async def run_report(turns: int, live: bool, export: str = None) -> str:
+    conversations = exported_conversations(export, turns) if export else [synthetic_conversation(turns)]
+    totals: Dict[str, List[float]] = {}
+    for conversation in conversations:
+        for key, values in (await run_conversation(conversation, live)).items():
+            totals.setdefault(key, []).extend(values)
+
+    before, after = sum(totals["before"]), sum(totals["after"])
+    lines = [
+        f"Conversaciones: {len(conversations)} de {turns} turnos | presupuesto {settings.memory.history_token_budget} tokens",
+        f"Prompt de clasificación (tokens) antes:   {describe(totals['before'])}",
+        f"Prompt de clasificación (tokens) después: {describe(totals['after'])}",
+        f"Tokens totales: {before} -> {after} ({1 - after / before if before else 0:.1%} menos)",
+        f"Construcción del historial (ms): {describe(totals['build_ms'])}",
+        f"Actualizaciones del resumen: {len(totals['summary_s'])} (s) {describe(totals['summary_s'])}",
+    ]
+    if live:
+        lines.append(f"Latencia de clasificación (s) antes:   {describe(totals['before_s'])}")
+        lines.append(f"Latencia de clasificación (s) después: {describe(totals['after_s'])}")
+
+    # Evolución por turno de la primera conversación
+    first = await run_conversation(conversations[0], False) if conversations else {"before": [], "after": []}
+    lines.append("Turno | antes | después")
+    lines.extend(f"{index + 1:>5} | {b:>5} | {a:>7}" for index, (b, a) in enumerate(zip(first["before"], first["after"])))
+
+    report = "\n".join(lines)
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tamaño del prompt y latencia con el historial resumido y acotado en tokens")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--live", action="store_true", help="Genera los resúmenes y mide la clasificación con el LLM")
+    parser.add_argument("--export", default=None, help="Export JSON de la colección 'messages'")
+    args = parser.parse_args()
+    asyncio.run(run_report(args.turns, args.live, args.export))
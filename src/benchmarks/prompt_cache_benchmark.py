@@ -0,0 +1,108 @@
+"""
+Benchmark del prefijo estático de los prompts sobre el tiempo hasta el primer token.
+Compara, para 'text2sql_chain' y 'classification_chain', la plantilla original (valores dinámicos intercalados entre los
+bloques fijos) con el prompt ensamblado (secciones fijas primero). Se ejecutan varias llamadas consecutivas con
+entradas distintas para que el proveedor pueda reutilizar el prefijo cacheado.
+
+Nota: OpenAI solo cachea prompts a partir de 1024 tokens de entrada, en incrementos de 128 tokens. Con prompts más cortos
+el informe mostrará 0 tokens cacheados en ambos casos.
+
+SCRIPT DE EJECUCIÓN: "python -m src.benchmarks.prompt_cache_benchmark --runs 10"
+Requiere OPENAI_API_KEY.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from langchain_core.prompts import PromptTemplate
+
+from src.logic.tool_config.llm_policy import generate_chain_llm
+from src.logic.tool_utilities.prompt_assembly import PROMPT_REGISTRY
+from src.logic.qa_chain import QAChain
+from src.logic.router_chain import Router_chain
+
+USER_INPUTS = [
+    "Busco un piso en venta en Gijón de 3 dormitorios por menos de 200000 euros",
+    "Quiero un piso en Oviedo con garaje y ascensor",
+    "Casa con jardín en Villaviciosa",
+    "Algo en Gijón que admita mascotas",
+    "Un local en venta en Gijón de más de 100 metros",
+    "Piso céntrico en Oviedo",
+    "Un chalet con vistas al mar",
+    "Garaje en venta en Gijón por menos de 20000 euros",
+]
+
+
+def chain_inputs(chain_name: str, user_input: str) -> Dict[str, Any]:
+    """Valores de una llamada. Incluye también los valores fijos que necesita la plantilla original."""
+    if chain_name == "text2sql_chain":
+        return {
+            "input": json.dumps({"text": user_input, "query": None}),
+            "dialect": QAChain.dialect,
+            "table_info": QAChain.table_info,
+        }
+    return {
+        "input": user_input,
+        "history": "[]",
+        "tool_instructions": json.dumps(Router_chain.tool_instructions),
+        "valid_values": str([item["key"] for item in Router_chain.tool_instructions]),
+    }
+
+
+async def run_call(chain_name: str, prompt: PromptTemplate, inputs: Dict[str, Any]) -> Dict[str, float]:
+    chain = prompt | generate_chain_llm(chain_name)
+    start = time.perf_counter()
+    first_token = None
+    final_chunk = None
+    async for chunk in chain.astream(inputs):
+        if first_token is None and chunk.content:
+            first_token = time.perf_counter() - start
+        final_chunk = chunk if final_chunk is None else final_chunk + chunk
+    total = time.perf_counter() - start
+
+    usage = getattr(final_chunk, "usage_metadata", None) or {}
+    return {
+        "ttft": first_token if first_token is not None else total,
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+    }
+
+
+async def run_benchmark(runs: int) -> str:
+    templates = {
+        "text2sql_chain": QAChain.GENERATE_SQL_QUERY_PROMPT,
+        "classification_chain": Router_chain.CLASSIFICATION_PROMPT,
+    }
+    header = f"{'chain':<22}{'prompt':<10}{'static_tok':>11}{'ttft_p50':>10}{'ttft_p90':>10}{'in_tok':>8}{'cached':>8}"
+    lines = [header, "-" * len(header)]
+
+    for chain_name, raw_template in templates.items():
+        variants = {
+            "original": (PromptTemplate.from_template(raw_template), 0),
+            "assembled": (PROMPT_REGISTRY[chain_name].prompt, PROMPT_REGISTRY[chain_name].static_tokens),
+        }
+        for variant, (prompt, static_tokens) in variants.items():
+            samples: List[Dict[str, float]] = []
+            for i in range(runs):
+                samples.append(await run_call(chain_name, prompt, chain_inputs(chain_name, USER_INPUTS[i % len(USER_INPUTS)])))
+
+            ttfts = sorted(s["ttft"] for s in samples)
+            p90 = ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.9))]
+            lines.append(
+                f"{chain_name:<22}{variant:<10}{static_tokens:>11}{statistics.median(ttfts) * 1000:>10.0f}{p90 * 1000:>10.0f}"
+                f"{statistics.mean(s['input_tokens'] for s in samples):>8.0f}{statistics.mean(s['cached_tokens'] for s in samples):>8.0f}"
+            )
+
+    report = "\n".join(lines)
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TTFT con la plantilla original frente al prompt con prefijo estático")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.runs))
@@ -0,0 +1,75 @@
+"""
+Comparativa de tokens de los prompts con inmuebles antes (json.dumps de las filas) y después de la serialización compacta.
+Usa inmuebles reales de la base de datos de búsqueda y renderiza el prompt completo de cada cadena afectada.
+
+SCRIPT DE EJECUCIÓN: "python -m src.benchmarks.prompt_payload_benchmark --sizes 1 5 10 20"
+"""
+import argparse
+import json
+import sqlite3
+from typing import Dict, List
+
+from src.utils.tokens import count_tokens
+from src.data_generation.sql_search_generation import execute_sql_query
+from src.logic.tool_utilities.qa_utilities import parse_db_answer, filter_presentation_fields
+from src.logic.tool_utilities.prompt_serialization import serialize_property, serialize_properties
+from src.logic.qa_chain import QAChain
+from src.logic.visit_chain import VisitChain
+
+
+def load_properties(num_properties: int) -> Dict[int, Dict]:
+    """Recupera inmuebles de la base de datos parseados por columna."""
+    result: List[sqlite3.Row] = execute_sql_query(f"SELECT * FROM inmuebles LIMIT {num_properties}")
+    return parse_db_answer(result)
+
+
+def prompt_tokens(prompt, **inputs) -> int:
+    return count_tokens(prompt.format(**inputs))
+
+
+def run_report(sizes: List[int]) -> str:
+    lines = [f"{'chain':<26}{'props':>6}{'before':>9}{'after':>9}{'saving':>9}", "-" * 59]
+    user_input = "Háblame más del segundo piso"
+
+    for size in sizes:
+        parsed = load_properties(size)
+        filtered = filter_presentation_fields(parsed)
+        ids = list(parsed.keys())
+        first_id = ids[0]
+
+        rows = {
+            "qa_general_chain": (
+                prompt_tokens(QAChain.qa_general_prompt, history_inm=json.dumps(filtered), input=user_input),
+                prompt_tokens(QAChain.qa_general_prompt, history_inm=serialize_properties(filtered, order=ids, max_properties=size), input=user_input),
+            ),
+            "id_of_interest_chain": (
+                prompt_tokens(VisitChain.id_of_interest_prompt, inm_data=json.dumps(filtered), input=user_input),
+                prompt_tokens(VisitChain.id_of_interest_prompt, inm_data=serialize_properties(filtered, order=ids, max_properties=size), input=user_input),
+            ),
+        }
+        if size == sizes[0]:
+            # Cadenas de un solo inmueble: independientes del tamaño de la sesión
+            instruction = next(item["description"] for item in QAChain.present_instructions if item["key"] == "already_presented")
+            rows["specific_answer_chain"] = (
+                prompt_tokens(QAChain.specific_answer_prompt, user_name="Lucía", input=user_input, instruction=instruction, selected_inm=json.dumps(parsed[first_id])),
+                prompt_tokens(QAChain.specific_answer_prompt, user_name="Lucía", input=user_input, instruction=instruction, selected_inm=serialize_property(parsed[first_id], first_id)),
+            )
+            rows["confirm_visit_chain"] = (
+                prompt_tokens(VisitChain.confirm_visit_prompt, user_name="Lucía", selected_inm=filtered[first_id]),
+                prompt_tokens(VisitChain.confirm_visit_prompt, user_name="Lucía", selected_inm=serialize_property(filtered[first_id])),
+            )
+
+        for chain_name, (before, after) in rows.items():
+            saving = 1 - after / before if before else 0
+            lines.append(f"{chain_name:<26}{size:>6}{before:>9}{after:>9}{saving:>9.1%}")
+
+    report = "\n".join(lines)
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokens de los prompts con inmuebles antes y después de la serialización compacta")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1, 5, 10, 20])
+    args = parser.parse_args()
+    run_report(args.sizes)
@@ -0,0 +1,102 @@
+"""
+Informe del resolvedor local de referencias a inmuebles sobre conversaciones registradas.
+Lee un export de la colección 'messages' de MongoDB (mongoexport, JSON por líneas o array) y, para cada turno del bot
+con metadatos 'reference_resolution' que incluyan la respuesta del LLM, vuelve a ejecutar el resolvedor con los
+inmuebles candidatos recuperados de la base de datos de búsqueda. Calcula:
+    - Tasa de llamadas evitadas: turnos resueltos localmente sobre el total.
+    - Concordancia: turnos resueltos localmente en los que el LLM eligió el mismo inmueble.
+Para obtener la respuesta del LLM también en los turnos resueltos localmente hay que registrar las conversaciones con
+RESOLVER_SHADOW=true.
+
+SCRIPT DE EJECUCIÓN: "python -m src.benchmarks.reference_resolver_benchmark --export messages.json"
+"""
+import argparse
+import json
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.data_generation.sql_search_generation import execute_sql_query
+from src.logic.tool_utilities.qa_utilities import generate_sql_ids, parse_db_answer, filter_presentation_fields
+from src.logic.tool_utilities.reference_resolver import resolve_reference
+
+
+def load_export(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def logged_turns(documents: List[Dict]) -> Iterator[Tuple[str, Dict]]:
+    """Pares (mensaje del usuario, metadatos de resolución) de todas las conversaciones."""
+    for document in documents:
+        messages = document.get("messages", [])
+        for previous, message in zip(messages, messages[1:]):
+            resolution = (message.get("metadata") or {}).get("reference_resolution")
+            if message.get("is_bot") and not previous.get("is_bot") and resolution:
+                yield previous.get("content", ""), resolution
+
+
+def llm_choice(llm_result: Optional[str]) -> Optional[str]:
+    """Normaliza la respuesta del LLM: un ID, 'new' o None."""
+    if not llm_result:
+        return None
+    if llm_result.strip().strip('"\'') == "new":
+        return "new"
+    match = re.search(r"\d+", llm_result)
+    return match.group() if match else None
+
+
+def run_report(export_path: str) -> str:
+    totals = Counter()
+    methods = Counter()
+    disagreements: List[str] = []
+
+    for user_input, logged in logged_turns(load_export(export_path)):
+        candidate_ids = logged.get("candidates") or []
+        if not candidate_ids:
+            continue
+        rows: List[sqlite3.Row] = execute_sql_query(generate_sql_ids(candidate_ids)) or []
+        candidates: Dict[int, Dict] = filter_presentation_fields(parse_db_answer(rows))
+
+        resolution = resolve_reference(
+            user_input, candidates, order=logged.get("order"), allow_new_search=logged.get("chain") == "qa_general_chain"
+        )
+        choice = llm_choice(logged.get("llm_result"))
+
+        totals["turns"] += 1
+        methods[resolution.method] += 1
+        if resolution.resolved:
+            totals["resolved"] += 1
+            if choice is not None:
+                totals["compared"] += 1
+                if choice == str(resolution.inm_id):
+                    totals["agree"] += 1
+                else:
+                    disagreements.append(f"  '{user_input}' -> local {resolution.inm_id} ({resolution.method}) | LLM {choice}")
+
+    turns = totals["turns"] or 1
+    lines = [
+        f"Turnos con referencia a inmuebles: {totals['turns']}",
+        f"Resueltos localmente (llamadas al LLM evitadas): {totals['resolved']} ({totals['resolved'] / turns:.1%})",
+        f"Concordancia con el LLM: {totals['agree']}/{totals['compared']}"
+        + (f" ({totals['agree'] / totals['compared']:.1%})" if totals["compared"] else ""),
+        "Método de resolución: " + ", ".join(f"{method}={count}" for method, count in methods.most_common()),
+    ]
+    if disagreements:
+        lines.append("Discrepancias:")
+        lines.extend(disagreements)
+
+    report = "\n".join(lines)
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tasa de llamadas evitadas y concordancia del resolvedor de referencias")
+    parser.add_argument("--export", required=True, help="Export JSON de la colección 'messages'")
+    args = parser.parse_args()
+    run_report(args.export)
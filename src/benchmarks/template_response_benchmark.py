@@ -0,0 +1,103 @@
+"""
+Comparativa de latencia entre las respuestas por plantilla y las cadenas LLM equivalentes
+(missing_fields_chain, confirm_form_chain y contact_chain), y estimación de la proporción de turnos servidos sin LLM.
+
+La proporción se calcula sobre un export de mensajes del bot (JSONL, una línea por turno con los campos 'type' del
+mensaje de usuario y 'chain' de los metadatos del bot). En producción la misma métrica se registra en cada turno
+(ver src/utils/llm_usage.py) y se guarda en los metadatos del mensaje ('llm_calls').
+
+SCRIPT DE EJECUCIÓN: "python -m src.benchmarks.template_response_benchmark --runs 5 [--transcript turns.jsonl]"
+Requiere OPENAI_API_KEY para la parte LLM.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from src.logic.qa_chain import QAChain
+from src.logic.router_chain import Router_chain
+from src.logic.form_chain import Form_chain
+from src.logic.tool_utilities.template_responses import use_template, render_response, missing_field_labels, contact_context
+
+MISSING_FIELDS = ["Precio", "NumDormitorios"]
+
+CASES: Dict[str, Dict[str, Any]] = {
+    "missing_fields_chain": {
+        "chain": QAChain.missing_fields_chain,
+        "llm_inputs": {"input": "Busco piso en Gijón", "missing_fields": str(MISSING_FIELDS)},
+        "template_context": {"user_name": "Lucía", "missing_labels": missing_field_labels(MISSING_FIELDS)},
+    },
+    "confirm_form_chain": {
+        "chain": Form_chain.confirm_form_chain,
+        "llm_inputs": {"user_name": "Lucía"},
+        "template_context": {"user_name": "Lucía"},
+    },
+    "contact_chain": {
+        "chain": Router_chain.contact_chain,
+        "llm_inputs": {"input": "¿Cuál es el teléfono de la oficina de Gijón?", "user_name": "Lucía"},
+        "template_context": {"user_name": "Lucía", **contact_context(Router_chain.contact_data, "¿Cuál es el teléfono de la oficina de Gijón?")},
+    },
+}
+
+# Cadenas que se ejecutan sin pasar por el clasificador (el turno entero puede servirse sin LLM)
+ROUTERLESS_CHAINS = {"confirm_form_chain"}
+
+
+async def llm_latency(chain, inputs: Dict[str, Any]) -> Dict[str, float]:
+    start = time.perf_counter()
+    first_token: Optional[float] = None
+    async for chunk in chain.astream(inputs):
+        if first_token is None and chunk:
+            first_token = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return {"ttft": first_token if first_token is not None else total, "latency": total}
+
+
+def template_latency(chain_name: str, context: Dict[str, Any], runs: int = 1000) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        render_response(chain_name, **context)
+    return (time.perf_counter() - start) / runs
+
+
+def llm_free_share(transcript_path: str) -> str:
+    """Proporción de turnos con respuesta por plantilla y de turnos sin ninguna llamada al LLM."""
+    with open(transcript_path, "r", encoding="utf-8") as file:
+        turns: List[Dict] = [json.loads(line) for line in file if line.strip()]
+
+    template_turns = [turn for turn in turns if use_template(turn.get("chain", ""))]
+    llm_free = [turn for turn in template_turns if turn.get("chain") in ROUTERLESS_CHAINS]
+    return (
+        f"Turnos: {len(turns)} | respuesta por plantilla: {len(template_turns)} ({len(template_turns) / len(turns):.1%}) | "
+        f"sin ninguna llamada al LLM: {len(llm_free)} ({len(llm_free) / len(turns):.1%})"
+    )
+
+
+async def run_benchmark(runs: int, transcript: Optional[str]) -> str:
+    header = f"{'chain':<22}{'llm_ttft_ms':>12}{'llm_total_ms':>13}{'template_ms':>12}"
+    lines = [header, "-" * len(header)]
+
+    for chain_name, case in CASES.items():
+        samples = [await llm_latency(case["chain"], case["llm_inputs"]) for _ in range(runs)]
+        template_ms = template_latency(chain_name, case["template_context"]) * 1000
+        lines.append(
+            f"{chain_name:<22}{statistics.median(s['ttft'] for s in samples) * 1000:>12.0f}"
+            f"{statistics.median(s['latency'] for s in samples) * 1000:>13.0f}{template_ms:>12.3f}"
+        )
+
+    if transcript:
+        lines.append(llm_free_share(transcript))
+
+    report = "\n".join(lines)
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latencia de respuestas por plantilla frente a LLM")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--transcript", type=str, default=None, help="Export JSONL de turnos con 'type' y 'chain'")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.runs, args.transcript))
@@ -6,7 +6,7 @@ Las funciones son llamadas desde el lifespan de la aplicación FastAPI.
 
 from src.core.settings import settings
 from src.database.mongo import MongoDatabase
-from src.database.redis import RedisCache
+from src.database.redis import RedisCache, SharedRedis
 from src.database.postgres import PostgresDatabase
 
 
@@ -24,6 +24,16 @@ def create_redis() -> RedisCache:
         ssl=settings.redis.ssl,
     )
 
+def create_shared_redis(name: str, timeout: float) -> SharedRedis:
+    return SharedRedis(
+        name=name,
+        timeout=timeout,
+        host=settings.redis.host,
+        port=settings.redis.port,
+        password=settings.redis.password,
+        ssl=settings.redis.ssl,
+    )
+
 
 def create_postgres() -> PostgresDatabase:
     return PostgresDatabase(
@@ -42,6 +42,261 @@ class IASettings(BaseSettings):
     langchain_endpoint: str | None = None
     langchain_project: str | None = None
 
+# ------CONFIGURACIÓN DE LA POLÍTICA DE MODELOS POR CADENA------
+class LLMPolicySettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="LLM_", extra="ignore")
+
+    policy_path: str = Field(default="config/llm_policy.json")
+    profile: str | None = Field(default=None) # Si no se indica se usa el 'active_profile' del fichero de política
+    tier_models: dict[str, str] = Field(default_factory=dict) # Modelo de cada nivel en este despliegue, p. ej. LLM_TIER_MODELS='{"large": "gpt-4o"}'
+
+# ------CONFIGURACIÓN DE LA CONSTRUCCIÓN DE PROMPTS------
+class PromptSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="PROMPT_", extra="ignore")
+
+    token_model: str = Field(default="gpt-4o") # Modelo de referencia para el conteo local de tokens
+    max_recent_properties: int = Field(default=8) # Inmuebles más recientes incluidos en los prompts de QA y visitas
+
+# ------CONFIGURACIÓN DE LA SELECCIÓN DE ESQUEMA PARA TEXT2SQL------
+class SchemaSelectionSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="SCHEMA_", extra="ignore")
+
+    enabled: bool = Field(default=True)
+    synonyms_path: str = Field(default="resources/column_synonyms.json")
+    min_confidence: float = Field(default=0.5) # Por debajo se usa el esquema completo
+    embedding_match: bool = Field(default=False) # Coincidencia adicional por embeddings de las descripciones
+    embedding_threshold: float = Field(default=0.45)
+    locations_ttl_s: float = Field(default=3600.0) # Vigencia del vocabulario de localizaciones leído de la base de datos
+
+# ------CONFIGURACIÓN DE LAS RESPUESTAS POR PLANTILLA------
+class TemplateSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="TEMPLATE_", extra="ignore")
+
+    templates_path: str = Field(default="resources/response_templates.json")
+    enabled: bool = Field(default=True) # Si es False todas las cadenas usan el LLM
+    llm_chains: list[str] = Field(default_factory=list) # Cadenas forzadas a LLM aunque su modo en el fichero sea 'template'
+
+# ------CONFIGURACIÓN DE LA RESOLUCIÓN LOCAL DE REFERENCIAS A INMUEBLES------
+class ResolverSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="RESOLVER_", extra="ignore")
+
+    enabled: bool = Field(default=True)
+    shadow: bool = Field(default=False) # Llama también al LLM cuando la referencia se resuelve localmente para medir la concordancia
+
+# ------CONFIGURACIÓN DEL HISTORIAL DE CONVERSACIÓN------
+class MemorySettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="MEMORY_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Si es False se pasan los últimos 4 mensajes sin resumen
+    history_token_budget: int = Field(default=500) # Tokens máximos de los mensajes recientes del historial
+    message_max_tokens: int = Field(default=120) # Los mensajes más largos se recortan en el historial
+    keep_recent_messages: int = Field(default=4) # Mensajes recientes que nunca se incorporan al resumen
+    summary_batch_messages: int = Field(default=4) # Mensajes pendientes necesarios para actualizar el resumen
+    summary_max_tokens: int = Field(default=250)
+    summary_prompt_path: str = Field(default="prompts/SUMMARY_PROMPT.txt")
+    buffer_max_tokens: int = Field(default=200) # Tokens máximos del input acumulado en QA cuando faltan campos
+
+# ------CONFIGURACIÓN DE LA CANCELACIÓN DE TURNOS------
+class TurnSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="TURN_", extra="ignore")
+
+    disconnect_poll_interval: float = Field(default=0.5) # Segundos entre comprobaciones de desconexión del cliente
+    cancel_on_new_message: bool = Field(default=True) # Un nuevo mensaje de la sesión cancela el turno en curso
+    supersede_wait_timeout: float = Field(default=2.0) # Espera máxima a que el turno cancelado guarde su estado
+    key_prefix: str = Field(default="turn") # Prefijo de las claves de Redis con el turno en curso de cada sesión
+    marker_ttl_s: int = Field(default=300) # Vigencia del marcador si el worker que lo creó no llega a liberarlo
+
+# ------CONFIGURACIÓN DEL PRESUPUESTO DE TIEMPO POR TURNO------
+class DeadlineSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="DEADLINE_", extra="ignore")
+
+    chat_budget: float = Field(default=30.0) # Segundos por turno en '/chat'
+    whatsapp_budget: float = Field(default=12.0) # Segundos por turno en '/whats-message' (Twilio corta a los 15 s)
+    relaxation_min_s: float = Field(default=8.0) # Tiempo mínimo restante para otra iteración de ampliación de la búsqueda
+    large_model_min_s: float = Field(default=6.0) # Por debajo, las cadenas del nivel 'large' usan el modelo pequeño
+    llm_reply_min_s: float = Field(default=2.0) # Por debajo, se responde con plantilla en lugar de con el LLM
+    truncation_notice: str = Field(default="\n\n_(He tenido que acortar la respuesta por falta de tiempo. Si quieres más detalle, pregúntamelo de nuevo.)_") # Cierre de las respuestas cortadas por el presupuesto. Vacío para no añadirlo
+
+# ------CONFIGURACIÓN DEL CIRCUIT BREAKER DE LOS MODELOS------
+class BreakerSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="BREAKER_", extra="ignore")
+
+    enabled: bool = Field(default=True)
+    window_size: int = Field(default=20) # Llamadas de la ventana deslizante
+    min_calls: int = Field(default=5) # Llamadas mínimas en la ventana para poder abrir el circuito
+    failure_rate_threshold: float = Field(default=0.5)
+    slow_call_seconds: float = Field(default=8.0) # Latencia (o tiempo hasta el primer token) a partir de la que una llamada cuenta como fallo
+    open_seconds: float = Field(default=30.0) # Tiempo en abierto antes de las llamadas de prueba
+    half_open_max_calls: int = Field(default=2)
+    request_timeout: float = Field(default=20.0) # Timeout de cada petición al proveedor
+    max_retries: int = Field(default=1)
+    degraded_results: int = Field(default=5) # Inmuebles de la búsqueda local en modo degradado
+    snippets_path: str = Field(default="resources/rag_snippets.json")
+
+# ------CONFIGURACIÓN DEL STREAMING DE RESPUESTAS------
+class StreamSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="STREAM_", extra="ignore")
+
+    results_first: bool = Field(default=True) # Tarjetas, imágenes, URLs y coordenadas se envían en cuanto existen, antes del texto
+    coalesce_window_ms: float = Field(default=30.0) # Los fragmentos de texto se agrupan en una trama como máximo durante este tiempo...
+    coalesce_max_bytes: int = Field(default=256) # ... o hasta alcanzar este tamaño
+    format: str = Field(default="ndjson") # 'ndjson' (una línea JSON por trama) o 'sse' (tramas 'data: ...' de Server-Sent Events)
+
+# ------CONFIGURACIÓN DE LA PRECARGA ESPECULATIVA DE INMUEBLES------
+class PrefetchSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="PREFETCH_", extra="ignore")
+
+    enabled: bool = Field(default=True)
+    top_results: int = Field(default=3) # Inmuebles de la presentación general que se precargan
+    max_per_session: int = Field(default=12) # Límite de inmuebles precargados por sesión
+    validate_photos: bool = Field(default=True) # Comprueba que las URLs de las fotos responden
+    photo_timeout: float = Field(default=2.0)
+    photo_concurrency: int = Field(default=8)
+    pregenerate: bool = Field(default=False) # Genera por adelantado la presentación detallada con el LLM
+    max_pregenerations_per_session: int = Field(default=2)
+    ttl_seconds: float = Field(default=900.0) # Vida de los datos precargados
+    max_sessions: int = Field(default=500) # Sesiones con datos precargados en memoria
+    redis: bool = Field(default=True) # Guarda los datos precargados en Redis para que cualquier worker atienda el turno siguiente
+    redis_timeout: float = Field(default=0.2) # Sin respuesta de Redis en este tiempo se sigue sin él
+    key_prefix: str = Field(default="prefetch")
+    budget_ttl_seconds: float = Field(default=86400.0) # Vida en Redis de los contadores de los límites por sesión
+
+# ------CONFIGURACIÓN DE LOS RESÚMENES PRECALCULADOS DE INMUEBLES------
+class PropertySummarySettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="SUMMARIES_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Genera los resúmenes en la carga nocturna de datos
+    serve_stored: bool = Field(default=True) # La presentación detallada usa el resumen guardado si está al día
+    db_path: str = Field(default="db/property_summaries.db")
+    report_path: str = Field(default="db/property_summaries_report.json")
+    concurrency: int = Field(default=4) # Llamadas simultáneas al LLM en el proceso por lotes
+    canonical_input: str = Field(default="Preséntame este inmueble, sin saludo inicial") # Petición con la que se genera el resumen canónico
+
+# ------CONFIGURACIÓN DEL FILTRO DE ASEQUIBILIDAD------
+class AffordabilitySettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="AFFORDABILITY_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Limita el precio de la búsqueda según la situación financiera del usuario
+    interest_rate: float = Field(default=0.035) # Tipo de interés anual de la hipoteca
+    term_years: int = Field(default=30) # Plazo de la hipoteca
+    ltv: float = Field(default=0.8) # Parte del precio que financia el banco (loan-to-value)
+    purchase_costs: float = Field(default=0.10) # Impuestos y gastos de compra sobre el precio, a cargo de los ahorros
+    max_debt_to_income: float = Field(default=0.35) # Parte de los ingresos que pueden destinarse a deudas
+    rent_to_income: float = Field(default=0.30) # Parte de los ingresos que puede destinarse al alquiler
+    margin: float = Field(default=0.05) # Margen sobre el tope calculado, para no descartar inmuebles negociables
+    loans_interest_rate: float = Field(default=0.06) # Tipo de interés anual supuesto para los préstamos vigentes del usuario
+    loans_term_years: int = Field(default=5) # Plazo restante supuesto para devolver esos préstamos
+
+# ------CONFIGURACIÓN DE LA COMPARACIÓN DE INMUEBLES------
+class ComparisonSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="COMPARISON_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Las comparaciones de inmuebles ya mostrados se resuelven con una tabla local
+    max_properties: int = Field(default=3) # Inmuebles por comparación
+    prompt_path: str = Field(default="prompts/qa_chain/COMPARISON_PROMPT.txt")
+
+# ------CONFIGURACIÓN DE RAG------
+class RagSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="RAG_", extra="ignore")
+
+    warm_on_startup: bool = Field(default=True) # Carga el índice vectorial en el arranque de cada worker
+    mmap: bool = Field(default=True) # Abre 'index.faiss' mapeado en memoria (páginas compartidas entre workers)
+    docstore_file: str = Field(default="docstore.json") # Documentos del índice, sin pickle
+    keep_versions: int = Field(default=3) # Versiones publicadas del índice que se conservan en 'rag_versions'
+    k: int = Field(default=4) # Documentos recuperados por consulta
+    embedding_model: str = Field(default="text-embedding-ada-002") # Modelo de embeddings del índice y de las consultas
+    pdf_dir: str = Field(default="data/pdf") # Documentos de la base de conocimiento
+    chunk_size: int = Field(default=800)
+    chunk_overlap: int = Field(default=100)
+    ingestion_workers: int = Field(default=4) # Procesos para leer y fragmentar los PDF
+    embedding_batch_size: int = Field(default=64) # Fragmentos por llamada a la API de embeddings
+    index_type: str = Field(default="flat") # Tipo de índice al construir: flat, ivf_flat, ivf_pq o hnsw
+    index_nlist: int = Field(default=0) # Celdas de los índices IVF (0: unas 4·√n)
+    index_nprobe: int | None = Field(default=None) # Celdas recorridas por consulta (None: la del manifiesto, 16 al construir)
+    index_pq_m: int = Field(default=64) # Subvectores de PQ (debe dividir la dimensión)
+    index_pq_nbits: int = Field(default=8)
+    index_pq_refine: int = Field(default=8) # Reordenación exacta de k·refine candidatos de PQ (0: sin reordenar)
+    index_hnsw_m: int = Field(default=32) # Vecinos por nodo del grafo HNSW
+    index_hnsw_ef_construction: int = Field(default=200)
+    index_hnsw_ef_search: int | None = Field(default=None) # Candidatos por consulta (None: el del manifiesto, 64 al construir)
+    hybrid: bool = Field(default=True) # Fusiona la búsqueda vectorial con BM25 (ver 'hybrid_search')
+    hybrid_candidates: int = Field(default=20) # Candidatos de cada búsqueda antes de la fusión
+    hybrid_vector_weight: float = Field(default=1.0) # Peso de la lista vectorial en RRF
+    hybrid_bm25_weight: float = Field(default=1.0) # Peso de la lista BM25 en RRF
+    rrf_k: int = Field(default=60)
+    bm25_k1: float = Field(default=1.2)
+    bm25_b: float = Field(default=0.75)
+    rerank: bool = Field(default=False) # Reordenación ligera de los candidatos fusionados
+    rerank_coverage_weight: float = Field(default=1.0)
+    rerank_phrase_weight: float = Field(default=0.5)
+    context_min_score: float = Field(default=0.75) # Similitud coseno mínima de un fragmento con la consulta (escala de ada-002)
+    context_compression: bool = Field(default=True) # Solo las frases más relevantes de cada fragmento (ver 'context_builder')
+    context_max_tokens: int = Field(default=500) # Presupuesto de tokens del contexto
+    context_dense_weight: float = Field(default=0.5) # Peso de la similitud del fragmento en la puntuación de cada frase
+    context_lexical_weight: float = Field(default=1.0) # Peso de la cobertura de términos de la consulta
+    context_neighbor_weight: float = Field(default=0.5) # Parte de la cobertura de una frase que reciben sus vecinas
+    context_duplicate_jaccard: float = Field(default=0.8) # Fragmentos con más solapamiento de términos se consideran duplicados
+    history_max_tokens: int = Field(default=400) # Historial en el prompt de RAG (se conserva el final)
+    early_exit: bool = Field(default=True) # Sin fragmentos relevantes se responde por plantilla, sin LLM
+
+# ------CONFIGURACIÓN DE LA CACHÉ DE EMBEDDINGS------
+class EmbeddingCacheSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="EMBEDDING_CACHE_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Caché de embeddings de consultas de RAG y de fragmentos de la ingesta
+    lru_size: int = Field(default=10000) # Vectores en memoria por proceso
+    redis: bool = Field(default=True) # Segundo nivel compartido en Redis
+    ttl_seconds: int = Field(default=30 * 24 * 3600)
+    redis_timeout: float = Field(default=0.1) # Segundos; una caché lenta no debe retrasar la consulta
+    key_prefix: str = Field(default="emb")
+
+# ------CONFIGURACIÓN DE LA AGRUPACIÓN DE PETICIONES DE EMBEDDINGS------
+class EmbeddingBatchSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="EMBEDDING_BATCH_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Agrupa los embeddings de consultas concurrentes en una sola llamada
+    window_ms: float = Field(default=5.0) # Espera máxima de una petición a que lleguen otras
+    max_batch: int = Field(default=64) # Textos por llamada
+    min_remaining_s: float = Field(default=1.0) # Con menos tiempo de turno que este (más la ventana) se envía sin esperar
+
+# ------CONFIGURACIÓN DE LA CACHÉ SEMÁNTICA DE RESPUESTAS DE RAG------
+class AnswerCacheSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="ANSWER_CACHE_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Reutiliza respuestas de RAG a preguntas casi iguales
+    threshold: float = Field(default=0.95) # Similitud coseno mínima entre embeddings de las preguntas
+    ttl_seconds: float = Field(default=24 * 3600.0)
+    max_entries: int = Field(default=2000) # Respuestas por worker; se descartan las más antiguas
+    check_interval_s: float = Field(default=30.0) # Cada cuánto se comprueba si la ingesta ha publicado un índice nuevo
+    audit_path: str | None = Field(default="db/answer_cache_hits.jsonl") # Registro de aciertos (una línea JSON por acierto)
+
+# ------CONFIGURACIÓN DE LA BÚSQUEDA SEMÁNTICA EN LAS DESCRIPCIONES DE LOS INMUEBLES------
+class DescriptionSearchSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="DESCRIPTION_SEARCH_", extra="ignore")
+
+    enabled: bool = Field(default=True) # Sin resultados SQL, ordena por descripción los inmuebles que cumplen los filtros estrictos
+    build_nightly: bool = Field(default=True) # Reconstrucción incremental del índice en 'load_app_data'
+    index_dir: str = Field(default="db")
+    k: int = Field(default=5) # Inmuebles presentados
+    min_score: float = Field(default=0.75) # Similitud coseno mínima entre la petición y la descripción (escala de ada-002)
+    max_tokens: int = Field(default=1000) # Longitud máxima de la descripción indexada
+    post_filter_ratio: float = Field(default=0.8) # Con más candidatos que esta proporción del índice se busca primero y se filtra después
+    post_filter_overfetch: int = Field(default=4) # Resultados pedidos por cada uno necesario al filtrar después
+    min_remaining_s: float = Field(default=1.0) # Tiempo de turno necesario para pedir el embedding de la petición
+    check_interval_s: float = Field(default=60.0) # Cada cuánto se comprueba si la carga nocturna ha publicado un índice nuevo
+    soft_columns: list[str] = Field(default_factory=lambda: [
+        "CheckLuz", "CheckOrientacionSur", "CheckVistasMar", "CheckVistasCiudad", "CheckVistasMontana", "CheckVistasDestacadas",
+        "CheckCercaPlaya", "CheckChimenea", "CheckPatio", "CheckJardin", "Estado_General", "TipoVentana", "Cocina", "EsCentro",
+        "ParqueCerca", "EstacionTrenCerca", "EstacionBusCerca", "UniversidadCerca", "HospitalCerca",
+    ]) # Características descriptivas: se relajan y las sustituye la similitud con la descripción
+
+# ------CONFIGURACIÓN DE LAS TAREAS PROGRAMADAS------
+class JobSettings(BaseSettings):
+    model_config = ConfigDict(env_prefix="JOBS_", extra="ignore")
+
+    lock_dir: str = Field(default="db/locks") # Ficheros de bloqueo de las tareas (compartidos por los workers)
+    min_interval_s: float = Field(default=12 * 3600.0) # Una tarea completada no se repite antes de este tiempo
+
 # ------CONFIGURACIÓN DE TWILIO------
 class TwilioSettings(BaseSettings):
     model_config = ConfigDict(extra="ignore")
@@ -69,6 +324,26 @@ class AppSettings(BaseSettings):
 
     # Configuración específica para IA
     ia: IASettings = IASettings()
+    llm_policy: LLMPolicySettings = LLMPolicySettings()
+    prompt: PromptSettings = PromptSettings()
+    schema_selection: SchemaSelectionSettings = SchemaSelectionSettings()
+    templates: TemplateSettings = TemplateSettings()
+    resolver: ResolverSettings = ResolverSettings()
+    memory: MemorySettings = MemorySettings()
+    turns: TurnSettings = TurnSettings()
+    deadline: DeadlineSettings = DeadlineSettings()
+    breaker: BreakerSettings = BreakerSettings()
+    stream: StreamSettings = StreamSettings()
+    prefetch: PrefetchSettings = PrefetchSettings()
+    property_summaries: PropertySummarySettings = PropertySummarySettings()
+    affordability: AffordabilitySettings = AffordabilitySettings()
+    comparison: ComparisonSettings = ComparisonSettings()
+    rag: RagSettings = RagSettings()
+    embedding_cache: EmbeddingCacheSettings = EmbeddingCacheSettings()
+    embedding_batch: EmbeddingBatchSettings = EmbeddingBatchSettings()
+    answer_cache: AnswerCacheSettings = AnswerCacheSettings()
+    description_search: DescriptionSearchSettings = DescriptionSearchSettings()
+    jobs: JobSettings = JobSettings()
 
     # Configuración específica para Twilio
     twilio: TwilioSettings = TwilioSettings()
@@ -0,0 +1,155 @@
+"""
+Índice vectorial de las descripciones públicas de los inmuebles ('Observaciones_Publicas'), para la búsqueda semántica
+dentro de los filtros SQL ('description_search').
+Se reconstruye al final de 'load_app_data', después de generar 'json_view_data':
+    1. Cada descripción se limpia ('clean_description') y se identifica por el hash de su texto y del modelo de embeddings.
+       Los inmuebles sin descripción no se indexan.
+    2. Solo se calculan los embeddings de las descripciones nuevas o modificadas, en llamadas por lotes
+       ('RAG_EMBEDDING_BATCH_SIZE') y a través de la caché de embeddings; el resto reutiliza el vector del índice anterior.
+    3. Se construye un índice FAISS plano de producto interno sobre vectores normalizados (similitud coseno) con el Id de
+       cada inmueble como identificador (IndexIDMap2), y se publica junto a su manifiesto con nombres temporales y
+       'os.replace': los workers nunca leen un índice a medio escribir.
+Con --fake se usan embeddings deterministas locales (sin red) y, salvo que se indique --index-dir, el índice se escribe en
+un directorio temporal.
+
+SCRIPT DE EJECUCIÓN: "python -m src.data_generation.description_index"
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+import orjson
+from langchain_core.embeddings import Embeddings
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_json
+from src.logic.tool_utilities.embedding_cache import cached_embeddings
+from src.logic.tool_utilities.description_search import INDEX_FILE, MANIFEST_FILE, clean_description, read_description_manifest
+from src.config import json_view_data_dir
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION_FIELD = "Observaciones_Publicas"
+
+
+def description_hash(text: str, embedding_model: str) -> str:
+    return hashlib.sha256(f"{embedding_model}\n{text}".encode("utf-8")).hexdigest()
+
+
+# ------ESTADO DEL ÍNDICE PUBLICADO------
+def previous_vectors(index_dir: str) -> Dict[int, tuple[str, np.ndarray]]:
+    """Hash y vector de cada inmueble del índice publicado (vacío si no hay índice o no se puede leer)."""
+    manifest = read_description_manifest(index_dir)
+    path = os.path.join(index_dir, INDEX_FILE)
+    if not manifest or not os.path.exists(path):
+        return {}
+    try:
+        index = faiss.read_index(path)
+        return {int(inm_id): (digest, index.reconstruct(int(inm_id))) for inm_id, digest in manifest.get("hashes", {}).items()}
+    except RuntimeError as e:
+        logger.warning(f"Previous description vectors could not be recovered, all descriptions will be embedded: {e}")
+        return {}
+
+
+def publish_description_index(index_dir: str, index: faiss.Index, manifest: Dict[str, Any]) -> None:
+    """Escribe índice y manifiesto con nombres temporales y los renombra; el manifiesto, el último."""
+    os.makedirs(index_dir, exist_ok=True)
+    suffix = f".tmp{os.getpid()}"
+    temporary = {name: os.path.join(index_dir, name + suffix) for name in (INDEX_FILE, MANIFEST_FILE)}
+    try:
+        faiss.write_index(index, temporary[INDEX_FILE])
+        with open(temporary[MANIFEST_FILE], "wb") as file:
+            file.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+        for name in (INDEX_FILE, MANIFEST_FILE):
+            os.replace(temporary[name], os.path.join(index_dir, name))
+    finally:
+        for path in temporary.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ------CONSTRUCCIÓN------
+class DescriptionIndexBuild:
+
+    def __init__(self, embeddings: Embeddings, embedding_model: str, index_dir: Optional[str] = None, force: bool = False):
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+        self.index_dir = index_dir or settings.description_search.index_dir
+        self.force = force
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        batch_size = settings.rag.embedding_batch_size
+        batches = [self.embeddings.embed_documents(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)]
+        return np.asarray([vector for batch in batches for vector in batch], dtype="float32")
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        properties: Dict[str, Dict] = open_json(json_view_data_dir)
+        descriptions = {int(inm_id): clean_description(data.get(DESCRIPTION_FIELD)) for inm_id, data in properties.items()}
+        descriptions = {inm_id: text for inm_id, text in descriptions.items() if text}
+        if not descriptions:
+            raise Exception(f"ERROR: No property descriptions found in {json_view_data_dir}")
+        hashes = {inm_id: description_hash(text, self.embedding_model) for inm_id, text in descriptions.items()}
+
+        # Solo se calculan los embeddings de las descripciones nuevas o modificadas
+        previous = {} if self.force else previous_vectors(self.index_dir)
+        pending = [inm_id for inm_id in descriptions if previous.get(inm_id, (None,))[0] != hashes[inm_id]]
+        embed_start = time.perf_counter()
+        new_vectors = dict(zip(pending, self.embed([descriptions[inm_id] for inm_id in pending]))) if pending else {}
+        embed_s = time.perf_counter() - embed_start
+
+        ids = list(descriptions)
+        vectors = np.vstack([new_vectors[inm_id] if inm_id in new_vectors else previous[inm_id][1] for inm_id in ids]).astype("float32")
+        faiss.normalize_L2(vectors)
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+
+        manifest = {
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "embedding_model": self.embedding_model,
+            "dimension": int(vectors.shape[1]),
+            "properties": len(ids),
+            "hashes": {str(inm_id): hashes[inm_id] for inm_id in ids},
+        }
+        publish_description_index(self.index_dir, index, manifest)
+
+        report = {
+            "index_dir": self.index_dir,
+            "properties": len(properties),
+            "indexed": len(ids),
+            "without_description": len(properties) - len(ids),
+            "embedded": len(pending),
+            "reused": len(ids) - len(pending),
+            "embed_s": round(embed_s, 2),
+            "wall_s": round(time.perf_counter() - start, 2),
+        }
+        logger.info(f"Description index: {report}")
+        return report
+
+
+def build_description_index(force: bool = False, fake: bool = False, index_dir: Optional[str] = None) -> Dict[str, Any]:
+    if fake:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings, model = DeterministicFakeEmbedding(size=1536), "fake"
+        index_dir = index_dir or tempfile.mkdtemp(prefix="description_index_")
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings, model = OpenAIEmbeddings(model=settings.rag.embedding_model), settings.rag.embedding_model
+    return DescriptionIndexBuild(cached_embeddings(embeddings, model), model, index_dir, force=force).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice vectorial de las descripciones de los inmuebles")
+    parser.add_argument("--force", action="store_true", help="Vuelve a calcular los embeddings de todas las descripciones")
+    parser.add_argument("--fake", action="store_true", help="Embeddings deterministas locales, sin llamadas a la API")
+    parser.add_argument("--index-dir", default=None)
+    args = parser.parse_args()
+    print(json.dumps(build_description_index(args.force, args.fake, args.index_dir), ensure_ascii=False, indent=4))
@@ -1,5 +1,6 @@
 import os
 import sys
+import logging
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.data_generation.data_retriever import data_retriving
@@ -7,6 +8,12 @@ from src.data_generation.data_cleaner import data_cleaning, data_viewing
 from src.data_generation.data_enrichment import data_enrichment
 from src.data_generation.sql_search_generation import sql_search_generating
 from src.data_generation.json_view_data_generation import create_view_json
+from src.data_generation.property_summaries import generate_property_summaries
+from src.data_generation.description_index import build_description_index
+from src.core.settings import settings
+from src.utils.job_lock import exclusive_job
+
+logger = logging.getLogger(__name__)
 
 # EXECUTION SCRIPT: "python -m src.data_generation.data_generation"
 
@@ -15,4 +22,24 @@ def load_app_data():
     data_cleaning()
     data_enrichment()
     sql_search_generating()
-    create_view_json()
\ No newline at end of file
+    create_view_json()
+
+    # Índice de las descripciones para la búsqueda semántica. Un fallo deja publicado el índice anterior.
+    # Solo lo construye uno de los workers que lanzan la carga.
+    if settings.description_search.build_nightly:
+        try:
+            with exclusive_job("description_index") as acquired:
+                if acquired:
+                    build_description_index()
+        except Exception as e:
+            logger.error(f"Error building the description index: {e}")
+
+    # Resúmenes canónicos de los inmuebles nuevos o modificados. Un fallo no invalida la carga de datos.
+    # Solo los genera uno de los workers que lanzan la carga (llamadas al LLM y escrituras en el mismo SQLite).
+    if settings.property_summaries.enabled:
+        try:
+            with exclusive_job("property_summaries") as acquired:
+                if acquired:
+                    generate_property_summaries()
+        except Exception as e:
+            logger.error(f"Error generating property summaries: {e}")
@@ -0,0 +1,190 @@
+"""
+Resúmenes precalculados de la presentación detallada de cada inmueble.
+Los datos de los inmuebles solo cambian en la carga nocturna, así que en lugar de generar la presentación con
+'specific_answer_chain' en cada turno se genera una versión canónica por inmueble al final de 'load_app_data':
+    - Concurrencia acotada ('SUMMARIES_CONCURRENCY') sobre todo el catálogo.
+    - Cada resumen se guarda con el hash de su contenido (datos del inmueble, prompt, instrucción y modelo). Los inmuebles
+      sin cambios se omiten y, como cada resumen se guarda en cuanto se genera, un proceso interrumpido se reanuda donde
+      se quedó.
+    - Al terminar se escribe un informe de coste y latencia ('SUMMARIES_REPORT_PATH').
+La presentación detallada en vivo usa el resumen guardado si su hash coincide con los datos actuales.
+
+SCRIPT DE EJECUCIÓN: "python -m src.data_generation.property_summaries --limit 20"
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_txt, open_json
+from src.data_generation.sql_search_generation import execute_sql_query
+from src.logic.tool_config.llm_policy import generate_chain_llm, load_llm_policy
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.prompt_serialization import serialize_property
+from src.logic.tool_utilities.qa_utilities import parse_db_answer, filter_presentation_fields, specific_presentation_dict
+from src.config import SPECIFIC_ANSWER_PROMPT_dir, tool_instructions_dir, table_name
+
+logger = logging.getLogger(__name__)
+
+CHAIN_NAME = "property_summary_chain"
+SPECIFIC_ANSWER_PROMPT = open_txt(SPECIFIC_ANSWER_PROMPT_dir)
+INSTRUCTION: str = next(item["description"] for item in open_json(tool_instructions_dir)["present_chain"] if item["key"] == "to_present")
+
+
+# ------HASH DE CONTENIDO------
+def _model_name() -> str:
+    policy = load_llm_policy()
+    return policy.tier(policy.chain_policy(CHAIN_NAME).tier).model
+
+
+def content_hash(inm_id: int, data: Dict[str, Any]) -> str:
+    """Hash de todo lo que determina el resumen: datos enriquecidos del inmueble, prompt, instrucción, petición y modelo."""
+    payload = json.dumps(
+        [inm_id, data, SPECIFIC_ANSWER_PROMPT, INSTRUCTION, settings.property_summaries.canonical_input, _model_name()],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ------ALMACENAMIENTO------
+def _connect(read_only: bool = False) -> sqlite3.Connection:
+    path = settings.property_summaries.db_path
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS property_summaries (
+            inm_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            model TEXT,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            latency REAL,
+            created_at TEXT
+        )
+    """)
+    return conn
+
+
+def stored_summary(inm_id: int, data: Dict[str, Any]) -> Optional[str]:
+    """Resumen guardado del inmueble si está al día con sus datos actuales; None en caso contrario."""
+    try:
+        conn = _connect(read_only=True)
+        try:
+            row = conn.execute("SELECT content_hash, summary FROM property_summaries WHERE inm_id = ?", (inm_id,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    if row and row[0] == content_hash(inm_id, data):
+        return row[1]
+    return None
+
+
+# ------PROCESO POR LOTES------
+class PropertySummaryBatch:
+
+    def __init__(self, force: bool = False, limit: Optional[int] = None):
+        self.force = force
+        self.limit = limit
+        self.chain = build_prompt(CHAIN_NAME, SPECIFIC_ANSWER_PROMPT) | generate_chain_llm(CHAIN_NAME)
+        self.conn = _connect()
+        self.stored: Dict[int, str] = dict(self.conn.execute("SELECT inm_id, content_hash FROM property_summaries").fetchall())
+        self.stats: Dict[str, Any] = {"generated": 0, "skipped": 0, "failed": 0, "input_tokens": 0, "output_tokens": 0}
+        self.latencies: List[float] = []
+
+    async def summarize(self, inm_id: int, filtered: Dict[str, Any], semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            try:
+                data = (await asyncio.to_thread(specific_presentation_dict, filtered, inm_id))[0]
+                digest = content_hash(inm_id, data)
+                if not self.force and self.stored.get(inm_id) == digest:
+                    self.stats["skipped"] += 1
+                    return
+
+                start = time.perf_counter()
+                message = await self.chain.ainvoke({
+                    "user_name": "",
+                    "input": settings.property_summaries.canonical_input,
+                    "selected_inm": serialize_property(data, inm_id),
+                    "instruction": INSTRUCTION,
+                })
+                latency = time.perf_counter() - start
+                usage = getattr(message, "usage_metadata", None) or {}
+
+                # Se guarda en cuanto se genera: un proceso interrumpido se reanuda sin repetir trabajo
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO property_summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (inm_id, digest, message.content, _model_name(), usage.get("input_tokens", 0), usage.get("output_tokens", 0), latency, datetime.now(timezone.utc).isoformat()),
+                )
+                self.conn.commit()
+                self.stats["generated"] += 1
+                self.stats["input_tokens"] += usage.get("input_tokens", 0)
+                self.stats["output_tokens"] += usage.get("output_tokens", 0)
+                self.latencies.append(latency)
+
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Error generating summary for property {inm_id}: {e}")
+
+    async def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        rows = execute_sql_query(f"SELECT * FROM {table_name}") or []
+        catalog: Dict[int, Dict] = filter_presentation_fields(parse_db_answer(rows)) if rows else {}
+
+        # Los resúmenes de inmuebles que ya no están en el catálogo se eliminan
+        removed = [inm_id for inm_id in self.stored if inm_id not in catalog]
+        self.conn.executemany("DELETE FROM property_summaries WHERE inm_id = ?", [(inm_id,) for inm_id in removed])
+        self.conn.commit()
+
+        items = list(catalog.items())[:self.limit] if self.limit else list(catalog.items())
+        semaphore = asyncio.Semaphore(settings.property_summaries.concurrency)
+        await asyncio.gather(*(self.summarize(inm_id, data, semaphore) for inm_id, data in items))
+        self.conn.close()
+
+        return self.report(len(items), len(removed), time.perf_counter() - start)
+
+    def report(self, properties: int, pruned: int, wall: float) -> Dict[str, Any]:
+        policy = load_llm_policy()
+        ordered = sorted(self.latencies)
+        report = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "model": _model_name(),
+            "properties": properties,
+            "pruned": pruned,
+            **self.stats,
+            "cost_usd": round(policy.cost(policy.chain_policy(CHAIN_NAME).tier, self.stats["input_tokens"], self.stats["output_tokens"]), 4),
+            "latency_s": {
+                "mean": round(statistics.mean(ordered), 3),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max": round(ordered[-1], 3),
+            } if ordered else None,
+            "wall_s": round(wall, 1),
+            "concurrency": settings.property_summaries.concurrency,
+        }
+        with open(settings.property_summaries.report_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+        logger.info(f"Property summaries: {report}")
+        return report
+
+
+def generate_property_summaries(force: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Etapa de 'load_app_data'. Se ejecuta en el hilo del planificador, con su propio bucle de eventos."""
+    return asyncio.run(PropertySummaryBatch(force, limit).run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los resúmenes canónicos de los inmuebles del catálogo")
+    parser.add_argument("--force", action="store_true", help="Regenera también los inmuebles sin cambios")
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de inmuebles a procesar")
+    args = parser.parse_args()
+    print(json.dumps(generate_property_summaries(args.force, args.limit), ensure_ascii=False, indent=4))
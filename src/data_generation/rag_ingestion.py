@@ -0,0 +1,223 @@
+"""
+Ingesta incremental de la base de conocimiento de RAG ('RAG_PDF_DIR') en el índice vectorial.
+    1. Los PDF nuevos o modificados (hash del fichero distinto al del manifiesto) se leen y fragmentan en un pool de
+       procesos ('RAG_INGESTION_WORKERS'). Los fragmentos de los PDF sin cambios se toman del docstore publicado.
+    2. Cada fragmento se identifica por el hash de su contenido. Solo se calculan los embeddings de los fragmentos que no
+       estaban en el índice anterior, en llamadas por lotes ('RAG_EMBEDDING_BATCH_SIZE'); el resto reutiliza su vector. Los
+       embeddings pasan por la caché compartida con las consultas ('embedding_cache'), así que una reconstrucción con --force
+       o con otra configuración de fragmentos solo calcula los textos que nunca se han visto.
+    3. Se reconstruye el índice FAISS del tipo configurado ('RAG_INDEX_TYPE', ver 'ann_index') y se publican índice, docstore, vectores y manifiesto a la vez, como una versión nueva del índice ('publish_index').
+Al terminar se informa de páginas/s, fragmentos/s y la proporción de fragmentos reutilizados. Los workers cargan el índice
+nuevo en su siguiente arranque.
+
+Con --fake se usan embeddings deterministas locales (sin red) y, salvo que se indique --index-dir, el índice se escribe en
+un directorio temporal.
+
+SCRIPT DE EJECUCIÓN: "python -m src.data_generation.rag_ingestion"
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.core.settings import settings
+from src.logic.tool_utilities.ann_index import INDEX_TYPES, build_index
+from src.logic.tool_utilities.embedding_cache import cached_embeddings
+from src.logic.tool_utilities.vector_store import INDEX_FILE, VECTORS_FILE, current_index_dir, read_docstore, read_manifest, publish_index
+from src.config import DB_DIR
+
+logger = logging.getLogger(__name__)
+
+# (clave del fragmento, texto, metadatos)
+Chunk = Tuple[str, str, Dict[str, Any]]
+
+
+# ------LECTURA Y FRAGMENTACIÓN------
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_pdf(path: str, source: str, chunk_size: int, chunk_overlap: int) -> Tuple[int, List[Chunk]]:
+    """Lee un PDF y lo divide en fragmentos por página. Se ejecuta en los procesos del pool. Devuelve (páginas, fragmentos)."""
+    reader = PdfReader(path)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+    chunks: List[Chunk] = []
+    for page_number, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        for document in splitter.create_documents([text], metadatas=[{"source": source, "page": page_number}]):
+            chunks.append((chunk_key(document.page_content), document.page_content, document.metadata))
+    return len(reader.pages), chunks
+
+
+# ------ESTADO DEL ÍNDICE PUBLICADO------
+def previous_state(index_dir: str, embedding_model: str) -> Tuple[Dict[str, Dict], Dict[str, np.ndarray], Dict[str, Document]]:
+    """
+    Ficheros, vectores por clave de fragmento y documentos del índice publicado. Los vectores solo se reutilizan si el
+    modelo de embeddings coincide. Un índice sin 'vectors.npy' (anterior a la ingesta) aporta sus vectores reconstruidos
+    desde FAISS, identificados por el hash del texto de cada documento.
+    """
+    index_dir = current_index_dir(index_dir)
+    manifest = read_manifest(index_dir) or {}
+    if manifest.get("embedding_model", settings.rag.embedding_model) != embedding_model:
+        return {}, {}, {}
+    try:
+        docstore, index_to_docstore_id = read_docstore(index_dir)
+    except FileNotFoundError:
+        return {}, {}, {}
+
+    ids = [index_to_docstore_id[position] for position in range(len(index_to_docstore_id))]
+    vectors_path = os.path.join(index_dir, VECTORS_FILE)
+    try:
+        vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else faiss.read_index(os.path.join(index_dir, INDEX_FILE)).reconstruct_n(0, len(ids))
+    except RuntimeError as e:
+        logger.warning(f"Previous vectors could not be recovered, all chunks will be embedded: {e}")
+        return manifest.get("files", {}), {}, {}
+
+    documents: Dict[str, Document] = {}
+    vectors_by_key: Dict[str, np.ndarray] = {}
+    for position, doc_id in enumerate(ids):
+        document = docstore.search(doc_id)
+        key = chunk_key(document.page_content)
+        documents[key] = document
+        vectors_by_key[key] = np.asarray(vectors[position], dtype="float32")
+    return manifest.get("files", {}), vectors_by_key, documents
+
+
+# ------INGESTA------
+class RagIngestion:
+
+    def __init__(self, embeddings: Embeddings, embedding_model: str, index_dir: str = DB_DIR, pdf_dir: Optional[str] = None, force: bool = False, workers: Optional[int] = None, index_type: Optional[str] = None):
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+        self.index_dir = index_dir
+        self.pdf_dir = pdf_dir or settings.rag.pdf_dir
+        self.force = force
+        self.workers = workers or settings.rag.ingestion_workers
+        self.index_type = index_type or settings.rag.index_type
+        self.index_spec: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embeddings de los fragmentos nuevos en llamadas por lotes."""
+        batch_size = settings.rag.embedding_batch_size
+        batches = [self.embeddings.embed_documents(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)]
+        return np.asarray([vector for batch in batches for vector in batch], dtype="float32")
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        files = {name: os.path.join(self.pdf_dir, name) for name in sorted(os.listdir(self.pdf_dir)) if name.lower().endswith(".pdf")}
+        hashes = {name: file_hash(path) for name, path in files.items()}
+        previous_files, previous_vectors, previous_documents = ({}, {}, {}) if self.force else previous_state(self.index_dir, self.embedding_model)
+
+        # ----1. LECTURA DE LOS PDF NUEVOS O MODIFICADOS
+        unchanged = [name for name in files if previous_files.get(name, {}).get("hash") == hashes[name] and all(key in previous_documents for key in previous_files[name]["chunks"])]
+        changed = [name for name in files if name not in unchanged]
+        parse_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            parsed = list(pool.map(
+                parse_pdf, [files[name] for name in changed], [os.path.join(self.pdf_dir, name) for name in changed],
+                [settings.rag.chunk_size] * len(changed), [settings.rag.chunk_overlap] * len(changed),
+            )) if changed else []
+        self.timings["parse_s"] = time.perf_counter() - parse_start
+        pages = sum(page_count for page_count, _ in parsed)
+
+        # ----2. FRAGMENTOS EN ORDEN DE FICHERO, SIN DUPLICADOS
+        chunks_by_file: Dict[str, List[Chunk]] = {name: chunks for name, (_, chunks) in zip(changed, parsed)}
+        for name in unchanged:
+            chunks_by_file[name] = [(key, previous_documents[key].page_content, previous_documents[key].metadata) for key in previous_files[name]["chunks"]]
+        chunks: Dict[str, Chunk] = {}
+        for name in files:
+            for chunk in chunks_by_file[name]:
+                chunks.setdefault(chunk[0], chunk)
+
+        # ----3. EMBEDDINGS SOLO DE LOS FRAGMENTOS NUEVOS
+        pending = [key for key in chunks if key not in previous_vectors]
+        embed_start = time.perf_counter()
+        new_vectors = dict(zip(pending, self.embed([chunks[key][1] for key in pending]))) if pending else {}
+        self.timings["embed_s"] = time.perf_counter() - embed_start
+        if not chunks:
+            raise Exception(f"ERROR: No chunks found in {self.pdf_dir}")
+
+        # ----4. ÍNDICE Y PUBLICACIÓN
+        build_start = time.perf_counter()
+        keys = list(chunks)
+        vectors = np.vstack([new_vectors[key] if key in new_vectors else previous_vectors[key] for key in keys]).astype("float32")
+        index, self.index_spec = build_index(vectors, self.index_type)
+        documents = {key: Document(page_content=text, metadata=metadata) for key, text, metadata in chunks.values()}
+
+        manifest = {
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "embedding_model": self.embedding_model,
+            "dimension": int(vectors.shape[1]),
+            "chunk_size": settings.rag.chunk_size,
+            "chunk_overlap": settings.rag.chunk_overlap,
+            "vectors": len(keys),
+            "index": self.index_spec,
+            "files": {name: {"hash": hashes[name], "chunks": list(dict.fromkeys(chunk[0] for chunk in chunks_by_file[name]))} for name in files},
+        }
+        publish_index(self.index_dir, index, documents, dict(enumerate(keys)), vectors, manifest)
+        self.timings["build_s"] = time.perf_counter() - build_start
+
+        return self.report(len(files), len(changed), pages, len(keys), len(pending), time.perf_counter() - start)
+
+    def report(self, files: int, parsed_files: int, pages: int, chunks: int, embedded: int, wall: float) -> Dict[str, Any]:
+        report = {
+            "index_dir": self.index_dir,
+            "index_type": self.index_spec["type"],
+            "files": files,
+            "parsed_files": parsed_files,
+            "pages": pages,
+            "pages_per_s": round(pages / self.timings["parse_s"], 1) if pages else None,
+            "chunks": chunks,
+            "chunks_per_s": round(chunks / wall, 1),
+            "embedded": embedded,
+            "reused": chunks - embedded,
+            "reuse_ratio": round((chunks - embedded) / chunks, 3),
+            **{key: round(value, 2) for key, value in self.timings.items()},
+            "wall_s": round(wall, 2),
+        }
+        logger.info(f"RAG ingestion: {report}")
+        return report
+
+
+def ingest_knowledge_base(force: bool = False, fake: bool = False, index_dir: Optional[str] = None, workers: Optional[int] = None, index_type: Optional[str] = None) -> Dict[str, Any]:
+    if fake:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings, model = DeterministicFakeEmbedding(size=1536), "fake"
+        index_dir = index_dir or tempfile.mkdtemp(prefix="rag_index_")
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings, model = OpenAIEmbeddings(model=settings.rag.embedding_model), settings.rag.embedding_model
+    return RagIngestion(cached_embeddings(embeddings, model), model, index_dir or DB_DIR, force=force, workers=workers, index_type=index_type).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta incremental de los PDF de la base de conocimiento en el índice de RAG")
+    parser.add_argument("--force", action="store_true", help="Vuelve a leer y a calcular los embeddings de todos los fragmentos")
+    parser.add_argument("--fake", action="store_true", help="Embeddings deterministas locales, sin llamadas a la API")
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None, help="Sustituye a RAG_INDEX_TYPE (los vectores se reutilizan)")
+    args = parser.parse_args()
+    print(json.dumps(ingest_knowledge_base(args.force, args.fake, args.index_dir, args.workers, args.index_type), ensure_ascii=False, indent=4))
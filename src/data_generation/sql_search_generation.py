@@ -17,7 +17,8 @@ from src.config import (
 logger = logging.getLogger(__name__)
 
 #------GENERACIÓN DE CONSULTA CREATE TABLE ------
-def generate_create_table(json_columns, output_txt_path, table_name="my_table"):
+def render_create_table(json_columns, table_name="my_table") -> str:
+    """Construye la consulta CREATE TABLE con las columnas de búsqueda indicadas. También se usa para generar esquemas reducidos en los prompts."""
 
     column_definitions = ["Id INTEGER PRIMARY KEY"]
     for col in json_columns:
@@ -42,7 +43,12 @@ def generate_create_table(json_columns, output_txt_path, table_name="my_table"):
             column_definitions.append(column_definition)
 
     # Crear consulta CREATE TABLE
-    create_table_query = f"CREATE TABLE IF NOT EXISTS {table_name} (\n    " + ",\n    ".join(column_definitions) + "\n);"
+    return f"CREATE TABLE IF NOT EXISTS {table_name} (\n    " + ",\n    ".join(column_definitions) + "\n);"
+
+
+def generate_create_table(json_columns, output_txt_path, table_name="my_table"):
+
+    create_table_query = render_create_table(json_columns, table_name)
 
     # Guardar la consulta en un archivo TXT
     with open(output_txt_path, "w", encoding="utf-8") as output_file:
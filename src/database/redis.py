@@ -1,11 +1,19 @@
 """
  Clase para manejar la conexión a Redis usando redis-py.
  En dev, usa host "redis" y puerto 6379 sin autenticación.
+ 'SharedRedis' da acceso tolerante a fallos a los datos que los workers comparten como caché.
  """
-from typing import Optional
+import logging
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+from redis import Redis as SyncRedis, RedisError
 from redis.asyncio import Redis
 from contextlib import asynccontextmanager
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
 class RedisCache:
 
     # ------INICIALIZACIÓN------
@@ -69,6 +77,11 @@ class RedisCache:
             return await client.setex(key, ttl, value)
         return await client.set(key, value)
 
+    async def getset(self, key: str, value: str, ttl: Optional[int] = None) -> Optional[str]:
+        """Almacena un valor con TTL opcional y devuelve el anterior en una sola operación"""
+        client = await self._ensure_client()
+        return await client.set(key, value, ex=ttl if ttl and ttl > 0 else None, get=True)
+
     async def delete(self, key: str) -> int:
         """Elimina una clave de Redis"""
         client = await self._ensure_client()
@@ -88,4 +101,73 @@ class RedisCache:
     async def flush_all(self):
         """Elimina todas las bases de datos de Redis."""
         client = await self._ensure_client()
-        await client.flushall(asynchronous=True)
\ No newline at end of file
+        await client.flushall(asynchronous=True)
+
+class SharedRedis:
+    """
+    Redis para datos prescindibles compartidos entre workers (caché de embeddings, precarga de inmuebles).
+    Clientes síncrono y asíncrono creados al primer uso, sin decodificar las respuestas (los valores son bytes) y con un
+    timeout corto. Si una operación falla se devuelve el valor por defecto y Redis no se vuelve a usar durante
+    'retry_seconds': estos datos nunca deben retrasar ni romper una consulta.
+    """
+
+    # ------INICIALIZACIÓN------
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        host: str = "redis",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        ssl: bool = False,
+        retry_seconds: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.retry_seconds = retry_seconds
+        self._options = dict(
+            host=host,
+            port=port,
+            db=db,
+            password=password,
+            ssl=ssl,
+            decode_responses=False,
+            socket_timeout=timeout,
+            socket_connect_timeout=timeout,
+        )
+        self._client: Optional[SyncRedis] = None
+        self._async_client: Optional[Redis] = None
+        self.down_until = 0.0
+        self.errors = 0
+
+    # ------DISPONIBILIDAD------
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def failed(self, e: Exception) -> None:
+        self.errors += 1
+        self.down_until = time.monotonic() + self.retry_seconds
+        logger.warning(f"{self.name}: Redis unavailable for {self.retry_seconds:.0f}s: {e}")
+
+    # ------EJECUCIÓN DE OPERACIONES------
+    def run(self, operation: Callable[[SyncRedis], T], default: T) -> T:
+        """Ejecuta 'operation' con el cliente síncrono; 'default' si Redis no está disponible o falla."""
+        if not self.available():
+            return default
+        try:
+            self._client = self._client or SyncRedis(**self._options)
+            return operation(self._client)
+        except (RedisError, OSError) as e:
+            self.failed(e)
+            return default
+
+    async def arun(self, operation: Callable[[Redis], Awaitable[T]], default: T) -> T:
+        """Ejecuta 'operation' con el cliente asíncrono; 'default' si Redis no está disponible o falla."""
+        if not self.available():
+            return default
+        try:
+            self._async_client = self._async_client or Redis(**self._options)
+            return await operation(self._async_client)
+        except (RedisError, OSError) as e:
+            self.failed(e)
+            return default
@@ -7,6 +7,9 @@ from src.dependencies.services_dependencies import get_messages_service
 from src.services.messages_service import MessagesService
 from src.models.messages import MessagesModel
 from src.schemas.message import MessageModel
+from src.logic.summary_chain import SummaryChain
+from src.logic.tool_utilities.history_window import build_history
+from src.utils.tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +28,10 @@ async def get_session_id(request: Request) -> str:
 async def manage_messages(request: Request, messages_service: MessagesService = Depends(get_messages_service)) -> List[MessageModel]:
     """ Dependencia que recupera y valida los mensajes desde MongoDB.
         Recesita recuperar el servicio de mensajes desde la src.       
+        Devuelve el historial para las cadenas: resumen de la conversación y mensajes recientes dentro del presupuesto de tokens.
     """
     messages = {}
 
-    num_last_messages = 4
-
     try:        
         #------COMPROBAMOS EL ID DE SESIÓN
         id: str = await get_session_id(request)
@@ -40,10 +42,8 @@ async def manage_messages(request: Request, messages_service: MessagesService =
             logging.warning(f"Messages not found in MongoDB.")
             raise HTTPException(status_code=401, detail="Messages not found in MongoDB.")
         
-        last_messages: List[MessageModel] = await messages_service.get_last_messages(messages, num_last_messages) or []
-
         #------ENTREGAMOS EL CONTROL AL ENDPOINT
-        return [{"user": msg.content} if not msg.is_bot else {"bot": msg.content, "tool": msg.metadata.get("tool", None) } for msg in last_messages]
+        return build_history(messages.messages, messages.summary)
     
     except Exception as e:
         logging.error(f"Error in messages dependence: {e}")
@@ -74,7 +74,8 @@ async def update_messages(
                 content = user_content,
                 is_bot = False,
                 timestamp = user_timestamp,
-                metadata = user_metadata
+                metadata = user_metadata,
+                tokens = count_tokens(user_content)
             )
 
             # Mensaje del bot
@@ -82,13 +83,17 @@ async def update_messages(
                 content = bot_content,
                 is_bot = True,
                 timestamp = datetime.now(timezone.utc),
-                metadata = bot_metadata
+                metadata = bot_metadata,
+                tokens = count_tokens(bot_content)
             )
 
             result: bool = await messages_service.set_messages(id, user_message, bot_message)
             if not result:
                 raise Exception("Document not saved")
 
+            #------ACTUALIZAMOS EL RESUMEN EN SEGUNDO PLANO
+            SummaryChain.schedule_update(messages_service, id)
+
         except Exception as e:
             logging.error(f"Error at messages registry update: {e}")
             raise HTTPException(status_code=500, detail=f"Error at messages registry update: {e}")
@@ -0,0 +1,68 @@
+"""
+Respuestas degradadas sin LLM, servidas mientras el circuit breaker del proveedor de modelos está abierto.
+    - Búsqueda: consulta SQL determinista y tarjetas de inmuebles del catálogo.
+    - Contacto: datos de las oficinas por plantilla.
+    - Información: fragmentos predefinidos (resources/rag_snippets.json) según las palabras clave de la petición.
+"""
+import json
+import logging
+from typing import AsyncGenerator, Dict, List
+
+from src.core.settings import settings
+from src.utils.stream_events import layout, with_results
+from src.utils.general_utilities import open_json, normalize_text
+from src.models.session import SessionModel
+from src.schemas.tools import QAToolModel
+from src.logic.tool_utilities.local_search import local_search, local_route
+from src.logic.tool_utilities.template_responses import render_response, contact_context
+from src.logic.tool_utilities.qa_utilities import general_presentation_dict
+from src.config import contact_info_json_dir
+
+logger = logging.getLogger(__name__)
+
+
+class DegradedChain:
+
+    contact_data: Dict = open_json(contact_info_json_dir)
+    rag_snippets: Dict = open_json(settings.breaker.snippets_path)
+
+    @classmethod
+    def snippet(cls, input: str) -> str:
+        """Fragmento predefinido cuyas palabras clave aparecen en la petición, o el fragmento por defecto."""
+        text = normalize_text(input)
+        for item in cls.rag_snippets.get("snippets", []):
+            if any(keyword in text for keyword in item["keywords"]):
+                return item["content"]
+        return cls.rag_snippets.get("default", "")
+
+    @staticmethod
+    async def text(content: str) -> AsyncGenerator[Dict, None]:
+        yield {"type": "text", "content": content}
+
+    @classmethod
+    async def execute(cls, input: str, session: SessionModel, user_name: str = None) -> AsyncGenerator[Dict, None]:
+        route = local_route(input)
+        logger.warning(f"Serving degraded response (route '{route}')")
+
+        if route == "contacto":
+            yield {"type": "text", "content": render_response("contact_chain", user_name=user_name, **contact_context(cls.contact_data, input))}
+
+        elif route == "busqueda":
+            qa_tool: QAToolModel = session.tools_data.get("qa_tool")
+            query, rows = local_search(input, settings.breaker.degraded_results)
+            data_results: Dict[int, Dict] = general_presentation_dict(rows) if rows else {}
+            data_results_content: List[Dict] = list(data_results.values())
+            if data_results:
+                qa_tool.searched_inms.extend(data_results.keys())
+                qa_tool.last_results = list(data_results.keys())
+            yield {"type": "metadata", "key": "modified_sql_query", "content": {"query": query.sql, "results": json.dumps(data_results) if data_results else "no results"}}
+            structured = [layout({"type": "function", "content": "generalPresentation", "input": data_results_content}, "cards")] if data_results_content else []
+            async for message in with_results(structured, cls.text(render_response("degraded_search", user_name=user_name, count=len(data_results_content)))):
+                yield message
+
+        else:
+            yield {"type": "text", "content": render_response("degraded_notice", user_name=user_name, snippet=cls.snippet(input))}
+
+        yield {"type": "metadata", "key": "response_source", "content": "degraded"}
+        yield {"type": "metadata", "key": "chain", "content": "degraded_chain"}
+        yield {"type": "metadata", "key": "tool", "content": route}
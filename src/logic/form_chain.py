@@ -1,26 +1,24 @@
 import logging
 from langchain_core.output_parsers import StrOutputParser
-from langchain.prompts import PromptTemplate
 from src.utils.general_utilities import open_txt
 
-from src.logic.tool_config.base_models import generate_router_llm
+from src.logic.tool_config.llm_policy import generate_chain_llm
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.template_responses import use_template, render_response
 from src.config import CONFIRM_FORM_PROMPT_dir
 
 logger = logging.getLogger(__name__)
 
 class Form_chain:
 
-    # MODELOS DE LENGUAJE
-    llm = generate_router_llm()
-
     # PLANTILLAS DE PROMPTS
     CONFIRM_FORM_PROMPT = open_txt(CONFIRM_FORM_PROMPT_dir)
 
     # PROMPTS
-    confirm_form_prompt = PromptTemplate.from_template(CONFIRM_FORM_PROMPT)
+    confirm_form_prompt = build_prompt("confirm_form_chain", CONFIRM_FORM_PROMPT)
 
     # CADENAS 
-    confirm_form_chain = confirm_form_prompt | llm | StrOutputParser()  # Cadena para confirmación del envío del formulario 
+    confirm_form_chain = confirm_form_prompt | generate_chain_llm("confirm_form_chain") | StrOutputParser()  # Cadena para confirmación del envío del formulario 
 
     @classmethod
     async def execute(cls, personal_data: dict):
@@ -31,8 +29,12 @@ class Form_chain:
             try:
                 user_name = personal_data.get("username")
 
-                async for partial_message in cls.confirm_form_chain.astream({"user_name": user_name}):
-                    yield {"type": "text", "content": partial_message}
+                if use_template("confirm_form_chain"):
+                    yield {"type": "text", "content": render_response("confirm_form_chain", user_name=user_name)}
+                    yield {"type": "metadata", "key": "response_source", "content": "template"}
+                else:
+                    async for partial_message in cls.confirm_form_chain.astream({"user_name": user_name}):
+                        yield {"type": "text", "content": partial_message}
                 yield {"type": "metadata", "key": "message_source", "content": {"tool": "form_tool", "chain": "confirm_form_chain"}}
 
             except Exception as e:
@@ -5,14 +5,29 @@ import sqlite3
 import re
 from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
-from typing import AsyncGenerator, List, Dict
+from typing import AsyncGenerator, List, Dict, Optional, Tuple
 from langchain.output_parsers import PydanticOutputParser
 
 from src.utils.general_utilities import open_txt, open_json
-from src.logic.tool_config.base_models import generate_qa_llm, generate_check_llm
+from src.logic.tool_config.llm_policy import generate_chain_llm
 from src.data_generation.sql_search_generation import execute_sql_query
+from src.data_generation.property_summaries import stored_summary
 from src.schemas.tools import QAToolModel, FinancialSituation
+from src.core.settings import settings
+from src.utils.tokens import truncate_tokens
+from src.utils.deadline import Deadline, DeadlineExceeded
+from src.utils.stream_events import layout, with_results
+from src.utils.turn_runner import current_turn
+from src.logic.tool_utilities.prefetch import PropertyPrefetcher
+from src.logic.tool_utilities.affordability import AffordabilityCaps, affordability_caps, apply_affordability
+from src.logic.tool_utilities.property_comparison import comparison_targets, build_comparison, comparison_diff
+from src.logic.tool_utilities.prompt_serialization import serialize_property, serialize_properties
+from src.logic.tool_utilities.schema_selector import select_schema
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.template_responses import use_template, render_response, missing_field_labels
+from src.logic.tool_utilities.reference_resolver import resolve_reference, presentation_only, Resolution
+from src.logic.tool_utilities.local_search import known_places
+from src.logic.tool_utilities.description_search import DescriptionSearch, relax_query, ID_COLUMN
 from src.config import (
     GENERATE_SQL_QUERY_PROMPT_dir,
     GENERIC_ANSWER_PROMPT_dir,
@@ -26,7 +41,8 @@ from src.config import (
     FINANCIAL_PARSER_PROMPT_dir,
     columns_dir,
     tool_instructions_dir,
-    search_table_generation_query_dir
+    search_table_generation_query_dir,
+    table_name
 )
 from src.logic.tool_utilities.qa_utilities import (
     generate_sql_ids,
@@ -64,6 +80,7 @@ class QAChain:
     FINANCIAL_PARSER_PROMPT = open_txt(FINANCIAL_PARSER_PROMPT_dir)
     SPECIFIC_ANSWER_PROMPT = open_txt(SPECIFIC_ANSWER_PROMPT_dir)
     QA_TOOL_EXPLANATION = open_txt(QA_TOOL_EXPLANATION_dir)
+    COMPARISON_PROMPT = open_txt(settings.comparison.prompt_path)
    
 
     # Columnas de la base de datos. Obtenidas a partir de un JSON
@@ -77,58 +94,63 @@ class QAChain:
             column_names.append(col_name)
 
 
-    # ------MODELOS DE LENGUAJE------
-    text2sql_llm = generate_qa_llm()
-    check_llm = generate_check_llm()
-    qa_general_llm = generate_check_llm()
-
     dialect = "sqlite"
     table_info = open_txt(search_table_generation_query_dir)
 
+    # Parser de la situación financiera. Sus instrucciones de formato son fijas y forman parte del prefijo estático.
+    financial_parser = PydanticOutputParser(pydantic_object=FinancialSituation)
+
     # ------PROMPTS------
-    text2sql_prompt  = PromptTemplate.from_template(GENERATE_SQL_QUERY_PROMPT)
-    qa_general_prompt = PromptTemplate.from_template(QA_GENERAL_PROMPT) # Prompt para chequear si se requiere o no nueva búsqueda
-    generic_answer_prompt = PromptTemplate.from_template(GENERIC_ANSWER_PROMPT) # Prompt para responder a la consulta SQL 
-    check_query_prompt = PromptTemplate.from_template(CHECK_QUERY_PROMPT) # Prompt para indicar al cliente que es necesaria más información.
-    broad_query_prompt = PromptTemplate.from_template(BROAD_QUERY_PROMPT)
-    specific_answer_prompt = PromptTemplate.from_template(SPECIFIC_ANSWER_PROMPT)
-    qa_tool_explanation_prompt = PromptTemplate.from_template(QA_TOOL_EXPLANATION)
-    financial_info_prompt = PromptTemplate.from_template(FINANCIAL_INFO_PROMPT)
-    more_info_prompt = PromptTemplate.from_template(MORE_INFO_PROMPT)
-    financial_parser_prompt = PromptTemplate.from_template(FINANCIAL_PARSER_PROMPT)
+    # Las secciones fijas de cada plantilla se colocan al inicio del prompt (ver prompt_assembly)
+    text2sql_prompt  = build_prompt("text2sql_chain", GENERATE_SQL_QUERY_PROMPT, dialect=dialect)
+    qa_general_prompt = build_prompt("qa_general_chain", QA_GENERAL_PROMPT) # Prompt para chequear si se requiere o no nueva búsqueda
+    generic_answer_prompt = build_prompt("generic_answer_chain", GENERIC_ANSWER_PROMPT) # Prompt para responder a la consulta SQL 
+    check_query_prompt = build_prompt("missing_fields_chain", CHECK_QUERY_PROMPT) # Prompt para indicar al cliente que es necesaria más información.
+    broad_query_prompt = build_prompt("broad_query_chain", BROAD_QUERY_PROMPT, dialect=dialect)
+    specific_answer_prompt = build_prompt("specific_answer_chain", SPECIFIC_ANSWER_PROMPT)
+    qa_tool_explanation_prompt = build_prompt("qa_tool_explanation_chain", QA_TOOL_EXPLANATION)
+    financial_info_prompt = build_prompt("financial_info_chain", FINANCIAL_INFO_PROMPT, format_instructions=financial_parser.get_format_instructions())
+    more_info_prompt = build_prompt("more_info_chain", MORE_INFO_PROMPT)
+    financial_parser_prompt = build_prompt("financial_parser_chain", FINANCIAL_PARSER_PROMPT, format_instructions=financial_parser.get_format_instructions())
+    comparison_prompt = build_prompt("comparison_chain", COMPARISON_PROMPT)
 
 
     # ------CADENAS------
     # Cadena general para conocer las intenciones del usuario: si desea una nueva búsqueda o más información sobre un inmueble ya localizado.
-    qa_general_chain = qa_general_prompt | qa_general_llm | StrOutputParser()
+    qa_general_chain = qa_general_prompt | generate_chain_llm("qa_general_chain") | StrOutputParser()
 
     # Cadena para resolver dudas acerca del procedimiento de búsqueda de inmuebles
-    qa_tool_explanation_chain = qa_tool_explanation_prompt | qa_general_llm | StrOutputParser()
+    qa_tool_explanation_chain = qa_tool_explanation_prompt | generate_chain_llm("qa_tool_explanation_chain") | StrOutputParser()
 
     # Cadena text2sql con un parsing final para evitar consultas SQL sintácticamente incorrectas
-    text2sql_chain = text2sql_prompt | text2sql_llm | RunnableLambda(parsing_sql_query)
+    text2sql_chain = text2sql_prompt | generate_chain_llm("text2sql_chain") | RunnableLambda(parsing_sql_query)
+    text2sql_chain_fast = text2sql_prompt | generate_chain_llm("text2sql_chain", tier="small") | RunnableLambda(parsing_sql_query)
 
     # Cadena cuando falta en la consulta SQL alguno de los campos requeridos 
-    missing_fields_chain = check_query_prompt | check_llm | StrOutputParser()
+    missing_fields_chain = check_query_prompt | generate_chain_llm("missing_fields_chain") | StrOutputParser()
 
     # Cadena para responder al usuario sobre la recuperación (exitosa o no) de resultados
-    generic_answer_chain = generic_answer_prompt | text2sql_llm | StrOutputParser()
+    generic_answer_chain = generic_answer_prompt | generate_chain_llm("generic_answer_chain") | StrOutputParser()
+    generic_answer_chain_fast = generic_answer_prompt | generate_chain_llm("generic_answer_chain", tier="small") | StrOutputParser()
 
     # Cadena para presentar información detallada de un solo Inmueble.
-    specific_answer_chain = specific_answer_prompt | text2sql_llm | StrOutputParser()
+    specific_answer_chain = specific_answer_prompt | generate_chain_llm("specific_answer_chain") | StrOutputParser()
+    specific_answer_chain_fast = specific_answer_prompt | generate_chain_llm("specific_answer_chain", tier="small") | StrOutputParser()
 
     # Consulta para generar una nueva consulta SQL más laxa cuando no se han encontrado datos
-    broad_query_chain = broad_query_prompt | text2sql_llm |  RunnableLambda(parsing_sql_query)
+    broad_query_chain = broad_query_prompt | generate_chain_llm("broad_query_chain") |  RunnableLambda(parsing_sql_query)
 
     # Cadena para solicitar al usuario algo más de información sobre el inmueble
-    more_info_chain = more_info_prompt | text2sql_llm | StrOutputParser()
+    more_info_chain = more_info_prompt | generate_chain_llm("more_info_chain") | StrOutputParser()
 
     # Cadena para consultar la sitación financiera
-    financial_info_chain = financial_info_prompt | text2sql_llm | StrOutputParser()
+    financial_info_chain = financial_info_prompt | generate_chain_llm("financial_info_chain") | StrOutputParser()
 
     # Cadena para parser la información financiera la situación financiera del inmueble
-    financial_parser = PydanticOutputParser(pydantic_object=FinancialSituation)
-    financial_parser_chain = financial_parser_prompt | text2sql_llm | financial_parser
+    financial_parser_chain = financial_parser_prompt | generate_chain_llm("financial_parser_chain") | financial_parser
+
+    # Cadena para comentar la tabla comparativa de varios inmuebles. Solo recibe las diferencias, no los inmuebles completos
+    comparison_chain = comparison_prompt | generate_chain_llm("comparison_chain") | StrOutputParser()
 
 
 
@@ -139,9 +161,82 @@ class QAChain:
     present_instructions = tool_instructions["present_chain"]
 
 
+    #------ACUMULACIÓN DEL INPUT------
+    @staticmethod
+    def buffer(input: str) -> str:
+        """Input acumulado mientras faltan campos. Se limita en tokens conservando los mensajes más recientes."""
+        return truncate_tokens(input, settings.memory.buffer_max_tokens, keep="end")
+
+
+    @classmethod
+    async def pregenerate_presentation(cls, selected_inm: Dict, inm_id: int, user_name: str = None) -> str:
+        """Presentación detallada de un inmueble generada por adelantado (precarga especulativa)."""
+        return await cls.specific_answer_chain.ainvoke({
+            "user_name": user_name,
+            "input": "Preséntame este inmueble",
+            "selected_inm": serialize_property(selected_inm, inm_id),
+            "instruction": next(item["description"] for item in cls.present_instructions if item["key"] == "to_present"),
+        })
+
+
+    #------COMPARACIÓN DE INMUEBLES------
+    @classmethod
+    async def compare(cls, input: str, inm_ids: List[int], rows: Dict[int, Dict], user_name: str = None, deadline: Deadline = None) -> AsyncGenerator[str, None]:
+        """
+        Compara inmuebles ya mostrados. La tabla se construye localmente y se envía como evento estructurado; el texto es un
+        comentario breve del LLM a partir de las diferencias o, sin tiempo o en modo plantilla, una frase fija.
+            - inm_ids (List[int]): inmuebles a comparar, en el orden en que los menciona el usuario.
+            - rows (Dict[int, Dict]): filas del catálogo de los inmuebles ya recuperadas, por ID.
+        """
+        deadline = deadline or Deadline.unlimited()
+        table = build_comparison(rows, inm_ids)
+        yield {"type": "metadata", "key": "comparison", "content": {"ids": inm_ids, "rows": [row["key"] for row in table["rows"]]}}
+
+        async def narrative():
+            if not use_template("comparison_chain") and deadline.allows(settings.deadline.llm_reply_min_s):
+                comparison_dict = {"user_name": user_name, "input": input, "comparison": comparison_diff(table)}
+                async for partial_message in deadline.stream(cls.comparison_chain.astream(comparison_dict), "comparison"):
+                    yield {"type": "text", "content": partial_message}
+            else:
+                yield {"type": "text", "content": render_response("comparison_chain", user_name=user_name, count=len(inm_ids))}
+                yield {"type": "metadata", "key": "response_source", "content": "template"}
+            yield {"type": "metadata", "key": "chain", "content": "comparison_chain"}
+
+        structured = [layout({"type": "function", "content": "propertyComparison", "input": table}, "comparison", "before_text")]
+        async for message in with_results(structured, narrative()):
+            yield message
+
+
+    #------BÚSQUEDA SEMÁNTICA EN LAS DESCRIPCIONES------
+    @classmethod
+    async def description_search(cls, input: str, query: str, qa_tool: QAToolModel, deadline: Deadline) -> Optional[Tuple[str, List]]:
+        """
+        Alternativa local a la ampliación por LLM cuando la consulta no tiene resultados: se relajan las características
+        descriptivas, los filtros estrictos (y la zona, si la hay) dan los candidatos y estos se ordenan por la similitud
+        de su descripción con la petición ('description_search').
+        Devuelve la consulta relajada y las filas en orden de similitud, o None si no hay nada que presentar.
+        """
+        candidates_query = relax_query(query, ID_COLUMN)
+        if candidates_query is None:
+            return None
+        if qa_tool.inm_localization:
+            candidates_query = add_geospatial_filter(candidates_query, qa_tool.inm_localization)
+        candidates = [row[ID_COLUMN] for row in execute_sql_query(candidates_query) or []]
+        if not candidates:
+            return None
+
+        ranked = await DescriptionSearch.rank(input, candidates, deadline=deadline)
+        logger.info(f"Description search: {len(candidates)} candidates, {len(ranked)} ranked {ranked}")
+        if not ranked:
+            return None
+        order = {inm_id: position for position, (inm_id, _) in enumerate(ranked)}
+        rows = execute_sql_query(f"SELECT * FROM {table_name} WHERE {ID_COLUMN} IN ({', '.join(str(inm_id) for inm_id in order)})") or []
+        return relax_query(query), sorted(rows, key=lambda row: order[row[ID_COLUMN]])
+
+
     #------EJECUCIÓN DE LA HERRAMIENTA------
     @classmethod
-    async def execute(cls, input: str, qa_tool: QAToolModel, user_name: str = None) -> AsyncGenerator[str, None]:
+    async def execute(cls, input: str, qa_tool: QAToolModel, user_name: str = None, deadline: Deadline = None) -> AsyncGenerator[str, None]:
         """
         Esta función coordina toda la herramienta de QA. En pocas palabras, la herramienta se ejecuta en dos pasos. Por un lado una búsqueda preliminar de varios inmuebles de acuerdo a la consulta del usuario. Luego el usuario puede demandar una nueva búsqueda o ampliar la información de los inmuebles presentados.
         Esta función contiene cuatro posibles generadores: para la presentación específica de un inmueble, para consultas de un inmueble ya presentado, para la presentación general de varios inmuebles y para indicar al usuario la necesidad de incorporar más datos a la búsqueda.
@@ -149,24 +244,29 @@ class QAChain:
             - user_name (str): nombre indicado por el usuario. Para referencias personalizadas.
             - qa_tool (QAToolModel): modelo pydantic para la gestión de toda la herramienta QA.
                 - last
+            - deadline (Deadline): presupuesto de tiempo del turno. Con poco tiempo se usan alternativas más baratas.
         Devuelve un generador asincrónico.
         """
+        deadline = deadline or Deadline.unlimited()
 
         print(f"ÚLTIMA CONSULTA: {qa_tool.last_query}")
-        input = qa_tool.buffer_input + " \n" + input # Input combinado con buffer
+        input = f"{qa_tool.buffer_input}\n{input}" if qa_tool.buffer_input else input # Input combinado con buffer
         original_query = "" # Consulta SQL generada y limpiada
         missing_fields = "" # Campos faltantes
         # Comprobamos si la info sobre situación financiera está completa
-        ask_financial_situation = False
-        financial_situation_complete = False
-        if ask_financial_situation:
-            financial_info: FinancialSituation = await cls.financial_parser_chain.ainvoke({"input":input, "format_instructions": cls.financial_parser.get_format_instructions()})
+        # Basta con que el usuario haya respondido una vez: con datos parciales se calculan los topes posibles y no se repite la pregunta
+        financial_situation_complete = qa_tool.financial_info is not None
+        if qa_tool.financial_asked and not financial_situation_complete:
+            try:
+                financial_info: FinancialSituation = await deadline.run(cls.financial_parser_chain.ainvoke({"input":input}), "financial_parser")
+            except Exception as e:
+                logger.warning(f"Financial situation could not be parsed: {e}")
+                financial_info = FinancialSituation()
             qa_tool.financial_info = financial_info
+            qa_tool.financial_asked = False
+            financial_situation_complete = True
             print(f"Situación financiera: {financial_info}")
-            if not any(value is None for value in qa_tool.financial_info.model_dump().values()):
-                financial_situation_complete = True                
-        else:
-            ask_financial_situation = False
+            yield {"type": "metadata", "key": "financial_info", "content": financial_info.model_dump()}
         
         # ------PASO 1: DETECCIÓN DE LA INTENCIÓN DEL USUARIO------
         # Ejecutamos la cadena general siempre que se haya presentado previamente algún inmueble (qa_tool.searched_inms). Esta consulta permite discriminar si el usuario demanda una nueva búsqueda o más información sobre un piso ya presentado.
@@ -175,7 +275,9 @@ class QAChain:
 
             # ----RECUPERAMOS DATOS DE LOS INMUEBLES BUSCADOS
             try:
-                list_inm_id: list = [id for id in qa_tool.searched_inms]
+                # Solo los inmuebles buscados más recientes (y los ya presentados) se recuperan e incluyen en el prompt
+                recent_inm_id: list = qa_tool.searched_inms[-settings.prompt.max_recent_properties:]
+                list_inm_id: list = list(dict.fromkeys(recent_inm_id + qa_tool.presented_inms))
                 print(f"IDS YA BUSCADOS: {list_inm_id}")
                 last_searched_query: str = generate_sql_ids(list_inm_id)  # Consulta a la base de datos con los IDs buscados
                 last_searched_result: List[sqlite3.Row] = execute_sql_query(last_searched_query)
@@ -188,19 +290,47 @@ class QAChain:
                 logger.error(f"Unspected error retriving searched properties: {e}")
                 raise Exception(f"ERROR: Unspected error retriving searched properties: {e}")
 
+            # ----COMPARACIÓN DE VARIOS INMUEBLES YA MOSTRADOS
+            # "¿Cuál es más grande, el primero o el tercero?": tabla local en lugar de 'qa_general_chain' + 'specific_answer_chain'
+            compared_ids = comparison_targets(input, last_searched_parsed, qa_tool.last_results or qa_tool.searched_inms, settings.comparison.max_properties) if settings.comparison.enabled else []
+            if compared_ids:
+                try:
+                    logger.info(f"IDS A COMPARAR: {compared_ids}")
+                    async for message in cls.compare(input, compared_ids, last_searched_parsed, user_name, deadline):
+                        yield message
+                    return
+
+                except Exception as e:
+                    logger.error(f"Unspected error in property comparison: {e}")
+                    raise Exception(f"ERROR: Unspected error in property comparison: {e}")
+
             try:
                 # ----CADENA PARA LA DETECCIÓN DE INMUEBLES O NUEVA BÚSQUEDA
                 # Esta cadena devuelve el ID al que el usuario hace referencia. También puede devolver "new" si se reclama una nueva búsqueda o "none" en caso de que no sea capaz de encontrar la referencia a ningún inmueble.
 
-                last_searched_filtered_str: str = json.dumps(last_searched_filtered)
-                general_result = await cls.qa_general_chain.ainvoke({"history_inm": last_searched_filtered_str, "input": input})
-                print(f"RESULTADO GENERAL: {general_result}")
-
-                if general_result == "new":
+                # Primero se intenta resolver la referencia localmente (ordinales, IDs, dirección, barrio, precio...). El LLM solo se usa si es ambigua.
+                resolution: Resolution = resolve_reference(input, last_searched_filtered, order=qa_tool.last_results or qa_tool.searched_inms, places=known_places()) if settings.resolver.enabled else Resolution()
+                general_result = None
+                if not resolution.resolved or settings.resolver.shadow:
+                    last_searched_filtered_str: str = serialize_properties(last_searched_filtered, order=qa_tool.searched_inms, pinned=qa_tool.presented_inms)
+                    try:
+                        general_result = await deadline.run(cls.qa_general_chain.ainvoke({"history_inm": last_searched_filtered_str, "input": input}), "qa_general")
+                    except DeadlineExceeded:
+                        general_result = "" # Se toma el último inmueble presentado o buscado
+                print(f"RESULTADO GENERAL: {general_result} | RESOLUCIÓN LOCAL: {resolution}")
+                yield {"type": "metadata", "key": "reference_resolution", "content": {
+                    "chain": "qa_general_chain", "method": resolution.method, "resolved_id": resolution.inm_id,
+                    "llm_result": general_result, "candidates": list(last_searched_filtered.keys()), "order": qa_tool.last_results or qa_tool.searched_inms,
+                }}
+
+                if resolution.resolved:
+                    selected_id = resolution.inm_id
+
+                elif general_result == "new":
                     new_search = True
 
                 else:
-                    match = re.search(r'\d+', general_result) 
+                    match = re.search(r'\d+', general_result or "") 
                     if match:
                         selected_id = int(match.group())
                     elif qa_tool.presented_inms:
@@ -223,7 +353,7 @@ class QAChain:
                     selected_searched_parsed: Dict[str, str] = selected_inm_tuple[0] # Datos del inmueble parseados y enriquecidos
 
                     
-                    selected_searched_parsed_str = json.dumps(selected_searched_parsed)
+                    selected_searched_parsed_str: str = serialize_property(selected_searched_parsed, selected_id)
                     
                     specific_present_dict = {
                         "user_name": user_name,
@@ -237,7 +367,8 @@ class QAChain:
                         )
                     )
 
-                    async for partial_message in cls.specific_answer_chain.astream(specific_present_dict):
+                    specific_answer_chain = deadline.pick(cls.specific_answer_chain, cls.specific_answer_chain_fast, "specific_answer", settings.deadline.large_model_min_s)
+                    async for partial_message in deadline.stream(specific_answer_chain.astream(specific_present_dict), "specific_answer"):
                             yield {"type": "text", "content": partial_message}
                     yield {"type": "metadata", "key": "chain", "content": "specific_answer_chain"}
 
@@ -254,8 +385,15 @@ class QAChain:
 
                     # ----AÑADIMOS INFORMACIÓN ADICIONAL AL INMUEBLE PRESENTADO
                     print(f"ID A PRESENTAR: {selected_id}")
-                    selected_searched_parsed: Dict[str, str] = last_searched_filtered.get(selected_id) # Resultados parseados por columna (columnas de presentacion)
-                    selected_inm_tuple: tuple[Dict, str, str, List[str], tuple[float, float]] = specific_presentation_dict(selected_searched_parsed, selected_id)
+                    # Datos precargados tras la presentación general (fotos ya comprobadas) o, si no los hay, se calculan ahora
+                    turn = current_turn()
+                    prefetched_detail, prefetched_text = await PropertyPrefetcher.get(turn.session_id if turn else None, selected_id)
+                    yield {"type": "metadata", "key": "prefetch", "content": {"hit": prefetched_detail is not None, "text": prefetched_text is not None}}
+                    if prefetched_detail:
+                        selected_inm_tuple: tuple[Dict, str, str, List[str], tuple[float, float]] = prefetched_detail
+                    else:
+                        selected_searched_parsed: Dict[str, str] = last_searched_filtered.get(selected_id) # Resultados parseados por columna (columnas de presentacion)
+                        selected_inm_tuple: tuple[Dict, str, str, List[str], tuple[float, float]] = specific_presentation_dict(selected_searched_parsed, selected_id)
                     selected_searched_parsed: Dict[str, str] =  selected_inm_tuple[0] # Datos del inmueble parseados y enriquecidos
                     url_inm: str = selected_inm_tuple[1] 
                     main_photo: str = selected_inm_tuple[2]
@@ -265,7 +403,7 @@ class QAChain:
                     specific_present_dict = {
                         "user_name": user_name,
                         "input": input,
-                        "selected_inm": selected_searched_parsed
+                        "selected_inm": serialize_property(selected_searched_parsed, selected_id)
                     }
 
                     specific_present_dict["instruction"] = (
@@ -276,23 +414,46 @@ class QAChain:
 
                     # ---- IMAGENES DEL INMUEBLE
                     if main_photo:
-                        yield {"type": "image", "content": main_photo}
+                        yield layout({"type": "image", "content": main_photo}, "gallery", "before_text")
 
                     if url_photos_inm:
                         for url in url_photos_inm:
-                            yield {"type": "image", "content": url}
+                            yield layout({"type": "image", "content": url}, "gallery", "before_text")
 
                     # ----PRESENTACIÓN TEXTUAL DEL INMUEBLE
-                    async for partial_message in cls.specific_answer_chain.astream(specific_present_dict):
-                            yield {"type": "text", "content": partial_message}
-                    yield {"type": "metadata", "key": "chain", "content": "specific_answer_chain"}
+                    async def narrative():
+                        # El resumen precalculado y la presentación pregenerada no tienen en cuenta la petición: solo se usan si
+                        # la petición se limita a pedir la presentación del inmueble, sin preguntar por ningún aspecto concreto
+                        if presentation_only(input, selected_searched_parsed):
+                            summary = stored_summary(selected_id, selected_searched_parsed) if settings.property_summaries.serve_stored else None
+                            if summary:
+                                yield {"type": "text", "content": render_response("property_summary_intro", user_name=user_name) + "\n\n"} # render_response recorta los saltos de línea
+                                for paragraph in re.split(r"(?<=\n\n)", summary.strip()):
+                                    yield {"type": "text", "content": paragraph}
+                                yield {"type": "metadata", "key": "chain", "content": "property_summary_chain"}
+                                yield {"type": "metadata", "key": "response_source", "content": "stored_summary"}
+                                return
+                            if prefetched_text:
+                                yield {"type": "text", "content": prefetched_text}
+                                yield {"type": "metadata", "key": "chain", "content": "specific_answer_chain"}
+                                yield {"type": "metadata", "key": "response_source", "content": "prefetch"}
+                                return
+                        specific_answer_chain = deadline.pick(cls.specific_answer_chain, cls.specific_answer_chain_fast, "specific_answer", settings.deadline.large_model_min_s)
+                        async for partial_message in deadline.stream(specific_answer_chain.astream(specific_present_dict), "specific_answer"):
+                                yield {"type": "text", "content": partial_message}
+                        yield {"type": "metadata", "key": "chain", "content": "specific_answer_chain"}
 
                     # ----URL Y LOCALIZACIÓN DEL INMUEBLE
+                    # Ya están disponibles: con 'results_first' se envían antes del texto y se maquetan después de él
+                    structured = []
                     if url_inm:
-                        yield {"type": "url", "content": url_inm}
+                        structured.append(layout({"type": "url", "content": url_inm}, "link"))
 
                     if localization_inm:
-                        yield {"type": "coord", "content": localization_inm}
+                        structured.append(layout({"type": "coord", "content": localization_inm}, "map"))
+
+                    async for message in with_results(structured, narrative()):
+                        yield message
 
                     qa_tool.presented_inms.append(selected_id)
 
@@ -306,11 +467,15 @@ class QAChain:
         # Este paso es realmente el primero en ejecutarse en el primer flujo de esta herramienta.
         query = ""
         try:
+            # ------ SELECCIÓN DEL ESQUEMA RELEVANTE
+            schema = await select_schema(input, qa_tool.last_query)
+            logger.info(f"Schema selection: {len(schema.columns)} columns, confidence {schema.confidence:.2f}, full={schema.full_schema}")
+            yield {"type": "metadata", "key": "schema_columns", "content": schema.columns}
+
             # ------ INPUT PROMPT DE GENERACIÓN DE LA CONSULTA SQL
             text2sql = { # Diccionario de entrada para la cadena de generación de consultas SQL
                 "input": json.dumps({"text": input, "query": qa_tool.last_query}),
-                "dialect": cls.dialect,
-                "table_info": cls.table_info,
+                "table_info": schema.table_info,
             }
             text2sql["last_result_instruct"] = (
                 next(
@@ -319,10 +484,16 @@ class QAChain:
             )
 
             # ------ GENERACIÓN DE LA CONSULTA SQL
-            query: str = await cls.text2sql_chain.ainvoke(text2sql) 
+            text2sql_chain = deadline.pick(cls.text2sql_chain, cls.text2sql_chain_fast, "text2sql", settings.deadline.large_model_min_s)
+            query: str = await deadline.run(text2sql_chain.ainvoke(text2sql), "text2sql")
             yield {"type": "metadata", "key": "sql_query", "content": query}
             print(f"CONSULTA SQL PURA: {query}")
 
+        except DeadlineExceeded:
+            yield {"type": "text", "content": render_response("deadline_exceeded", user_name=user_name)}
+            yield {"type": "metadata", "key": "response_source", "content": "template"}
+            return
+
         except Exception as e:
             logger.error(f"Unexpected error in query generation: {e}")
             raise Exception(f"ERROR: Unexpected error in query generation: {e}")
@@ -364,18 +535,28 @@ class QAChain:
         # ------ DEMANDA DE CAMPOS FALTANTES
         if qa_tool.missing_fields:
             try:
-                qa_tool.buffer_input = input # Añadimos el input al buffer para acumularlo en el próximo flujo
-                
-                async for partial_message in cls.missing_fields_chain.astream({"input": input, "missing_fields": str(qa_tool.missing_fields)}):
-                    yield {"type": "text", "content": partial_message}
-                yield {"type": "metadata", "key": "chain", "content": "missing_fields_chain"}
+                qa_tool.buffer_input = cls.buffer(input) # Añadimos el input al buffer para acumularlo en el próximo flujo
 
+                async def narrative():
+                    if use_template("missing_fields_chain"):
+                        missing_labels = missing_field_labels(qa_tool.missing_fields)
+                        yield {"type": "text", "content": render_response("missing_fields_chain", user_name=user_name, missing_labels=missing_labels)}
+                        yield {"type": "metadata", "key": "response_source", "content": "template"}
+                    else:
+                        async for partial_message in deadline.stream(cls.missing_fields_chain.astream({"input": input, "missing_fields": str(qa_tool.missing_fields)}), "missing_fields"):
+                            yield {"type": "text", "content": partial_message}
+                    yield {"type": "metadata", "key": "chain", "content": "missing_fields_chain"}
+
+                structured = []
                 is_localization = reclame_localization(qa_tool.missing_fields)
                 print(f"DEBUG: {is_localization}")
                 if not qa_tool.inm_localization and is_localization:
                     city_location: tuple = city_localization(original_query) # Recuperamos las coordenadas de la población de referencia
                     print(f"DEBUG: {city_location}")
-                    yield {"type": "function", "content": "generateMapLocalization", "input": city_location}
+                    structured.append(layout({"type": "function", "content": "generateMapLocalization", "input": city_location}, "map"))
+
+                async for message in with_results(structured, narrative()):
+                    yield message
             
             except Exception as e:
                 logger.error(f"Unexpected error in missing fields feedback: {e}")
@@ -385,8 +566,8 @@ class QAChain:
         elif not qa_tool.more_info:
             print("ENTRAMOS EN MORE INFO")
             try:
-                qa_tool.buffer_input = input
-                async for partial_message in cls.more_info_chain.astream({"input": input, "user_name": user_name}):
+                qa_tool.buffer_input = cls.buffer(input)
+                async for partial_message in deadline.stream(cls.more_info_chain.astream({"input": input, "user_name": user_name}), "more_info"):
                     yield {"type": "text", "content": partial_message}
                 yield {"type": "metadata", "key": "chain", "content": "more_info_chain"}
                 qa_tool.more_info = True
@@ -399,9 +580,9 @@ class QAChain:
         elif not financial_situation_complete:
             print("ENTRAMOS EN SITUACIÓN FINANCIERA")
             try:
-                ask_financial_situation = True
-                qa_tool.buffer_input = input
-                async for partial_message in cls.financial_info_chain.astream({"input": input, "format_instructions": cls.financial_parser.get_format_instructions()}):
+                qa_tool.financial_asked = True
+                qa_tool.buffer_input = cls.buffer(input)
+                async for partial_message in deadline.stream(cls.financial_info_chain.astream({"input": input}), "financial_info"):
                     yield {"type": "text", "content": partial_message}
                 yield {"type": "metadata", "key": "chain", "content": "more_info_chain"}
                 qa_tool.more_info = True
@@ -413,31 +594,73 @@ class QAChain:
             
         # ------ EJECUCIÓN Y PRESENTACIÓN DE RESULTADOS
         else:
-            async for partial_message in cls.direct_execute(input, qa_tool, user_name):
+            async for partial_message in cls.direct_execute(input, qa_tool, user_name, deadline):
                 yield partial_message
             
 
     @classmethod
-    async def direct_execute(cls, input: str, qa_tool: QAToolModel, user_name: str = None) -> AsyncGenerator[str, None]:
+    async def direct_execute(cls, input: str, qa_tool: QAToolModel, user_name: str = None, deadline: Deadline = None) -> AsyncGenerator[str, None]:
         """
         Esta función asume que la consulta SQL esta totalmente bien formada y directamente la ejecuta, tras lo cual se realiza la presentación general de los inmuebles localizados.
         """
+        deadline = deadline or Deadline.unlimited()
         query = qa_tool.last_modify_query
-        input = qa_tool.buffer_input + " \n" + input # Input combinado con buffer
+        input = f"{qa_tool.buffer_input}\n{input}" if qa_tool.buffer_input else input # Input combinado con buffer
         qa_tool.buffer_input = ""
+
+        # Limitamos el precio a lo que el usuario puede permitirse según su situación financiera (cálculo local, sin LLM)
+        if settings.affordability.enabled and qa_tool.financial_info:
+            caps: AffordabilityCaps = affordability_caps(qa_tool.financial_info)
+            query = apply_affordability(query, caps)
+            yield {"type": "metadata", "key": "affordability", "content": caps.as_dict()}
+            logger.info(f"CONSULTA SQL CON TOPES DE PRECIO: {query}")
         qa_tool.more_info = False
-        results = ""
+
+        # ----- ULTIMOS AÑADIDOS A LA CONSULTA
+        # Se añaden antes de ejecutarla: la comprobación de resultados usa la misma consulta que se presenta
+        final_query = query
+        try:
+            # Añadimos búsqueda geoespacial (solo para web)
+            if qa_tool.inm_localization:
+                final_query = add_geospatial_filter(final_query, qa_tool.inm_localization)
+
+            # Añadimos cláusula de filtrado y orden
+            final_query = modify_sql_prioridadrk(final_query)
+
+            results = execute_sql_query(final_query)
+            logger.info(f"RESULTADO DE LA CONSULTA: {results}")
+
+        except Exception as e:
+                logger.error(f"Unexpected error in query adaptation: {e}")
+                raise Exception(f"Unexpected error in query adaptation: {e}")
+        checked_results = bool(results)
 
         # ------PASO 6: AMPLIACIÓN DE CONSULTA SQL SI NO HAY RESULTADOS------
         modified_query = query
+
+        # Primero, sin LLM: inmuebles que cumplen los filtros estrictos ordenados por su descripción
+        semantic_results = None
+        if not results and settings.description_search.enabled:
+            try:
+                semantic_results = await cls.description_search(input, query, qa_tool, deadline)
+            except Exception as e:
+                logger.error(f"Unexpected error in description search: {e}")
+            if semantic_results:
+                modified_query, results = semantic_results
+                yield {"type": "metadata", "key": "description_search", "content": {"query": modified_query, "results": len(results)}}
+
         if not results:
             try:
                 alt_query_dict = {}
-                alt_query_dict["dialect"] = cls.dialect
 
                 num_limit_searches = 5
                 while num_limit_searches>0:
 
+                    # Cada ampliación es una llamada al LLM: se omite si no queda tiempo suficiente
+                    if not deadline.allows(settings.deadline.relaxation_min_s):
+                        deadline.degrade("skip_relaxation")
+                        break
+
                     alt_query_dict["last_query"] = modified_query
                     
                     # ------ GENERAMOS UNA CONSULTA ALTERNATIVA
@@ -446,7 +669,10 @@ class QAChain:
 
                     alt_query_dict["remove_column"] = column_to_remove
 
-                    alt_query: str = await cls.broad_query_chain.ainvoke(alt_query_dict)
+                    try:
+                        alt_query: str = await deadline.run(cls.broad_query_chain.ainvoke(alt_query_dict), "broad_query")
+                    except DeadlineExceeded:
+                        break
 
                     print(f"CONSULTA AMPLIADA: {alt_query}")
 
@@ -464,22 +690,20 @@ class QAChain:
                 raise Exception(f"ERROR: Unexpected error in broad query loop: {e}")
             
 
-         # ----- ULTIMOS AÑADIDOS A LA CONSULTA
-        try:
-            # Añadimos búsqueda geoespacial (solo para web)
-            if qa_tool.inm_localization:
-                query = add_geospatial_filter(query, qa_tool.inm_localization)
-                qa_tool.inm_localization = None
-
-            # Añadimos cláusula de filtrado y orden
-            query = modify_sql_prioridadrk(query)
-
-            results = execute_sql_query(query)
-            print(f"RESULTADO FINAL: {results}")
+        # ----- CONSULTA FINAL
+        # Los resultados de la búsqueda semántica ya están filtrados por zona y ordenados por similitud; si la consulta
+        # tenía resultados, ya se han obtenido en la comprobación
+        qa_tool.inm_localization = None
+        if not semantic_results:
+            query = final_query
+        if not semantic_results and not checked_results:
+            try:
+                results = execute_sql_query(final_query)
+                logger.info(f"RESULTADO FINAL: {results}")
 
-        except Exception as e:
-                logger.error(f"Unexpected error in query adaptation: {e}")
-                raise Exception(f"Unexpected error in query adaptation: {e}")
+            except Exception as e:
+                    logger.error(f"Unexpected error in query adaptation: {e}")
+                    raise Exception(f"Unexpected error in query adaptation: {e}")
 
 
         # ------PASO 7: PRESENTACIÓN GENÉRICA DE INMUEBLES ------
@@ -489,6 +713,7 @@ class QAChain:
                 # ------ LIMPIEZA DE LOS RESULTADOS
                 data_results: Dict[int, Dict] = general_presentation_dict(results)
                 qa_tool.searched_inms.extend(data_results.keys()) # Añadimos el ID a la lista inmuebles buscados
+                qa_tool.last_results = list(data_results.keys()) # Orden de presentación para las referencias ordinales ("el segundo")
                 data_results_content: List[Dict] = list(data_results.values())
                 yield {"type": "metadata", "key": "modified_sql_query", "content": {"query": modified_query, "results": json.dumps(data_results)}}
 
@@ -531,13 +756,30 @@ class QAChain:
             logger.info(f"CONSULTA DEFINITIVA: {modified_query}")
 
             # ------ CADENA DE PRESENTACIÓN GENÉRICA DE INMUEBLES
-            async for partial_message in cls.generic_answer_chain.astream(answer_dict):
-                yield {"type": "text", "content": partial_message}
-            yield {"type": "metadata", "key": "chain", "content": "generic_presentation_chain"}
-            
+            async def narrative():
+                if deadline.allows(settings.deadline.llm_reply_min_s):
+                    generic_answer_chain = deadline.pick(cls.generic_answer_chain, cls.generic_answer_chain_fast, "generic_answer", settings.deadline.large_model_min_s)
+                    async for partial_message in deadline.stream(generic_answer_chain.astream(answer_dict), "generic_answer"):
+                        yield {"type": "text", "content": partial_message}
+                else:
+                    # Sin tiempo para el LLM: resumen por plantilla de los resultados, que se muestran igualmente
+                    deadline.degrade("generic_answer_template")
+                    yield {"type": "text", "content": render_response("search_results_summary", count=len(data_results_content), relaxed=bool(results) and query!=modified_query)}
+                    yield {"type": "metadata", "key": "response_source", "content": "template"}
+                yield {"type": "metadata", "key": "chain", "content": "generic_presentation_chain"}
+
+            # Las tarjetas ya están disponibles: se envían antes que el texto del LLM (ver 'with_results')
+            structured = []
             if results:
                 print(f"RESULTADOS A DEVOLVER A LA PRESENTACIÓN: {data_results_content}")
-                yield {"type": "function", "content": "generalPresentation", "input": data_results_content}
+                structured.append(layout({"type": "function", "content": "generalPresentation", "input": data_results_content}, "cards"))
+
+            async for message in with_results(structured, narrative()):
+                yield message
+
+            # Precarga especulativa del detalle de los primeros inmuebles para el siguiente turno ("háblame del X")
+            if results:
+                await PropertyPrefetcher.schedule(list(data_results.keys()), lambda data, inm_id: cls.pregenerate_presentation(data, inm_id, user_name))
 
 
         except Exception as e:
@@ -1,39 +1,202 @@
-from langchain_core.runnables import RunnablePassthrough
+import asyncio
+import logging
+import re
+import threading
+import time
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from operator import itemgetter
 from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
 from src.utils.general_utilities import open_txt
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Optional, Tuple
 from src.config import RAG_CHAIN_PROMPT_dir, DB_DIR
-from src.logic.tool_config.base_models import generate_rag_llm
+from src.logic.tool_config.llm_policy import generate_chain_llm
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.template_responses import render_response
+from src.logic.tool_utilities.vector_store import current_index_dir, load_vector_store, index_version, read_vectors
+from src.logic.tool_utilities.hybrid_search import BM25Index, hybrid_rank, lexical_positions
+from src.logic.tool_utilities.embedding_cache import cached_embeddings
+from src.logic.tool_utilities.embedding_batcher import batched_embeddings, embedding_deadline
+from src.logic.tool_utilities.answer_cache import AnswerCache, cacheable_question
+from src.logic.tool_utilities.context_builder import build_context
+from src.core.settings import settings
+from src.utils.deadline import Deadline
+from src.utils.tokens import truncate_tokens
 
 #-------------------------------------------------------------------------------------------------
 
-
-RAG_CHAIN_PROMPT = open_txt(RAG_CHAIN_PROMPT_dir)
+logger = logging.getLogger(__name__)
 
 
 class RagChain:
+    """
+    Herramienta RAG. El índice vectorial se carga una sola vez por worker (en el arranque de la aplicación, ver 'lifespan')
+    y se comparte entre todas las peticiones:
+     - Se toma el input del usuario y se selecciona la información relevante.
+     - Esa información se pasa al retriever, que busca datos relevantes en la base de datos vectorial
+     - Con los fragmentos relevantes se construye un contexto comprimido ('context_builder'); si no hay ninguno se responde
+       por plantilla sin llamar al LLM
+     - Tanto el input del usuario como el contexto y el final del historial se pasan al prompt de RAG
+     - El prompt pasa a través de un modelo de lenguaje
+     - Finalmente, la respuesta se procesa como una cadena de texto que se puede mostrar o usar en la aplicación.
+    """
+
+    # ---- PLANTILLAS DE PROMPTS
+    RAG_CHAIN_PROMPT = open_txt(RAG_CHAIN_PROMPT_dir)
+
+    # ---- PROMPTS Y MODELOS
+    rag_prompt = build_prompt("rag_chain", RAG_CHAIN_PROMPT)
+    rag_llm = generate_chain_llm("rag_chain")
+    rag_llm_fast = generate_chain_llm("rag_chain", tier="small") # Variante para turnos con poco tiempo
+
+    # ---- ÍNDICE VECTORIAL Y CADENAS (se crean en 'load')
+    embeddings: Optional[Embeddings] = None # Caché de embeddings y agrupación de peticiones delante del modelo
+    vector_db: Optional[FAISS] = None
+    vectors: Optional[np.ndarray] = None # Vectores de los fragmentos ('vectors.npy' mapeado), para puntuar su relevancia
+    bm25: Optional[BM25Index] = None # Índice BM25 sobre los mismos fragmentos (solo con 'RAG_HYBRID')
+    index_version: Optional[str] = None # Versión del índice cargado (fecha de construcción del manifiesto)
+    answer_cache = AnswerCache(DB_DIR) # Respuestas a preguntas casi iguales, en memoria de cada worker (ver 'answer_cache')
+    rag_chain = None
+    rag_chain_fast = None
+    _load_lock = threading.Lock()
+
+
+    #------CARGA DEL ÍNDICE------
+    @classmethod
+    def load(cls) -> float:
+        """
+        Carga el índice (mapeado en memoria) y el docstore y construye las cadenas. Es síncrona: en el arranque se ejecuta
+        en un hilo. Incluye una búsqueda de calentamiento para que la primera consulta no pague la carga de páginas.
+        Devuelve los segundos empleados (0 si ya estaba cargado).
+        """
+        with cls._load_lock:
+            if cls.vector_db is not None:
+                return 0.0
+            start = time.perf_counter()
+            index_dir = current_index_dir(DB_DIR) # Todos los ficheros se leen de la misma versión publicada
+            version = index_version(index_dir)
+            embeddings = cached_embeddings(batched_embeddings(OpenAIEmbeddings(model=settings.rag.embedding_model)), settings.rag.embedding_model)
+            vector_db = load_vector_store(index_dir, embeddings)
+            vector_db.similarity_search_by_vector([0.0] * vector_db.index.d, k=1)
+            if settings.rag.hybrid:
+                positions = range(len(vector_db.index_to_docstore_id))
+                cls.bm25 = BM25Index([vector_db.docstore.search(vector_db.index_to_docstore_id[position]).page_content for position in positions])
+
+            vectors = read_vectors(index_dir)
+            if vectors is not None and len(vectors) != vector_db.index.ntotal:
+                logger.warning(f"RAG vectors file ({len(vectors)}) does not match the index ({vector_db.index.ntotal}), scores taken from the index")
+                vectors = None
+
+            cls.rag_chain = cls.rag_prompt | cls.rag_llm | StrOutputParser()
+            cls.rag_chain_fast = cls.rag_prompt | cls.rag_llm_fast | StrOutputParser()
+            cls.embeddings, cls.vector_db, cls.vectors, cls.index_version = embeddings, vector_db, vectors, version
+
+            elapsed = time.perf_counter() - start
+            logger.info(f"RAG index loaded in {elapsed:.2f}s: {vector_db.index.ntotal} vectors, mmap={settings.rag.mmap}, hybrid={cls.bm25 is not None}")
+            return elapsed
+
+
+    @classmethod
+    async def ensure_loaded(cls) -> None:
+        """Carga perezosa para procesos sin arranque de la aplicación (scripts, benchmarks)."""
+        if cls.vector_db is None:
+            await asyncio.to_thread(cls.load)
+
 
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        self.vector_db = FAISS.load_local(DB_DIR, self.embeddings, allow_dangerous_deserialization=True)
-        self.retriever = self.vector_db.as_retriever(search_kwargs={"k": 4}) # 4 documentos de texto a recuperar
-        self.rag_prompt = PromptTemplate.from_template(RAG_CHAIN_PROMPT)
-        self.rag_llm = generate_rag_llm()
+    #------RECUPERACIÓN DE DOCUMENTOS------
+    @classmethod
+    async def retrieve(cls, query: str, deadline: Optional[Deadline] = None, vector: Optional[List[float]] = None) -> Tuple[List[Document], List[Optional[float]], List[bool]]:
         """
-         - Se toma el input del usuario y se selecciona la información relevante.
-         - Esa información se pasa al retriever, que busca datos relevantes en la base de datos vectorial
-         - Tanto el input del usuario como los datos recuperados y el historial se pasan al prompt de RAG
-         - El prompt pasa a través de un modelo de lenguaje
-         - Finalmente, la respuesta se procesa como una cadena de texto que se puede mostrar o usar en la aplicación.
-         """
-        self.rag_chain = {"context": itemgetter("input") | self.retriever, "input": RunnablePassthrough(), "history": RunnablePassthrough()} | self.rag_prompt | self.rag_llm | StrOutputParser()
-
-
-    # FUNCIÓN PARA REALIZAR UNA CONSULTA RAG
-    async def query_rag(self, input: str, history: str, user_name: str) -> AsyncGenerator[str, None]:
-        async for message in self.rag_chain.astream({"input": input, "history": history}):
-            yield {"type": "text", "content": message}
\ No newline at end of file
+        El embedding de la consulta es asíncrono (y se agrupa con los de otras consultas concurrentes, salvo que el deadline
+        del turno no lo permita) y la búsqueda en FAISS, síncrona, se ejecuta en un hilo para no bloquear el bucle de eventos.
+        Devuelve los fragmentos, su similitud con la consulta y si BM25 los ha recuperado.
+        """
+        if vector is None:
+            with embedding_deadline(deadline):
+                vector = await cls.embeddings.aembed_query(query)
+        return await asyncio.to_thread(cls.search, query, vector)
+
+
+    @classmethod
+    def search(cls, query: str, vector: List[float]) -> Tuple[List[Document], List[Optional[float]], List[bool]]:
+        """Búsqueda vectorial o, con el índice BM25 cargado, híbrida (ver 'hybrid_search')."""
+        candidates = settings.rag.k if cls.bm25 is None else max(settings.rag.k, settings.rag.hybrid_candidates)
+        _, positions = cls.vector_db.index.search(np.array([vector], dtype="float32"), candidates)
+        sparse_positions = lexical_positions(query, cls.bm25)
+        ranked = hybrid_rank(query, positions[0].tolist(), cls.bm25, settings.rag.k, sparse_positions=sparse_positions)
+        documents = [cls.vector_db.docstore.search(cls.vector_db.index_to_docstore_id[position]) for position in ranked]
+        lexical = set(sparse_positions)
+        return documents, cls.scores(vector, ranked), [position in lexical for position in ranked]
+
+
+    @classmethod
+    def scores(cls, vector: List[float], positions: List[int]) -> List[Optional[float]]:
+        """
+        Similitud coseno de la consulta con cada fragmento. Los vectores se toman de 'vectors.npy' o, sin él, se reconstruyen
+        del índice; los índices que no lo permiten (IVF sin mapa directo) devuelven None y el fragmento no se descarta.
+        """
+        if cls.vectors is not None:
+            chunk_vectors = np.asarray(cls.vectors[positions], dtype="float32")
+        else:
+            try:
+                chunk_vectors = np.vstack([cls.vector_db.index.reconstruct(position) for position in positions]) if positions else np.zeros((0, len(vector)), dtype="float32")
+            except RuntimeError:
+                return [None] * len(positions)
+        query = np.asarray(vector, dtype="float32")
+        norms = np.linalg.norm(chunk_vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        return (chunk_vectors @ query / np.where(norms > 0, norms, 1.0)).tolist()
+
+
+    #------CONSULTA RAG------
+    @classmethod
+    async def query_rag(cls, input: str, history: str, user_name: str, deadline: Deadline = None) -> AsyncGenerator[str, None]:
+        deadline = deadline or Deadline.unlimited()
+        if not deadline.allows(settings.deadline.llm_reply_min_s):
+            deadline.degrade("rag_template")
+            yield {"type": "text", "content": render_response("deadline_exceeded", user_name=user_name)}
+            yield {"type": "metadata", "key": "response_source", "content": "template"}
+            return
+
+        await cls.ensure_loaded()
+
+        # ----CACHÉ SEMÁNTICA DE RESPUESTAS
+        # El embedding de la pregunta se reutiliza en la recuperación
+        vector = None
+        if settings.answer_cache.enabled and cacheable_question(input) and cls.answer_cache.usable(cls.index_version):
+            with embedding_deadline(deadline):
+                vector = await cls.embeddings.aembed_query(input)
+            hit = cls.answer_cache.lookup(vector)
+            if hit:
+                entry, similarity = hit
+                await cls.answer_cache.audit(input, entry, similarity)
+                for paragraph in re.split(r"(?<=\n\n)", entry.answer):
+                    yield {"type": "text", "content": paragraph}
+                yield {"type": "metadata", "key": "response_source", "content": "answer_cache"}
+                return
+
+        # ----CONTEXTO
+        documents, scores, lexical = await cls.retrieve(input, deadline, vector)
+        context = build_context(input, documents, scores, cls.bm25.idf if cls.bm25 else None, lexical)
+        yield {"type": "metadata", "key": "rag_context", "content": {"chunks": context.chunks, "sentences": context.sentences, "tokens": context.tokens}}
+        if context.empty and settings.rag.early_exit:
+            logger.info(f"RAG early exit: no lexical match and no chunk above {settings.rag.context_min_score} for '{input}' (best {max((score for score in scores if score is not None), default=None)})")
+            yield {"type": "text", "content": render_response("rag_no_context", user_name=user_name)}
+            yield {"type": "metadata", "key": "response_source", "content": "template"}
+            return
+
+        # ----GENERACIÓN
+        # Las preguntas que no dependen de la conversación se responden sin historial: la respuesta vale para cualquier
+        # usuario y se puede guardar en la caché aunque el turno no sea el primero (un saludo previo, otra consulta)
+        rag_chain = deadline.pick(cls.rag_chain, cls.rag_chain_fast, "rag", settings.deadline.large_model_min_s)
+        history = "" if vector is not None else truncate_tokens(history, settings.rag.history_max_tokens, keep="end")
+        inputs = {"input": input, "history": history, "context": context.text}
+        parts = []
+        async for message in deadline.stream(rag_chain.astream(inputs), "rag"):
+            parts.append(message)
+            yield {"type": "text", "content": message}
+
+        # Solo se guardan respuestas completas del modelo principal, y siempre generadas sin historial
+        if vector is not None and rag_chain is cls.rag_chain and "rag_truncated" not in deadline.degradations:
+            cls.answer_cache.store(input, vector, "".join(parts))
@@ -1,4 +1,3 @@
-from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import json
 from typing import AsyncGenerator, List, Dict, Any
@@ -9,6 +8,7 @@ from src.utils.general_utilities import open_txt, open_json
 from src.logic.qa_chain import QAChain
 from src.logic.rag_chain import RagChain
 from src.logic.visit_chain import VisitChain
+from src.logic.degraded_chain import DegradedChain
 from src.models.session import SessionModel
 from src.schemas.tools import RouterToolModel, QAToolModel, VisitToolModel
 from src.config import (
@@ -21,15 +21,17 @@ from src.config import (
     contact_info_json_dir,
     tool_instructions_dir,    
 )
-from src.logic.tool_config.base_models import generate_router_llm
+from src.logic.tool_config.llm_policy import generate_chain_llm, model_available, is_provider_error
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.template_responses import use_template, render_response, contact_context
+from src.logic.tool_utilities.history_window import format_history
+from src.core.settings import settings
+from src.utils.deadline import Deadline, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
 class Router_chain:
 
-    # ----  MODELOS DE LENGUAJE
-    llm = generate_router_llm()
-
     # ---- PLANTILLAS DE PROMPTS
     CLASSIFICATION_PROMPT = open_txt(CLASSIFICATION_PROMPT_dir)
     PRESENTATION_PROMPT = open_txt(PRESENTATION_PROMPT_dir)
@@ -38,43 +40,57 @@ class Router_chain:
     NAME_PROMPT = open_txt(NAME_PROMPT_dir)
     ANSWER_NAME_PROMPT = open_txt(ANSWER_NAME_PROMPT_dir)
 
-    # ---- PROMPTS
-    classification_prompt = PromptTemplate.from_template(CLASSIFICATION_PROMPT)
-    presentation_prompt = PromptTemplate.from_template(PRESENTATION_PROMPT)
-    contact_prompt = PromptTemplate.from_template(CONTACT_PROMPT)
-    off_topic_prompt = PromptTemplate.from_template(OFF_TOPIC_PROMPT)
-    name_prompt = PromptTemplate.from_template(NAME_PROMPT)
-    answer_name_prompt = PromptTemplate.from_template(ANSWER_NAME_PROMPT)
-
-    # ---- CADENAS 
-    classification_chain = classification_prompt | llm | StrOutputParser()   #Cadena clasificadora
-    presentation_chain = presentation_prompt | llm | StrOutputParser()  # Cadena de presentación
-    contact_chain = contact_prompt | llm | StrOutputParser()  # Cadena de información de contacto
-    off_topic_chain = off_topic_prompt | llm | StrOutputParser()  # Cadena de consultas ajenas a la app
-    name_chain = name_prompt | llm | StrOutputParser()  # Cadena para reconocimiento del nombre
-    answer_name_chain = answer_name_prompt | llm | StrOutputParser() # Cadena para contestar al nombre del usuario
-
     #---- INSTRUCCIONES DE LA CADENA ENRUTADORA
     try:
-        contact_info: str = json.dumps(open_json(contact_info_json_dir))
+        contact_data: Dict = open_json(contact_info_json_dir)
+        contact_info: str = json.dumps(contact_data)
 
         tool_instructions: List[Dict] = open_json(tool_instructions_dir).get("route_chain")
         
     except Exception as e:
             logger.error(f"Unexpected error in routing chain configuration: {e}")
             raise Exception(f"ERROR: Unexpected error in routing chain configuration: {e}")
-            
+
+    # ---- PROMPTS
+    # Las instrucciones de herramientas completas forman parte del prefijo estático. Las herramientas no disponibles
+    # en cada turno se excluyen mediante los valores válidos, que son dinámicos.
+    classification_prompt = build_prompt("classification_chain", CLASSIFICATION_PROMPT, tool_instructions=json.dumps(tool_instructions))
+    presentation_prompt = build_prompt("presentation_chain", PRESENTATION_PROMPT)
+    contact_prompt = build_prompt("contact_chain", CONTACT_PROMPT, contact_info=contact_info)
+    off_topic_prompt = build_prompt("off_topic_chain", OFF_TOPIC_PROMPT)
+    name_prompt = build_prompt("name_chain", NAME_PROMPT)
+    answer_name_prompt = build_prompt("answer_name_chain", ANSWER_NAME_PROMPT)
+
+    # ---- CADENAS 
+    classification_chain = classification_prompt | generate_chain_llm("classification_chain") | StrOutputParser()   #Cadena clasificadora
+    presentation_chain = presentation_prompt | generate_chain_llm("presentation_chain") | StrOutputParser()  # Cadena de presentación
+    contact_chain = contact_prompt | generate_chain_llm("contact_chain") | StrOutputParser()  # Cadena de información de contacto
+    off_topic_chain = off_topic_prompt | generate_chain_llm("off_topic_chain") | StrOutputParser()  # Cadena de consultas ajenas a la app
+    name_chain = name_prompt | generate_chain_llm("name_chain") | StrOutputParser()  # Cadena para reconocimiento del nombre
+    answer_name_chain = answer_name_prompt | generate_chain_llm("answer_name_chain") | StrOutputParser() # Cadena para contestar al nombre del usuario
+
     
     @classmethod
-    async def execute(cls, input: str, session: SessionModel, history: List[Dict[str, Any]], user_name: str = None) -> AsyncGenerator[str, None]:
-        """Esta función enruta la consulta del usuario a alguna de las herramientas disponibles del agente"""
+    async def execute(cls, input: str, session: SessionModel, history: List[Dict[str, Any]], user_name: str = None, deadline: Deadline = None) -> AsyncGenerator[str, None]:
+        """
+        Esta función enruta la consulta del usuario a alguna de las herramientas disponibles del agente.
+            - deadline (Deadline): presupuesto de tiempo del turno, propagado a todas las herramientas.
+        """
+        deadline = deadline or Deadline.unlimited()
         
         tools_data: Dict = session.tools_data
         router_tool: RouterToolModel = tools_data.get("router_tool")
         qa_model: QAToolModel = tools_data.get("qa_tool")
         visit_model: VisitToolModel = tools_data.get("visit_tool")
 
-        print(f"HISTORIAL: {json.dumps(history)}")
+        history_str = format_history(history) # Resumen de la conversación y mensajes recientes
+        print(f"HISTORIAL: {history_str}")
+
+        # Con el circuito del proveedor abierto no se llega a llamar al clasificador: respuesta degradada local
+        if not model_available("classification_chain"):
+            async for message in DegradedChain.execute(input, session, user_name):
+                yield message
+            return
 
         try:
             #------MODIFICACIÓN DINÁMICA DE LAS INSTRUCCIONES
@@ -87,12 +103,11 @@ class Router_chain:
             valid_values = [item["key"] for item in tool_instructions]
 
             #------CADENA ENRUTADORA
-            result = await cls.classification_chain.ainvoke({
+            result = await deadline.run(cls.classification_chain.ainvoke({
                 "input": input, 
-                "history": json.dumps(history), 
-                "tool_instructions": json.dumps(tool_instructions),
+                "history": history_str, 
                 "valid_values": str(valid_values)
-            })
+            }), "classification")
             if result.startswith("[") and result.endswith("]"):
                 result = ast.literal_eval(result)[0]
 
@@ -100,41 +115,89 @@ class Router_chain:
 
             router_tool.is_answer_name = False
 
+        except DeadlineExceeded:
+            # Sin tiempo para enrutar: respuesta por plantilla
+            yield {"type": "text", "content": render_response("deadline_exceeded", user_name=user_name)}
+            yield {"type": "metadata", "key": "response_source", "content": "template"}
+            yield {"type": "metadata", "key": "chain", "content": "deadline_exceeded"}
+            return
+
         except Exception as e:
-             logger.error(f"Error in router context access: {e}")
-             raise Exception(f"Error in router context access: {e}")
+            if is_provider_error(e):
+                logger.error(f"Model provider unavailable in router classification: {e}")
+                async for message in DegradedChain.execute(input, session, user_name):
+                    yield message
+                return
+            logger.error(f"Error in router context access: {e}")
+            raise Exception(f"Error in router context access: {e}")
 
-        #------HERRAMIENTAS DEL AGENTE IA
-        # Es necesario que todas las instancias dinámicas pasadas a las cadenas sean diccionarios para asegurar la mutabilidad
         result = result.strip('"\'')
         if result not in valid_values:
             result = ""
 
+        # Si el proveedor falla durante la herramienta se responde en modo degradado. Si ya se había entregado parte de la
+        # respuesta solo se añade el aviso.
+        answered = False
+        try:
+            async for message in cls.run_tool(result, input, session, history_str, user_name, deadline):
+                answered = answered or message["type"] in ("text", "function")
+                yield message
+        except Exception as e:
+            if not is_provider_error(e):
+                raise
+            logger.error(f"Model provider unavailable in tool '{result}': {e}")
+            if answered:
+                yield {"type": "text", "content": "\n\n" + render_response("degraded_notice", user_name=user_name, snippet="")}
+                yield {"type": "metadata", "key": "response_source", "content": "degraded"}
+            else:
+                async for message in DegradedChain.execute(input, session, user_name):
+                    yield message
+
+    @classmethod
+    async def run_tool(cls, result: str, input: str, session: SessionModel, history_str: str, user_name: str, deadline: Deadline) -> AsyncGenerator[str, None]:
+        """Ejecuta la herramienta elegida por la cadena clasificadora."""
+        tools_data: Dict = session.tools_data
+        router_tool: RouterToolModel = tools_data.get("router_tool")
+        qa_model: QAToolModel = tools_data.get("qa_tool")
+        visit_model: VisitToolModel = tools_data.get("visit_tool")
+
+        #------HERRAMIENTAS DEL AGENTE IA
+        # Es necesario que todas las instancias dinámicas pasadas a las cadenas sean diccionarios para asegurar la mutabilidad
+
         if result == "busqueda":
-            async for message in QAChain.execute(input, qa_model, user_name): # Herramienta Text2SQL
+            async for message in QAChain.execute(input, qa_model, user_name, deadline): # Herramienta Text2SQL
                 yield message
             yield {"type": "metadata", "key": "tool", "content": "busqueda"}
 
         elif result == "info":
-            async for message in RagChain.query_rag(input, history, user_name): # Herramienta RAG
+            async for message in RagChain.query_rag(input, history_str, user_name, deadline): # Herramienta RAG
                 yield message
             yield {"type": "metadata", "key": "tool", "content": "info"}
 
         elif result == "visita":
-            async for message in VisitChain.execute(input, visit_model, qa_model.presented_inms, user_name, session.personal_data): # Herramienta de organización de visitas
+            async for message in VisitChain.execute(input, visit_model, qa_model.presented_inms, user_name, session.personal_data, deadline): # Herramienta de organización de visitas
                 yield message
             yield {"type": "metadata", "key": "tool", "content": "visita"}
 
         elif result == "contacto": 
-            async for message in cls.contact_chain.astream({"input": input, "contact_info": cls.contact_info, "user_name": user_name}): # Herramienta de contacto
-                yield {"type": "text", "content": message}
+            if use_template("contact_chain") or not deadline.allows(settings.deadline.llm_reply_min_s): # Herramienta de contacto
+                if not use_template("contact_chain"):
+                    deadline.degrade("contact_template")
+                yield {"type": "text", "content": render_response("contact_chain", user_name=user_name, **contact_context(cls.contact_data, input))}
+                yield {"type": "metadata", "key": "response_source", "content": "template"}
+            else:
+                async for message in deadline.stream(cls.contact_chain.astream({"input": input, "user_name": user_name}), "contact"):
+                    yield {"type": "text", "content": message}
             yield {"type": "metadata", "key": "chain", "content": "contact_chain"}
             yield {"type": "metadata", "key": "tool", "content": "contacto"}
 
         elif result == "nombre": 
-            user_name = await cls.name_chain.ainvoke({"input": input})
-            session.name = user_name
-            async for message in cls.answer_name_chain.astream({"input": input, "user_name": user_name}):
+            try:
+                user_name = await deadline.run(cls.name_chain.ainvoke({"input": input}), "name")
+                session.name = user_name
+            except DeadlineExceeded:
+                pass
+            async for message in deadline.stream(cls.answer_name_chain.astream({"input": input, "user_name": user_name}), "answer_name"):
                 yield {"type": "text", "content": message}
             yield {"type": "metadata", "key": "chain", "content": "answer_name_chain"}
             yield {"type": "metadata", "key": "tool", "content": "nombre"}
@@ -142,13 +205,13 @@ class Router_chain:
         elif result == "bienvenida":
             if not user_name:
                 router_tool.is_answer_name = True
-            async for message in cls.presentation_chain.astream({"input": input, "user_name": user_name}):
+            async for message in deadline.stream(cls.presentation_chain.astream({"input": input, "user_name": user_name}), "presentation"):
                 yield {"type": "text", "content": message}
             yield {"type": "metadata", "key": "chain", "content": "presentation_chain"}
             yield {"type": "metadata", "key": "tool", "content": "bienvenida"}
 
         elif result == "off-topic": 
-            async for message in cls.off_topic_chain.astream({"input": input}):
+            async for message in deadline.stream(cls.off_topic_chain.astream({"input": input}), "off_topic"):
                 yield {"type": "text", "content": message}
             yield {"type": "metadata", "key": "chain", "content": "off_topic_chain"}
             yield {"type": "metadata", "key": "tool", "content": "off-topic"}
@@ -0,0 +1,101 @@
+"""
+Resumen incremental de la conversación. Tras cada turno se lanza en segundo plano una actualización que incorpora al
+resumen los mensajes que van a salir de la ventana de mensajes recientes. El resumen se guarda junto a los mensajes de la
+sesión en MongoDB y se usa en 'build_history' para construir el historial de las cadenas.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+from langchain_core.output_parsers import StrOutputParser
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_txt
+from src.utils.tokens import count_tokens, truncate_tokens
+from src.logic.tool_config.llm_policy import generate_chain_llm
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.history_window import history_entry, format_history, pending_summary_messages
+from src.models.messages import MessagesModel
+from src.schemas.message import ConversationSummaryModel
+from src.services.messages_service import MessagesService
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryChain:
+
+    # ---- PLANTILLAS DE PROMPTS
+    SUMMARY_PROMPT = open_txt(settings.memory.summary_prompt_path)
+
+    # ---- PROMPTS
+    summary_prompt = build_prompt("summary_chain", SUMMARY_PROMPT, max_tokens=str(settings.memory.summary_max_tokens))
+
+    # ---- CADENAS
+    summary_chain = summary_prompt | generate_chain_llm("summary_chain") | StrOutputParser()
+
+    # ---- ACTUALIZACIONES EN CURSO POR SESIÓN
+    # Se conserva la referencia a las tareas para que no las elimine el recolector de basura. Solo evita duplicados dentro
+    # del worker; entre workers lo impide la actualización condicional de 'update_summary'.
+    running: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    async def update(cls, messages_service: MessagesService, session_id: str) -> bool:
+        """
+        Incorpora al resumen los mensajes pendientes de la sesión, si los hay.
+        Devuelve True si el resumen se ha actualizado.
+        """
+        messages: MessagesModel = await messages_service.get_messages(session_id)
+        if not messages:
+            return False
+
+        summary: ConversationSummaryModel = messages.summary
+        pending = pending_summary_messages(messages.messages, summary)
+        if not pending:
+            return False
+
+        start = time.perf_counter()
+        new_messages: List[Dict] = [history_entry(message, settings.memory.message_max_tokens) for message in pending]
+        content = await cls.summary_chain.ainvoke({
+            "previous_summary": summary.content or "Sin resumen previo.",
+            "messages": format_history(new_messages),
+        })
+        content = truncate_tokens(content.strip(), settings.memory.summary_max_tokens)
+
+        updated = ConversationSummaryModel(
+            content=content,
+            summarized_until=summary.summarized_until + len(pending),
+            tokens=count_tokens(content),
+            updated_at=datetime.now(timezone.utc),
+        )
+        # Solo se guarda si nadie ha actualizado el resumen mientras tanto: el registro de tareas en curso es de cada worker
+        # y otro worker puede haber resumido los mismos mensajes
+        if not await messages_service.update_summary(session_id, updated, previous_until=summary.summarized_until):
+            logger.info(f"Conversation summary not saved: updated by another worker since message {summary.summarized_until}")
+            return False
+        logger.info(
+            f"Conversation summary updated: {len(pending)} messages folded, {updated.summarized_until} summarized, "
+            f"{updated.tokens} tokens, {time.perf_counter() - start:.2f}s"
+        )
+        return True
+
+    @classmethod
+    def schedule_update(cls, messages_service: MessagesService, session_id: str) -> None:
+        """Lanza la actualización del resumen en segundo plano. Si ya hay una en curso para la sesión no se duplica."""
+        if not settings.memory.enabled:
+            return
+        task = cls.running.get(session_id)
+        if task and not task.done():
+            return
+
+        task = asyncio.create_task(cls._safe_update(messages_service, session_id))
+        cls.running[session_id] = task
+        task.add_done_callback(lambda _: cls.running.pop(session_id, None))
+
+    @classmethod
+    async def _safe_update(cls, messages_service: MessagesService, session_id: str) -> None:
+        # Un fallo del resumen no afecta a la conversación: los mensajes siguen disponibles en la ventana reciente
+        try:
+            await cls.update(messages_service, session_id)
+        except Exception as e:
+            logger.error(f"Error updating conversation summary: {e}")
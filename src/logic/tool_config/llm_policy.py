@@ -0,0 +1,182 @@
+"""
+Política declarativa de modelos de lenguaje por cadena.
+El fichero de política (config/llm_policy.json) asigna a cada cadena un nivel de modelo (tier), un límite de tokens de salida,
+secuencias de parada, temperatura y streaming. Todas las cadenas obtienen su modelo a través de 'generate_chain_llm'.
+"""
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from pydantic import BaseModel, Field
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_openai import ChatOpenAI
+from openai import APIError
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_json
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from src.logic.tool_utilities.prompt_assembly import PromptCacheLogger
+
+logger = logging.getLogger(__name__)
+
+
+# ------MODELOS DE LA POLÍTICA------
+class TierConfig(BaseModel):
+    model: str = Field(..., description="Nombre del modelo en el proveedor")
+    input_cost_per_1m: float = Field(default=0.0, description="Coste en USD por millón de tokens de entrada")
+    output_cost_per_1m: float = Field(default=0.0, description="Coste en USD por millón de tokens de salida")
+
+
+class ChainPolicy(BaseModel):
+    tier: str = Field(default="large", description="Nivel de modelo asignado a la cadena")
+    max_tokens: Optional[int] = Field(default=None, description="Límite de tokens de salida")
+    stop: Optional[List[str]] = Field(default=None, description="Secuencias de parada")
+    temperature: float = Field(default=0.0, description="Temperatura del modelo")
+    streaming: bool = Field(default=True, description="Si la cadena genera su respuesta en streaming")
+
+
+class LLMPolicy(BaseModel):
+    active_profile: str = Field(..., description="Perfil usado por defecto")
+    tiers: Dict[str, TierConfig] = Field(..., description="Niveles de modelo disponibles")
+    profiles: Dict[str, Dict[str, ChainPolicy]] = Field(..., description="Perfiles: política por cadena con una entrada 'default'")
+
+    def chain_policy(self, chain_name: str, profile: Optional[str] = None) -> ChainPolicy:
+        """Devuelve la política de una cadena dentro de un perfil, o la política 'default' del perfil si no está definida."""
+        profile = profile or self.active_profile
+        if profile not in self.profiles:
+            raise ValueError(f"LLM policy profile '{profile}' not defined")
+
+        chains = self.profiles[profile]
+        return chains.get(chain_name) or chains.get("default") or ChainPolicy()
+
+    def tier(self, tier_name: str) -> TierConfig:
+        """Devuelve la configuración de un nivel de modelo."""
+        if tier_name not in self.tiers:
+            raise ValueError(f"LLM tier '{tier_name}' not defined")
+        return self.tiers[tier_name]
+
+    def cost(self, tier_name: str, input_tokens: int, output_tokens: int) -> float:
+        """Coste estimado (USD) de una llamada con el número de tokens indicado."""
+        tier = self.tier(tier_name)
+        return (input_tokens * tier.input_cost_per_1m + output_tokens * tier.output_cost_per_1m) / 1_000_000
+
+
+# ------CARGA DE LA POLÍTICA------
+@lru_cache(maxsize=1)
+def load_llm_policy(policy_path: Optional[str] = None) -> LLMPolicy:
+    """Carga y valida el fichero de política. Se cachea para que todas las cadenas compartan la misma instancia."""
+    policy_path = policy_path or settings.llm_policy.policy_path
+    try:
+        policy = LLMPolicy.model_validate(open_json(policy_path))
+    except Exception as e:
+        logger.critical(f"Error loading LLM policy from '{policy_path}': {e}")
+        raise
+
+    if settings.llm_policy.profile:
+        policy.active_profile = settings.llm_policy.profile
+    for tier_name, model in settings.llm_policy.tier_models.items(): # Los modelos del fichero son valores por defecto
+        policy.tier(tier_name).model = model
+    logger.info(f"LLM policy loaded with profile '{policy.active_profile}'")
+    return policy
+
+
+# ------CIRCUIT BREAKER------
+class CircuitBreakerCallback(BaseCallbackHandler):
+    """
+    Conecta las llamadas de un modelo con el breaker de su endpoint.
+    Rechaza la llamada (CircuitOpenError) si el circuito está abierto y registra cada resultado: error, latencia total o,
+    en streaming, el tiempo hasta el primer token.
+    """
+
+    raise_error = True # El CircuitOpenError de 'on_*_start' debe llegar a la cadena
+    run_inline = True
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def _start(self, run_id: UUID) -> None:
+        probe = self.breaker.before_call()
+        self.runs[run_id] = {"start": time.monotonic(), "first_token": None, "probe": probe}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self.runs.get(run_id)
+        if run and run["first_token"] is None:
+            run["first_token"] = time.monotonic() - run["start"]
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self.runs.pop(run_id, None)
+        if run:
+            self.breaker.record(run["first_token"] if run["first_token"] is not None else time.monotonic() - run["start"])
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self.runs.pop(run_id, None)
+        if not run:
+            return
+        # Las cancelaciones (desconexión del cliente, presupuesto del turno, stream cerrado antes de terminar) no son fallos
+        # del proveedor; si era una llamada de prueba se libera su plaza, o el breaker se quedaría semiabierto sin admitir más
+        # pruebas
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            self.breaker.release(run["probe"])
+        else:
+            self.breaker.record(time.monotonic() - run["start"], error=True)
+
+
+def is_provider_error(error: BaseException) -> bool:
+    """
+    Si el error procede del proveedor de modelos (circuito abierto, timeout, límite de peticiones, error del servidor).
+    Las cadenas envuelven los errores en Exception genéricas, por lo que se recorre la cadena de excepciones.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, (CircuitOpenError, APIError)):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def model_available(chain_name: str, profile: Optional[str] = None, tier: Optional[str] = None) -> bool:
+    """Si el endpoint del modelo de una cadena acepta llamadas (circuito cerrado o con llamadas de prueba libres)."""
+    if not settings.breaker.enabled:
+        return True
+    policy = load_llm_policy()
+    return get_breaker(policy.tier(tier or policy.chain_policy(chain_name, profile).tier).model).available()
+
+
+# ------FACTORÍA DE MODELOS------
+def generate_chain_llm(chain_name: str, profile: Optional[str] = None, tier: Optional[str] = None) -> ChatOpenAI:
+    """
+    Crea el modelo de lenguaje de una cadena de acuerdo a la política.
+        - chain_name (str): nombre de la cadena (por ejemplo 'text2sql_chain').
+        - profile (str): perfil de la política. Por defecto el perfil activo.
+        - tier (str): fuerza un nivel de modelo distinto al de la política (degradaciones).
+    """
+    policy = load_llm_policy()
+    chain_policy = policy.chain_policy(chain_name, profile)
+    tier_config = policy.tier(tier or chain_policy.tier)
+
+    callbacks = [PromptCacheLogger(chain_name)] # Registro de tokens cacheados / no cacheados por llamada
+    if settings.breaker.enabled:
+        callbacks.append(CircuitBreakerCallback(get_breaker(tier_config.model)))
+
+    return ChatOpenAI(
+        model=tier_config.model,
+        temperature=chain_policy.temperature,
+        max_tokens=chain_policy.max_tokens,
+        stop=chain_policy.stop,
+        streaming=chain_policy.streaming,
+        stream_usage=True, # Incluye el uso de tokens también en las respuestas en streaming
+        timeout=settings.breaker.request_timeout,
+        max_retries=settings.breaker.max_retries,
+        callbacks=callbacks,
+    )
@@ -0,0 +1,171 @@
+"""
+Filtro de asequibilidad calculado localmente a partir de la situación financiera del usuario ('FinancialSituation').
+En lugar de dejar que el LLM razone en la respuesta qué inmuebles puede permitirse el usuario, se calculan topes de precio y
+se añaden a la consulta SQL antes de ejecutarla:
+    - Venta: cuota hipotecaria asumible (ingresos por 'AFFORDABILITY_MAX_DEBT_TO_INCOME' menos la cuota de otros préstamos), capital
+      que financia esa cuota al tipo y plazo configurados, y entrada más gastos de compra cubiertos por los ahorros
+      ('AFFORDABILITY_LTV', 'AFFORDABILITY_PURCHASE_COSTS').
+    - Alquiler: parte de los ingresos destinada al alquiler ('AFFORDABILITY_RENT_TO_INCOME').
+En ambos casos el gasto mensual que el usuario dice poder asumir limita la cuota o la renta. Los traspasos no se filtran.
+'amount_loans' es lo que queda por devolver de los préstamos vigentes, no su cuota: se convierte en una cuota mensual
+suponiendo el tipo y el plazo restante configurados ('AFFORDABILITY_LOANS_INTEREST_RATE', 'AFFORDABILITY_LOANS_TERM_YEARS').
+Los topes se insertan en el árbol sintáctico de la consulta (sqlglot), no por manipulación de texto.
+"""
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Set
+
+import sqlglot
+from sqlglot import exp
+
+from src.core.settings import settings
+from src.schemas.tools import FinancialSituation
+
+logger = logging.getLogger(__name__)
+
+OPERATION_COLUMN = "Operacion"
+PRICE_COLUMN = "Precio"
+
+
+@dataclass
+class AffordabilityCaps:
+    max_sale_price: Optional[int] = None
+    max_rent: Optional[int] = None
+    monthly_payment: Optional[float] = None # Cuota hipotecaria asumible
+    loan: Optional[float] = None # Capital que financia esa cuota
+
+    @property
+    def empty(self) -> bool:
+        return self.max_sale_price is None and self.max_rent is None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: round(value) if isinstance(value, float) else value for key, value in asdict(self).items()}
+
+
+# ------CÁLCULO DE LOS TOPES------
+def _positive(value) -> Optional[float]:
+    """Cantidad positiva o None. Los booleanos no son cantidades ('monthly_expenses' vale False por defecto)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        return None
+    return float(value)
+
+
+def mortgage_principal(monthly_payment: float, annual_rate: float, years: int) -> float:
+    """Capital de una hipoteca de cuota constante (sistema francés)."""
+    months = years * 12
+    rate = annual_rate / 12
+    if rate <= 0:
+        return monthly_payment * months
+    return monthly_payment * (1 - (1 + rate) ** -months) / rate
+
+
+def loan_payment(principal: float, annual_rate: float, years: int) -> float:
+    """Cuota mensual constante que amortiza el capital en el plazo indicado (inversa de 'mortgage_principal')."""
+    months = max(years * 12, 1)
+    rate = annual_rate / 12
+    if rate <= 0:
+        return principal / months
+    return principal * rate / (1 - (1 + rate) ** -months)
+
+
+def affordability_caps(financial: Optional[FinancialSituation]) -> AffordabilityCaps:
+    """
+    Topes de precio de venta y de alquiler para la situación financiera indicada. Un tope es None si faltan los datos
+    para calcularlo.
+    """
+    config = settings.affordability
+    caps = AffordabilityCaps()
+    if financial is None:
+        return caps
+
+    income = _positive(financial.month_revenues)
+    savings = _positive(financial.savings)
+    # Cuota mensual de los préstamos vigentes a partir de la cantidad que queda por devolver
+    outstanding = _positive(financial.amount_loans)
+    loans = loan_payment(outstanding, config.loans_interest_rate, config.loans_term_years) if outstanding else 0.0
+    budget = _positive(financial.monthly_expenses)
+
+    # ----VENTA
+    payment = max(income * config.max_debt_to_income - loans, 0.0) if income else None
+    if budget is not None:
+        payment = min(payment, budget) if payment is not None else budget
+
+    limits = []
+    if savings is not None:
+        # La entrada y los gastos de compra salen de los ahorros
+        limits.append(savings / (1 - config.ltv + config.purchase_costs))
+    if payment is not None:
+        caps.monthly_payment = payment
+        caps.loan = mortgage_principal(payment, config.interest_rate, config.term_years)
+        # Con ahorros conocidos, precio más gastos cubiertos por ahorros y préstamo; sin ellos, solo el límite de financiación
+        limits.append((savings + caps.loan) / (1 + config.purchase_costs) if savings is not None else caps.loan / config.ltv)
+    if limits:
+        caps.max_sale_price = round(min(limits) * (1 + config.margin))
+
+    # ----ALQUILER
+    rent = max(income * config.rent_to_income - loans, 0.0) if income else None
+    if budget is not None:
+        rent = min(rent, budget) if rent is not None else budget
+    if rent is not None:
+        caps.max_rent = round(rent * (1 + config.margin))
+
+    return caps
+
+
+# ------INSERCIÓN EN LA CONSULTA------
+def _filtered_operations(where: Optional[exp.Where]) -> Set[str]:
+    """
+    Operaciones a las que la consulta ya se limita ("Operacion = 'Venta'", "Operacion IN (...)"). Solo cuentan las
+    condiciones unidas por AND al nivel superior del WHERE: dentro de un OR no restringen la operación.
+    """
+    operations: Set[str] = set()
+    if where is None:
+        return operations
+    condition = where.this.unnest()
+    for node in (condition.flatten() if isinstance(condition, exp.And) else [condition]):
+        node = node.unnest()
+        if not isinstance(node, (exp.EQ, exp.In)):
+            continue
+        column = node.this
+        if not isinstance(column, exp.Column) or column.name.lower() != OPERATION_COLUMN.lower():
+            continue
+        values = [node.expression] if isinstance(node, exp.EQ) else node.expressions
+        operations.update(value.name for value in values if isinstance(value, exp.Literal) and value.is_string)
+    return operations
+
+
+def _price_cap(cap: int) -> exp.Expression:
+    return exp.LTE(this=exp.column(PRICE_COLUMN), expression=exp.Literal.number(cap))
+
+
+def apply_affordability(query: str, caps: AffordabilityCaps) -> str:
+    """
+    Añade los topes de precio al WHERE de la consulta. Si la consulta ya fija una única operación se añade solo su tope
+    ("Precio <= X"); en otro caso cada tope se condiciona a su operación ("(Operacion <> 'Venta' OR Precio <= X)").
+    Si la consulta no se puede analizar se devuelve sin cambios.
+    """
+    if caps.empty:
+        return query
+    try:
+        tree = sqlglot.parse_one(query, read="sqlite")
+    except sqlglot.errors.ParseError as e:
+        logger.warning(f"Affordability filter not applied, query could not be parsed: {e}")
+        return query
+    if not isinstance(tree, exp.Select):
+        return query
+
+    by_operation = {"Venta": caps.max_sale_price, "Alquiler": caps.max_rent}
+    operations = _filtered_operations(tree.args.get("where"))
+    if len(operations) == 1:
+        cap = by_operation.get(next(iter(operations)))
+        conditions = [_price_cap(cap)] if cap is not None else []
+    else:
+        conditions = [
+            exp.paren(exp.or_(exp.NEQ(this=exp.column(OPERATION_COLUMN), expression=exp.Literal.string(operation)), _price_cap(cap)))
+            for operation, cap in by_operation.items()
+            if cap is not None and (not operations or operation in operations)
+        ]
+
+    if not conditions:
+        return query
+    return tree.where(*conditions, append=True).sql(dialect="sqlite")
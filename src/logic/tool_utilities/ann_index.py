@@ -0,0 +1,107 @@
+"""
+Tipos de índice FAISS del RAG. El tipo y sus parámetros se eligen al construir el índice ('RAG_INDEX_TYPE' y
+'RAG_INDEX_*') y quedan registrados en el manifiesto; al cargar, el índice se abre según el manifiesto y se le aplican los
+parámetros de búsqueda (nprobe, efSearch), que se pueden ajustar sin reconstruir.
+    - flat: búsqueda exacta. Es la opción para corpus pequeños como el actual.
+    - ivf_flat: particiona los vectores en 'nlist' celdas y solo recorre 'nprobe' de ellas por consulta.
+    - ivf_pq: como ivf_flat, con los vectores comprimidos por cuantización de producto (m subvectores de 'nbits' bits).
+      Con 'refine' > 0 los k·refine candidatos de PQ se reordenan con la distancia exacta (IndexRefineFlat): recupera casi
+      todo el recall de PQ a cambio de guardar los vectores completos, que en los workers se leen mapeados en memoria.
+    - hnsw: grafo de vecinos navegable; rápido y sin entrenamiento, pero ocupa más que los vectores.
+Los índices que necesitan entrenamiento (IVF, PQ) requieren un mínimo de vectores; con menos se construye un índice plano.
+"""
+import logging
+import math
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+TRAINING_POINTS_PER_CENTROID = 39 # Mínimo recomendado por FAISS para entrenar k-means sin avisos
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+
+# ------PARÁMETROS------
+def index_params(index_type: Optional[str] = None) -> Dict[str, Any]:
+    """Parámetros de construcción y de búsqueda del tipo de índice según la configuración."""
+    index_type = index_type or settings.rag.index_type
+    if index_type not in INDEX_TYPES:
+        raise Exception(f"ERROR: Unknown RAG index type '{index_type}'. Valid types: {', '.join(INDEX_TYPES)}")
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params = {"nlist": settings.rag.index_nlist, "nprobe": settings.rag.index_nprobe or DEFAULT_NPROBE}
+        if index_type == "ivf_pq":
+            params.update({"m": settings.rag.index_pq_m, "nbits": settings.rag.index_pq_nbits, "refine": settings.rag.index_pq_refine})
+        return params
+    if index_type == "hnsw":
+        return {"m": settings.rag.index_hnsw_m, "ef_construction": settings.rag.index_hnsw_ef_construction, "ef_search": settings.rag.index_hnsw_ef_search or DEFAULT_EF_SEARCH}
+    return {}
+
+
+def _nlist(params: Dict[str, Any], size: int) -> int:
+    """Número de celdas: el configurado o, con 0, unas 4·√n."""
+    return params.get("nlist") or max(1, int(4 * math.sqrt(size)))
+
+
+# ------CONSTRUCCIÓN------
+def build_index(vectors: np.ndarray, index_type: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Construye y rellena un índice L2 del tipo indicado. Devuelve el índice y su descripción para el manifiesto
+    ({"type", "params"}), que refleja el tipo realmente construido.
+    """
+    index_type = index_type or settings.rag.index_type
+    params = {**index_params(index_type), **(params or {})}
+    size, dimension = vectors.shape
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params["nlist"] = _nlist(params, size)
+        centroids = params["nlist"] if index_type == "ivf_flat" else max(params["nlist"], 2 ** params["nbits"])
+        if size < centroids * TRAINING_POINTS_PER_CENTROID:
+            logger.warning(f"{size} vectors are not enough to train a {index_type} index (nlist={params['nlist']}), building a flat index")
+            return build_index(vectors, "flat")
+        if index_type == "ivf_pq" and dimension % params["m"] != 0:
+            raise Exception(f"ERROR: RAG_INDEX_PQ_M ({params['m']}) must divide the embedding dimension ({dimension})")
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"], faiss.METRIC_L2)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["m"], params["nbits"])
+        index.train(vectors)
+        if params.get("refine"):
+            index = faiss.IndexRefineFlat(index)
+
+    index.add(vectors)
+    spec = {"type": index_type, "params": params}
+    apply_search_params(index, spec)
+    return index, spec
+
+
+# ------BÚSQUEDA------
+def apply_search_params(index: faiss.Index, spec: Optional[Dict[str, Any]]) -> None:
+    """
+    Aplica los parámetros de búsqueda del manifiesto al índice cargado. 'RAG_INDEX_NPROBE' y 'RAG_INDEX_HNSW_EF_SEARCH'
+    los sustituyen si están definidos, sin reconstruir el índice.
+    """
+    if not spec:
+        return
+    params = spec.get("params", {})
+    if spec["type"] in ("ivf_flat", "ivf_pq"):
+        nprobe = settings.rag.index_nprobe or params.get("nprobe", DEFAULT_NPROBE)
+        faiss.extract_index_ivf(index).nprobe = min(nprobe, params.get("nlist", nprobe))
+        if params.get("refine"):
+            faiss.downcast_index(index).k_factor = params["refine"]
+    elif spec["type"] == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = settings.rag.index_hnsw_ef_search or params.get("ef_search", DEFAULT_EF_SEARCH)
@@ -0,0 +1,185 @@
+"""
+Caché semántica de respuestas de la herramienta RAG ('info').
+Las preguntas de información ("¿qué gastos tiene el vendedor?", "¿cuándo es mejor comprar?") se repiten mucho entre usuarios
+con pequeñas diferencias de redacción, y cada una pagaba la recuperación y una generación completa.
+    - Se busca el embedding de la pregunta (el mismo que usa la recuperación, ya en la caché de embeddings) en un índice FAISS
+      plano con las preguntas ya respondidas. Si la similitud coseno llega a 'ANSWER_CACHE_THRESHOLD' se envía la respuesta
+      guardada, sin recuperación ni LLM.
+    - Cada respuesta se asocia a la versión del índice de RAG con la que se generó (fecha de construcción del manifiesto).
+      Cuando la ingesta publica un índice nuevo la caché se vacía, y mientras el worker siga con el índice anterior no se
+      sirve ni se guarda nada.
+    - Las respuestas caducan a los 'ANSWER_CACHE_TTL_SECONDS'.
+    - Solo se consultan y guardan las preguntas que no dependen del historial (no "¿y eso?", "entonces, ¿cuánto sería?").
+      Esas preguntas se responden sin historial en el prompt, también cuando no son el primer turno: la caché se comparte
+      entre usuarios y una respuesta adaptada a una conversación (nombre, situación, lo que ya se dijo) no puede servirse
+      en otra. Solo se guardan respuestas completas del modelo principal (no las del modelo rápido ni las cortadas por el
+      deadline).
+    - Cada acierto se registra en el log y en 'ANSWER_CACHE_AUDIT_PATH' (una línea JSON con la pregunta, la pregunta
+      guardada y la similitud) para auditar los aciertos incorrectos y ajustar el umbral.
+La caché vive en la memoria de cada worker (un diccionario y un índice FAISS por proceso): no se comparte entre workers ni
+sobrevive a un reinicio, y cada worker la llena con sus propias respuestas. 'ANSWER_CACHE_MAX_ENTRIES' es por worker.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+import orjson
+
+from src.core.settings import settings
+from src.utils.general_utilities import normalize_text
+from src.logic.tool_utilities.vector_store import index_version
+
+logger = logging.getLogger(__name__)
+
+# Preguntas que se apoyan en la conversación: la respuesta depende del historial y no se reutiliza
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\W*(y|entonces|pues|vale|ok|ademas|tambien)\b|\b(eso|esto|aquello|lo anterior|lo mismo|me (has|habias) dicho|"
+    r"(has|habias) dicho|dijiste|comentaste|mencionaste|explicamelo|explicame mas|amplia(lo)?|mas detalles?)\b"
+)
+CANDIDATES = 4 # Vecinos revisados por búsqueda (los caducados se descartan)
+
+METRICS: Dict[str, int] = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "follow_ups": 0, "stale_index": 0, "expired": 0, "invalidations": 0}
+
+
+def cacheable_question(question: str) -> bool:
+    """La respuesta a la pregunta no depende del historial de la conversación."""
+    if FOLLOW_UP_PATTERN.search(normalize_text(question)):
+        METRICS["follow_ups"] += 1
+        return False
+    return True
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    created: float
+    version: Optional[str]
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    Índice de preguntas respondidas de un índice de RAG, en memoria del worker.
+        - index_dir (str): directorio del índice de RAG, cuyo manifiesto marca la versión de las respuestas.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.index: Optional[faiss.IndexIDMap2] = None
+        self.entries: Dict[int, CachedAnswer] = {} # En orden de inserción: el primero es el más antiguo
+        self.next_id = 0
+        self.version: Optional[str] = None
+        self.checked_at = float("-inf")
+
+    # ------VERSIÓN DEL ÍNDICE------
+    def clear(self) -> None:
+        self.index, self.entries = None, {}
+
+    def usable(self, loaded_version: Optional[str]) -> bool:
+        """
+        Comprueba (como mucho cada 'ANSWER_CACHE_CHECK_INTERVAL_S') la versión publicada del índice y vacía la caché si ha
+        cambiado. Solo se usa si el worker tiene cargada esa misma versión.
+        """
+        now = time.monotonic()
+        if now - self.checked_at >= settings.answer_cache.check_interval_s:
+            self.checked_at = now
+            published = index_version(self.index_dir)
+            if published != self.version:
+                if self.entries:
+                    METRICS["invalidations"] += 1
+                    logger.info(f"Answer cache: RAG index {self.version} replaced by {published}, {len(self.entries)} answers dropped")
+                self.clear()
+                self.version = published
+        if loaded_version != self.version:
+            METRICS["stale_index"] += 1
+            return False
+        return True
+
+    # ------CONSULTA Y GUARDADO------
+    @staticmethod
+    def _normalized(vector: List[float]) -> np.ndarray:
+        vector = np.array([vector], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _remove(self, ids: List[int]) -> None:
+        self.index.remove_ids(np.array(ids, dtype="int64"))
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+
+    def lookup(self, vector: List[float]) -> Optional[Tuple[CachedAnswer, float]]:
+        """Respuesta guardada más parecida por encima del umbral, con su similitud."""
+        METRICS["lookups"] += 1
+        if self.index is None or not self.entries:
+            METRICS["misses"] += 1
+            return None
+        similarities, ids = self.index.search(self._normalized(vector), min(CANDIDATES, len(self.entries)))
+        expired = []
+        hit = None
+        for similarity, entry_id in zip(similarities[0].tolist(), ids[0].tolist()):
+            if similarity < settings.answer_cache.threshold:
+                break
+            entry = self.entries[entry_id]
+            if time.time() - entry.created > settings.answer_cache.ttl_seconds:
+                expired.append(entry_id)
+                continue
+            hit = (entry, similarity)
+            break
+        if expired:
+            METRICS["expired"] += len(expired)
+            self._remove(expired)
+        if hit is None:
+            METRICS["misses"] += 1
+            return None
+        METRICS["hits"] += 1
+        hit[0].hits += 1
+        return hit
+
+    def store(self, question: str, vector: List[float], answer: str) -> None:
+        if not answer.strip():
+            return
+        normalized = self._normalized(vector)
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(normalized.shape[1]))
+        if len(self.entries) >= settings.answer_cache.max_entries:
+            self._remove(list(self.entries)[:len(self.entries) - settings.answer_cache.max_entries + 1])
+        self.index.add_with_ids(normalized, np.array([self.next_id], dtype="int64"))
+        self.entries[self.next_id] = CachedAnswer(question, answer, time.time(), self.version)
+        self.next_id += 1
+        METRICS["stores"] += 1
+
+    # ------AUDITORÍA------
+    async def audit(self, question: str, entry: CachedAnswer, similarity: float) -> None:
+        """Registra un acierto: la pregunta recibida, la que generó la respuesta y su similitud."""
+        record = {
+            "at": time.time(),
+            "question": question,
+            "cached_question": entry.question,
+            "similarity": round(similarity, 4),
+            "age_s": round(time.time() - entry.created, 1),
+            "entry_hits": entry.hits,
+            "index_version": entry.version,
+        }
+        logger.info(f"Answer cache hit ({similarity:.3f}): '{question}' -> '{entry.question}'")
+        if settings.answer_cache.audit_path:
+            await asyncio.to_thread(_append_line, settings.answer_cache.audit_path, record)
+
+
+def _append_line(path: str, record: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "ab") as file:
+            file.write(orjson.dumps(record) + b"\n")
+    except OSError as e:
+        logger.warning(f"Answer cache: audit record could not be written to {path}: {e}")
+
+
+def answer_cache_metrics() -> Dict[str, Any]:
+    return {**METRICS, "hit_rate": round(METRICS["hits"] / METRICS["lookups"], 3) if METRICS["lookups"] else None}
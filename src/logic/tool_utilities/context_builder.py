@@ -0,0 +1,187 @@
+"""
+Construcción del contexto del prompt de RAG a partir de los fragmentos recuperados.
+Antes se pasaban siempre los 'RAG_K' fragmentos completos (la lista de 'Document' tal cual, con sus metadatos), fuera cual
+fuera su relevancia. Ahora:
+    1. Se descartan los fragmentos con similitud coseno con la consulta menor que 'RAG_CONTEXT_MIN_SCORE', salvo los que
+       ha recuperado BM25: una coincidencia exacta de términos (una referencia, una sigla) es relevante aunque la
+       similitud densa sea baja. Si no queda ninguno, el contexto queda vacío y 'RagChain' responde por plantilla sin
+       llamar al LLM.
+    2. Los fragmentos consecutivos del mismo documento se unen sin repetir el solapamiento de la fragmentación
+       ('RAG_CHUNK_OVERLAP'), y se descartan los casi duplicados (Jaccard de términos).
+    3. Con 'RAG_CONTEXT_COMPRESSION' se divide cada fragmento en frases y se puntúa cada una, en CPU, combinando la
+       similitud del fragmento con la consulta y la cobertura de los términos de la consulta en la frase (ponderada por
+       IDF). Las vecinas de una frase relevante reciben parte de su puntuación: la respuesta suele ir justo después.
+    4. Se añaden frases por puntuación hasta 'RAG_CONTEXT_MAX_TOKENS' y se escriben en su orden original, con el nombre
+       del documento de origen.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from langchain_core.documents import Document
+
+from src.core.settings import settings
+from src.utils.general_utilities import normalize_text
+from src.utils.tokens import count_tokens, truncate_tokens
+from src.logic.tool_utilities.hybrid_search import tokenize
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?:;])\s+(?=[¿¡\"«(]?[A-ZÁÉÍÓÚÑ0-9])")
+SPACE_PATTERN = re.compile(r"\s+")
+
+
+@dataclass
+class _Chunk:
+    text: str
+    source: str
+    score: Optional[float] # Similitud con la consulta (None si el índice no permite calcularla)
+    page: Optional[int] = None
+    start: Optional[int] = None
+    terms: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    chunks: int = 0 # Fragmentos que superan el umbral o recuperados por BM25
+    merged: int = 0 # Fragmentos unidos a su vecino por solapamiento
+    duplicates: int = 0
+    sentences: int = 0 # Frases incluidas
+    tokens: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not self.text
+
+
+# ------FRAGMENTOS------
+def _source_name(source: Optional[str]) -> str:
+    return re.split(r"[\\/]", source or "")[-1].rsplit(".", 1)[0]
+
+
+def _clean(text: str) -> str:
+    return SPACE_PATTERN.sub(" ", text).strip()
+
+
+def _merge_overlapping(chunks: List[_Chunk]) -> List[_Chunk]:
+    """
+    Une los fragmentos de la misma página cuyo rango de caracteres se solapa o es contiguo ('start_index' de la ingesta). El
+    resultado ocupa el lugar del mejor de ellos.
+    """
+    merged: List[_Chunk] = []
+    for chunk in chunks:
+        target = None
+        if chunk.start is not None:
+            for candidate in merged:
+                if candidate.source == chunk.source and candidate.page == chunk.page and candidate.start is not None:
+                    first, second = (candidate, chunk) if candidate.start <= chunk.start else (chunk, candidate)
+                    if second.start <= first.start + len(first.text):
+                        target = candidate
+                        break
+        if target is None:
+            merged.append(chunk)
+            continue
+        first, second = (target, chunk) if target.start <= chunk.start else (chunk, target)
+        end = first.start + len(first.text)
+        if second.start + len(second.text) > end:
+            target.text = first.text + second.text[end - second.start:]
+        else:
+            target.text = first.text
+        target.start = first.start
+        target.score = max((score for score in (target.score, chunk.score) if score is not None), default=None)
+    return merged
+
+
+def _drop_duplicates(chunks: List[_Chunk]) -> List[_Chunk]:
+    kept: List[_Chunk] = []
+    for chunk in chunks:
+        chunk.terms = set(tokenize(chunk.text))
+        if not any(len(chunk.terms & other.terms) / (len(chunk.terms | other.terms) or 1) >= settings.rag.context_duplicate_jaccard for other in kept):
+            kept.append(chunk)
+    return kept
+
+
+# ------FRASES------
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in SENTENCE_PATTERN.split(_clean(text)) if sentence]
+
+
+def _coverage(terms: List[str], weights: Dict[str, float], total: float, sentence: str) -> float:
+    """Proporción de los términos de la consulta, ponderados por IDF, que aparecen en la frase."""
+    present = set(tokenize(sentence))
+    return sum(weights[term] for term in terms if term in present) / total
+
+
+def _compress(query: str, chunks: List[_Chunk], idf: Optional[Dict[str, float]], max_tokens: int) -> tuple[str, int, int]:
+    """Frases más relevantes dentro del presupuesto. Devuelve el texto, las frases y los tokens."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    weights = {term: (idf or {}).get(term, 1.0) for term in terms}
+    total = sum(weights.values()) or 1.0
+    top_score = max((chunk.score for chunk in chunks if chunk.score is not None), default=None)
+
+    seen: Set[str] = set()
+    candidates = [] # (puntuación, fragmento, posición de la frase, texto, tokens)
+    for chunk_number, chunk in enumerate(chunks):
+        sentences = [sentence for sentence in split_sentences(chunk.text) if normalize_text(sentence) not in seen]
+        seen.update(normalize_text(sentence) for sentence in sentences)
+        coverage = [_coverage(terms, weights, total, sentence) for sentence in sentences]
+        # Sin similitud calculable, la del fragmento se aproxima por su posición en la recuperación
+        relevance = chunk.score / top_score if chunk.score is not None and top_score else 1 / (1 + chunk_number)
+        for number, sentence in enumerate(sentences):
+            neighbors = max(coverage[max(number - 1, 0):number + 2])
+            lexical = max(coverage[number], settings.rag.context_neighbor_weight * neighbors)
+            score = settings.rag.context_dense_weight * relevance + settings.rag.context_lexical_weight * lexical
+            candidates.append((score, chunk_number, number, sentence, count_tokens(sentence)))
+
+    selected = []
+    used = 0
+    for candidate in sorted(candidates, key=lambda item: -item[0]):
+        if used + candidate[4] > max_tokens:
+            continue
+        selected.append(candidate)
+        used += candidate[4]
+
+    blocks = []
+    for chunk_number, chunk in enumerate(chunks):
+        chosen = sorted((number, sentence) for _, selected_chunk, number, sentence, _ in selected if selected_chunk == chunk_number)
+        if not chosen:
+            continue
+        parts = [chosen[0][1]]
+        for (previous, _), (number, sentence) in zip(chosen, chosen[1:]):
+            parts.append(sentence if number == previous + 1 else "[…] " + sentence)
+        blocks.append(f"[{chunk.source}] " + " ".join(parts))
+    return "\n\n".join(blocks), len(selected), used
+
+
+# ------CONTEXTO------
+def build_context(
+    query: str, documents: List[Document], scores: List[Optional[float]], idf: Optional[Dict[str, float]] = None,
+    lexical: Optional[List[bool]] = None,
+) -> BuiltContext:
+    """
+    Contexto del prompt de RAG.
+        - documents (List[Document]): fragmentos recuperados, en orden de relevancia.
+        - scores (List[float]): similitud coseno de cada fragmento con la consulta (None si no se conoce: no se descarta).
+        - idf (Dict): IDF de los términos (el del índice BM25, si está cargado).
+        - lexical (List[bool]): si BM25 ha recuperado cada fragmento. Estos no se descartan por similitud.
+    """
+    lexical = lexical or [False] * len(documents)
+    chunks = [
+        _Chunk(doc.page_content, _source_name(doc.metadata.get("source")), score, doc.metadata.get("page"), doc.metadata.get("start_index"))
+        for doc, score, matched in zip(documents, scores, lexical)
+        if matched or score is None or score >= settings.rag.context_min_score
+    ]
+    if not chunks:
+        return BuiltContext("")
+    relevant = len(chunks)
+    merged = _merge_overlapping(chunks)
+    unique = _drop_duplicates(merged)
+
+    if settings.rag.context_compression:
+        text, sentences, tokens = _compress(query, unique, idf, settings.rag.context_max_tokens)
+    else:
+        text = truncate_tokens("\n\n".join(f"[{chunk.source}] {_clean(chunk.text)}" for chunk in unique), settings.rag.context_max_tokens)
+        sentences, tokens = 0, count_tokens(text)
+    return BuiltContext(text, relevant, relevant - len(merged), len(merged) - len(unique), sentences, tokens)
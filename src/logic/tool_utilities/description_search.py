@@ -0,0 +1,212 @@
+"""
+Búsqueda semántica en las descripciones de los inmuebles ('Observaciones_Publicas') combinada con los filtros SQL.
+Peticiones como "luminoso, reformado y tranquilo" se traducían a columnas ('CheckLuz = 1 AND Estado_General = 'Reformado'')
+que muchas veces están vacías o no reflejan lo que dice el anuncio: la consulta no devolvía nada y se ampliaba con hasta
+cinco llamadas al LLM ('broad_query_chain'). Ahora, sin resultados:
+    1. Se eliminan de la consulta las condiciones sobre características descriptivas ('DESCRIPTION_SEARCH_SOFT_COLUMNS'). Los
+       filtros estrictos (operación, tipo, precio, dormitorios, zona) se mantienen y dan el conjunto de inmuebles candidatos.
+    2. Los candidatos se ordenan por similitud entre la petición y su descripción en un índice FAISS plano con los Id de
+       los inmuebles (IndexIDMap2), construido cada noche ('src.data_generation.description_index'). La búsqueda se
+       restringe a los candidatos con un selector de Id de FAISS, en CPU; si los candidatos son casi todo el catálogo se
+       busca primero y se filtra después.
+    3. Se presentan los 'DESCRIPTION_SEARCH_K' más parecidos por encima de 'DESCRIPTION_SEARCH_MIN_SCORE'.
+El índice se carga una vez por worker y se recarga cuando la carga nocturna publica uno nuevo. Sin índice, la búsqueda no
+devuelve nada y se sigue con la ampliación por LLM.
+"""
+import asyncio
+import html
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+import orjson
+import sqlglot
+from sqlglot import exp
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from src.core.settings import settings
+from src.utils.deadline import Deadline
+from src.utils.tokens import truncate_tokens
+from src.logic.tool_utilities.vector_store import read_index
+from src.logic.tool_utilities.embedding_cache import cached_embeddings
+from src.logic.tool_utilities.embedding_batcher import batched_embeddings, embedding_deadline
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "description_index.faiss"
+MANIFEST_FILE = "description_manifest.json"
+ID_COLUMN = "Id"
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+SPACE_PATTERN = re.compile(r"\s+")
+
+METRICS: Dict[str, int] = {"searches": 0, "selector": 0, "post_filter": 0, "candidates": 0, "ranked": 0, "no_index": 0, "reloads": 0}
+
+
+# ------TEXTO INDEXADO------
+def clean_description(text: Optional[str]) -> str:
+    """
+    Descripción pública lista para el embedding: sin entidades ni etiquetas HTML, con los espacios normalizados y en
+    minúsculas si está escrita en mayúsculas (muchos anuncios lo están, y así ocupan más tokens y se parecen menos a
+    las peticiones de los usuarios).
+    """
+    text = SPACE_PATTERN.sub(" ", TAG_PATTERN.sub(" ", html.unescape(text or ""))).strip()
+    letters = [char for char in text if char.isalpha()]
+    if letters and sum(char.isupper() for char in letters) / len(letters) > 0.5:
+        text = text.lower()
+    return truncate_tokens(text, settings.description_search.max_tokens)
+
+
+# ------CONSULTA DE CANDIDATOS------
+def _references_soft_column(node: exp.Expression, soft_columns: set) -> bool:
+    return any(column.name.lower() in soft_columns for column in node.find_all(exp.Column))
+
+
+def relax_query(query: str, columns: str = "*") -> Optional[str]:
+    """
+    Consulta con las condiciones sobre características descriptivas eliminadas del WHERE, sin orden ni límite. Solo se
+    eliminan condiciones unidas por AND al nivel superior; una condición OR que mencione alguna se elimina entera.
+        - columns (str): columnas seleccionadas ("Id" para obtener los candidatos).
+    Devuelve None si la consulta no se puede analizar o no tiene condiciones que relajar.
+    """
+    try:
+        tree = sqlglot.parse_one(query, read="sqlite")
+    except sqlglot.errors.ParseError as e:
+        logger.warning(f"Description search skipped, query could not be parsed: {e}")
+        return None
+    where = tree.args.get("where") if isinstance(tree, exp.Select) else None
+    if where is None:
+        return None
+
+    soft_columns = {column.lower() for column in settings.description_search.soft_columns}
+    condition = where.this.unnest()
+    conditions = list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+    kept = [node for node in conditions if not _references_soft_column(node, soft_columns)]
+    if len(kept) == len(conditions):
+        return None
+
+    relaxed = tree.copy()
+    for clause in ("where", "order", "limit", "offset"):
+        relaxed.set(clause, None)
+    relaxed.set("expressions", [exp.Star()] if columns == "*" else [exp.column(columns)])
+    if kept:
+        relaxed = relaxed.where(*(node.copy() for node in kept))
+    return relaxed.sql(dialect="sqlite")
+
+
+# ------ÍNDICE------
+def read_description_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return orjson.loads(file.read())
+
+
+def search_index(index: faiss.Index, vector: np.ndarray, ids: Optional[Sequence[int]], k: int) -> List[Tuple[int, float]]:
+    """
+    Los k inmuebles más parecidos al vector (normalizado), limitados a los Id indicados (None: todo el índice).
+        - Con pocos candidatos se busca solo entre ellos (IDSelectorBatch): la búsqueda plana salta el resto sin calcular
+          la distancia.
+        - Si los candidatos superan 'DESCRIPTION_SEARCH_POST_FILTER_RATIO' del índice se busca primero en todo el índice,
+          pidiendo 'DESCRIPTION_SEARCH_POST_FILTER_OVERFETCH' veces más resultados, y se filtra después. Si no llegan a k,
+          se repite con el selector.
+    Devuelve (Id, similitud) en orden de similitud.
+    """
+    query = vector.reshape(1, -1)
+    if ids is None:
+        similarities, found = index.search(query, min(k, index.ntotal))
+        return [(inm_id, similarity) for similarity, inm_id in zip(similarities[0].tolist(), found[0].tolist()) if inm_id >= 0]
+    if not len(ids):
+        return []
+
+    config = settings.description_search
+    if len(ids) >= config.post_filter_ratio * index.ntotal:
+        METRICS["post_filter"] += 1
+        allowed = set(ids)
+        similarities, found = index.search(query, min(k * config.post_filter_overfetch, index.ntotal))
+        hits = [(inm_id, similarity) for similarity, inm_id in zip(similarities[0].tolist(), found[0].tolist()) if inm_id in allowed]
+        if len(hits) >= k:
+            return hits[:k]
+
+    METRICS["selector"] += 1
+    selector = faiss.IDSelectorBatch(np.asarray(ids, dtype="int64"))
+    similarities, found = index.search(query, min(k, len(ids)), params=faiss.SearchParameters(sel=selector))
+    return [(inm_id, similarity) for similarity, inm_id in zip(similarities[0].tolist(), found[0].tolist()) if inm_id >= 0]
+
+
+class DescriptionSearch:
+    """Índice de descripciones del worker, cargado de forma perezosa y recargado cuando se publica uno nuevo."""
+
+    index: Optional[faiss.Index] = None
+    embeddings: Optional[Embeddings] = None
+    model: Optional[str] = None # Modelo de embeddings del índice cargado
+    version: Optional[str] = None # Fecha de construcción del índice cargado
+    checked_at = float("-inf")
+    _load_lock = threading.Lock()
+
+
+    #------CARGA DEL ÍNDICE------
+    @classmethod
+    def load(cls) -> None:
+        """Carga el índice si no está cargado o si la carga nocturna ha publicado otro. Es síncrona: se ejecuta en un hilo."""
+        with cls._load_lock:
+            now = time.monotonic()
+            if now - cls.checked_at < settings.description_search.check_interval_s:
+                return
+            cls.checked_at = now
+            manifest = read_description_manifest(settings.description_search.index_dir)
+            if manifest is None:
+                if cls.index is None:
+                    logger.warning(f"Description index not found in {settings.description_search.index_dir}, run 'python -m src.data_generation.description_index'")
+                return
+            if manifest.get("built_at") == cls.version:
+                return
+
+            index = read_index(settings.description_search.index_dir, INDEX_FILE)
+            model = manifest.get("embedding_model", settings.rag.embedding_model)
+            if model != cls.model:
+                cls.embeddings = cached_embeddings(batched_embeddings(OpenAIEmbeddings(model=model)), model)
+            if cls.index is not None:
+                METRICS["reloads"] += 1
+            cls.index, cls.version, cls.model = index, manifest.get("built_at"), model
+            logger.info(f"Description index {cls.version} loaded: {index.ntotal} properties, model {model}")
+
+
+    #------BÚSQUEDA------
+    @classmethod
+    async def rank(cls, text: str, ids: Optional[Sequence[int]], k: Optional[int] = None, deadline: Optional[Deadline] = None) -> List[Tuple[int, float]]:
+        """
+        Inmuebles de 'ids' cuya descripción más se parece al texto, con su similitud, por encima de
+        'DESCRIPTION_SEARCH_MIN_SCORE'. Lista vacía sin índice o sin tiempo de turno para el embedding.
+        """
+        if time.monotonic() - cls.checked_at >= settings.description_search.check_interval_s:
+            await asyncio.to_thread(cls.load)
+        if cls.index is None:
+            METRICS["no_index"] += 1
+            return []
+        deadline = deadline or Deadline.unlimited()
+        if not deadline.allows(settings.description_search.min_remaining_s):
+            deadline.degrade("skip_description_search")
+            return []
+
+        with embedding_deadline(deadline):
+            vector = np.array(await cls.embeddings.aembed_query(text), dtype="float32")
+        faiss.normalize_L2(vector.reshape(1, -1))
+        hits = await asyncio.to_thread(search_index, cls.index, vector, ids, k or settings.description_search.k)
+
+        METRICS["searches"] += 1
+        METRICS["candidates"] += len(ids) if ids is not None else cls.index.ntotal
+        ranked = [(inm_id, similarity) for inm_id, similarity in hits if similarity >= settings.description_search.min_score]
+        METRICS["ranked"] += len(ranked)
+        return ranked
+
+
+def description_search_metrics() -> Dict[str, Any]:
+    return {**METRICS, "loaded": DescriptionSearch.index is not None, "properties": DescriptionSearch.index.ntotal if DescriptionSearch.index is not None else 0, "version": DescriptionSearch.version}
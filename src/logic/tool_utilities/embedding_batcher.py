@@ -0,0 +1,134 @@
+"""
+Agrupación de las peticiones de embeddings concurrentes (micro-batching).
+Con varias consultas de RAG a la vez, cada una pedía su embedding en una llamada propia y pagaba la latencia fija de la API.
+'EmbeddingBatcher' retiene las peticiones que llegan dentro de una ventana corta ('EMBEDDING_BATCH_WINDOW_MS', o hasta
+'EMBEDDING_BATCH_MAX_BATCH' textos), las envía en una única llamada por lotes y reparte los vectores a cada coroutine.
+    - La ventana empieza con la primera petición pendiente: ninguna espera más de 'window_ms' antes de enviarse.
+    - Si el turno que pide el embedding tiene poco tiempo ('embedding_deadline'), el lote se envía sin esperar.
+    - Las peticiones canceladas (turno cancelado o deadline agotado) se descartan del lote; un error de la API se propaga a
+      todas las peticiones del lote.
+Va detrás de la caché de embeddings: solo se agrupan los textos que no están en caché.
+"""
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src.core.settings import settings
+from src.utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+_request_deadline: ContextVar[Optional[Deadline]] = ContextVar("embedding_deadline", default=None)
+
+METRICS: Dict[str, int] = {"requests": 0, "batches": 0, "texts": 0, "cancelled": 0, "immediate": 0}
+
+
+@contextmanager
+def embedding_deadline(deadline: Optional[Deadline]) -> Iterator[None]:
+    """Asocia el deadline del turno a las peticiones de embeddings que se hagan dentro del bloque."""
+    token = _request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+class EmbeddingBatcher(Embeddings):
+    """
+    'Embeddings' que agrupa las peticiones asíncronas concurrentes. Las llamadas síncronas (ingesta, que ya envía lotes de
+    'RAG_EMBEDDING_BATCH_SIZE') pasan directamente al modelo.
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self.embeddings = embeddings
+        self.window_s = (settings.embedding_batch.window_ms if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or settings.embedding_batch.max_batch
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.flush_at = 0.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    # ------PLANIFICACIÓN DEL ENVÍO------
+    def _wait_for(self, deadline: Optional[Deadline]) -> float:
+        """Segundos que la petición puede esperar a otras: la ventana, o nada si al turno le queda poco tiempo."""
+        if deadline is not None and not deadline.allows(self.window_s + settings.embedding_batch.min_remaining_s):
+            METRICS["immediate"] += 1
+            return 0.0
+        return self.window_s
+
+    def _schedule(self, wait: float) -> None:
+        """Programa el envío dentro de 'wait' segundos, salvo que ya esté programado antes."""
+        flush_at = self.loop.time() + wait
+        if self.flush_handle is not None:
+            if self.flush_at <= flush_at:
+                return
+            self.flush_handle.cancel()
+        self.flush_at = flush_at
+        self.flush_handle = self.loop.call_at(flush_at, self._flush) if wait > 0 else self.loop.call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self.flush_handle = None
+        while self.pending:
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            live = [(text, future) for text, future in batch if not future.done()]
+            METRICS["cancelled"] += len(batch) - len(live)
+            if live:
+                task = self.loop.create_task(self._dispatch(live))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        METRICS["batches"] += 1
+        METRICS["texts"] += len(batch)
+        try:
+            vectors = await self.embeddings.aembed_documents([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    # ------EMBEDDINGS------
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop: # Scripts que crean un bucle nuevo en cada 'asyncio.run'
+            self.loop, self.pending, self.flush_handle = loop, [], None
+
+        METRICS["requests"] += 1
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.pending.append((text, future))
+            futures.append(future)
+
+        if len(self.pending) >= self.max_batch:
+            self._schedule(0.0)
+        else:
+            self._schedule(self._wait_for(_request_deadline.get()))
+        return list(await asyncio.gather(*futures))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def batched_embeddings(embeddings: Embeddings) -> Embeddings:
+    """El modelo detrás del agrupador si 'EMBEDDING_BATCH_ENABLED' está activo."""
+    return EmbeddingBatcher(embeddings) if settings.embedding_batch.enabled else embeddings
+
+
+def embedding_batch_metrics() -> Dict[str, float]:
+    return {**METRICS, "mean_batch": round(METRICS["texts"] / METRICS["batches"], 2) if METRICS["batches"] else None}
@@ -0,0 +1,182 @@
+"""
+Caché de embeddings direccionada por contenido, compartida por las consultas de RAG y la ingesta de la base de conocimiento.
+    - La clave es el hash del texto normalizado (minúsculas, espacios y signos de interrogación/exclamación de los extremos)
+      junto con el nombre del modelo de embeddings: vectores de modelos distintos nunca se mezclan.
+    - Primer nivel: LRU en memoria del proceso ('EMBEDDING_CACHE_LRU_SIZE').
+    - Segundo nivel: Redis, compartido entre workers y con la ingesta. El vector se guarda como bytes float32 (6 KB para 1536
+      dimensiones, frente a ~30 KB en JSON). Si Redis falla o tarda más de 'EMBEDDING_CACHE_REDIS_TIMEOUT', se sigue sin él
+      durante unos segundos: la caché nunca debe retrasar ni romper una consulta.
+'CachedEmbeddings' envuelve cualquier 'Embeddings' de LangChain y solo pide al modelo los textos que no están en caché, en
+una única llamada por lotes.
+"""
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from langchain_core.embeddings import Embeddings
+
+from src.core.factories import create_shared_redis
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+METRICS: Dict[str, int] = {"lru_hits": 0, "redis_hits": 0, "misses": 0}
+
+
+# ------CLAVES------
+def normalize_for_cache(text: str) -> str:
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return re.sub(r"\s+", " ", text).strip(" ¿?¡!")
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_for_cache(text).encode("utf-8")).hexdigest()
+    return f"{settings.embedding_cache.key_prefix}:{model}:{digest}"
+
+
+# ------PRIMER NIVEL: LRU EN MEMORIA------
+class _LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self.items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.lock = threading.Lock() # La ingesta y 'asyncio.to_thread' pueden usarla desde varios hilos
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            vector = self.items.get(key)
+            if vector is not None:
+                self.items.move_to_end(key)
+            return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        with self.lock:
+            self.items[key] = vector
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+LRU = _LRU(settings.embedding_cache.lru_size)
+
+
+# ------SEGUNDO NIVEL: REDIS------
+class _RedisTier:
+    """Lecturas y escrituras por lotes, síncronas (ingesta) y asíncronas (consultas), sobre 'SharedRedis'."""
+
+    def __init__(self):
+        self.redis = create_shared_redis("Embedding cache", settings.embedding_cache.redis_timeout)
+
+    @staticmethod
+    def _write(client: Redis | AsyncRedis, items: Dict[str, bytes]):
+        pipeline = client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(key, value, ex=settings.embedding_cache.ttl_seconds)
+        return pipeline.execute()
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys or not settings.embedding_cache.redis:
+            return [None] * len(keys)
+        return self.redis.run(lambda client: client.mget(keys), [None] * len(keys))
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        if items and settings.embedding_cache.redis:
+            self.redis.run(lambda client: self._write(client, items), None)
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys or not settings.embedding_cache.redis:
+            return [None] * len(keys)
+        return await self.redis.arun(lambda client: client.mget(keys), [None] * len(keys))
+
+    async def aset_many(self, items: Dict[str, bytes]) -> None:
+        if items and settings.embedding_cache.redis:
+            await self.redis.arun(lambda client: self._write(client, items), None)
+
+
+REDIS = _RedisTier()
+
+
+# ------EMBEDDINGS CON CACHÉ------
+class CachedEmbeddings(Embeddings):
+    """
+    'Embeddings' con la caché de dos niveles delante del modelo.
+        - embeddings (Embeddings): modelo real (OpenAI, o uno local en pruebas).
+        - model (str): nombre del modelo, parte de la clave.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str):
+        self.embeddings = embeddings
+        self.model = model
+
+    def _from_memory(self, texts: List[str]) -> Dict[str, Any]:
+        """
+        Busca los textos en la LRU. Devuelve el estado de la petición: claves, vectores encontrados y, por cada clave sin
+        vector, las posiciones que la usan (un texto repetido en el lote solo se calcula una vez).
+        """
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = [LRU.get(key) for key in keys]
+        METRICS["lru_hits"] += sum(vector is not None for vector in vectors)
+        pending: Dict[str, List[int]] = {}
+        for position, vector in enumerate(vectors):
+            if vector is None:
+                pending.setdefault(keys[position], []).append(position)
+        return {"keys": keys, "vectors": vectors, "pending": pending}
+
+    def _fill(self, state: Dict[str, Any], key: str, vector: np.ndarray) -> None:
+        LRU.put(key, vector)
+        for position in state["pending"].pop(key):
+            state["vectors"][position] = vector
+
+    def _merge_redis(self, state: Dict[str, Any], values: List[Optional[bytes]]) -> None:
+        for key, value in zip(list(state["pending"]), values):
+            if value is not None:
+                METRICS["redis_hits"] += 1
+                self._fill(state, key, np.frombuffer(value, dtype="float32"))
+
+    def _store(self, state: Dict[str, Any], computed: List[List[float]]) -> Dict[str, bytes]:
+        """Guarda en memoria los vectores calculados; devuelve los bytes a escribir en Redis."""
+        METRICS["misses"] += len(computed)
+        to_redis = {}
+        for key, vector in zip(list(state["pending"]), computed):
+            vector = np.asarray(vector, dtype="float32")
+            self._fill(state, key, vector)
+            to_redis[key] = vector.tobytes()
+        return to_redis
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        state = self._from_memory(texts)
+        self._merge_redis(state, REDIS.get_many(list(state["pending"])))
+        if state["pending"]:
+            computed = self.embeddings.embed_documents([texts[positions[0]] for positions in state["pending"].values()])
+            REDIS.set_many(self._store(state, computed))
+        return [vector.tolist() for vector in state["vectors"]]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        state = self._from_memory(texts)
+        self._merge_redis(state, await REDIS.aget_many(list(state["pending"])))
+        if state["pending"]:
+            computed = await self.embeddings.aembed_documents([texts[positions[0]] for positions in state["pending"].values()])
+            await REDIS.aset_many(self._store(state, computed))
+        return [vector.tolist() for vector in state["vectors"]]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def cached_embeddings(embeddings: Embeddings, model: str) -> Embeddings:
+    """El modelo envuelto en la caché si 'EMBEDDING_CACHE_ENABLED' está activo."""
+    return CachedEmbeddings(embeddings, model) if settings.embedding_cache.enabled else embeddings
+
+
+def embedding_cache_metrics() -> Dict[str, Any]:
+    lookups = METRICS["lru_hits"] + METRICS["redis_hits"] + METRICS["misses"]
+    return {**METRICS, "redis_errors": REDIS.redis.errors, "hit_rate": round((lookups - METRICS["misses"]) / lookups, 3) if lookups else None, "lru_items": len(LRU.items)}
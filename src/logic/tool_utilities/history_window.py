@@ -0,0 +1,73 @@
+"""
+Construcción del historial que reciben las cadenas: el resumen incremental de la conversación más los mensajes recientes
+que caben en un presupuesto de tokens. Los mensajes largos se recortan y los más antiguos quedan cubiertos por el resumen.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from src.core.settings import settings
+from src.schemas.message import MessageModel, ConversationSummaryModel
+from src.utils.tokens import count_tokens, truncate_tokens
+
+MESSAGE_OVERHEAD_TOKENS = 6 # Claves y separadores de cada mensaje en el JSON del historial
+
+
+def message_tokens(message: MessageModel) -> int:
+    """Tokens del mensaje: usa el conteo almacenado y solo cuenta localmente los mensajes antiguos que no lo tienen."""
+    return message.tokens or count_tokens(message.content or "")
+
+
+def history_entry(message: MessageModel, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Entrada del historial para un mensaje, en el formato que esperan los prompts."""
+    content = message.content or ""
+    if max_tokens and message_tokens(message) > max_tokens:
+        content = truncate_tokens(content, max_tokens)
+    if message.is_bot:
+        return {"bot": content, "tool": message.metadata.get("tool", None)}
+    return {"user": content}
+
+
+def build_history(messages: List[MessageModel], summary: Optional[ConversationSummaryModel] = None) -> List[Dict[str, Any]]:
+    """
+    Historial para las cadenas a partir de todos los mensajes de la sesión.
+        - messages (List[MessageModel]): mensajes de la sesión, del más antiguo al más reciente.
+        - summary (ConversationSummaryModel): resumen de los primeros 'summarized_until' mensajes.
+    Devuelve una lista con el resumen (si existe) seguido de los mensajes recientes no resumidos que caben en el presupuesto.
+    """
+    memory = settings.memory
+    if not memory.enabled:
+        return [history_entry(message) for message in messages[-4:]]
+
+    summary = summary or ConversationSummaryModel()
+    pending = messages[summary.summarized_until:]
+
+    # Se recorren los mensajes del más reciente al más antiguo hasta agotar el presupuesto. El último mensaje siempre entra.
+    recent: List[Dict[str, Any]] = []
+    budget = memory.history_token_budget
+    for message in reversed(pending):
+        cost = min(message_tokens(message), memory.message_max_tokens) + MESSAGE_OVERHEAD_TOKENS
+        if recent and cost > budget:
+            break
+        recent.append(history_entry(message, memory.message_max_tokens))
+        budget -= cost
+    recent.reverse()
+
+    if summary.content:
+        return [{"summary": summary.content}] + recent
+    return recent
+
+
+def format_history(history: List[Dict[str, Any]]) -> str:
+    """Serialización compacta del historial para los prompts."""
+    return json.dumps(history, ensure_ascii=False, separators=(",", ":"))
+
+
+def pending_summary_messages(messages: List[MessageModel], summary: ConversationSummaryModel) -> List[MessageModel]:
+    """
+    Mensajes que deben incorporarse al resumen: los no resumidos salvo los 'keep_recent_messages' más recientes.
+    Solo se devuelven cuando hay al menos 'summary_batch_messages' para agrupar las llamadas al LLM.
+    """
+    memory = settings.memory
+    end = len(messages) - memory.keep_recent_messages
+    pending = messages[summary.summarized_until:end] if end > summary.summarized_until else []
+    return pending if len(pending) >= memory.summary_batch_messages else []
@@ -0,0 +1,152 @@
+"""
+Recuperación híbrida para la herramienta de información (RAG): índice BM25 en memoria sobre los mismos fragmentos que el
+índice FAISS, fusionado con la búsqueda vectorial por reciprocal rank fusion (RRF).
+    - BM25 encuentra los términos exactos ("ITP", "fianza", "cédula de habitabilidad") que la búsqueda densa suele perder.
+    - RRF combina las dos listas por posición (no por puntuación, que no son comparables), con un peso por lista.
+    - Reordenación opcional en CPU: los primeros candidatos fusionados se reordenan según la cobertura de los términos de la
+      consulta (ponderada por IDF) y las parejas de palabras consecutivas de la consulta que aparecen literalmente.
+Las posiciones son las del índice FAISS ('index_to_docstore_id'), así que el resultado se traduce a documentos igual que en
+la búsqueda vectorial.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.settings import settings
+from src.utils.general_utilities import normalize_text
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a al algo ante antes como con cual cuando de del desde donde el ella en entre es esa ese eso esta este esto hay la las "
+    "le les lo los mas me mi mis muy ni no nos o para pero por que se si sin sobre son su sus te tiene tu un una uno unos "
+    "unas y ya yo ha han he hemos tengo tener puede puedo debo debe".split()
+)
+
+
+# ------TOKENIZACIÓN------
+def _stem(token: str) -> str:
+    """Plural simple: 'alquileres' -> 'alquiler', 'gastos' -> 'gasto'. Las siglas y palabras cortas se dejan igual."""
+    if len(token) > 5 and token.endswith("es") and token[-3] not in "aeiou":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in TOKEN_PATTERN.findall(normalize_text(text)) if token not in STOPWORDS]
+
+
+# ------ÍNDICE BM25------
+class BM25Index:
+    """
+    Índice invertido BM25 (Okapi) sobre una lista de textos. Cada término guarda las posiciones de los documentos que lo
+    contienen y su frecuencia, en arrays de numpy; la consulta acumula las puntuaciones solo de esas posiciones.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: Optional[float] = None, b: Optional[float] = None):
+        self.k1 = settings.rag.bm25_k1 if k1 is None else k1
+        self.b = settings.rag.bm25_b if b is None else b
+        self.size = len(texts)
+        self.tokens: List[List[str]] = [tokenize(text) for text in texts]
+        self.lengths = np.array([len(tokens) for tokens in self.tokens], dtype="float32")
+        self.average_length = float(self.lengths.mean()) if self.size else 0.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for position, tokens in enumerate(self.tokens):
+            for term, frequency in Counter(tokens).items():
+                postings.setdefault(term, []).append((position, frequency))
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            term: (np.array([p for p, _ in items], dtype="int64"), np.array([f for _, f in items], dtype="float32"))
+            for term, items in postings.items()
+        }
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (self.size - len(items[0]) + 0.5) / (len(items[0]) + 0.5)) for term, items in self.postings.items()
+        }
+        # Normalización por longitud de BM25, precalculada por documento
+        self.norms = self.k1 * (1 - self.b + self.b * self.lengths / (self.average_length or 1))
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Las 'k' posiciones con mayor puntuación BM25 (solo documentos con algún término de la consulta)."""
+        scores = np.zeros(self.size, dtype="float32")
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            positions, frequencies = self.postings[term]
+            scores[positions] += self.idf[term] * frequencies * (self.k1 + 1) / (frequencies + self.norms[positions])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        return sorted(((int(position), float(scores[position])) for position in matched), key=lambda item: -item[1])
+
+
+# ------FUSIÓN Y REORDENACIÓN------
+def reciprocal_rank_fusion(rankings: List[Tuple[List[int], float]], rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fusiona listas de posiciones ordenadas: cada documento suma peso / (rrf_k + rango) por cada lista en la que aparece.
+        - rankings (List[Tuple[List[int], float]]): (posiciones ordenadas, peso de la lista).
+    """
+    scores: Dict[int, float] = {}
+    for positions, weight in rankings:
+        for rank, position in enumerate(positions, start=1):
+            scores[position] = scores.get(position, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def rerank(query: str, fused: List[Tuple[int, float]], bm25: BM25Index) -> List[Tuple[int, float]]:
+    """
+    Reordenación ligera de los candidatos fusionados. La puntuación combina la de RRF (normalizada) con la proporción de los
+    términos de la consulta, ponderada por IDF, que aparecen en el fragmento, y con las parejas de términos consecutivos de
+    la consulta que aparecen también consecutivas en él ("cédula de habitabilidad", "contrato de arras").
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not fused:
+        return fused
+    weights = {term: bm25.idf.get(term, 0.0) for term in terms}
+    total_weight = sum(weights.values()) or 1.0
+    query_pairs = set(zip(terms, terms[1:]))
+    top_score = fused[0][1] or 1.0
+
+    reranked = []
+    for position, score in fused:
+        tokens = bm25.tokens[position]
+        present = set(tokens)
+        coverage = sum(weight for term, weight in weights.items() if term in present) / total_weight
+        phrases = len(query_pairs & set(zip(tokens, tokens[1:]))) / len(query_pairs) if query_pairs else 0.0
+        reranked.append((position, score / top_score + settings.rag.rerank_coverage_weight * coverage + settings.rag.rerank_phrase_weight * phrases))
+    return sorted(reranked, key=lambda item: -item[1])
+
+
+def lexical_positions(query: str, bm25: Optional[BM25Index]) -> List[int]:
+    """Candidatos de BM25 ordenados por puntuación (vacío sin índice BM25)."""
+    return [position for position, _ in bm25.search(query, settings.rag.hybrid_candidates)] if bm25 is not None else []
+
+
+def hybrid_rank(
+    query: str, dense_positions: List[int], bm25: Optional[BM25Index], k: int, rerank_results: Optional[bool] = None,
+    sparse_positions: Optional[List[int]] = None,
+) -> List[int]:
+    """
+    Posiciones finales de la recuperación híbrida.
+        - dense_positions (List[int]): candidatos de FAISS ordenados por distancia.
+        - bm25 (BM25Index): sin índice BM25 se devuelven los candidatos densos.
+        - sparse_positions (List[int]): candidatos de BM25 ya calculados con 'lexical_positions'.
+    """
+    dense_positions = [position for position in dense_positions if position >= 0]
+    if bm25 is None:
+        return dense_positions[:k]
+    if sparse_positions is None:
+        sparse_positions = lexical_positions(query, bm25)
+    fused = reciprocal_rank_fusion(
+        [(dense_positions, settings.rag.hybrid_vector_weight), (sparse_positions, settings.rag.hybrid_bm25_weight)], settings.rag.rrf_k
+    )
+    if settings.rag.rerank if rerank_results is None else rerank_results:
+        fused = rerank(query, fused[:settings.rag.hybrid_candidates], bm25)
+    return [position for position, _ in fused[:k]]
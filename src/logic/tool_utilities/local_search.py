@@ -0,0 +1,144 @@
+"""
+Búsqueda determinista sin LLM, usada en modo degradado cuando el proveedor de modelos no está disponible.
+Traduce la petición a una consulta SQL con reglas sencillas: operación, tipo de inmueble, localización (poblaciones,
+municipios y barrios del catálogo), dormitorios mínimos y precio máximo. También decide de forma local a qué herramienta
+corresponde la petición (contacto, búsqueda o información).
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from src.utils.general_utilities import normalize_text
+from src.data_generation.sql_search_generation import execute_sql_query
+from src.logic.tool_utilities.reference_resolver import mentioned_prices
+from src.config import table_name
+
+logger = logging.getLogger(__name__)
+
+OPERATION_WORDS: Dict[str, str] = {
+    "alquiler": "Alquiler", "alquilar": "Alquiler", "alquilo": "Alquiler", "arrendar": "Alquiler",
+    "venta": "Venta", "comprar": "Venta", "compra": "Venta", "compro": "Venta",
+    "traspaso": "Traspaso", "traspasar": "Traspaso",
+}
+
+TYPE_WORDS: Dict[str, str] = {
+    "piso": "Pisos", "pisos": "Pisos", "apartamento": "Pisos", "apartamentos": "Pisos", "atico": "Pisos", "duplex": "Pisos",
+    "casa": "Casas o chalets", "casas": "Casas o chalets", "chalet": "Casas o chalets", "chalets": "Casas o chalets",
+    "finca": "Fincas y solares", "fincas": "Fincas y solares", "solar": "Fincas y solares", "solares": "Fincas y solares",
+    "terreno": "Fincas y solares", "parcela": "Fincas y solares",
+    "local": "Locales", "locales": "Locales", "garaje": "Garajes", "garajes": "Garajes", "plaza de garaje": "Garajes",
+    "negocio": "Negocios", "negocios": "Negocios", "nave": "Naves", "naves": "Naves", "edificio": "Edificios",
+    "edificios": "Edificios", "oficina": "Oficinas", "oficinas": "Oficinas", "trastero": "Trasteros", "trasteros": "Trasteros",
+}
+
+BEDROOMS_PATTERN = re.compile(r"\b(\d{1,2}|un|una|dos|tres|cuatro|cinco|seis)\s+(?:dormitorios?|habitacion(?:es)?|cuartos?)\b")
+NUMBER_WORDS = {"un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6}
+MAX_PRICE_PATTERN = re.compile(r"\b(hasta|menos de|maximo|max|como mucho|no (?:pase|supere) de|por debajo de|inferior a)\b")
+
+CONTACT_PATTERN = re.compile(r"\b(contact\w*|telefono|llamar|email|correo|oficinas?|direccion de la agencia|horario)\b")
+SEARCH_PATTERN = re.compile(r"\b(busc\w*|necesito|encontrar|ensename|muestrame|disponibles?)\b")
+
+
+@dataclass
+class LocalQuery:
+    filters: Dict[str, object] = field(default_factory=dict)
+    sql: str = ""
+
+    @property
+    def empty(self) -> bool:
+        return not self.filters
+
+
+# ------VOCABULARIO DEL CATÁLOGO------
+@lru_cache(maxsize=1)
+def _locations() -> Tuple[Tuple[str, str, str], ...]:
+    """(texto normalizado, columna, valor) de poblaciones, municipios y barrios. Las entradas más largas primero."""
+    entries = {}
+    for column in ("Poblacion", "Municipio", "Barrio"):
+        rows = execute_sql_query(f"SELECT DISTINCT {column} FROM {table_name} WHERE {column} IS NOT NULL") or []
+        for row in rows:
+            value = row[0]
+            key = normalize_text(value)
+            if len(key) >= 4 and key not in entries: # Poblaciones y municipios tienen preferencia sobre barrios homónimos
+                entries[key] = (key, column, value)
+    return tuple(sorted(entries.values(), key=lambda entry: -len(entry[0])))
+
+
+def known_places() -> Tuple[str, ...]:
+    """Poblaciones, municipios y barrios del catálogo, normalizados."""
+    return tuple(key for key, _, _ in _locations())
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# ------TRADUCCIÓN DE LA PETICIÓN------
+def build_local_query(text: str, limit: int = 5) -> LocalQuery:
+    """Construye la consulta SQL de la petición. Si no se reconoce ningún criterio se devuelve sin filtros."""
+    normalized = normalize_text(text)
+    filters: Dict[str, object] = {}
+    conditions: List[str] = []
+
+    operation = next((value for word, value in OPERATION_WORDS.items() if re.search(rf"\b{word}\b", normalized)), None)
+    if operation:
+        filters["Operacion"] = operation
+
+    types = list(dict.fromkeys(value for word, value in TYPE_WORDS.items() if re.search(rf"\b{word}\b", normalized)))
+    if types:
+        filters["Tipo"] = types
+
+    for key, column, value in _locations():
+        if re.search(rf"\b{re.escape(key)}\b", normalized):
+            filters[column] = value
+            break
+
+    if match := BEDROOMS_PATTERN.search(normalized):
+        amount = match.group(1)
+        filters["NumDormitorios"] = int(amount) if amount.isdigit() else NUMBER_WORDS[amount]
+
+    prices = mentioned_prices(normalized)
+    if prices and MAX_PRICE_PATTERN.search(normalized):
+        filters["Precio"] = max(prices)
+
+    for column, value in filters.items():
+        if column == "Tipo":
+            conditions.append(f"Tipo IN ({', '.join(_quote(item) for item in value)})")
+        elif column == "NumDormitorios":
+            conditions.append(f"NumDormitorios >= {int(value)}")
+        elif column == "Precio":
+            conditions.append(f"Precio <= {int(value)}")
+        else:
+            conditions.append(f"{column} = {_quote(value)}")
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"SELECT * FROM {table_name}{where} ORDER BY PrioridadRK DESC, Precio ASC LIMIT {int(limit)}"
+    return LocalQuery(filters=filters, sql=sql)
+
+
+def local_search(text: str, limit: int = 5) -> Tuple[LocalQuery, List]:
+    """Ejecuta la búsqueda local. Devuelve la consulta y las filas (sqlite3.Row)."""
+    query = build_local_query(text, limit)
+    if query.empty:
+        return query, []
+    rows = execute_sql_query(query.sql) or []
+    logger.info(f"Local search with filters {query.filters}: {len(rows)} results")
+    return query, rows
+
+
+def local_route(text: str) -> str:
+    """Herramienta que corresponde a la petición sin clasificador: 'contacto', 'busqueda' o 'info'."""
+    normalized = normalize_text(text)
+    query = build_local_query(text)
+    # 'oficina' es también un tipo de inmueble: solo es contacto si no hay otros criterios de búsqueda
+    search_criteria = {key for key in query.filters if key not in ("Poblacion", "Municipio", "Barrio")}
+    if query.filters.get("Tipo") == ["Oficinas"]:
+        search_criteria.discard("Tipo")
+    if CONTACT_PATTERN.search(normalized) and not search_criteria and not SEARCH_PATTERN.search(normalized):
+        return "contacto"
+    # La operación por sí sola no basta ("¿cómo funciona la fianza en un alquiler?" es una consulta de información)
+    if set(query.filters) - {"Operacion"} or SEARCH_PATTERN.search(normalized):
+        return "busqueda"
+    return "info"
@@ -0,0 +1,288 @@
+"""
+Precarga especulativa de la presentación detallada de inmuebles.
+Tras una presentación general, el siguiente turno suele ser "háblame del X", que pasa por 'specific_presentation_dict'
+(datos enriquecidos, URL, fotos y coordenadas). Al mostrar los resultados se lanza en segundo plano, ligada al turno, la
+preparación de los primeros inmuebles: datos de detalle, comprobación de las URLs de las fotos y, opcionalmente, la
+presentación detallada generada por el LLM. El turno siguiente usa esos datos si están disponibles.
+El trabajo especulativo está limitado por sesión y se registran métricas de su utilidad.
+Las tareas en curso son del worker que las lanzó, pero cada resultado se guarda también en Redis ('PREFETCH_REDIS'), con la
+vida de 'PREFETCH_TTL_SECONDS': el turno siguiente puede atenderlo cualquier worker de uvicorn. El worker que lanzó la
+precarga espera a la tarea si aún no ha terminado; otro worker solo usa lo que ya esté en Redis. Si Redis falla o tarda
+más de 'PREFETCH_REDIS_TIMEOUT' se sigue sin él. Los límites por sesión también se cuentan en Redis, sumando lo que lanzan
+todos los workers; sin Redis se cuentan en cada worker.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+import requests
+from redis.asyncio import Redis
+
+from src.core.factories import create_shared_redis
+from src.core.settings import settings
+from src.utils.turn_runner import current_turn, spawn_in_turn
+from src.data_generation.sql_search_generation import execute_sql_query
+from src.logic.tool_utilities.qa_utilities import generate_sql_ids, parse_db_answer, filter_presentation_fields, specific_presentation_dict
+
+logger = logging.getLogger(__name__)
+
+# (datos enriquecidos, URL del inmueble, foto principal, fotos, coordenadas), como 'specific_presentation_dict'
+PropertyDetail = Tuple[Dict, str, str, List[str], Tuple[float, float]]
+
+
+@dataclass
+class PrefetchedProperty:
+    detail_task: asyncio.Task
+    text_task: Optional[asyncio.Task] = None
+    created_at: float = field(default_factory=time.monotonic)
+    used: bool = False
+
+
+@dataclass
+class SessionPrefetch:
+    properties: Dict[int, PrefetchedProperty] = field(default_factory=dict)
+    prefetched: int = 0 # Inmuebles precargados en la sesión (límite 'max_per_session')
+    pregenerated: int = 0
+
+
+METRICS: Dict[str, int] = {
+    "scheduled": 0, "capped": 0, "hits": 0, "redis_hits": 0, "text_hits": 0, "misses": 0, "failed": 0,
+    "unused": 0, "photos_checked": 0, "photos_invalid": 0,
+}
+
+# ------ALMACÉN COMPARTIDO: REDIS------
+class _PrefetchStore:
+    """
+    Resultados de la precarga por sesión e inmueble en un hash de Redis ('detail', 'text') y contadores de los límites
+    por sesión, compartidos entre workers.
+    """
+
+    def __init__(self):
+        self.redis = create_shared_redis("Prefetch", settings.prefetch.redis_timeout)
+
+    @staticmethod
+    def key(session_id: str, inm_id: int) -> str:
+        return f"{settings.prefetch.key_prefix}:{session_id}:{inm_id}"
+
+    @staticmethod
+    def budget_key(session_id: str) -> str:
+        return f"{settings.prefetch.key_prefix}:{session_id}:budget"
+
+    async def put(self, session_id: str, inm_id: int, field: str, value: Any) -> None:
+        if not settings.prefetch.redis:
+            return
+        try:
+            payload = orjson.dumps(value, default=str)
+        except TypeError as e:
+            logger.warning(f"Prefetch: property {inm_id} is not serializable: {e}")
+            return
+
+        async def operation(client: Redis) -> None:
+            key = self.key(session_id, inm_id)
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hset(key, field, payload)
+            pipeline.expire(key, int(settings.prefetch.ttl_seconds))
+            await pipeline.execute()
+
+        await self.redis.arun(operation, None)
+
+    async def get(self, session_id: str, inm_id: int) -> Tuple[Optional[PropertyDetail], Optional[str]]:
+        if not settings.prefetch.redis:
+            return None, None
+        detail, text = await self.redis.arun(lambda client: client.hmget(self.key(session_id, inm_id), ["detail", "text"]), (None, None))
+        if not detail:
+            return None, None
+        try:
+            data, url, main_photo, photos, coords = orjson.loads(detail)
+            return (data, url, main_photo, photos, tuple(coords) if coords else coords), orjson.loads(text) if text else None
+        except (orjson.JSONDecodeError, ValueError) as e:
+            logger.warning(f"Prefetch: invalid entry for property {inm_id} in session {session_id}: {e}")
+            return None, None
+
+    async def reserve(self, session_id: str, counter: str, requested: int, limit: int) -> Optional[int]:
+        """
+        Suma 'requested' al contador 'counter' de la sesión y devuelve cuántos caben bajo 'limit' contando lo que ya
+        reservaron todos los workers. None si Redis no está disponible: el límite se cuenta entonces en este worker.
+        """
+        if not settings.prefetch.redis:
+            return None
+
+        async def operation(client: Redis) -> int:
+            key = self.budget_key(session_id)
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hincrby(key, counter, requested)
+            pipeline.expire(key, int(settings.prefetch.budget_ttl_seconds))
+            total, _ = await pipeline.execute()
+            return max(0, min(requested, limit - (int(total) - requested)))
+
+        return await self.redis.arun(operation, None) if requested else 0
+
+
+STORE = _PrefetchStore()
+
+
+# ------TRABAJO ESPECULATIVO------
+def _check_photo(url: str) -> bool:
+    try:
+        response = requests.head(url, timeout=settings.prefetch.photo_timeout, allow_redirects=True)
+        return response.status_code < 400
+    except requests.RequestException:
+        return False
+
+
+async def _valid_photos(urls: List[str]) -> List[str]:
+    """URLs de fotos que responden, en el mismo orden."""
+    semaphore = asyncio.Semaphore(settings.prefetch.photo_concurrency)
+
+    async def check(url: str) -> bool:
+        async with semaphore:
+            return await asyncio.to_thread(_check_photo, url)
+
+    valid = await asyncio.gather(*(check(url) for url in urls))
+    METRICS["photos_checked"] += len(urls)
+    METRICS["photos_invalid"] += valid.count(False)
+    return [url for url, ok in zip(urls, valid) if ok]
+
+
+def load_property_detail(inm_id: int) -> Optional[PropertyDetail]:
+    """Datos de la presentación detallada de un inmueble, igual que en el PASO 3 de QAChain.execute."""
+    rows = execute_sql_query(generate_sql_ids([inm_id]))
+    filtered = filter_presentation_fields(parse_db_answer(rows)) if rows else {}
+    if inm_id not in filtered:
+        return None
+    return specific_presentation_dict(filtered[inm_id], inm_id)
+
+
+async def _prefetch_detail(session_id: str, inm_id: int) -> Optional[PropertyDetail]:
+    detail = await asyncio.to_thread(load_property_detail, inm_id)
+    if detail and settings.prefetch.validate_photos:
+        data, url, main_photo, photos, coords = detail
+        candidates = list(dict.fromkeys(([main_photo] if main_photo else []) + list(photos or [])))
+        valid = await _valid_photos(candidates)
+        main_photo = main_photo if main_photo in valid else (valid[0] if valid else None)
+        detail = (data, url, main_photo, [photo for photo in (photos or []) if photo in valid and photo != main_photo], coords)
+    if detail:
+        await STORE.put(session_id, inm_id, "detail", detail)
+    return detail
+
+
+async def _prefetch_text(session_id: str, detail_task: asyncio.Task, generate_text: Callable[[Dict, int], Awaitable[str]], inm_id: int) -> Optional[str]:
+    detail = await detail_task
+    text = await generate_text(detail[0], inm_id) if detail else None
+    if text:
+        await STORE.put(session_id, inm_id, "text", text)
+    return text
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception():
+        logger.warning(f"Speculative prefetch failed: {task.exception()}")
+
+
+# ------REGISTRO POR SESIÓN------
+class PropertyPrefetcher:
+
+    sessions: "OrderedDict[str, SessionPrefetch]" = OrderedDict()
+
+    @classmethod
+    def _session(cls, session_id: str) -> SessionPrefetch:
+        if session_id in cls.sessions:
+            cls.sessions.move_to_end(session_id)
+        else:
+            cls.sessions[session_id] = SessionPrefetch()
+            while len(cls.sessions) > settings.prefetch.max_sessions:
+                _, evicted = cls.sessions.popitem(last=False)
+                cls._discard(evicted.properties.values())
+        return cls.sessions[session_id]
+
+    @staticmethod
+    def _discard(entries) -> None:
+        for entry in entries:
+            METRICS["unused"] += not entry.used
+            for task in (entry.detail_task, entry.text_task):
+                if task and not task.done():
+                    task.cancel()
+
+    @classmethod
+    async def schedule(cls, inm_ids: List[int], generate_text: Optional[Callable[[Dict, int], Awaitable[str]]] = None) -> int:
+        """
+        Lanza la precarga de los primeros inmuebles de una presentación general. Devuelve cuántos se han lanzado.
+            - inm_ids (List[int]): IDs en el orden mostrado al usuario.
+            - generate_text: genera la presentación detallada a partir de los datos (solo con 'PREFETCH_PREGENERATE').
+        Fuera de un turno (sin sesión identificada) no se precarga nada.
+        """
+        turn = current_turn()
+        if not settings.prefetch.enabled or turn is None:
+            return 0
+
+        session = cls._session(turn.session_id)
+        candidates = [inm_id for inm_id in inm_ids[:settings.prefetch.top_results] if inm_id not in session.properties]
+        allowed = await STORE.reserve(turn.session_id, "prefetched", len(candidates), settings.prefetch.max_per_session)
+        if allowed is None:
+            allowed = max(0, min(len(candidates), settings.prefetch.max_per_session - session.prefetched))
+        METRICS["capped"] += len(candidates) - allowed
+        candidates = candidates[:allowed]
+
+        pregenerations = 0
+        if generate_text and settings.prefetch.pregenerate:
+            limit = settings.prefetch.max_pregenerations_per_session
+            pregenerations = await STORE.reserve(turn.session_id, "pregenerated", len(candidates), limit)
+            if pregenerations is None:
+                pregenerations = max(0, min(len(candidates), limit - session.pregenerated))
+
+        for position, inm_id in enumerate(candidates):
+            detail_task = spawn_in_turn(_prefetch_detail(turn.session_id, inm_id))
+            detail_task.add_done_callback(_log_failure)
+            entry = PrefetchedProperty(detail_task)
+            if position < pregenerations:
+                entry.text_task = spawn_in_turn(_prefetch_text(turn.session_id, detail_task, generate_text, inm_id))
+                entry.text_task.add_done_callback(_log_failure)
+                session.pregenerated += 1
+            session.properties[inm_id] = entry
+            session.prefetched += 1
+
+        METRICS["scheduled"] += len(candidates)
+        logger.info(f"Prefetch scheduled for {len(candidates)} properties in session {turn.session_id}")
+        return len(candidates)
+
+    @classmethod
+    async def get(cls, session_id: Optional[str], inm_id: int) -> Tuple[Optional[PropertyDetail], Optional[str]]:
+        """
+        Datos precargados de un inmueble: (detalle, presentación pregenerada). Si la precarga del detalle sigue en curso en
+        este worker se espera a que termine, ya que es el mismo trabajo que habría que hacer. El texto solo se usa si ya
+        está listo. Si la precarga se lanzó en otro worker se toma de Redis.
+        """
+        session = cls.sessions.get(session_id) if session_id else None
+        entry = session.properties.get(inm_id) if session else None
+        if entry is None or time.monotonic() - entry.created_at > settings.prefetch.ttl_seconds:
+            detail, text = await STORE.get(session_id, inm_id) if session_id and entry is None else (None, None)
+            if detail is None:
+                METRICS["misses"] += 1
+                return None, None
+            METRICS["hits"] += 1
+            METRICS["redis_hits"] += 1
+            METRICS["text_hits"] += text is not None
+            return detail, text
+
+        await asyncio.wait({entry.detail_task})
+        if entry.detail_task.cancelled() or entry.detail_task.exception() or not entry.detail_task.result():
+            METRICS["failed"] += 1
+            return None, None
+
+        text = None
+        task = entry.text_task
+        if task and task.done() and not task.cancelled() and not task.exception():
+            text = task.result()
+        entry.used = True
+        METRICS["hits"] += 1
+        METRICS["text_hits"] += text is not None
+        return entry.detail_task.result(), text
+
+
+def prefetch_metrics() -> Dict[str, Any]:
+    """Métricas acumuladas de la precarga. 'usefulness' es la fracción de inmuebles precargados que se llegan a usar."""
+    return {**METRICS, "redis_errors": STORE.redis.errors, "usefulness": round(METRICS["hits"] / METRICS["scheduled"], 3) if METRICS["scheduled"] else None}
@@ -0,0 +1,179 @@
+"""
+Construcción de los prompts de las cadenas con un prefijo estático estable.
+Las plantillas de 'prompts/' se dividen en secciones ('###'). Las secciones sin variables, o cuyas variables son valores
+fijos de la cadena (dialecto, instrucciones de herramientas, información de contacto...), se rellenan una sola vez y se
+colocan al principio del prompt en su orden original. Las secciones con valores de cada llamada (input, historial,
+nombre de usuario...) van a continuación. Así el prefijo es idéntico byte a byte entre llamadas y el proveedor puede
+reutilizar su caché de prompts.
+
+Además se cuentan localmente los tokens de cada segmento y, cuando el proveedor lo informa, se registra la división
+entre tokens de entrada cacheados y no cacheados de cada llamada.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.prompts import PromptTemplate
+
+from src.utils.tokens import count_tokens
+from src.utils.llm_usage import record_llm_call
+
+logger = logging.getLogger(__name__)
+
+SECTION_PATTERN = re.compile(r"^(?=###)", re.MULTILINE)
+VARIABLE_PATTERN = re.compile(r"(?<!\{)\{([a-zA-Z_][a-zA-Z0-9_]*)\}(?!\})")
+
+
+@dataclass
+class PromptSegment:
+    title: str
+    template: str
+    variables: List[str]
+    static: bool
+
+
+@dataclass
+class AssembledPrompt:
+    chain_name: str
+    prompt: PromptTemplate
+    segments: List[PromptSegment]
+    static_prefix: str # Texto final del prefijo estático (ya renderizado)
+    static_tokens: int
+    input_variables: List[str] = field(default_factory=list)
+
+    def segment_tokens(self, inputs: Dict[str, Any]) -> Dict[str, int]:
+        """Tokens de cada segmento del prompt para los valores indicados."""
+        tokens = {}
+        for segment in self.segments:
+            if segment.static:
+                tokens[segment.title] = count_tokens(_unescape(segment.template))
+            else:
+                values = {var: inputs.get(var, "") for var in segment.variables}
+                tokens[segment.title] = count_tokens(PromptTemplate.from_template(segment.template).format(**values))
+        return tokens
+
+
+# Registro de prompts por cadena. El callback de tokens lo usa para conocer el prefijo estático de cada cadena.
+PROMPT_REGISTRY: Dict[str, AssembledPrompt] = {}
+
+# Última división de tokens de entrada registrada por cadena (benchmarks y métricas)
+PROMPT_USAGE: Dict[str, Dict[str, int]] = {}
+
+
+# ------UTILIDADES DE PLANTILLA------
+def _escape(value: str) -> str:
+    """Escapa las llaves de un valor fijo para que PromptTemplate no las interprete como variables."""
+    return str(value).replace("{", "{{").replace("}", "}}")
+
+
+def _unescape(template: str) -> str:
+    return template.replace("{{", "{").replace("}}", "}")
+
+
+def _split_sections(template: str) -> List[str]:
+    return [section for section in SECTION_PATTERN.split(template) if section.strip()]
+
+
+def _section_title(section: str) -> str:
+    first_line = section.strip().splitlines()[0]
+    return first_line.lstrip("#").strip().rstrip(":")[:40]
+
+
+# ------ENSAMBLADO------
+def assemble_prompt(chain_name: str, template: str, **static_values: Any) -> AssembledPrompt:
+    """
+    Ordena la plantilla con las secciones estáticas primero y rellena los valores fijos.
+        - chain_name (str): nombre de la cadena (el mismo que en la política de modelos).
+        - template (str): contenido del fichero de prompt.
+        - static_values: valores fijos durante toda la vida de la aplicación.
+    """
+    static_segments: List[PromptSegment] = []
+    dynamic_segments: List[PromptSegment] = []
+
+    for section in _split_sections(template):
+        variables = list(dict.fromkeys(VARIABLE_PATTERN.findall(section)))
+        for var in variables:
+            if var in static_values:
+                section = section.replace("{" + var + "}", _escape(static_values[var]))
+        pending = [var for var in variables if var not in static_values]
+
+        segment = PromptSegment(title=_section_title(section), template=section, variables=pending, static=not pending)
+        (static_segments if segment.static else dynamic_segments).append(segment)
+
+    # Se asegura el salto de línea entre la última sección estática y la primera dinámica
+    segments = static_segments + dynamic_segments
+    for segment in segments:
+        if not segment.template.endswith("\n"):
+            segment.template += "\n"
+
+    static_prefix = _unescape("".join(segment.template for segment in static_segments))
+    prompt = PromptTemplate.from_template("".join(segment.template for segment in segments))
+
+    assembled = AssembledPrompt(
+        chain_name=chain_name,
+        prompt=prompt,
+        segments=segments,
+        static_prefix=static_prefix,
+        static_tokens=count_tokens(static_prefix),
+        input_variables=prompt.input_variables,
+    )
+    PROMPT_REGISTRY[chain_name] = assembled
+    return assembled
+
+
+def build_prompt(chain_name: str, template: str, **static_values: Any) -> PromptTemplate:
+    """Devuelve el PromptTemplate ensamblado de una cadena."""
+    return assemble_prompt(chain_name, template, **static_values).prompt
+
+
+# ------REGISTRO DE TOKENS CACHEADOS------
+class PromptCacheLogger(BaseCallbackHandler):
+    """Registra por llamada los tokens locales (prefijo estático / dinámico) y los cacheados que informa el proveedor."""
+
+    run_inline = True
+
+    def __init__(self, chain_name: str):
+        self.chain_name = chain_name
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        text = "".join(str(message.content) for batch in messages for message in batch)
+        self._local_tokens(text)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._local_tokens("".join(prompts))
+
+    def _local_tokens(self, text: str) -> None:
+        record_llm_call(self.chain_name)
+        assembled = PROMPT_REGISTRY.get(self.chain_name)
+        total = count_tokens(text)
+        static = assembled.static_tokens if assembled and text.startswith(assembled.static_prefix) else 0
+        PROMPT_USAGE[self.chain_name] = {"local_tokens": total, "static_tokens": static, "dynamic_tokens": total - static}
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = _usage_metadata(response)
+        if not usage:
+            return
+
+        input_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        stats = PROMPT_USAGE.setdefault(self.chain_name, {})
+        stats.update({"input_tokens": input_tokens, "cached_tokens": cached_tokens, "uncached_tokens": input_tokens - cached_tokens})
+
+        logger.info(
+            f"[{self.chain_name}] input tokens: {input_tokens} (cached {cached_tokens}, uncached {input_tokens - cached_tokens}) | "
+            f"local static prefix {stats.get('static_tokens', 0)}, dynamic {stats.get('dynamic_tokens', 0)}"
+        )
+
+
+def _usage_metadata(response: LLMResult) -> Optional[Dict[str, Any]]:
+    """Extrae el uso de tokens de la respuesta, tanto en llamadas completas como en streaming."""
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                return usage
+    return None
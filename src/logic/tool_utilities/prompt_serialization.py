@@ -0,0 +1,107 @@
+"""
+Serialización compacta de inmuebles para los prompts.
+Los inmuebles se envían con los alias cortos de columnas definidos en columns.json, sin campos nulos ni booleanos falsos,
+y las listas de varios inmuebles en formato tabular (cabecera + una fila por inmueble) en lugar de JSON.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_json
+from src.config import columns_dir
+
+# ------CONFIGURACIÓN DE COLUMNAS------
+_columns_data = open_json(columns_dir)
+_json_columns = _columns_data.get("api_columns", []) + _columns_data.get("enrichment_columns", [])
+
+COLUMN_ALIASES: Dict[str, str] = {"Id": "id", **{col["name"]: col["alias"] for col in _json_columns if col.get("alias")}}
+BOOLEAN_COLUMNS: set = {col["name"] for col in _json_columns if col.get("type") == "BOOLEAN"}
+
+EMPTY_VALUES = {"", "none", "null", "nan"}
+FALSE_VALUES = {"0", "0.0", "false", "no"}
+
+
+# ------LIMPIEZA DE VALORES------
+def _is_empty(column: str, value: Any) -> bool:
+    """Indica si un valor no aporta información al prompt: nulos, vacíos y booleanos falsos."""
+    if value is None or value is False:
+        return True
+    if isinstance(value, float) and value != value: # NaN
+        return True
+    if isinstance(value, (list, dict)) and not value:
+        return True
+
+    text = str(value).strip().lower()
+    if text in EMPTY_VALUES:
+        return True
+    if column in BOOLEAN_COLUMNS and text in FALSE_VALUES:
+        return True
+    return False
+
+
+def _compact_value(column: str, value: Any) -> Any:
+    """Normaliza el valor: booleanos como 1 y decimales redondeados."""
+    if column in BOOLEAN_COLUMNS:
+        return 1
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else round(value, 5)
+    return value
+
+
+def compact_property(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Devuelve el inmueble con alias cortos y sin campos vacíos. Las columnas sin alias mantienen su nombre."""
+    if not data:
+        return {}
+    return {
+        COLUMN_ALIASES.get(column, column): _compact_value(column, value)
+        for column, value in data.items()
+        if not _is_empty(column, value)
+    }
+
+
+# ------SERIALIZACIÓN------
+def serialize_property(data: Dict[str, Any], inm_id: Optional[int] = None) -> str:
+    """Serializa un único inmueble como JSON compacto."""
+    compact = compact_property(data)
+    if inm_id is not None:
+        compact = {"id": inm_id, **compact}
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def select_recent(properties: Dict[int, Dict], order: Optional[Iterable[int]] = None, max_properties: Optional[int] = None, pinned: Optional[Iterable[int]] = None) -> List[int]:
+    """
+    Devuelve los IDs de los inmuebles más recientes a incluir en el prompt.
+        - order: IDs en orden cronológico (por ejemplo 'qa_tool.searched_inms'). Por defecto el orden del diccionario.
+        - max_properties: límite de inmuebles. Por defecto el de la configuración.
+        - pinned: IDs que se incluyen siempre (por ejemplo 'qa_tool.presented_inms'); el límite se aplica al resto.
+    """
+    max_properties = max_properties or settings.prompt.max_recent_properties
+    pinned = [inm_id for inm_id in dict.fromkeys(pinned or []) if inm_id in properties]
+    ids = [inm_id for inm_id in (order or properties.keys()) if inm_id in properties]
+    ids = list(dict.fromkeys(ids + pinned)) # Sin duplicados, conservando el orden
+    recent = set([inm_id for inm_id in ids if inm_id not in pinned][-max_properties:])
+    return [inm_id for inm_id in ids if inm_id in recent or inm_id in pinned]
+
+
+def serialize_properties(properties: Dict[int, Dict], order: Optional[Iterable[int]] = None, max_properties: Optional[int] = None, pinned: Optional[Iterable[int]] = None) -> str:
+    """
+    Serializa varios inmuebles en formato tabular separado por '|'. La primera línea es la cabecera con los alias
+    de las columnas presentes en algún inmueble y cada línea siguiente corresponde a un inmueble.
+    """
+    ids = select_recent(properties, order, max_properties, pinned)
+    if not ids:
+        return ""
+
+    rows = [compact_property(properties[inm_id]) for inm_id in ids]
+
+    header: List[str] = []
+    for row in rows:
+        header.extend(column for column in row if column not in header and column != "id")
+
+    def cell(value: Any) -> str:
+        return str(value).replace("|", "/").replace("\n", " ").strip()
+
+    lines = ["|".join(["id"] + header)]
+    for inm_id, row in zip(ids, rows):
+        lines.append("|".join([str(inm_id)] + [cell(row[column]) if column in row else "" for column in header]))
+    return "\n".join(lines)
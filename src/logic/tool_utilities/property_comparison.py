@@ -0,0 +1,207 @@
+"""
+Comparación de inmuebles ya mostrados ("¿cuál es más grande, el primero o el tercero?").
+La tabla comparativa se construye localmente con las filas del catálogo que QAChain ya tiene recuperadas: precio, precio por
+m², superficie, habitaciones, extras y cercanía a puntos de interés, marcando el mejor valor de cada fila. Se envía como
+evento estructurado y, si se genera un comentario con el LLM, este solo recibe las filas que difieren entre los inmuebles.
+"""
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils.general_utilities import normalize_text
+from src.logic.tool_utilities.reference_resolver import ORDINALS, ORDINAL_PATTERN, NUMERIC_ORDINAL_PATTERN
+
+logger = logging.getLogger(__name__)
+
+COMPARISON_PATTERN = re.compile(
+    r"\b(compar\w*|diferencias?|versus|vs|frente a|cual (es|sale|tiene|me conviene|de ellos|de los dos)|que es mejor|mejor opcion|"
+    r"(mas|menos) (grande|barat|car|ampli|nuev|pequen|luminos|cerca)\w*)\b"
+)
+ALL_PATTERN = re.compile(r"\b(todos|todas|ambos|ambas|los dos|las dos|los tres|las tres)\b")
+COUNT_WORDS: Dict[str, int] = {"dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "ambos": 2, "ambas": 2}
+# El número va con el ordinal: "los dos primeros", "las tres últimas", "los primeros 2"
+FIRST_LAST_PATTERN = re.compile(
+    r"\b(?:los|las)\s+(?:(dos|tres|cuatro|cinco|\d)\s+(primer|ultim)[oa]s|(primer|ultim)[oa]s\s+(dos|tres|cuatro|cinco|\d))\b"
+)
+# Números sueltos: no las partes de un importe ("180.000") ni de un ordinal ("2º" queda como "2o")
+NUMBER_PATTERN = re.compile(r"(?<![\d.,])\b\d+\b(?![.,]\d)")
+SEARCH_PATTERN = re.compile(r"\b(busca(r|me)?|busco|otros|otras|nuevos|nuevas)\b")
+
+# (clave, etiqueta, cálculo del valor, formato, mejor valor: "min", "max" o None)
+Row = Tuple[str, str, Callable[[Dict], Any], Callable[[Any], str], Optional[str]]
+
+
+# ------FORMATO DE VALORES------
+def _euros(value: float) -> str:
+    return f"{value:,.0f} €".replace(",", ".")
+
+
+def _euros_m2(value: float) -> str:
+    return f"{_euros(value)}/m²"
+
+
+def _meters(value: float) -> str:
+    return f"{value:,.0f} m²".replace(",", ".")
+
+
+def _plain(value: Any) -> str:
+    return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+
+
+def _floor(value: Any) -> str:
+    return "Bajo" if str(value) == "0" else _plain(value)
+
+
+def _to_number(value: Any) -> Optional[float]:
+    """Valor numérico positivo o None. En el catálogo un 0 en las cantidades indica que el dato no se ha informado."""
+    try:
+        number = float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def _number(column: str) -> Callable[[Dict], Optional[float]]:
+    return lambda data: _to_number(data.get(column))
+
+
+def _text(column: str) -> Callable[[Dict], Optional[Any]]:
+    return lambda data: data.get(column) if data.get(column) not in (None, "") else None
+
+
+def _price_m2(data: Dict) -> Optional[float]:
+    price = _to_number(data.get("Precio"))
+    meters = _to_number(data.get("Metros_Utiles")) or _to_number(data.get("Metros_Construidos"))
+    return round(price / meters) if price and meters else None
+
+
+AMENITIES: Dict[str, str] = {
+    "CheckAscensor": "ascensor", "CheckGaraje": "garaje", "CheckTrastero": "trastero", "CheckPiscina": "piscina",
+    "CheckJardin": "jardín", "CheckPatio": "patio", "CheckAireAcondicionado": "aire acondicionado", "CheckChimenea": "chimenea",
+    "CheckAmueblado": "amueblado", "CheckAtico": "ático", "CheckDuplex": "dúplex", "CheckObraNueva": "obra nueva",
+    "CheckOrientacionSur": "orientación sur", "CheckVistasMar": "vistas al mar", "CheckVistasMontana": "vistas a la montaña",
+    "CheckCercaPlaya": "cerca de la playa", "CheckMascotasSi": "admite mascotas",
+}
+
+# El catálogo guarda la cercanía a puntos de interés como indicador o como nombre del lugar, no como distancia
+POINTS_OF_INTEREST: Dict[str, str] = {
+    "EsCentro": "centro", "EstacionTrenCerca": "estación de tren", "EstacionBusCerca": "estación de autobús",
+    "ParqueCerca": "parque", "UniversidadCerca": "universidad", "HospitalCerca": "hospital",
+}
+
+
+def _flags(columns: Dict[str, str]) -> Callable[[Dict], List[str]]:
+    def values(data: Dict) -> List[str]:
+        found = []
+        for column, label in columns.items():
+            value = data.get(column)
+            if value in (None, "", 0, "0", False):
+                continue
+            found.append(f"{label} ({value})" if isinstance(value, str) and not value.isdigit() else label)
+        return found
+    return values
+
+
+ROWS: List[Row] = [
+    ("price", "Precio", _number("Precio"), _euros, "min"),
+    ("price_m2", "Precio por m²", _price_m2, _euros_m2, "min"),
+    ("useful_m2", "Metros útiles", _number("Metros_Utiles"), _meters, "max"),
+    ("built_m2", "Metros construidos", _number("Metros_Construidos"), _meters, "max"),
+    ("bedrooms", "Dormitorios", _number("NumDormitorios"), _plain, "max"),
+    ("bathrooms", "Baños", _number("NumAseos"), _plain, "max"),
+    ("terraces", "Terrazas", _number("NumTerrazas"), _plain, "max"),
+    ("floor", "Planta", _text("Planta"), _floor, None),
+    ("year", "Año de construcción", _number("Antiguedad"), _plain, "max"),
+    ("condition", "Estado", _text("Estado_General"), _plain, None),
+    ("energy", "Certificado energético", _text("Certificado_Energetico"), _plain, None),
+    ("community_fees", "Gastos de comunidad", _number("Gastos_Comunidad"), _euros, "min"),
+    ("amenities", "Extras", _flags(AMENITIES), ", ".join, "max"),
+    ("nearby", "Cerca de", _flags(POINTS_OF_INTEREST), ", ".join, "max"),
+]
+
+
+# ------DETECCIÓN------
+def comparison_targets(input: str, candidates: Dict[int, Dict], order: Optional[List[int]] = None, max_properties: int = 3) -> List[int]:
+    """
+    IDs de los inmuebles que el usuario quiere comparar, en el orden en que los menciona. Devuelve una lista vacía si la
+    petición no es una comparación o no identifica al menos dos inmuebles sin ambigüedad.
+        - candidates (Dict[int, Dict]): inmuebles ya mostrados, por ID.
+        - order (List[int]): orden en que se mostraron (para los ordinales).
+    """
+    text = normalize_text(input)
+    if not candidates or not COMPARISON_PATTERN.search(text) or SEARCH_PATTERN.search(text):
+        return []
+
+    order = list(dict.fromkeys(inm_id for inm_id in (order or list(candidates)) if inm_id in candidates)) or list(candidates)
+
+    positions: List[int] = []
+    for count_before, edge_before, edge_after, count_after in FIRST_LAST_PATTERN.findall(text):
+        count = COUNT_WORDS.get(count_before or count_after) or int(count_before or count_after)
+        positions += list(range(1, count + 1)) if (edge_before or edge_after) == "primer" else list(range(-count, 0))
+    text = FIRST_LAST_PATTERN.sub(" ", text)
+
+    # Un número que es el ID de un candidato es un ID aunque sea corto ("el 42"); si no, puede ser un ordinal ("el 2")
+    targets = [int(number) for number in NUMBER_PATTERN.findall(text) if int(number) in candidates]
+    positions += [ORDINALS[word] for word in ORDINAL_PATTERN.findall(text)]
+    positions += [int(a or b) for a, b in NUMERIC_ORDINAL_PATTERN.findall(text) if int(a or b) not in candidates]
+    for position in positions:
+        index = position - 1 if position > 0 else len(order) + position
+        if 0 <= index < len(order):
+            targets.append(order[index])
+
+    targets = list(dict.fromkeys(targets))
+    # "compara los dos", "¿cuál es mejor de todos?": todos los mostrados, solo si no hay ordinales y el número coincide
+    if len(targets) < 2 and not positions and (match := ALL_PATTERN.search(text)) and 2 <= len(order) <= max_properties:
+        if COUNT_WORDS.get(match.group(1).split()[-1], len(order)) == len(order):
+            targets = order
+    return targets[:max_properties] if len(targets) >= 2 else []
+
+
+# ------TABLA COMPARATIVA------
+def _title(data: Dict) -> str:
+    """'Pisos en venta · Barrio, Población'."""
+    kind = data.get("Tipo") or "Inmueble"
+    if data.get("Operacion"):
+        kind += f" en {str(data['Operacion']).lower()}"
+    place = ", ".join(str(part) for part in (data.get("Barrio"), data.get("Poblacion")) if part)
+    return f"{kind} · {place}" if place else kind
+
+
+def build_comparison(rows: Dict[int, Dict], inm_ids: List[int]) -> Dict[str, Any]:
+    """
+    Tabla comparativa de los inmuebles indicados. Cada fila lleva los valores formateados (None si el dato no existe) y los
+    IDs con el mejor valor. Las filas sin datos en ningún inmueble se omiten.
+    """
+    table = {"ids": inm_ids, "titles": [_title(rows[inm_id]) for inm_id in inm_ids], "rows": []}
+    for key, label, value_of, display, better in ROWS:
+        values = [value_of(rows[inm_id]) for inm_id in inm_ids]
+        if all(value is None or value == [] for value in values):
+            continue
+
+        # Las listas (extras, puntos de interés) se comparan por número de elementos
+        best = []
+        scores = [(inm_id, len(value) if isinstance(value, list) else value) for inm_id, value in zip(inm_ids, values) if value is not None]
+        if better and len(scores) > 1 and len({score for _, score in scores}) > 1:
+            target = min(score for _, score in scores) if better == "min" else max(score for _, score in scores)
+            best = [inm_id for inm_id, score in scores if score == target]
+
+        table["rows"].append({
+            "key": key,
+            "label": label,
+            "values": [(display(value) or None) if value is not None else None for value in values],
+            "best": best,
+        })
+    return table
+
+
+def comparison_diff(table: Dict[str, Any]) -> str:
+    """Filas que difieren entre los inmuebles, en texto compacto, para el comentario del LLM."""
+    lines = ["Inmuebles: " + " | ".join(f"{inm_id} ({title})" for inm_id, title in zip(table["ids"], table["titles"]))]
+    for row in table["rows"]:
+        if len(set(row["values"])) == 1:
+            continue
+        line = f"{row['label']}: " + " | ".join(value or "-" for value in row["values"])
+        if row["best"]:
+            line += f" (mejor: {', '.join(str(inm_id) for inm_id in row['best'])})"
+        lines.append(line)
+    return "\n".join(lines)
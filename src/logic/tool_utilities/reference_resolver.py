@@ -0,0 +1,225 @@
+"""
+Resolución local del inmueble al que hace referencia el usuario ("el segundo", "el de la calle Uría", "el de 180.000 €").
+Se usa antes de 'qa_general_chain' y 'id_of_interest_chain': solo si la referencia es ambigua se llama al LLM.
+
+Orden de reglas:
+    1. ID explícito de uno de los inmuebles candidatos.
+    2. Petición con términos de búsqueda (solo en QA): se deja la decisión al LLM. Cuentan las pistas de nueva búsqueda
+       ("otro", "más barato", "tenéis algo", "pisos", "un piso", "alquilar", "en Gijón"); los verbos de petición
+       ("quiero", "prefiero") y las poblaciones solo cuentan si no hay una referencia explícita ("quiero ver el segundo").
+    3. Ordinales con artículo ("el primero", "la segunda", "el último", "el 3º") sobre el orden en que se presentaron.
+    4. Dirección, barrio o población que identifican a un único candidato.
+    5. Precio que coincide con un único candidato.
+    6. Sesión con un único candidato y sin otros datos en la petición.
+Las reglas 4 (salvo la población, que además exige "el de...") y 6 necesitan en QA una referencia explícita: "el de...",
+un ordinal, un demostrativo ("ese piso", "esa casa", "aquel") o "el mismo". En visitas todas las peticiones se refieren a
+un inmueble ya mostrado y no la necesitan.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from src.utils.general_utilities import normalize_text
+
+logger = logging.getLogger(__name__)
+
+PROPERTY_NOUNS = "piso|casa|chalet|inmueble|apartamento|atico|duplex|estudio|vivienda|local|finca|bajo|anuncio|opcion"
+
+ORDINALS: Dict[str, int] = {
+    "primer": 1, "primero": 1, "primera": 1, "segundo": 2, "segunda": 2, "tercer": 3, "tercero": 3, "tercera": 3,
+    "cuarto": 4, "cuarta": 4, "quinto": 5, "quinta": 5, "sexto": 6, "sexta": 6, "septimo": 7, "septima": 7,
+    "octavo": 8, "octava": 8, "noveno": 9, "novena": 9, "decimo": 10, "decima": 10,
+    "ultimo": -1, "ultima": -1, "penultimo": -2, "penultima": -2,
+}
+ORDINAL_WORDS = "|".join(ORDINALS)
+# Solo con artículo ("el segundo", "la segunda", "al primero", "el piso tercero"): "de segunda mano" no es un ordinal
+ORDINAL_PATTERN = re.compile(rf"\b(?:el|la|al|del|lo)\s+(?:(?:{PROPERTY_NOUNS})\s+)?({ORDINAL_WORDS})\b(?!\s+mano\b)")
+# Tras normalizar el texto '2º' y '2ª' quedan como '2o' y '2a'
+NUMERIC_ORDINAL_PATTERN = re.compile(r"\b(?:el|la|numero)\s+(\d{1,2})(?=\s*(?:[?.!,]|$|de la lista))|\b(?:el|la|al|del)\s+(\d{1,2})(?:o|a)\b")
+
+# Pistas de nueva búsqueda, con o sin referencia explícita
+NEW_SEARCH_PATTERN = re.compile(
+    r"\b(otr[oa]s?|nuev[oa]s?|busca(r|me)?|busco|buscando|cambia(r)?|en lugar de|en vez de|mas barat[oa]s?|mas grandes?|"
+    r"distint[oa]s?|diferentes?|alternativas?|otra zona|otra busqueda|algo|alquilar|comprar|"
+    r"pisos|casas|chalets|apartamentos|aticos|viviendas|inmuebles|locales|fincas|"
+    rf"(?:un|una|algun|alguna)\s+(?:{PROPERTY_NOUNS}))\b"
+)
+# Verbos de petición: solo son búsqueda si no hay una referencia explícita ("quiero ver el segundo")
+REQUEST_PATTERN = re.compile(r"\b(quiero|queria|querria|prefiero|preferiria|teneis|tienen|tienes|hay|me interesaria)\b")
+# "el de Oviedo", "la del ático"; también contraído: "el precio del de la playa", "vamos al de Gijón"
+REFERENCE_PATTERN = re.compile(r"\b(?:el|la|del|al) (de|del|que esta en|situad[oa] en|ubicad[oa] en)\b")
+DEMONSTRATIVE_PATTERN = re.compile(
+    rf"\b(?:(?:es[ea]|est[ea]|aquel|aquella|dich[oa])\s+(?:{PROPERTY_NOUNS})|ese|esa|aquel|aquella|(?:el|la) mism[oa])\b"
+)
+PRICE_PATTERN = re.compile(r"(\d{1,3}(?:[.\s]\d{3})+|\d+(?:,\d+)?)\s*(k|mil|millones?|m)?\b")
+
+# Palabras de una petición de presentación sin pregunta concreta ("háblame del segundo", "¿cómo es ese piso?")
+PRESENTATION_WORDS = {
+    "hablame", "cuentame", "muestrame", "ensename", "presentame", "describeme", "describe", "dime", "dame", "ver", "verlo",
+    "verla", "saber", "conocer", "quiero", "queria", "querria", "gustaria", "me", "interesa", "podrias", "puedes", "favor",
+    "por", "mas", "informacion", "info", "detalles", "datos", "ficha", "todo", "sobre", "acerca", "que", "tal", "como", "es",
+    "seria", "y", "vale", "ok", "si", "genial", "perfecto", "gracias", "pues", "entonces", "a", "de", "del", "el", "la", "lo",
+    "los", "las", "al", "un", "una", "numero", "mismo", "misma", "ese", "esa", "este", "esta", "aquel", "aquella", "dicho", "dicha",
+    *PROPERTY_NOUNS.split("|"), *ORDINALS,
+}
+
+ADDRESS_STOPWORDS = {"calle", "avenida", "avda", "plaza", "paseo", "carretera", "camino", "barrio", "lugar", "de", "del", "la", "las", "los", "el", "y"}
+
+
+@dataclass
+class Resolution:
+    inm_id: Optional[int] = None
+    method: str = "ambiguous" # id | ordinal | address | barrio | poblacion | price | single | new_search_cue | ambiguous
+
+    @property
+    def resolved(self) -> bool:
+        return self.inm_id is not None
+
+
+# ------UTILIDADES------
+def _to_number(value) -> Optional[float]:
+    try:
+        return float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def mentioned_prices(text: str) -> List[float]:
+    """Importes de la petición: '180.000', '180000', '180 mil', '180k', '1,2 millones'."""
+    prices = []
+    for number, unit in PRICE_PATTERN.findall(text):
+        value = _to_number(re.sub(r"[.\s]", "", number) if re.search(r"[.\s]\d{3}", number) else number)
+        if value is None:
+            continue
+        if unit in ("k", "mil"):
+            value *= 1_000
+        elif unit and unit.startswith("m"):
+            value *= 1_000_000
+        if value >= 1_000:
+            prices.append(value)
+    return prices
+
+
+def _unique(matches: List[int]) -> Optional[int]:
+    matches = list(dict.fromkeys(matches))
+    return matches[0] if len(matches) == 1 else None
+
+
+def _address_tokens(address: str) -> set:
+    return {word for word in re.findall(r"[a-z0-9]+", normalize_text(address)) if len(word) > 2 and word not in ADDRESS_STOPWORDS and not word.isdigit()}
+
+
+def _mentions_place(text: str, places: Iterable[str]) -> bool:
+    """Si la petición pide una localización ("en Gijón", "en el centro de Oviedo", "por La Arena")."""
+    names = sorted({place for place in places if len(place) > 2}, key=len, reverse=True)
+    if not names:
+        return False
+    pattern = r"\b(?:en|por|cerca de)\s+(?:(?:el|la|los|las|centro|zona|de|del)\s+){0,3}(?:" + "|".join(map(re.escape, names)) + r")\b"
+    return re.search(pattern, text) is not None
+
+
+def has_reference_cue(text: str) -> bool:
+    """Si la petición (normalizada) se refiere explícitamente a un inmueble ya mostrado: "el de...", ordinal o demostrativo."""
+    return any(pattern.search(text) for pattern in (REFERENCE_PATTERN, ORDINAL_PATTERN, NUMERIC_ORDINAL_PATTERN, DEMONSTRATIVE_PATTERN))
+
+
+def presentation_only(input: str, data: Optional[Dict] = None) -> bool:
+    """
+    Si la petición solo pide que se presente el inmueble, sin preguntar por ningún aspecto concreto: "háblame del
+    segundo" o "¿cómo es el de la calle Uría?" sí; "háblame del segundo, sobre todo de la terraza" no. Las palabras con
+    las que se identifica el inmueble (ID, dirección, barrio, población, precio) no cuentan como aspecto.
+        - data (Dict): datos del inmueble seleccionado.
+    """
+    words = set(re.findall(r"[a-z0-9]+", normalize_text(input)))
+    for column in ("Direccion", "Barrio", "Poblacion", "Municipio"):
+        if data and data.get(column):
+            words -= set(re.findall(r"[a-z0-9]+", normalize_text(str(data[column]))))
+    return all(word in PRESENTATION_WORDS or word.isdigit() or word in ADDRESS_STOPWORDS or re.fullmatch(r"\d+(o|a|k|mil)", word) for word in words)
+
+
+# ------RESOLUCIÓN------
+def resolve_reference(
+    input: str, candidates: Dict[int, Dict], order: Optional[List[int]] = None, allow_new_search: bool = True, places: Iterable[str] = ()
+) -> Resolution:
+    """
+    Intenta resolver localmente el inmueble al que se refiere el usuario.
+        - input (str): petición del usuario.
+        - candidates (Dict[int, Dict]): inmuebles ya mostrados, por ID, con sus columnas de presentación.
+        - order (List[int]): orden en que se mostraron los inmuebles (para los ordinales). Por defecto el de 'candidates'.
+        - allow_new_search (bool): si la petición puede ser una nueva búsqueda (QA). En ese caso las peticiones con
+          términos de búsqueda se dejan al LLM y las reglas de dirección, barrio y candidato único exigen una referencia
+          explícita.
+        - places (Iterable[str]): poblaciones, municipios y barrios del catálogo, normalizados, para reconocer "en Gijón".
+          Se añaden los de los candidatos.
+    Devuelve una Resolution; si no está resuelta ('ambiguous' o 'new_search_cue') debe usarse el LLM.
+    """
+    if not candidates:
+        return Resolution()
+
+    text = normalize_text(input)
+    order = [inm_id for inm_id in (order or list(candidates)) if inm_id in candidates]
+    order = list(dict.fromkeys(order)) or list(candidates)
+
+    # ----IDS EXPLÍCITOS (antes que la nueva búsqueda: "quiero ver el 4521" es inequívoco)
+    mentioned_ids = [int(number) for number in re.findall(r"\b\d{3,}\b", text) if int(number) in candidates]
+    if (inm_id := _unique(mentioned_ids)) is not None:
+        return Resolution(inm_id, "id")
+
+    # ----TÉRMINOS DE BÚSQUEDA
+    explicit = has_reference_cue(text)
+    if allow_new_search:
+        places = list(places) + [normalize_text(data[column]) for data in candidates.values() for column in ("Poblacion", "Municipio", "Barrio") if data.get(column)]
+        if NEW_SEARCH_PATTERN.search(text) or (not explicit and (REQUEST_PATTERN.search(text) or _mentions_place(text, places))):
+            return Resolution(method="new_search_cue")
+    else:
+        explicit = True # En visitas la petición siempre se refiere a un inmueble ya mostrado
+
+    # ----ORDINALES
+    positions = [ORDINALS[word] for word in ORDINAL_PATTERN.findall(text)]
+    positions += [int(a or b) for a, b in NUMERIC_ORDINAL_PATTERN.findall(text)]
+    if len(set(positions)) == 1:
+        position = positions[0]
+        index = position - 1 if position > 0 else len(order) + position
+        if 0 <= index < len(order):
+            return Resolution(order[index], "ordinal")
+
+    # ----DIRECCIÓN
+    address_tokens = {inm_id: _address_tokens(data.get("Direccion") or "") for inm_id, data in candidates.items()}
+    words = set(re.findall(r"[a-z0-9]+", text))
+    address_matches = []
+    for inm_id, tokens in address_tokens.items():
+        # Solo cuentan las palabras de la dirección que no comparte con otros candidatos
+        others = set().union(*(t for other, t in address_tokens.items() if other != inm_id))
+        if (tokens - others) & words:
+            address_matches.append(inm_id)
+    if explicit and (inm_id := _unique(address_matches)) is not None:
+        return Resolution(inm_id, "address")
+
+    # ----BARRIO Y POBLACIÓN
+    for column, method in (("Barrio", "barrio"), ("Poblacion", "poblacion")):
+        # La población solo se acepta con "el de Oviedo" para no confundirla con una búsqueda
+        if not explicit or (method == "poblacion" and not REFERENCE_PATTERN.search(text)):
+            continue
+        matches = [
+            inm_id for inm_id, data in candidates.items()
+            if data.get(column) and len(normalize_text(data[column])) > 2 and re.search(rf"\b{re.escape(normalize_text(data[column]))}\b", text)
+        ]
+        if (inm_id := _unique(matches)) is not None:
+            return Resolution(inm_id, method)
+
+    # ----PRECIO
+    prices = mentioned_prices(text)
+    if prices:
+        price_matches = [
+            inm_id for inm_id, data in candidates.items()
+            if (price := _to_number(data.get("Precio"))) and any(abs(price - p) <= max(500, price * 0.005) for p in prices)
+        ]
+        if (inm_id := _unique(price_matches)) is not None:
+            return Resolution(inm_id, "price")
+
+    # ----UN SOLO CANDIDATO
+    if explicit and len(candidates) == 1 and not re.search(r"\d", text):
+        return Resolution(order[0], "single")
+
+    return Resolution()
@@ -0,0 +1,187 @@
+"""
+Selección de columnas relevantes del esquema para la cadena text2sql.
+En lugar de enviar el CREATE TABLE completo en cada llamada, se eligen las columnas mencionadas en la petición del usuario
+(sinónimos, descripciones de columns.json y valores ENUM), más un conjunto núcleo garantizado y las columnas de la
+consulta previa. Si la confianza de la selección es baja se devuelve el esquema completo.
+"""
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_json, open_txt, normalize_text
+from src.data_generation.sql_search_generation import render_create_table, execute_sql_query
+from src.config import columns_dir, search_table_generation_query_dir, table_name
+
+logger = logging.getLogger(__name__)
+
+# Columnas siempre presentes: campos obligatorios de la búsqueda y los usados para ordenar y presentar resultados
+CORE_COLUMNS = ["Barrio", "Poblacion", "Municipio", "Provincia", "Operacion", "Tipo", "NumDormitorios", "Precio", "Metros_Utiles"]
+
+# Palabras sin valor para decidir columnas (verbos y términos genéricos de una búsqueda de inmuebles)
+GENERIC_WORDS = {
+    "busco", "buscando", "buscar", "quiero", "queria", "necesito", "gustaria", "encontrar", "tener", "tenga", "tengan",
+    "comprar", "compra", "alquilar", "alquiler", "venta", "vender", "piso", "pisos", "casa", "casas", "chalet", "chalets",
+    "local", "locales", "vivienda", "inmueble", "inmuebles", "apartamento", "habitacion", "habitaciones", "dormitorio",
+    "dormitorios", "precio", "euros", "mil", "maximo", "minimo", "menos", "entre", "hasta", "unos", "algo", "otro", "otra",
+    "barato", "barata", "economico", "asturias", "mejor", "cerca", "tambien", "para", "como", "donde", "pero", "desde",
+    "sobre", "este", "esta", "estos", "estas", "ese", "esa", "mas", "muy", "hola", "gracias", "favor", "todo", "todos",
+}
+
+
+@dataclass
+class SchemaSelection:
+    table_info: str
+    columns: List[str] = field(default_factory=list)
+    confidence: float = 1.0
+    full_schema: bool = False
+
+
+# ------CATÁLOGO DE COLUMNAS------
+_columns_data = open_json(columns_dir)
+SEARCH_COLUMNS: List[Dict] = [
+    col for col in _columns_data.get("api_columns", []) + _columns_data.get("enrichment_columns", []) if col.get("search")
+]
+FULL_TABLE_INFO: str = open_txt(search_table_generation_query_dir)
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9²]+", normalize_text(text))
+
+
+@lru_cache(maxsize=1)
+def _keyword_index() -> Dict[str, Set[str]]:
+    """Índice palabra clave normalizada -> columnas. Combina sinónimos, valores ENUM y palabras de las descripciones."""
+    index: Dict[str, Set[str]] = {}
+
+    def add(keyword: str, column: str):
+        keyword = normalize_text(keyword).strip()
+        if keyword and keyword not in GENERIC_WORDS:
+            index.setdefault(keyword, set()).add(column)
+
+    for column, synonyms in open_json(settings.schema_selection.synonyms_path).items():
+        for synonym in synonyms:
+            add(synonym, column)
+
+    for col in SEARCH_COLUMNS:
+        for value in col.get("values", []):
+            add(value, col["name"])
+        for word in _tokens(col.get("description", "")):
+            if len(word) > 4 and word not in {"inmueble", "donde", "ubica", "tiene", "cerca"}:
+                add(word, col["name"])
+    return index
+
+
+_location_cache: Dict[str, Any] = {"vocabulary": set(), "loaded_at": None}
+
+
+def _location_vocabulary() -> Set[str]:
+    """
+    Palabras de poblaciones, municipios y barrios del catálogo. Se consideran explicadas por las columnas núcleo.
+    Se recargan cada 'SCHEMA_LOCATIONS_TTL_S' para recoger las localizaciones de la carga nocturna de inmuebles.
+    """
+    loaded_at = _location_cache["loaded_at"]
+    if loaded_at is not None and time.monotonic() - loaded_at < settings.schema_selection.locations_ttl_s:
+        return _location_cache["vocabulary"]
+
+    vocabulary: Set[str] = set()
+    rows = execute_sql_query(f"SELECT DISTINCT Poblacion, Municipio, Barrio FROM {table_name}")
+    if rows is None and loaded_at is not None:
+        return _location_cache["vocabulary"] # Si falla la consulta se mantiene el vocabulario anterior
+    for row in rows or []:
+        for value in row:
+            vocabulary.update(_tokens(value or ""))
+    _location_cache.update(vocabulary=vocabulary, loaded_at=time.monotonic())
+    return vocabulary
+
+
+# ------COINCIDENCIA POR EMBEDDINGS (OPCIONAL)------
+_description_vectors: Optional[np.ndarray] = None
+_embeddings = None # Cliente de embeddings compartido por todas las peticiones. Se crea en el primer uso
+
+
+async def _embedding_matches(text: str) -> Set[str]:
+    """Columnas cuya descripción es semánticamente cercana a la petición."""
+    global _description_vectors, _embeddings
+    if _embeddings is None:
+        from langchain_openai import OpenAIEmbeddings
+        _embeddings = OpenAIEmbeddings(model=settings.rag.embedding_model)
+
+    if _description_vectors is None:
+        descriptions = [f"{col['name']}: {col.get('description', '')}" for col in SEARCH_COLUMNS]
+        _description_vectors = np.array(await _embeddings.aembed_documents(descriptions), dtype=np.float32)
+        _description_vectors /= np.linalg.norm(_description_vectors, axis=1, keepdims=True)
+
+    query = np.array(await _embeddings.aembed_query(text), dtype=np.float32)
+    scores = _description_vectors @ (query / np.linalg.norm(query))
+    threshold = settings.schema_selection.embedding_threshold
+    return {SEARCH_COLUMNS[i]["name"] for i in np.flatnonzero(scores >= threshold)}
+
+
+# ------SELECCIÓN DEL ESQUEMA------
+def match_columns(text: str) -> tuple[Set[str], float]:
+    """
+    Devuelve las columnas mencionadas en el texto y la confianza de la selección.
+    La confianza es la proporción de palabras con contenido de la petición que quedan explicadas por alguna columna,
+    por las columnas núcleo (localizaciones, números) o que son términos genéricos.
+    """
+    normalized = " " + " ".join(_tokens(text)) + " "
+    index = _keyword_index()
+
+    matched: Set[str] = set()
+    explained: Set[str] = set()
+    for keyword, columns in index.items():
+        if f" {keyword} " in normalized:
+            matched.update(columns)
+            explained.update(keyword.split())
+
+    content_words = [word for word in normalized.split() if len(word) > 3 and not word.isdigit()]
+    if not content_words:
+        return matched, 1.0
+
+    locations = _location_vocabulary()
+    unexplained = [
+        word for word in content_words
+        if word not in explained and word not in GENERIC_WORDS and word not in locations
+    ]
+    confidence = 1 - len(unexplained) / len(content_words)
+    return matched, confidence
+
+
+async def select_schema(text: str, last_query: Optional[str] = None) -> SchemaSelection:
+    """
+    Construye el esquema mínimo para la petición del usuario.
+        - text (str): petición del usuario (incluido el buffer de peticiones previas).
+        - last_query (str): consulta SQL previa. Sus columnas se mantienen para poder completarla.
+    """
+    config = settings.schema_selection
+    if not config.enabled:
+        return SchemaSelection(table_info=FULL_TABLE_INFO, columns=[col["name"] for col in SEARCH_COLUMNS], full_schema=True)
+
+    matched, confidence = match_columns(text)
+
+    if config.embedding_match:
+        try:
+            matched |= await _embedding_matches(text)
+        except Exception as e:
+            logger.warning(f"Embedding match for schema selection failed: {e}")
+
+    if last_query:
+        matched |= {col["name"] for col in SEARCH_COLUMNS if re.search(rf"\b{col['name']}\b", last_query)}
+
+    if confidence < config.min_confidence:
+        logger.info(f"Schema selection confidence {confidence:.2f} below threshold. Using full schema")
+        return SchemaSelection(table_info=FULL_TABLE_INFO, columns=[col["name"] for col in SEARCH_COLUMNS], confidence=confidence, full_schema=True)
+
+    selected = set(CORE_COLUMNS) | matched
+    selected_columns = [col for col in SEARCH_COLUMNS if col["name"] in selected] # Se conserva el orden original
+    return SchemaSelection(
+        table_info=render_create_table(selected_columns, table_name=table_name),
+        columns=[col["name"] for col in selected_columns],
+        confidence=confidence,
+    )
@@ -0,0 +1,60 @@
+"""
+Respuestas por plantilla para las cadenas de contenido casi fijo (campos faltantes, confirmación de formulario,
+información de contacto y límite de visitas). Cada cadena tiene en resources/response_templates.json un modo
+('template' o 'llm') y un conjunto de variantes; se elige una variante al azar y se personaliza con el contexto.
+"""
+import logging
+import random
+from typing import Any, Dict, List, Optional
+
+from src.core.settings import settings
+from src.utils.general_utilities import open_json, normalize_text
+from src.utils.template_engine import render_template
+from src.config import columns_dir
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_TEMPLATES: Dict[str, Dict[str, Any]] = open_json(settings.templates.templates_path)
+
+_columns_data = open_json(columns_dir)
+COLUMN_LABELS: Dict[str, str] = {
+    col["name"]: col["label"]
+    for col in _columns_data.get("api_columns", []) + _columns_data.get("enrichment_columns", [])
+    if col.get("label")
+}
+
+
+def use_template(chain_name: str) -> bool:
+    """Indica si la cadena se sirve por plantilla en lugar de con el LLM."""
+    if not settings.templates.enabled or chain_name in settings.templates.llm_chains:
+        return False
+    config = RESPONSE_TEMPLATES.get(chain_name)
+    return bool(config and config.get("mode") == "template" and config.get("variants"))
+
+
+def render_response(chain_name: str, **context: Any) -> str:
+    """Renderiza una variante aleatoria de la plantilla de la cadena con el contexto indicado."""
+    variants: List[str] = RESPONSE_TEMPLATES[chain_name]["variants"]
+    return render_template(random.choice(variants), context).strip()
+
+
+# ------CONTEXTOS DE LAS PLANTILLAS------
+def missing_field_labels(missing_fields: List[str]) -> List[str]:
+    """Nombres legibles de los campos faltantes. Municipio y Población se piden una sola vez."""
+    labels = []
+    for field in missing_fields:
+        label = COLUMN_LABELS.get(field, field)
+        if field in ("Municipio", "Poblacion"):
+            label = COLUMN_LABELS.get("Poblacion", field)
+        if label not in labels:
+            labels.append(label)
+    return labels
+
+
+def contact_context(contact_info: Dict[str, Any], input: Optional[str] = None) -> Dict[str, Any]:
+    """Oficinas a mostrar: si el usuario menciona alguna ciudad se muestran solo esas, si no todas."""
+    offices: List[Dict] = contact_info.get("offices", [])
+    text = normalize_text(input or "")
+    mentioned = [office for office in offices if normalize_text(office.get("city", "")) in text]
+    selected = mentioned or offices
+    return {"offices": selected, "single_office": len(selected) == 1, "webs": contact_info.get("webs", [])}
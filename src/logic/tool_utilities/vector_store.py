@@ -0,0 +1,221 @@
+"""
+Carga y guardado del índice vectorial de RAG sin pickle.
+    - El índice FAISS ('index.faiss') se abre con los flags de mmap de FAISS: los vectores no se copian a la memoria del
+      proceso sino que se leen de la caché de páginas del sistema, compartida entre los workers de uvicorn.
+    - Los documentos se guardan en 'docstore.json' (orjson): texto, metadatos y orden de los vectores. Sustituye al
+      'index.pkl' de LangChain, que exige deserialización pickle ('allow_dangerous_deserialization').
+    - La ingesta ('src.data_generation.rag_ingestion') guarda además los vectores ('vectors.npy') y un manifiesto
+      ('rag_manifest.json'), y publica todos los ficheros a la vez con 'publish_index'. El manifiesto indica el fichero y
+      el tipo del índice ('ann_index'), con el que se aplican sus parámetros de búsqueda al cargarlo.
+    - Cada publicación es un directorio de versión ('rag_versions/<versión>'). El fichero puntero 'rag_current' indica la
+      versión publicada y se sustituye de una vez: los lectores resuelven el directorio una sola vez ('current_index_dir')
+      y leen todos los ficheros de la misma versión. Sin puntero (índices anteriores) los ficheros están en el propio
+      directorio.
+Los índices antiguos se convierten una sola vez con "python -m src.logic.tool_utilities.vector_store --migrate".
+"""
+import argparse
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+import orjson
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from src.core.settings import settings
+from src.logic.tool_utilities.ann_index import apply_search_params
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+PICKLE_DOCSTORE_FILE = "index.pkl"
+VECTORS_FILE = "vectors.npy"
+MANIFEST_FILE = "rag_manifest.json"
+VERSIONS_DIR = "rag_versions"
+CURRENT_FILE = "rag_current"
+
+
+# ------FORMATO DEL DOCSTORE------
+def _docstore_path(index_dir: str) -> str:
+    return os.path.join(index_dir, settings.rag.docstore_file)
+
+
+def _docstore_payload(documents: Dict[str, Document], index_to_docstore_id: Dict[int, str]) -> bytes:
+    return orjson.dumps({
+        "ids": [index_to_docstore_id[position] for position in range(len(index_to_docstore_id))],
+        "documents": {doc_id: {"page_content": doc.page_content, "metadata": doc.metadata} for doc_id, doc in documents.items()},
+    })
+
+
+def write_docstore(index_dir: str, documents: Dict[str, Document], index_to_docstore_id: Dict[int, str]) -> None:
+    """Escribe los documentos en el orden de los vectores del índice."""
+    with open(_docstore_path(index_dir), "wb") as file:
+        file.write(_docstore_payload(documents, index_to_docstore_id))
+
+
+def read_docstore(index_dir: str) -> tuple[InMemoryDocstore, Dict[int, str]]:
+    with open(_docstore_path(index_dir), "rb") as file:
+        payload: Dict[str, Any] = orjson.loads(file.read())
+    documents = {doc_id: Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc_id, doc in payload["documents"].items()}
+    ids: List[str] = payload["ids"]
+    return InMemoryDocstore(documents), dict(enumerate(ids))
+
+
+# ------VERSIÓN PUBLICADA------
+def current_index_dir(index_dir: str) -> str:
+    """
+    Directorio de la versión publicada del índice. Sin puntero, el propio directorio. Es idempotente: el directorio de una
+    versión no tiene puntero y se devuelve tal cual.
+    """
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as file:
+            version = file.read().strip()
+    except FileNotFoundError:
+        return index_dir
+    version_dir = os.path.join(index_dir, VERSIONS_DIR, version)
+    if not version or not os.path.isdir(version_dir):
+        logger.warning(f"RAG index pointer in {index_dir} refers to a missing version '{version}', using {index_dir}")
+        return index_dir
+    return version_dir
+
+
+def _prune_versions(index_dir: str, current: str) -> None:
+    """
+    Elimina las versiones más antiguas y conserva las 'RAG_KEEP_VERSIONS' últimas. Un worker que aún tenga mapeada una
+    versión eliminada sigue leyéndola: el sistema de ficheros no libera los ficheros abiertos.
+    """
+    versions_dir = os.path.join(index_dir, VERSIONS_DIR)
+    versions = sorted(name for name in os.listdir(versions_dir) if os.path.isdir(os.path.join(versions_dir, name)) and not name.endswith(".tmp"))
+    for name in versions[:-max(settings.rag.keep_versions, 1)]:
+        if name != current:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+
+# ------CARGA Y GUARDADO------
+def read_index(index_dir: str, index_file: str = INDEX_FILE) -> faiss.Index:
+    """Índice FAISS, mapeado en memoria si 'RAG_MMAP' está activo."""
+    path = os.path.join(index_dir, index_file)
+    if not settings.rag.mmap:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP_IFC mapea los vectores de los índices planos sin copiarlos; IO_FLAG_MMAP, las listas de los IVF. No todos
+    # los tipos de índice admiten los dos a la vez (IVF-PQ con reordenación), así que se prueba después solo con el primero
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    for flags in (faiss.IO_FLAG_READ_ONLY | ifc | faiss.IO_FLAG_MMAP, faiss.IO_FLAG_READ_ONLY | ifc):
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            error = e
+    logger.warning(f"FAISS index could not be memory-mapped, loading it in memory: {error}")
+    return faiss.read_index(path)
+
+
+def load_vector_store(index_dir: str, embeddings: Embeddings) -> FAISS:
+    """
+    Vector store de LangChain a partir del índice mapeado en memoria y del docstore JSON. El fichero y el tipo del índice se
+    toman del manifiesto; sin manifiesto (índices anteriores a la ingesta) se usa 'index.faiss' tal cual.
+    """
+    index_dir = current_index_dir(index_dir)
+    if not os.path.exists(_docstore_path(index_dir)):
+        raise Exception(f"ERROR: Docstore '{settings.rag.docstore_file}' not found in {index_dir}. Run 'python -m src.logic.tool_utilities.vector_store --migrate'")
+    docstore, index_to_docstore_id = read_docstore(index_dir)
+    spec = (read_manifest(index_dir) or {}).get("index")
+    index = read_index(index_dir, spec.get("file", INDEX_FILE) if spec else INDEX_FILE)
+    apply_search_params(index, spec)
+    if index.ntotal != len(index_to_docstore_id):
+        raise Exception(f"ERROR: FAISS index ({index.ntotal} vectors) and docstore ({len(index_to_docstore_id)} documents) in {index_dir} do not match")
+    return FAISS(embedding_function=embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+
+
+def read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return orjson.loads(file.read())
+
+
+def read_vectors(index_dir: str) -> Optional[np.ndarray]:
+    """Vectores de los fragmentos guardados por la ingesta ('vectors.npy'), mapeados en memoria. None si no existen."""
+    path = os.path.join(index_dir, VECTORS_FILE)
+    return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+
+def index_version(index_dir: str) -> Optional[str]:
+    """Versión del índice publicado: fecha de construcción del manifiesto o, sin manifiesto, la de 'index.faiss'."""
+    index_dir = current_index_dir(index_dir)
+    manifest = read_manifest(index_dir)
+    if manifest and manifest.get("built_at"):
+        return manifest["built_at"]
+    path = os.path.join(index_dir, INDEX_FILE)
+    return str(os.path.getmtime(path)) if os.path.exists(path) else None
+
+
+def publish_index(index_dir: str, index: faiss.Index, documents: Dict[str, Document], index_to_docstore_id: Dict[int, str], vectors: np.ndarray, manifest: Dict[str, Any]) -> str:
+    """
+    Publica un índice nuevo como una versión: se escriben todos los ficheros en un directorio temporal, se renombra al
+    directorio de la versión y se sustituye el puntero 'rag_current' (os.replace es atómico en el mismo sistema de
+    ficheros). Un fallo antes del cambio de puntero deja publicada la versión anterior; un lector nunca combina ficheros
+    de dos versiones. Devuelve el directorio de la versión.
+        - manifest (Dict): debe incluir la descripción del índice ('index') devuelta por 'build_index'.
+    """
+    manifest = {**manifest, "index": {**manifest["index"], "file": INDEX_FILE}}
+    version = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-{os.getpid()}"
+    versions_dir = os.path.join(index_dir, VERSIONS_DIR)
+    temporary_dir = os.path.join(versions_dir, version + ".tmp")
+    version_dir = os.path.join(versions_dir, version)
+    pointer = os.path.join(index_dir, CURRENT_FILE)
+    temporary_pointer = pointer + f".tmp{os.getpid()}"
+    os.makedirs(temporary_dir)
+    try:
+        with open(os.path.join(temporary_dir, VECTORS_FILE), "wb") as file:
+            np.save(file, vectors)
+        with open(os.path.join(temporary_dir, settings.rag.docstore_file), "wb") as file:
+            file.write(_docstore_payload(documents, index_to_docstore_id))
+        faiss.write_index(index, os.path.join(temporary_dir, INDEX_FILE))
+        with open(os.path.join(temporary_dir, MANIFEST_FILE), "wb") as file:
+            file.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+        os.rename(temporary_dir, version_dir)
+
+        with open(temporary_pointer, "w", encoding="utf-8") as file:
+            file.write(version)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_pointer, pointer)
+    finally:
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        if os.path.exists(temporary_pointer):
+            os.remove(temporary_pointer)
+
+    _prune_versions(index_dir, version)
+    logger.info(f"RAG index version {version} published in {index_dir}")
+    return version_dir
+
+
+def migrate_pickle_docstore(index_dir: str) -> int:
+    """
+    Convierte el 'index.pkl' de LangChain al docstore JSON. Solo se deserializa el fichero generado localmente por la
+    ingesta, una única vez. Devuelve el número de documentos.
+    """
+    with open(os.path.join(index_dir, PICKLE_DOCSTORE_FILE), "rb") as file:
+        docstore, index_to_docstore_id = pickle.load(file)
+    write_docstore(index_dir, docstore._dict, index_to_docstore_id)
+    logger.info(f"Docstore migrated to {_docstore_path(index_dir)}: {len(docstore._dict)} documents")
+    return len(docstore._dict)
+
+
+if __name__ == "__main__":
+    from src.config import DB_DIR
+
+    parser = argparse.ArgumentParser(description="Utilidades del índice vectorial de RAG")
+    parser.add_argument("--migrate", action="store_true", help="Convierte 'index.pkl' al docstore JSON")
+    parser.add_argument("--index-dir", default=DB_DIR)
+    args = parser.parse_args()
+    if args.migrate:
+        print(f"{migrate_pickle_docstore(args.index_dir)} documentos migrados")
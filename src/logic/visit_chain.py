@@ -1,5 +1,4 @@
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
 from typing import Dict, AsyncGenerator,List
 import re
 import sqlite3
@@ -11,10 +10,16 @@ from src.config import (
     ID_OF_INTEREST_PROMPT_dir,
     CONFIRM_VISIT_PROMPT_dir,
 )
-from src.logic.tool_config.base_models import generate_book_llm
+from src.logic.tool_config.llm_policy import generate_chain_llm
+from src.logic.tool_utilities.prompt_assembly import build_prompt
+from src.logic.tool_utilities.template_responses import use_template, render_response
+from src.logic.tool_utilities.reference_resolver import resolve_reference, Resolution
+from src.core.settings import settings
+from src.utils.deadline import Deadline, DeadlineExceeded
 from src.utils.general_utilities import open_txt
 from src.schemas.tools import VisitToolModel
 from src.logic.tool_utilities.visit_utilities import extract_data
+from src.logic.tool_utilities.prompt_serialization import serialize_property, serialize_properties
 from src.data_generation.sql_search_generation import execute_sql_query
 from src.logic.tool_utilities.qa_utilities import (
     generate_sql_ids,
@@ -33,26 +38,25 @@ class VisitChain:
     CONFIRM_VISIT_PROMPT = open_txt(CONFIRM_VISIT_PROMPT_dir)
     
     # PROMPTS
-    id_of_interest_prompt = PromptTemplate.from_template(ID_OF_INTEREST_PROMPT) # Prompt para obtener el id del inmueble de interés
-    confirm_visit_prompt = PromptTemplate.from_template(CONFIRM_VISIT_PROMPT) # Prompt para pedir confirmación al usuario
-
-    # MODELOS DE LENGUAJE
-    book_llm = generate_book_llm()
+    id_of_interest_prompt = build_prompt("id_of_interest_chain", ID_OF_INTEREST_PROMPT) # Prompt para obtener el id del inmueble de interés
+    confirm_visit_prompt = build_prompt("confirm_visit_chain", CONFIRM_VISIT_PROMPT) # Prompt para pedir confirmación al usuario
 
     # CADENAS
     # Cadena para obtener el id del inmueble de interés
-    id_of_interest_chain = id_of_interest_prompt | book_llm | StrOutputParser()
+    id_of_interest_chain = id_of_interest_prompt | generate_chain_llm("id_of_interest_chain") | StrOutputParser()
 
     # Cadena para pedir confirmación al usuario
-    confirm_visit_chain = confirm_visit_prompt | book_llm | StrOutputParser()
+    confirm_visit_chain = confirm_visit_prompt | generate_chain_llm("confirm_visit_chain") | StrOutputParser()
 
 
     #------EJECUCIÓN DE LA HERRAMIENTA------
     @classmethod
-    async def execute(cls, input: str, visit_tool: VisitToolModel, presented_inms: List[int], user_name: str, personal_data: bool) -> AsyncGenerator[str, None]:
+    async def execute(cls, input: str, visit_tool: VisitToolModel, presented_inms: List[int], user_name: str, personal_data: bool, deadline: Deadline = None) -> AsyncGenerator[str, None]:
         """
         Esta función coordina toda la herramienta de visitas. Primero selecciona el inmueble por el que el usuario parece haber mostrado interes, tras lo cual responde con una breve descripción del inmueble de manera que el usuario sepa el inmueble para el que se esta considerando realizar la visita. También genera una ventana 
+            - deadline (Deadline): presupuesto de tiempo del turno.
         """
+        deadline = deadline or Deadline.unlimited()
 
         data_inm = "" # Guarda los datos del inmueble seleccionado
 
@@ -65,13 +69,29 @@ class VisitChain:
                 last_searched_result: List[sqlite3.Row] = execute_sql_query(last_searched_query)
                 last_searched_parsed: Dict[int, Dict] = parse_db_answer(last_searched_result) # Resultados parseados por columna
                 last_searched_filtered: Dict[int, Dict] = filter_presentation_fields(last_searched_parsed) # Resultados filtrados
-                last_searched_filtered_str: str = json.dumps(last_searched_filtered)
+                last_searched_filtered_str: str = serialize_properties(last_searched_filtered, order=presented_inms)
                 print(f"INMUEBLES PRESENTADOS: {presented_inms}")
 
                 # ---- OBTENEMOS EL INMUEBLE DE INTERES
-                selected_id = await cls.id_of_interest_chain.ainvoke({"input": input, "inm_data": last_searched_filtered_str})
-                match = re.search(r'\d+', selected_id) 
-                if match:
+                # Resolución local de la referencia. El LLM solo se usa si es ambigua.
+                resolution: Resolution = resolve_reference(input, last_searched_filtered, order=presented_inms, allow_new_search=False) if settings.resolver.enabled else Resolution()
+                llm_result = None
+                if (not resolution.resolved or settings.resolver.shadow) and deadline.allows(settings.deadline.llm_reply_min_s):
+                    try:
+                        llm_result = await deadline.run(cls.id_of_interest_chain.ainvoke({"input": input, "inm_data": last_searched_filtered_str}), "id_of_interest")
+                    except DeadlineExceeded:
+                        pass # Se toma el último inmueble presentado
+                elif not resolution.resolved:
+                    deadline.degrade("id_of_interest_skipped")
+                yield {"type": "metadata", "key": "reference_resolution", "content": {
+                    "chain": "id_of_interest_chain", "method": resolution.method, "resolved_id": resolution.inm_id,
+                    "llm_result": llm_result, "candidates": list(last_searched_filtered.keys()), "order": presented_inms,
+                }}
+
+                match = re.search(r'\d+', llm_result or "")
+                if resolution.resolved:
+                    selected_id = resolution.inm_id
+                elif match:
                     selected_id = int(match.group())
                 else:
                     selected_id = presented_inms[-1] # Si no se ha obtenido un ID suponemos que el inmueble de interés es el último presentado
@@ -86,7 +106,7 @@ class VisitChain:
 
             #------GENERAMOS LA PETICIÓN DE CONFIRMACIÓN
             # Independientemente de si se resuelve el inmueble de interés, se ejecuta la cadena de confirmación de visita, ya que esta también es capaz de responder a dudas del usuario.
-            async for partial_message in cls.confirm_visit_chain.astream({"user_name": user_name, "selected_inm": data_inm}):
+            async for partial_message in deadline.stream(cls.confirm_visit_chain.astream({"user_name": user_name, "selected_inm": serialize_property(data_inm) if data_inm else ""}), "confirm_visit"):
                 yield {"type": "text", "content": partial_message}
             yield {"type": "metadata", "key": "chain", "content": "confirm_visit_chain"}
             
@@ -96,4 +116,9 @@ class VisitChain:
             return
         
         else:
-            yield {"type": "text", "content": "Lo sentimos, pero solo es posible realizar una sola reserva por usuario"}
\ No newline at end of file
+            # Con la plantilla desactivada (TEMPLATE_ENABLED o TEMPLATE_LLM_CHAINS) se devuelve el mensaje fijo original: esta respuesta nunca ha pasado por el LLM
+            if use_template("visit_limit"):
+                yield {"type": "text", "content": render_response("visit_limit", user_name=user_name)}
+                yield {"type": "metadata", "key": "response_source", "content": "template"}
+            else:
+                yield {"type": "text", "content": "Lo sentimos, pero solo es posible realizar una sola reserva por usuario"}
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from twilio.rest import Client
@@ -18,6 +19,7 @@ from src.services.user_service import UserService
 from src.utils.logger_config import configure_logging
 #from src.routers.base import main_router
 from src.data_generation.load_app_data import load_app_data
+from src.logic.rag_chain import RagChain
 
 # Configurar logging
 configure_logging()
@@ -58,6 +60,14 @@ async def lifespan(app: FastAPI):
     app.state.users_service = UserService(mongo_db) # Servicio de usuarios
     app.state.sessions_service = SessionService(redis_cache) # Servicio de sesiones
     
+    #------ÍNDICE VECTORIAL DE RAG
+    # Una instancia por worker; con mmap las páginas del índice se comparten entre los workers
+    if settings.rag.warm_on_startup:
+        try:
+            await asyncio.to_thread(RagChain.load)
+        except Exception as e:
+            logger.error(f"Error loading RAG index, it will be loaded on the first query: {e}")
+
     #------CONFIGURAR TWILIO
     try:
         client = Client(settings.twilio.account_sid, settings.twilio.auth_token)
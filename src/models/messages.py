@@ -3,7 +3,7 @@ from typing import List, Dict, Any, Optional, Union
 from datetime import datetime, timezone
 from beanie import Document
 
-from src.schemas.message import MessageModel
+from src.schemas.message import MessageModel, ConversationSummaryModel
 
 # ------MODELO PARA LA COLECCIÓN 'MESSAGES'------
 class MessagesModel(Document):
@@ -24,6 +24,10 @@ class MessagesModel(Document):
         default_factory=list, 
         description="Historial de mensajes"
     )
+    summary: ConversationSummaryModel = Field(
+        default_factory=ConversationSummaryModel,
+        description="Resumen incremental de los mensajes antiguos, actualizado en segundo plano"
+    )
     metadata: Dict[str, Any] = Field(
         default_factory=dict,
         description="Metadatos adicionales del documento"
@@ -3,19 +3,27 @@ from fastapi.responses import StreamingResponse
 from datetime import datetime, timezone
 from pprint import pprint
 import tempfile
+import asyncio
 import logging
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
 
 from src.logic.router_chain import Router_chain
 from src.logic.qa_chain import QAChain
 from src.dependencies.combined_dependencies import combined_dependencies
 from src.dependencies.session_dependece import update_session
-from src.dependencies.messages_dependence import update_messages
+from src.dependencies.messages_dependence import update_messages, manage_messages
+from src.dependencies.services_dependencies import get_session_service, get_messages_service
 from src.models.session import SessionModel
 from src.schemas.tools import QAToolModel
 from src.logic.form_chain import Form_chain
 from src.utils.api_calls import transcribe_audio
+from src.utils.llm_usage import start_turn, end_turn
+from src.utils.turn_runner import Turn, TurnRegistry, run_turn
+from src.utils.deadline import Deadline
+from src.utils.stream_events import StreamTrace
+from src.utils.frame_writer import write_frames, encode_frame
+from src.core.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -75,81 +83,127 @@ async def chat(
     try:
         session: SessionModel = context.get("session_context")
         history: List[Dict[str,Any]] = context.get("messages_context")
+
+        # Si había un turno en curso en la sesión se cancela y se recargan sesión e historial con su estado parcial
+        turn, superseded = await TurnRegistry.begin(session.id, request.app.state.redis_cache)
+        if superseded:
+            session = await get_session_service(request).get_session(session.id) or session
+            history = await manage_messages(request, get_messages_service(request))
+
         username = session.name
     
     except Exception as e:
             logging.error(f"Error retriving session objects in route /chat: {e}")
             raise Exception(f"Error retriving session objects in route /chat: {e}")
 
+    # ----GENERADOR DE LA HERRAMIENTA CORRESPONDIENTE AL TIPO DE MENSAJE
+    async def generate(input: str, deadline: Deadline):
+
+        # ---- PROCESADO DE RESPUESTA CUANDO SE EXIGE LOCALIZACIÓN
+        if type=="inm_localization_action":
+            localization: tuple = content
+            tools_data: dict = session.tools_data
+            qa_tool: QAToolModel = tools_data.get("qa_tool")
+            print(f"QA TOOL: {qa_tool}")
+            qa_tool.inm_localization = localization
+            async for partial_response in QAChain.direct_execute(input, qa_tool, deadline=deadline):
+                yield partial_response
+
+        # ---- PROCESADO DE RESPUESTA CUANDO SE PIDEN DATOS PERSONALES
+        if type=="personal_form_action":
+            personal_data: dict = content
+            async for partial_response in Form_chain.execute(personal_data):
+                yield partial_response
+
+        # ---- PROCESADO DE RESPUESTA GENÉRICO PARA INPUT DE USUARIO
+        if type=="text":
+            async for partial_response in Router_chain.execute(input, session, history, username, deadline):
+                yield partial_response
+
     # ----FUNCIÓN ASÍNCRONA GENERADORA DE RESPUESTAS
     async def response_stream():
         
-        try:        
-            print(f"SESSION CONTEXT 1: {session}")
-            partial_answers = []
-            bot_matadata = {}
-            user_matadata = {}
-            input = ""
-
-            # ---- PROCESADO DE RESPUESTA CUANDO SE EXIGE LOCALIZACIÓN
-            if type=="inm_localization_action":
-                localization: tuple = content
-                tools_data: dict = session.tools_data
-                qa_tool: QAToolModel = tools_data.get("qa_tool")
-                print(f"QA TOOL: {qa_tool}")
-                qa_tool.inm_localization = localization
-                user_matadata["type"] = type
-
-                # Generación la respuesta del chatbot.
-                async for partial_response in QAChain.direct_execute(input, qa_tool):
-
-                    # las respuestas son diccionarios en formato {"type": type, "content": content}
-                    yield json.dumps(partial_response) + "\n" # Importante el salto de línea para dividir las respuestas
-                    if partial_response["type"] == "text":
-                        partial_answers.append(partial_response["content"])
-                    if partial_response["type"] == "metadata":
-                        bot_matadata[partial_response["key"]] = partial_response["content"]
-
-            # ---- PROCESADO DE RESPUESTA CUANDO SE PIDEN DATOS PERSONALES
-            if type=="personal_form_action":
-                personal_data: dict = content
-                user_matadata["type"] = type
-
-                # Generación la respuesta del chatbot.
-                async for partial_response in Form_chain.execute(personal_data):
-
-                    # las respuestas son diccionarios en formato {"type": type, "content": content}
-                    yield json.dumps(partial_response) + "\n" # Importante el salto de línea para dividir las respuestas
-                    if partial_response["type"] == "text":
-                        partial_answers.append(partial_response["content"])
-                    if partial_response["type"] == "metadata":
-                        bot_matadata[partial_response["key"]] = partial_response["content"]
-
-            # ---- PROCESADO DE RESPUESTA GENÉRICO PARA INPUT DE USUARIO
-            if type=="text":
-                input: str = content
-                user_matadata["type"] = type
-                        
-                # Generación la respuesta del chatbot.
-                async for partial_response in Router_chain.execute(input, session, history, username):
-
-                    # Las respuestas son diccionarios en formato {"type": type, "content": content}
-                    yield json.dumps(partial_response) + "\n" # Importante el salto de línea para dividir las respuestas
-                    if partial_response["type"] == "text":
-                        content_chunk = partial_response["content"]
-                        partial_answers.append(content_chunk)
-                    if partial_response["type"] == "metadata":
-                        bot_matadata[partial_response["key"]] = partial_response["content"]
-                    else:
-                        pass
-
-            print(f"BOT METADATA: {bot_matadata}")
-            answer = "".join(partial_answers)        
-            await update_session(session, request)
-            await update_messages(user_timestamp, input, answer, user_matadata, bot_matadata, request)
+        print(f"SESSION CONTEXT 1: {session}")
+        partial_answers = []
+        bot_matadata = {}
+        user_matadata = {"type": type}
+        input = content if type=="text" else ""
+        # Estado de la sesión al inicio del turno, para restaurarlo si el turno se interrumpe
+        snapshot: SessionModel = session.model_copy(deep=True)
+        functions_delivered = False
+        failed = False
+        start_turn() # Registro de llamadas al LLM del turno
+        deadline = Deadline(settings.deadline.chat_budget) # Presupuesto de tiempo del turno
+        trace = StreamTrace() # Tiempos del primer resultado y del primer texto
+
+        async def events():
+            nonlocal functions_delivered
+            # Generación la respuesta del chatbot. Las respuestas son diccionarios en formato {"type": type, "content": content}
+            async for partial_response in run_turn(turn, generate(input, deadline), request.is_disconnected):
+                trace.mark(partial_response)
+                if partial_response["type"] == "text":
+                    partial_answers.append(partial_response["content"])
+                if partial_response["type"] == "metadata":
+                    bot_matadata[partial_response["key"]] = partial_response["content"]
+                if partial_response["type"] == "function":
+                    functions_delivered = True
+                yield partial_response
+
+        try:
+            # Los fragmentos de texto se agrupan en tramas; los eventos estructurados se envían de inmediato
+            async for frame in write_frames(events()):
+                yield frame
 
         except Exception as e:
             logger.error(f"Error in /chat route: {e}")
-            yield {"type": "text", "content": "Lo siento, ahora mismo no podemos atenderte."}
-
-    return StreamingResponse(response_stream(), media_type="text/event-stream")
\ No newline at end of file
+            failed = True
+            yield encode_frame({"type": "text", "content": "Lo siento, ahora mismo no podemos atenderte."})
+
+        finally:
+            # Si el stream termina antes que la generación (desconexión detectada por el servidor) se cancela el turno
+            if turn.task and not turn.task.done():
+                turn.cancel(turn.cancel_reason or "disconnect")
+            bot_matadata["llm_calls"] = end_turn(bot_matadata.get("response_source", "llm"))
+            bot_matadata["deadline"] = deadline.report()
+            bot_matadata["stream_trace"] = trace.report()
+
+            if failed:
+                TurnRegistry.finish(turn)
+            else:
+                if turn.cancelled:
+                    # Se guarda la transcripción parcial. Si el usuario no llegó a ver resultados, la sesión vuelve al estado
+                    # previo al turno para no dejar a medias la consulta SQL o la selección de inmuebles.
+                    bot_matadata["interrupted"] = turn.cancel_reason
+                    if not functions_delivered:
+                        session.tools_data = snapshot.tools_data
+                        session.name = snapshot.name
+                # La persistencia corre en su propia tarea para completarse aunque el stream haya sido cancelado
+                persist = asyncio.create_task(persist_turn(turn, session, user_timestamp, input, "".join(partial_answers), user_matadata, bot_matadata, request))
+                PERSIST_TASKS.add(persist)
+                persist.add_done_callback(PERSIST_TASKS.discard)
+
+    # El cuerpo NDJSON se sirve también como 'text/event-stream' para que los proxies no lo almacenen en búfer
+    return StreamingResponse(response_stream(), media_type="text/event-stream")
+
+
+# ------PERSISTENCIA DEL TURNO------
+PERSIST_TASKS: Set[asyncio.Task] = set()
+
+async def persist_turn(
+        turn: Turn,
+        session: SessionModel,
+        user_timestamp: datetime,
+        input: str,
+        answer: str,
+        user_metadata: dict,
+        bot_metadata: dict,
+        request: Request):
+    """Guarda la sesión y los mensajes del turno (completo o parcial) y libera el turno en el registro."""
+    try:
+        print(f"BOT METADATA: {bot_metadata}")
+        await update_session(session, request)
+        await update_messages(user_timestamp, input, answer, user_metadata, bot_metadata, request)
+    except Exception as e:
+        logger.error(f"Error persisting turn in /chat route: {e}")
+    finally:
+        TurnRegistry.finish(turn)
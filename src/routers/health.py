@@ -1,8 +1,22 @@
 from fastapi import APIRouter
 
+from src.utils.circuit_breaker import breakers_snapshot, OPEN
+from src.logic.tool_utilities.prefetch import prefetch_metrics
+from src.logic.rag_chain import RagChain
+from src.logic.tool_utilities.embedding_cache import embedding_cache_metrics
+from src.logic.tool_utilities.embedding_batcher import embedding_batch_metrics
+from src.logic.tool_utilities.answer_cache import answer_cache_metrics
+from src.logic.tool_utilities.description_search import description_search_metrics
+
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
-    """Endpoint de verificación de estado del servicio"""
-    return {"status": "ok", "version": "1.0.0"}
\ No newline at end of file
+    """Endpoint de verificación de estado del servicio. Incluye el estado de los circuit breakers de los modelos, las métricas de la precarga especulativa, si el índice de RAG está cargado, las cachés de embeddings y de respuestas y la búsqueda en las descripciones."""
+    breakers = breakers_snapshot()
+    degraded = any(breaker["state"] == OPEN for breaker in breakers.values())
+    return {"status": "degraded" if degraded else "ok", "version": "1.0.0", "llm_breakers": breakers, "prefetch": prefetch_metrics(),
+            "rag": {"loaded": RagChain.vector_db is not None, "vectors": RagChain.vector_db.index.ntotal if RagChain.vector_db else 0, "hybrid": RagChain.bm25 is not None},
+            "embedding_cache": embedding_cache_metrics(), "embedding_batch": embedding_batch_metrics(),
+            "answer_cache": {**answer_cache_metrics(), "entries": len(RagChain.answer_cache.entries)},
+            "description_search": description_search_metrics()}
@@ -15,6 +15,8 @@ from src.dependencies.session_dependece import update_session
 from src.dependencies.messages_dependence import update_messages
 from src.models.session import SessionModel
 from src.utils.general_utilities import is_valid_twilio_media
+from src.utils.deadline import Deadline
+from src.core.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -59,15 +61,17 @@ async def chat(
             raise Exception(f"Error retriving session objects in route /whats-message: {e}")
 
     # ----GENERACIÓN ASÍNCRONA DE RESPUESTA DEL CHATBOT
+    # El presupuesto de tiempo es menor que el límite del webhook de Twilio
+    deadline = Deadline(settings.deadline.whatsapp_budget)
     try:        
-        async for partial_response in Router_chain.execute(input, session, history, user_name):
+        async for partial_response in Router_chain.execute(input, session, history, user_name, deadline):
 
             # las respuestas son diccionarios en formato {"type": type, "content": content}
             json.dumps(partial_response) + "\n" # Importante el salto de línea para dividir las respuestas
             if partial_response["type"] == "text":
                 partial_answers.append(partial_response["content"])
             if partial_response["type"] == "metadata":
-                bot_matadata: dict = partial_response["content"]
+                bot_matadata[partial_response["key"]] = partial_response["content"]
             if partial_response["type"] == "image":
                 alt_content.append(partial_response)
             if partial_response["type"] == "url":
@@ -76,6 +80,7 @@ async def chat(
                 alt_content = order_generic_presentation(partial_response["input"])
 
         #----ACTUALIZACIÓN DE OBJETOS DE SESIÓN
+        bot_matadata["deadline"] = deadline.report()
         chatbot_response = "".join(partial_answers)
         await update_session(session, request)
         await update_messages(user_timestamp, input, chatbot_response, user_metada, bot_matadata, request)
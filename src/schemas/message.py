@@ -19,4 +19,29 @@ class MessageModel(BaseModel):
     metadata: Dict[str, Any] = Field(
         default_factory=dict,
         description="Marca de tiempo del mensaje"
-    )
\ No newline at end of file
+    )
+    tokens: int = Field(
+        default=0,
+        description="Tokens del contenido del mensaje (conteo local)"
+    )
+
+
+# ------ESQUEMA DE VALIDACIÓN PARA EL RESUMEN DE LA CONVERSACIÓN------
+
+class ConversationSummaryModel(BaseModel):
+    content: str = Field(
+        default="",
+        description="Resumen acumulado de los mensajes antiguos de la conversación"
+    )
+    summarized_until: int = Field(
+        default=0,
+        description="Número de mensajes del historial incorporados al resumen"
+    )
+    tokens: int = Field(
+        default=0,
+        description="Tokens del resumen (conteo local)"
+    )
+    updated_at: Optional[datetime] = Field(
+        default=None,
+        description="Marca de tiempo de la última actualización del resumen"
+    )
@@ -70,6 +70,10 @@ class QAToolModel(BaseModel):
         default_factory=list, 
         description="Lista de IDs de inmuebles ya presentados"
     )
+    last_results: List[int] = Field(
+        default_factory=list, 
+        description="IDs de la última presentación general de inmuebles, en el orden mostrado al usuario"
+    )
     inm_localization: Optional[tuple[float, float]] = Field(
         default=None, 
         description="Localización (latitud, longitud) indicada para búsqueda generada en la animación."
@@ -86,6 +90,10 @@ class QAToolModel(BaseModel):
         default=None, 
         description="Situación financiera del usuario."
     )
+    financial_asked: bool = Field(
+        default=False, 
+        description="Indica si se le ha preguntado al usuario por su situación financiera en el turno anterior."
+    )
     
     
 class RouterToolModel(BaseModel):
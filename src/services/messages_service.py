@@ -2,7 +2,7 @@ from typing import Optional, Union, List
 from datetime import datetime, timezone
 
 from src.models.messages import MessagesModel
-from src.schemas.message import MessageModel
+from src.schemas.message import MessageModel, ConversationSummaryModel
 from src.database.mongo import MongoDatabase
 
 class MessagesService:
@@ -44,25 +44,41 @@ class MessagesService:
     
     # ----AGREGAR MENSAJES
     async def set_messages(self, messages: Union[str, MessagesModel], user_message: MessageModel, bot_message: MessageModel) -> bool:
-        """ Agrega un mensaje a una documento existente."""
+        """ Agrega un mensaje a una documento existente.
+            Se usa '$push' en lugar de reemplazar el documento para no pisar el resumen que se actualiza en segundo plano.
+        """
 
-        if isinstance(messages, MessagesModel):
-            message_inst = messages
-        elif isinstance(messages, str):
-            id = messages
-            message_inst: MessagesModel = await self.get_messages(id)       
-        if not message_inst:
-            raise ValueError("Messages not found at updating")
-        
-        if not message_inst:
+        id = messages.id if isinstance(messages, MessagesModel) else messages
+        if not id:
             raise ValueError("A previous messages register is required for updating messages")
-        
-        message_inst.messages.append(user_message)
-        message_inst.messages.append(bot_message)
 
-        result = await self.update_messages(message_inst)
+        result = await self._collection.update_one(
+            {"_id": id},
+            {
+                "$push": {"messages": {"$each": [user_message.model_dump(), bot_message.model_dump()]}},
+                "$set": {"last_activity": datetime.now(timezone.utc).replace(microsecond=0).isoformat()}
+            }
+        )
+        if not result.matched_count:
+            raise ValueError("Messages not found at updating")
 
-        return result
+        return result.modified_count > 0
+    
+    # ----ACTUALIZACIÓN DEL RESUMEN
+    async def update_summary(self, id: str, summary: ConversationSummaryModel, previous_until: Optional[int] = None) -> bool:
+        """
+        Guarda el resumen incremental de la conversación sin tocar los mensajes.
+        Con 'previous_until' solo se guarda si el resumen almacenado sigue cubriendo ese número de mensajes: si otro worker
+        ya lo ha actualizado, no se sobrescribe. Devuelve False en ese caso.
+        """
+
+        query = {"_id": id}
+        if previous_until is not None:
+            covered = {"summary.summarized_until": previous_until}
+            # Las sesiones sin resumen guardado equivalen a un resumen que no cubre ningún mensaje
+            query.update({"$or": [covered, {"summary": None}, {"summary.summarized_until": {"$exists": False}}]} if previous_until == 0 else covered)
+        result = await self._collection.update_one(query, {"$set": {"summary": summary.model_dump()}})
+        return result.modified_count > 0
     
     # ---- RECUPERAR ULTIMOS MENSAJES
     async def get_last_messages(self, messages: Union[str, MessagesModel], k: int = None) -> Optional[List[MessagesModel]]:
@@ -0,0 +1,160 @@
+"""
+Circuit breaker por endpoint de modelo (un breaker por nombre de modelo).
+    - Cerrado: las llamadas pasan y se registra su resultado en una ventana deslizante. Una llamada cuenta como fallo si
+      lanza un error o si su latencia supera 'slow_call_seconds'.
+    - Abierto: si la tasa de fallos de la ventana supera el umbral, las llamadas se rechazan al instante con
+      CircuitOpenError durante 'open_seconds'.
+    - Semiabierto: pasado ese tiempo se dejan pasar hasta 'half_open_max_calls' llamadas de prueba. Si todas van bien
+      el breaker se cierra; un solo fallo lo vuelve a abrir. Una llamada de prueba cancelada no es un resultado: libera
+      su plaza ('release') para que otra llamada pueda probar el endpoint.
+"""
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """El endpoint tiene el circuito abierto y la llamada se rechaza sin intentarla."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit open for endpoint '{name}'")
+        self.name = name
+
+
+class CircuitBreaker:
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 5,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 8.0,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 2,
+    ):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.outcomes: Deque[bool] = deque(maxlen=window_size) # True = fallo
+        self.opened_at: Optional[float] = None
+        self.half_open_calls = 0 # Llamadas de prueba lanzadas en estado semiabierto
+        self.half_open_successes = 0
+        self.half_open_round = 0 # Se incrementa en cada paso a semiabierto; identifica las plazas de prueba de esa ronda
+        self.rejected = 0 # Llamadas rechazadas desde el arranque
+
+    # ------ESTADO------
+    def current_state(self) -> str:
+        """Estado actual; un breaker abierto pasa a semiabierto al cumplirse 'open_seconds'."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self.state
+
+    def failure_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def available(self) -> bool:
+        """Si una llamada sería aceptada ahora (sin consumir una llamada de prueba)."""
+        state = self.current_state()
+        return state == CLOSED or (state == HALF_OPEN and self.half_open_calls < self.half_open_max_calls)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker '{self.name}': {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == HALF_OPEN:
+            self.half_open_calls = 0
+            self.half_open_successes = 0
+            self.half_open_round += 1
+        if state == CLOSED:
+            self.outcomes.clear()
+
+    # ------LLAMADAS------
+    def before_call(self) -> Optional[int]:
+        """
+        Se invoca antes de cada llamada. Lanza CircuitOpenError si no se permite.
+        Devuelve la ronda semiabierta si la llamada ocupa una plaza de prueba (None si el breaker está cerrado).
+        """
+        state = self.current_state()
+        if state == OPEN or (state == HALF_OPEN and self.half_open_calls >= self.half_open_max_calls):
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+        if state == HALF_OPEN:
+            self.half_open_calls += 1
+            return self.half_open_round
+        return None
+
+    def release(self, half_open_round: Optional[int]) -> None:
+        """
+        Libera la plaza de una llamada de prueba que terminó sin resultado (cancelada). Solo si el breaker sigue en la
+        misma ronda semiabierta: las plazas de rondas anteriores ya se reiniciaron.
+        """
+        if half_open_round is not None and self.state == HALF_OPEN and half_open_round == self.half_open_round and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record(self, latency: Optional[float], error: bool = False) -> None:
+        """Registra el resultado de una llamada: error o latencia (lenta si supera 'slow_call_seconds')."""
+        failed = error or (latency is not None and latency > self.slow_call_seconds)
+
+        if self.state == HALF_OPEN:
+            if failed:
+                self._transition(OPEN)
+            else:
+                self.half_open_successes += 1
+                if self.half_open_successes >= self.half_open_max_calls:
+                    self._transition(CLOSED)
+            return
+
+        self.outcomes.append(failed)
+        if self.state == CLOSED and len(self.outcomes) >= self.min_calls and self.failure_rate() >= self.failure_rate_threshold:
+            self._transition(OPEN)
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.current_state(),
+            "failure_rate": round(self.failure_rate(), 3),
+            "calls_in_window": len(self.outcomes),
+            "rejected": self.rejected,
+        }
+
+
+# ------REGISTRO DE BREAKERS------
+BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Devuelve el breaker del endpoint, creándolo con la configuración de la aplicación."""
+    if name not in BREAKERS:
+        config = settings.breaker
+        BREAKERS[name] = CircuitBreaker(
+            name,
+            window_size=config.window_size,
+            min_calls=config.min_calls,
+            failure_rate_threshold=config.failure_rate_threshold,
+            slow_call_seconds=config.slow_call_seconds,
+            open_seconds=config.open_seconds,
+            half_open_max_calls=config.half_open_max_calls,
+        )
+    return BREAKERS[name]
+
+
+def breakers_snapshot() -> Dict[str, Dict]:
+    return {name: breaker.snapshot() for name, breaker in BREAKERS.items()}
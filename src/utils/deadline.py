@@ -0,0 +1,121 @@
+"""
+Presupuesto de tiempo por turno de conversación.
+Cada petición ('/chat', '/whats-message') crea un Deadline que se propaga por Router_chain, QAChain, RagChain y VisitChain.
+Cada etapa consulta el tiempo restante y, si es escaso, elige una alternativa más barata (omitir la ampliación de la
+búsqueda, usar el modelo pequeño, responder con plantilla). Las degradaciones aplicadas quedan registradas en el turno.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Any, AsyncGenerator, AsyncIterable, Awaitable, Dict, List, Optional
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """Se agota el presupuesto de tiempo en una etapa."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded at stage '{stage}'")
+        self.stage = stage
+
+
+class Deadline:
+
+    def __init__(self, budget: Optional[float]):
+        """
+            - budget (float): segundos disponibles para el turno. None para un turno sin límite.
+        """
+        self.budget = budget
+        self.started = time.monotonic()
+        self.degradations: List[str] = []
+
+    @classmethod
+    def unlimited(cls) -> "Deadline":
+        return cls(None)
+
+    # ------TIEMPO------
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if self.budget is None:
+            return math.inf
+        return self.budget - self.elapsed()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float) -> bool:
+        """Si quedan al menos 'seconds' segundos de presupuesto."""
+        return self.remaining() >= seconds
+
+    # ------DEGRADACIONES------
+    def degrade(self, name: str) -> None:
+        """Registra una degradación aplicada en el turno (una sola vez por nombre)."""
+        if name not in self.degradations:
+            self.degradations.append(name)
+            logger.info(f"Deadline degradation '{name}' with {self.remaining():.2f}s remaining")
+
+    def pick(self, chain: Any, fast_chain: Any, stage: str, min_seconds: float) -> Any:
+        """Devuelve la cadena normal si hay tiempo suficiente o su variante rápida en caso contrario."""
+        if self.allows(min_seconds):
+            return chain
+        self.degrade(f"{stage}_small_model")
+        return fast_chain
+
+    def report(self) -> Dict[str, Any]:
+        return {"budget": self.budget, "elapsed": round(self.elapsed(), 3), "degradations": list(self.degradations)}
+
+    # ------EJECUCIÓN ACOTADA------
+    async def run(self, awaitable: Awaitable, stage: str) -> Any:
+        """Espera el resultado dentro del tiempo restante. Lanza DeadlineExceeded si se agota."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            self.degrade(f"{stage}_timeout")
+            raise DeadlineExceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, None if math.isinf(remaining) else remaining)
+        except asyncio.TimeoutError:
+            self.degrade(f"{stage}_timeout")
+            raise DeadlineExceeded(stage)
+
+    async def stream(self, source: AsyncIterable, stage: str) -> AsyncGenerator[Any, None]:
+        """
+        Reenvía un stream hasta que se agota el presupuesto; en ese caso lo corta, registra la degradación y termina con
+        el aviso 'DEADLINE_TRUNCATION_NOTICE' para que el usuario sepa que la respuesta está incompleta.
+        """
+        iterator = source.__aiter__()
+        truncated = False
+        try:
+            while True:
+                remaining = self.remaining()
+                if remaining <= 0:
+                    truncated = True
+                    break
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), None if math.isinf(remaining) else remaining)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    truncated = True
+                    break
+                yield chunk
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+
+        if truncated:
+            self.degrade(f"{stage}_truncated")
+            if settings.deadline.truncation_notice:
+                yield settings.deadline.truncation_notice
@@ -0,0 +1,103 @@
+"""
+Escritura de las tramas del stream de '/chat'.
+Los fragmentos de texto del LLM se agrupan por ventana de tiempo y tamaño ('STREAM_COALESCE_WINDOW_MS',
+'STREAM_COALESCE_MAX_BYTES') para no pagar el coste por trama de Python, Starlette y la red en cada token. Los eventos
+estructurados (tarjetas, imágenes, URLs, metadatos) vacían el texto pendiente y se envían de inmediato.
+El formato es NDJSON (una línea JSON por trama) o, con 'STREAM_FORMAT=sse', Server-Sent Events ('data: ...\\n\\n').
+"""
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+
+import orjson
+
+from src.core.settings import settings
+
+_DONE = object()
+
+
+def encode_frame(event: Dict[str, Any], format: Optional[str] = None) -> bytes:
+    """Serializa un evento en una trama."""
+    format = format or settings.stream.format
+    data = orjson.dumps(event)
+    if format == "sse":
+        return b"event: " + event.get("type", "message").encode() + b"\ndata: " + data + b"\n\n"
+    return data + b"\n" # Importante el salto de línea para dividir las respuestas
+
+
+async def write_frames(
+    events: AsyncIterator[Dict[str, Any]],
+    window_ms: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    format: Optional[str] = None,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Convierte el stream de eventos en tramas agrupando el texto.
+        - window_ms (float): tiempo máximo que un fragmento de texto espera en el búfer. 0 desactiva la agrupación.
+        - max_bytes (int): tamaño del texto (en caracteres, aproximación barata de los bytes) a partir del cual se envía sin
+          esperar a la ventana.
+    """
+    window = (settings.stream.coalesce_window_ms if window_ms is None else window_ms) / 1000
+    max_bytes = settings.stream.coalesce_max_bytes if max_bytes is None else max_bytes
+    format = format or settings.stream.format
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        # Lee los eventos en su propia tarea: la espera con límite de tiempo no debe cancelar el generador de origen
+        try:
+            async for event in events:
+                queue.put_nowait(event)
+            queue.put_nowait((_DONE, None))
+        except Exception as e:
+            queue.put_nowait((_DONE, e))
+
+    buffer: List[str] = []
+    buffered_bytes = 0
+    deadline = 0.0
+
+    def flush() -> bytes:
+        nonlocal buffer, buffered_bytes
+        frame = encode_frame({"type": "text", "content": "".join(buffer)}, format)
+        buffer, buffered_bytes = [], 0
+        return frame
+
+    reader = asyncio.create_task(pump())
+    try:
+        while True:
+            if not queue.empty():
+                event = queue.get_nowait() # Ráfaga de fragmentos ya recibidos: sin espera
+            elif buffer:
+                # Se espera al siguiente evento solo hasta que vence la ventana del texto pendiente
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        event = await queue.get()
+                except TimeoutError:
+                    yield flush()
+                    continue
+            else:
+                event = await queue.get()
+
+            if isinstance(event, tuple) and event[0] is _DONE:
+                if buffer:
+                    yield flush()
+                if event[1] is not None:
+                    raise event[1]
+                break
+
+            if event.get("type") == "text" and window > 0:
+                if not buffer:
+                    deadline = asyncio.get_running_loop().time() + window
+                buffer.append(event["content"])
+                buffered_bytes += len(event["content"])
+                if buffered_bytes >= max_bytes:
+                    yield flush()
+                continue
+
+            # Evento estructurado: primero el texto pendiente, para conservar el orden
+            if buffer:
+                yield flush()
+            yield encode_frame(event, format)
+
+    finally:
+        if not reader.done():
+            reader.cancel()
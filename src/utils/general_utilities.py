@@ -1,5 +1,6 @@
 import json
 import requests
+import unicodedata
 from typing import Type, Dict, Any
 import json
 from typing import Any
@@ -81,8 +82,9 @@ def is_valid_twilio_media(url: str, timeout: int = 5) -> bool:
         return False
 
 
-
-
-
-
-
+def normalize_text(text: str) -> str:
+    """Normaliza un texto para comparaciones: minúsculas y sin tildes."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
@@ -0,0 +1,54 @@
+"""
+Ejecución única de las tareas programadas entre procesos.
+El scheduler de la carga nocturna ('load_app_data') arranca en cada worker de uvicorn, y todos lanzan la tarea a la vez.
+Las etapas caras (llamadas al LLM o a la API de embeddings) y las que escriben en ficheros SQLite compartidos se ejecutan
+dentro de 'exclusive_job':
+    - Un bloqueo de fichero ('fcntl.flock', no bloqueante) por tarea en 'JOBS_LOCK_DIR': solo un proceso la ejecuta y el
+      resto la omite sin esperar. El sistema operativo libera el bloqueo si el proceso muere.
+    - El fichero guarda la hora de la última ejecución completada. Si fue hace menos de 'JOBS_MIN_INTERVAL_S' la tarea se
+      omite: un worker que llega tarde, cuando otro ya la terminó y soltó el bloqueo, no la repite.
+El bloqueo es de la máquina: cubre los workers de un contenedor, que son los que comparten los ficheros SQLite.
+"""
+import fcntl
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def exclusive_job(name: str) -> Iterator[bool]:
+    """
+    Bloqueo de la tarea 'name'. Devuelve True si este proceso debe ejecutarla; False si otro la está ejecutando o ya la
+    completó hace menos de 'JOBS_MIN_INTERVAL_S'. Si el bloque termina sin excepción se registra como completada.
+    """
+    os.makedirs(settings.jobs.lock_dir, exist_ok=True)
+    with open(os.path.join(settings.jobs.lock_dir, f"{name}.lock"), "a+") as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info(f"Job '{name}' skipped: running in another process")
+            yield False
+            return
+        try:
+            file.seek(0)
+            try:
+                last_run = float(file.read().strip() or 0)
+            except ValueError:
+                last_run = 0.0
+            if time.time() - last_run < settings.jobs.min_interval_s:
+                logger.info(f"Job '{name}' skipped: already completed at {time.ctime(last_run)}")
+                yield False
+                return
+            yield True
+            file.seek(0)
+            file.truncate()
+            file.write(str(time.time()))
+            file.flush()
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
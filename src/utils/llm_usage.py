@@ -0,0 +1,52 @@
+"""
+Seguimiento de las llamadas a modelos de lenguaje por turno de conversación.
+Cada turno abre un registro en una variable de contexto; el callback de los modelos anota en él las cadenas que
+generan con LLM. Al cerrar el turno se actualizan los contadores globales (turnos totales y turnos servidos sin LLM).
+"""
+import logging
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_turn_calls: ContextVar[Optional[List[str]]] = ContextVar("turn_llm_calls", default=None)
+
+TURN_STATS: Dict[str, int] = {"turns": 0, "llm_free_turns": 0, "template_responses": 0}
+
+
+def start_turn() -> None:
+    """Abre el registro de llamadas del turno actual."""
+    _turn_calls.set([])
+
+
+def record_llm_call(chain_name: str) -> None:
+    """Anota una llamada al LLM en el turno actual (si hay un turno abierto)."""
+    calls = _turn_calls.get()
+    if calls is not None:
+        calls.append(chain_name)
+
+
+def end_turn(response_source: Optional[str] = None) -> List[str]:
+    """
+    Cierra el turno y devuelve las cadenas que llamaron al LLM.
+        - response_source (str): origen de la respuesta final ('template' o 'llm').
+    """
+    calls = _turn_calls.get() or []
+    _turn_calls.set(None)
+
+    TURN_STATS["turns"] += 1
+    if not calls:
+        TURN_STATS["llm_free_turns"] += 1
+    if response_source == "template":
+        TURN_STATS["template_responses"] += 1
+
+    logger.info(
+        f"Turn LLM calls: {len(calls)} {calls} | turns without LLM: {TURN_STATS['llm_free_turns']}/{TURN_STATS['turns']} "
+        f"({llm_free_share():.1%}) | template responses: {TURN_STATS['template_responses']}"
+    )
+    return calls
+
+
+def llm_free_share() -> float:
+    """Proporción de turnos servidos sin ninguna llamada al LLM."""
+    return TURN_STATS["llm_free_turns"] / TURN_STATS["turns"] if TURN_STATS["turns"] else 0.0
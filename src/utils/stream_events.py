@@ -0,0 +1,62 @@
+"""
+Orden de los eventos del stream de respuesta.
+Con 'results_first' los eventos estructurados (tarjetas, imágenes, URLs, coordenadas) se envían en cuanto los datos
+existen, antes del texto del LLM, de forma que el tiempo hasta ver los resultados no depende de la generación. Cada evento
+estructurado lleva una pista de maquetación para que el frontend lo coloque respecto al texto:
+    {"type": "function", "content": "generalPresentation", "input": [...], "layout": {"slot": "cards", "position": "after_text"}}
+"""
+import time
+from typing import Any, AsyncGenerator, AsyncIterable, Dict, List, Optional
+
+from src.core.settings import settings
+
+STRUCTURED_TYPES = ("function", "image", "url", "coord")
+
+
+def layout(event: Dict[str, Any], slot: str, position: str = "after_text") -> Dict[str, Any]:
+    """
+    Añade la pista de maquetación a un evento estructurado.
+        - slot (str): zona del mensaje ('cards', 'gallery', 'link', 'map').
+        - position (str): 'before_text' o 'after_text', posición respecto al texto con independencia del orden de llegada.
+    """
+    event["layout"] = {"slot": slot, "position": position}
+    return event
+
+
+async def with_results(structured: List[Dict[str, Any]], narrative: AsyncIterable[Dict[str, Any]]) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Combina los eventos estructurados, ya disponibles, con el texto que se genera en streaming.
+    Con 'results_first' se envían primero los estructurados; si no, después del texto (orden anterior).
+    """
+    if settings.stream.results_first:
+        for event in structured:
+            yield event
+    async for event in narrative:
+        yield event
+    if not settings.stream.results_first:
+        for event in structured:
+            yield event
+
+
+# ------TRAZA DE TIEMPOS------
+class StreamTrace:
+    """Instantes (ms desde el inicio del turno) del primer evento, del primer resultado estructurado y del primer texto."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks: Dict[str, Optional[float]] = {"first_event_ms": None, "first_structured_ms": None, "first_text_ms": None, "last_event_ms": None}
+
+    def mark(self, event: Dict[str, Any]) -> None:
+        now = round((time.perf_counter() - self.started) * 1000, 1)
+        if event.get("type") == "metadata":
+            return
+        if self.marks["first_event_ms"] is None:
+            self.marks["first_event_ms"] = now
+        if event.get("type") in STRUCTURED_TYPES and self.marks["first_structured_ms"] is None:
+            self.marks["first_structured_ms"] = now
+        if event.get("type") == "text" and self.marks["first_text_ms"] is None:
+            self.marks["first_text_ms"] = now
+        self.marks["last_event_ms"] = now
+
+    def report(self) -> Dict[str, Any]:
+        return {"results_first": settings.stream.results_first, **self.marks}
@@ -0,0 +1,35 @@
+"""
+Renderizado de las respuestas de contenido fijo con Jinja2, en un entorno aislado ('SandboxedEnvironment'): las
+plantillas solo leen el contexto recibido y no pueden acceder a atributos internos ni llamar a métodos inseguros.
+Además de los filtros de Jinja ('join', 'default', 'capitalize', 'lower', 'upper'...) se añade:
+    - sentence: une una lista como enumeración en castellano, {{ fields | sentence("y") }} -> "a, b y c".
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable
+
+from jinja2 import TemplateError, Undefined
+from jinja2.sandbox import SandboxedEnvironment
+
+__all__ = ["TemplateError", "compile_template", "render_template"]
+
+
+def _sentence(items: Iterable[Any], conjunction: str = "y") -> str:
+    items = [str(item) for item in (items or [])]
+    return f" {conjunction} ".join([", ".join(items[:-1]), items[-1]]) if len(items) > 1 else "".join(items)
+
+
+# Las variables que no se pasan o valen None se escriben vacías; 'keep_trailing_newline' conserva el salto de párrafo
+# final de plantillas como 'property_summary_intro'
+ENVIRONMENT = SandboxedEnvironment(undefined=Undefined, finalize=lambda value: "" if value is None else value, keep_trailing_newline=True, autoescape=False)
+ENVIRONMENT.filters["sentence"] = _sentence
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str):
+    """Compila una plantilla. Se cachea por texto de plantilla."""
+    return ENVIRONMENT.from_string(template)
+
+
+def render_template(template: str, context: Dict[str, Any]) -> str:
+    """Renderiza una plantilla con el contexto indicado."""
+    return compile_template(template).render(**context)
@@ -0,0 +1,38 @@
+import tiktoken
+from functools import lru_cache
+from typing import Optional
+
+from src.core.settings import settings
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str) -> tiktoken.Encoding:
+    """Devuelve el codificador de tokens del modelo. Si el modelo no es conocido por tiktoken se usa 'o200k_base'."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Cuenta localmente los tokens de un texto para el modelo indicado (por defecto el de referencia en la configuración)."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model or settings.prompt.token_model)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None, keep: str = "start") -> str:
+    """
+    Recorta un texto a un número máximo de tokens.
+        - keep (str): 'start' conserva el principio del texto y 'end' el final.
+    """
+    if not text or max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model or settings.prompt.token_model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    if keep == "end":
+        return "…" + encoding.decode(tokens[-max_tokens:])
+    return encoding.decode(tokens[:max_tokens]) + "…"
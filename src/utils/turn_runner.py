@@ -0,0 +1,222 @@
+"""
+Ejecución cancelable de los turnos de conversación.
+La generación de la respuesta corre en una tarea propia que entrega los fragmentos a través de una cola. Si el cliente se
+desconecta o el usuario envía un nuevo mensaje en la misma sesión, se cancela la tarea y, con ella, todo lo que esté en
+curso: streams del LLM, consultas pendientes y tareas hijas lanzadas con 'spawn_in_turn' (p. ej. trabajo especulativo).
+Los mensajes de una sesión pueden llegar a workers distintos, así que el turno en curso de cada sesión se marca también en
+Redis. El turno comprueba el marcador al sondear la desconexión y se cancela si otro worker ha abierto uno nuevo.
+"""
+import asyncio
+import logging
+import math
+import uuid
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Optional, Set, Tuple
+
+from src.core.settings import settings
+from src.database.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+_current_turn: ContextVar[Optional["Turn"]] = ContextVar("current_turn", default=None)
+_DONE = object()
+
+
+# ------TURNO------
+class Turn:
+    """Árbol de tareas de un turno de conversación."""
+
+    def __init__(self, session_id: str, redis_cache: Optional[RedisCache] = None):
+        self.session_id = session_id
+        self.token = uuid.uuid4().hex # Identifica el turno en el marcador de Redis
+        self.redis_cache = redis_cache
+        self.task: Optional[asyncio.Task] = None
+        self.children: Set[asyncio.Task] = set()
+        self.cancel_reason: Optional[str] = None # 'disconnect' | 'superseded'
+        self.persisted = asyncio.Event() # Se activa cuando el turno ha guardado mensajes y sesión
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_reason is not None
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Lanza una tarea hija que se cancela junto con el turno."""
+        task = asyncio.create_task(coro)
+        self.children.add(task)
+        task.add_done_callback(self.children.discard)
+        return task
+
+    def cancel(self, reason: str) -> None:
+        """Cancela la generación y las tareas hijas. Solo cuenta el primer motivo."""
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+            logger.info(f"Turn cancelled ({reason}) for session {self.session_id}: {len(self.children)} child tasks")
+        for child in list(self.children):
+            child.cancel()
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    # ------MARCADOR EN REDIS------
+    @property
+    def marker_key(self) -> str:
+        return f"{settings.turns.key_prefix}:{self.session_id}"
+
+    async def claim(self) -> Optional[str]:
+        """Marca el turno como el de la sesión. Devuelve el token del turno que estaba en curso, si lo había."""
+        if not self.redis_cache:
+            return None
+        try:
+            return await self.redis_cache.getset(self.marker_key, self.token, ttl=settings.turns.marker_ttl_s)
+        except Exception as e:
+            logger.warning(f"Turn marker of session {self.session_id} not stored in Redis: {e}")
+            return None
+
+    async def superseded_elsewhere(self) -> bool:
+        """Si otro worker ha abierto un turno más reciente en la sesión."""
+        if not self.redis_cache:
+            return False
+        try:
+            marker = await self.redis_cache.get(self.marker_key)
+        except Exception:
+            return False
+        return marker is not None and marker != self.token
+
+    async def release(self) -> None:
+        """Retira el marcador si sigue siendo el del turno y avisa de que el turno está guardado."""
+        try:
+            await self.redis_cache.set(done_key(self.token), "1", ttl=math.ceil(settings.turns.supersede_wait_timeout) + 1)
+            if await self.redis_cache.get(self.marker_key) == self.token:
+                await self.redis_cache.delete(self.marker_key)
+        except Exception as e:
+            logger.warning(f"Turn marker of session {self.session_id} not released in Redis: {e}")
+
+
+def done_key(token: str) -> str:
+    return f"{settings.turns.key_prefix}:done:{token}"
+
+
+def current_turn() -> Optional[Turn]:
+    """Turno en curso en el contexto actual (None fuera de un turno)."""
+    return _current_turn.get()
+
+
+def spawn_in_turn(coro: Coroutine) -> asyncio.Task:
+    """Lanza una tarea ligada al turno actual; fuera de un turno es una tarea normal."""
+    turn = current_turn()
+    return turn.spawn(coro) if turn else asyncio.create_task(coro)
+
+
+# ------REGISTRO DE TURNOS POR SESIÓN------
+class TurnRegistry:
+
+    turns: Dict[str, Turn] = {} # Turnos en curso en este worker
+    releases: Set[asyncio.Task] = set()
+
+    @classmethod
+    async def begin(cls, session_id: str, redis_cache: Optional[RedisCache] = None) -> Tuple[Turn, bool]:
+        """
+        Abre un turno para la sesión. Si hay otro en curso, en este u otro worker, se cancela y se espera (con límite) a que
+        guarde su estado parcial. Sin 'redis_cache' solo se ven los turnos de este worker.
+        Devuelve el turno y si se ha interrumpido uno anterior, en cuyo caso la sesión y el historial deben recargarse.
+        """
+        if not settings.turns.cancel_on_new_message:
+            turn = Turn(session_id)
+            cls.turns[session_id] = turn
+            return turn, False
+
+        turn = Turn(session_id, redis_cache)
+        previous = cls.turns.get(session_id)
+        previous_token = await turn.claim()
+        superseded = False
+        if previous and not previous.persisted.is_set():
+            previous.cancel("superseded")
+            superseded = True
+            try:
+                await asyncio.wait_for(previous.persisted.wait(), timeout=settings.turns.supersede_wait_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Previous turn of session {session_id} not persisted in time")
+        elif previous_token and not (previous and previous.token == previous_token):
+            # El turno anterior corre en otro worker: se cancela al ver el nuevo marcador
+            superseded = True
+            await cls._wait_remote(redis_cache, session_id, previous_token)
+
+        cls.turns[session_id] = turn
+        return turn, superseded
+
+    @classmethod
+    async def _wait_remote(cls, redis_cache: RedisCache, session_id: str, token: str) -> None:
+        """Espera (con límite) a que el turno de otro worker se guarde."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.turns.supersede_wait_timeout
+        try:
+            while loop.time() < deadline:
+                if await redis_cache.exists(done_key(token)):
+                    return
+                await asyncio.sleep(min(settings.turns.disconnect_poll_interval, 0.1))
+        except Exception as e:
+            logger.warning(f"Previous turn of session {session_id} not checked in Redis: {e}")
+            return
+        logger.warning(f"Previous turn of session {session_id} not persisted in time")
+
+    @classmethod
+    def finish(cls, turn: Turn) -> None:
+        """Marca el turno como guardado y lo retira del registro y de Redis."""
+        turn.persisted.set()
+        if cls.turns.get(turn.session_id) is turn:
+            cls.turns.pop(turn.session_id, None)
+        if turn.redis_cache:
+            release = asyncio.create_task(turn.release())
+            cls.releases.add(release)
+            release.add_done_callback(cls.releases.discard)
+
+
+# ------EJECUCIÓN------
+async def run_turn(
+    turn: Turn,
+    producer: AsyncIterator[Dict[str, Any]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Ejecuta el generador de respuestas en una tarea cancelable y devuelve sus fragmentos.
+        - turn (Turn): turno registrado para la sesión.
+        - producer (AsyncIterator): generador de la cadena (Router_chain.execute, QAChain.direct_execute...).
+        - is_disconnected: comprobación de desconexión del cliente (Request.is_disconnected).
+    Si el turno se cancela, termina sin error tras los fragmentos ya entregados; el motivo queda en 'turn.cancel_reason'.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        _current_turn.set(turn)
+        try:
+            async for item in producer:
+                queue.put_nowait(item)
+            queue.put_nowait((_DONE, None))
+        except asyncio.CancelledError:
+            queue.put_nowait((_DONE, None))
+            raise
+        except Exception as e:
+            queue.put_nowait((_DONE, e))
+
+    async def watch():
+        while not turn.cancelled:
+            await asyncio.sleep(settings.turns.disconnect_poll_interval)
+            if await is_disconnected():
+                turn.cancel("disconnect")
+            elif await turn.superseded_elsewhere():
+                turn.cancel("superseded")
+
+    turn.task = asyncio.create_task(produce())
+    watcher = asyncio.create_task(watch())
+    try:
+        while True:
+            item = await queue.get()
+            if isinstance(item, tuple) and item and item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                break
+            yield item
+    finally:
+        watcher.cancel()
+        # Si el consumidor se cancela (el servidor detecta la desconexión) se cancela también la generación
+        if not turn.task.done():
+            turn.cancel(turn.cancel_reason or "disconnect")
@@ -0,0 +1,151 @@
+"""
+Configuración común de los tests.
+Las rutas de configuración del proyecto (config/, resources/, prompts/, db/) son relativas a la raíz del repositorio.
+"""
+import os
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Variables obligatorias de AppSettings que en despliegue llegan por entorno
+os.environ.setdefault("CORS_ALLOW_ORIGINS", "*")
+os.environ.setdefault("MIDDLEWARE_SECRET_KEY", "test-secret")
+os.chdir(ROOT_DIR)
+
+
+# ------REDIS EN MEMORIA------
+class FakeRedisCache:
+    """Sustituto en memoria de RedisCache (src/database/redis.py) con las mismas operaciones. Ignora los TTL."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ttl=None):
+        self.store[key] = value
+        return True
+
+    async def getset(self, key, value, ttl=None):
+        previous = self.store.get(key)
+        self.store[key] = value
+        return previous
+
+    async def delete(self, key):
+        return int(self.store.pop(key, None) is not None)
+
+    async def exists(self, key):
+        return key in self.store
+
+    async def expire(self, key, ttl):
+        return key in self.store
+
+
+@pytest.fixture
+def redis_cache() -> FakeRedisCache:
+    return FakeRedisCache()
+
+
+class FakeSyncRedisClient:
+    """
+    Cliente síncrono de redis-py en memoria con las operaciones que usan los datos compartidos ('SharedRedis'): cadenas,
+    hashes y pipelines. Los valores se guardan como bytes, como con decode_responses=False. Ignora los TTL.
+    """
+
+    def __init__(self, store=None):
+        self.store = {} if store is None else store
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def mget(self, keys):
+        return [self.store.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.store[key] = self._bytes(value)
+        return True
+
+    def hset(self, key, field, value):
+        self.store.setdefault(key, {})[field] = self._bytes(value)
+        return 1
+
+    def hmget(self, key, fields):
+        values = self.store.get(key, {})
+        return [values.get(field) for field in fields]
+
+    def hincrby(self, key, field, amount=1):
+        values = self.store.setdefault(key, {})
+        values[field] = self._bytes(int(values.get(field, b"0")) + amount)
+        return int(values[field])
+
+    def expire(self, key, ttl):
+        return key in self.store
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class FakeRedisClient(FakeSyncRedisClient):
+    """Versión asíncrona de FakeSyncRedisClient. 'sync_client' comparte los mismos datos."""
+
+    async def get(self, key):
+        return super().get(key)
+
+    async def mget(self, keys):
+        return super().mget(keys)
+
+    async def set(self, key, value, ex=None):
+        return super().set(key, value, ex)
+
+    async def hset(self, key, field, value):
+        return super().hset(key, field, value)
+
+    async def hmget(self, key, fields):
+        return super().hmget(key, fields)
+
+    async def hincrby(self, key, field, amount=1):
+        return super().hincrby(key, field, amount)
+
+    async def expire(self, key, ttl):
+        return super().expire(key, ttl)
+
+    @property
+    def sync_client(self) -> FakeSyncRedisClient:
+        return FakeSyncRedisClient(self.store)
+
+
+class _FakePipeline:
+
+    def __init__(self, client: FakeSyncRedisClient):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(FakeSyncRedisClient, name), args, kwargs))
+            return self
+        return queue
+
+    def _run(self):
+        return [method(self.client, *args, **kwargs) for method, args, kwargs in self.calls]
+
+    def execute(self):
+        if isinstance(self.client, FakeRedisClient):
+            async def run():
+                return self._run()
+            return run()
+        return self._run()
+
+
+@pytest.fixture
+def redis_client_bytes() -> FakeRedisClient:
+    return FakeRedisClient()
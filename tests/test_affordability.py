@@ -0,0 +1,99 @@
+"""Topes de precio calculados a partir de la situación financiera y su inserción en la consulta SQL."""
+import sqlite3
+
+import pytest
+
+from src.core.settings import settings
+from src.logic.tool_utilities.affordability import (
+    AffordabilityCaps, affordability_caps, apply_affordability, loan_payment, mortgage_principal,
+)
+from src.schemas.tools import FinancialSituation
+
+PROPERTIES = [
+    (1, "Venta", "Pisos", "Oviedo", 90000),
+    (2, "Venta", "Pisos", "Oviedo", 180000),
+    (3, "Venta", "Pisos", "Gijon", 420000),
+    (4, "Alquiler", "Pisos", "Oviedo", 550),
+    (5, "Alquiler", "Pisos", "Gijon", 1400),
+    (6, "Traspaso", "Locales", "Oviedo", 30000),
+]
+
+
+@pytest.fixture
+def database():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE inmuebles (ID INTEGER, Operacion TEXT, Tipo TEXT, Poblacion TEXT, Precio INTEGER)")
+    connection.executemany("INSERT INTO inmuebles VALUES (?, ?, ?, ?, ?)", PROPERTIES)
+    yield connection
+    connection.close()
+
+
+def ids(connection: sqlite3.Connection, query: str):
+    return {row[0] for row in connection.execute(query)}
+
+
+# ------CÁLCULO DE LOS TOPES------
+def test_mortgage_principal_and_loan_payment_are_inverse():
+    principal = mortgage_principal(900, 0.035, 30)
+    assert principal == pytest.approx(200_000, rel=0.01)
+    assert loan_payment(principal, 0.035, 30) == pytest.approx(900)
+    assert mortgage_principal(500, 0.0, 10) == 60_000
+
+
+def test_caps_from_income_and_savings():
+    caps = affordability_caps(FinancialSituation(month_revenues=2500, savings=40000, amount_loans=0))
+    config = settings.affordability
+    payment = 2500 * config.max_debt_to_income
+    by_savings = 40000 / (1 - config.ltv + config.purchase_costs)
+    by_loan = (40000 + mortgage_principal(payment, config.interest_rate, config.term_years)) / (1 + config.purchase_costs)
+    assert caps.monthly_payment == pytest.approx(payment)
+    assert caps.max_sale_price == round(min(by_savings, by_loan) * (1 + config.margin))
+    assert caps.max_rent == round(2500 * config.rent_to_income * (1 + config.margin))
+
+
+def test_outstanding_loans_are_amortised_into_a_monthly_payment():
+    without = affordability_caps(FinancialSituation(month_revenues=2500))
+    with_loans = affordability_caps(FinancialSituation(month_revenues=2500, amount_loans=12000))
+    config = settings.affordability
+    instalment = loan_payment(12000, config.loans_interest_rate, config.loans_term_years)
+    assert with_loans.monthly_payment == pytest.approx(without.monthly_payment - instalment)
+    # La cantidad pendiente no se resta entera de los ingresos del mes
+    assert with_loans.monthly_payment > 2500 * config.max_debt_to_income - 12000
+
+
+def test_stated_budget_limits_payment_and_rent():
+    caps = affordability_caps(FinancialSituation(monthly_expenses=700))
+    assert caps.monthly_payment == 700
+    assert caps.max_rent == round(700 * (1 + settings.affordability.margin))
+
+
+def test_no_caps_without_financial_data():
+    assert affordability_caps(None).empty
+    assert affordability_caps(FinancialSituation()).empty
+
+
+# ------INSERCIÓN EN LA CONSULTA------
+def test_single_operation_gets_only_its_cap(database):
+    caps = AffordabilityCaps(max_sale_price=200000, max_rent=800)
+    query = apply_affordability("SELECT * FROM inmuebles WHERE Operacion = 'Venta' AND Tipo = 'Pisos'", caps)
+    assert "Precio <= 200000" in query and "800" not in query
+    assert ids(database, query) == {1, 2}
+
+
+def test_mixed_operations_are_capped_by_operation(database):
+    caps = AffordabilityCaps(max_sale_price=200000, max_rent=800)
+    query = apply_affordability("SELECT * FROM inmuebles WHERE Poblacion = 'Oviedo' OR Poblacion = 'Gijon'", caps)
+    # Los traspasos no se filtran; el OR original sigue agrupado
+    assert ids(database, query) == {1, 2, 4, 6}
+
+
+def test_operation_inside_or_does_not_restrict_the_caps(database):
+    caps = AffordabilityCaps(max_sale_price=100000, max_rent=800)
+    query = apply_affordability("SELECT * FROM inmuebles WHERE Operacion = 'Venta' OR Poblacion = 'Gijon'", caps)
+    assert ids(database, query) == {1}
+
+
+def test_query_without_caps_or_unparseable_is_unchanged():
+    query = "SELECT * FROM inmuebles WHERE Operacion = 'Venta'"
+    assert apply_affordability(query, AffordabilityCaps()) == query
+    assert apply_affordability("SELECT * FROM WHERE (", AffordabilityCaps(max_rent=500)) == "SELECT * FROM WHERE ("
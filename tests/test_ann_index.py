@@ -0,0 +1,86 @@
+"""Tipos de índice FAISS del RAG: construcción, recall frente a la búsqueda exacta y parámetros de búsqueda del manifiesto."""
+import faiss
+import numpy as np
+import pytest
+
+from src.core.settings import settings
+from src.logic.tool_utilities.ann_index import apply_search_params, build_index, index_params
+
+DIMENSION = 32
+K = 10
+
+
+def clustered_vectors(size: int, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    """Vectores unitarios agrupados en clusters, más parecidos a los embeddings de texto que el ruido uniforme."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIMENSION))
+    vectors = centers[rng.integers(clusters, size=size)] + 0.3 * rng.normal(size=(size, DIMENSION))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32")
+
+
+def recall(index: faiss.Index, exact: faiss.Index, queries: np.ndarray) -> float:
+    found = index.search(queries, K)[1]
+    expected = exact.search(queries, K)[1]
+    return float(np.mean([len(set(a) & set(b)) / K for a, b in zip(found, expected)]))
+
+
+@pytest.fixture(autouse=True)
+def search_overrides(monkeypatch):
+    monkeypatch.setattr(settings.rag, "index_nprobe", None)
+    monkeypatch.setattr(settings.rag, "index_hnsw_ef_search", None)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    vectors = clustered_vectors(8000)
+    queries = vectors[:50] + 0.05 * np.random.default_rng(1).normal(size=(50, DIMENSION)).astype("float32")
+    exact, _ = build_index(vectors, "flat")
+    return vectors, queries, exact
+
+
+@pytest.mark.parametrize("index_type, params, min_recall", [
+    ("ivf_flat", {"nlist": 32, "nprobe": 8}, 0.9),
+    ("ivf_pq", {"nlist": 16, "nprobe": 8, "m": 16, "nbits": 4, "refine": 16}, 0.9),
+    ("hnsw", {"m": 16, "ef_construction": 64, "ef_search": 64}, 0.9),
+])
+def test_approximate_indexes_keep_recall(corpus, index_type, params, min_recall):
+    vectors, queries, exact = corpus
+    index, spec = build_index(vectors, index_type, params)
+    assert spec["type"] == index_type
+    assert index.ntotal == len(vectors)
+    assert recall(index, exact, queries) >= min_recall
+
+
+def test_nprobe_trades_recall_without_rebuilding(corpus, monkeypatch):
+    vectors, queries, exact = corpus
+    index, spec = build_index(vectors, "ivf_flat", {"nlist": 64, "nprobe": 1})
+    low = recall(index, exact, queries)
+    monkeypatch.setattr(settings.rag, "index_nprobe", 64)
+    apply_search_params(index, spec)
+    assert faiss.extract_index_ivf(index).nprobe == 64
+    assert recall(index, exact, queries) == 1.0 > low
+
+
+def test_hnsw_ef_search_from_manifest_and_override(corpus, monkeypatch):
+    index, spec = build_index(corpus[0][:500], "hnsw", {"m": 8, "ef_construction": 40, "ef_search": 24})
+    assert index.hnsw.efSearch == 24
+    monkeypatch.setattr(settings.rag, "index_hnsw_ef_search", 128)
+    apply_search_params(index, spec)
+    assert index.hnsw.efSearch == 128
+
+
+def test_small_corpus_falls_back_to_flat():
+    index, spec = build_index(clustered_vectors(200), "ivf_pq")
+    assert spec == {"type": "flat", "params": {}}
+    assert isinstance(index, faiss.IndexFlatL2)
+
+
+def test_pq_m_must_divide_the_dimension(corpus):
+    with pytest.raises(Exception, match="must divide"):
+        build_index(corpus[0], "ivf_pq", {"nlist": 16, "m": 7, "nbits": 4})
+
+
+def test_unknown_index_type():
+    with pytest.raises(Exception, match="Unknown RAG index type"):
+        index_params("lsh")
@@ -0,0 +1,151 @@
+"""
+Caché semántica de respuestas de RAG: umbral de similitud, caducidad, límite de entradas, versión del índice y preguntas
+que dependen del historial. La caché es de cada worker, en memoria.
+"""
+from typing import Any, AsyncGenerator, Dict, List
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.core.settings import settings
+from src.logic.rag_chain import RagChain
+from src.logic.tool_utilities import answer_cache
+from src.logic.tool_utilities.answer_cache import AnswerCache, cacheable_question
+
+SELLER = "¿Qué gastos tiene el vendedor de una vivienda?"
+ANSWER = "El vendedor paga la plusvalía municipal y la cancelación de la hipoteca."
+
+
+def vector(*values: float) -> List[float]:
+    return list(values) + [0.0] * (8 - len(values))
+
+
+@pytest.fixture
+def published(monkeypatch) -> Dict[str, str]:
+    """Versión publicada del índice de RAG, controlada por el test."""
+    state = {"version": "v1"}
+    monkeypatch.setattr(answer_cache, "index_version", lambda index_dir: state["version"])
+    monkeypatch.setattr(settings.answer_cache, "check_interval_s", 0.0)
+    monkeypatch.setattr(settings.answer_cache, "threshold", 0.95)
+    monkeypatch.setattr(settings.answer_cache, "audit_path", None)
+    return state
+
+
+@pytest.fixture
+def cache(published) -> AnswerCache:
+    cache = AnswerCache("db")
+    assert cache.usable("v1")
+    cache.store(SELLER, vector(1.0, 0.1), ANSWER)
+    return cache
+
+
+# ------PREGUNTAS QUE DEPENDEN DEL HISTORIAL------
+@pytest.mark.parametrize("question, cacheable", [
+    (SELLER, True),
+    ("¿Es buen momento comprar casa en invierno?", True),
+    ("¿Y eso cuánto cuesta?", False),
+    ("Entonces, ¿quién lo paga?", False),
+    ("¿Me das más detalles?", False),
+])
+def test_follow_up_questions_are_not_cached(question, cacheable):
+    assert cacheable_question(question) is cacheable
+
+
+# ------CONSULTA Y GUARDADO------
+def test_similar_question_hits_and_different_one_misses(cache):
+    entry, similarity = cache.lookup(vector(1.0, 0.12))
+    assert entry.answer == ANSWER and similarity >= 0.95 and entry.hits == 1
+    assert cache.lookup(vector(1.0, 1.0)) is None
+
+
+def test_expired_answers_are_dropped(cache, monkeypatch):
+    monkeypatch.setattr(settings.answer_cache, "ttl_seconds", -1.0)
+    assert cache.lookup(vector(1.0, 0.1)) is None
+    assert not cache.entries
+
+
+def test_oldest_answers_are_evicted(published, monkeypatch):
+    monkeypatch.setattr(settings.answer_cache, "max_entries", 2)
+    cache = AnswerCache("db")
+    cache.usable("v1")
+    for position, question in enumerate(["primera", "segunda", "tercera"]):
+        cache.store(question, vector(*([0.0] * position + [1.0])), f"respuesta {position}")
+    assert [entry.question for entry in cache.entries.values()] == ["segunda", "tercera"]
+    assert cache.lookup(vector(1.0)) is None
+
+
+def test_empty_answers_are_not_stored(published):
+    cache = AnswerCache("db")
+    cache.usable("v1")
+    cache.store(SELLER, vector(1.0), "  ")
+    assert not cache.entries
+
+
+# ------VERSIÓN DEL ÍNDICE------
+def test_new_index_version_clears_the_cache(cache, published):
+    published["version"] = "v2"
+    # El worker sigue con el índice anterior: no se usa
+    assert not cache.usable("v1")
+    assert not cache.entries
+    assert cache.usable("v2")
+
+
+# ------RESPUESTAS DE LA HERRAMIENTA RAG------
+class FakeChain:
+    """Cadena de RAG que registra las entradas de cada generación."""
+
+    def __init__(self):
+        self.inputs: List[Dict[str, Any]] = []
+
+    async def astream(self, inputs: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        self.inputs.append(inputs)
+        yield ANSWER
+
+
+@pytest.fixture
+def rag(published, monkeypatch) -> FakeChain:
+    chain = FakeChain()
+
+    async def retrieve(query, deadline=None, vector=None):
+        return [Document(page_content=ANSWER, metadata={"source": "data/pdf/guía de los gastos del vendedor.pdf", "page": 0})], [0.9], [True]
+
+    monkeypatch.setattr(settings.answer_cache, "enabled", True)
+    monkeypatch.setattr(RagChain, "vector_db", object())
+    monkeypatch.setattr(RagChain, "bm25", None)
+    monkeypatch.setattr(RagChain, "embeddings", DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr(RagChain, "index_version", "v1")
+    monkeypatch.setattr(RagChain, "answer_cache", AnswerCache("db"))
+    monkeypatch.setattr(RagChain, "retrieve", retrieve)
+    monkeypatch.setattr(RagChain, "rag_chain", chain)
+    monkeypatch.setattr(RagChain, "rag_chain_fast", chain)
+    return chain
+
+
+async def ask(question: str, history: str) -> List[Dict[str, Any]]:
+    return [message async for message in RagChain.query_rag(question, history, "Ana")]
+
+
+def source(messages: List[Dict[str, Any]]) -> str:
+    return next(message["content"] for message in messages if message.get("key") == "response_source")
+
+
+async def test_answers_after_a_greeting_are_cached(rag):
+    greeting = "human: Hola\nai: ¡Hola Ana! ¿En qué puedo ayudarte?"
+    await ask(SELLER, greeting)
+    # La pregunta no depende del historial: se genera sin él y se guarda aunque no sea el primer turno
+    assert rag.inputs[0]["history"] == ""
+    assert len(RagChain.answer_cache.entries) == 1
+
+    messages = await ask(SELLER, "human: Buenas tardes\nai: Buenas tardes, ¿qué necesitas?")
+    assert source(messages) == "answer_cache"
+    assert "".join(message["content"] for message in messages if message["type"] == "text") == ANSWER
+    assert len(rag.inputs) == 1
+
+
+async def test_follow_up_questions_keep_the_history_and_are_not_cached(rag):
+    history = "human: ¿Qué gastos tiene el vendedor?\nai: La plusvalía municipal."
+    await ask("¿Y eso cuánto cuesta?", history)
+    assert rag.inputs[0]["history"] == history
+    assert not RagChain.answer_cache.entries
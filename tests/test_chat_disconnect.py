@@ -0,0 +1,180 @@
+"""
+Desconexión del cliente a mitad del stream de '/chat'.
+Se cierra la respuesta tras unas pocas tramas y se comprueba que la generación (el LLM) se cancela y que el turno se
+libera en el registro y en Redis.
+"""
+import asyncio
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from src.core.settings import settings
+from src.dependencies.combined_dependencies import combined_dependencies
+from src.models.session import SessionModel
+from src.routers import chat
+from src.utils.turn_runner import TurnRegistry
+
+SESSION_ID = "session-disconnect"
+
+
+# ------TRANSPORTE ASGI CON STREAMING------
+class _StreamedBody(httpx.AsyncByteStream):
+
+    def __init__(self, chunks: asyncio.Queue, disconnected: asyncio.Event, app_task: asyncio.Task):
+        self.chunks = chunks
+        self.disconnected = disconnected
+        self.app_task = app_task
+
+    async def __aiter__(self):
+        while (chunk := await self.chunks.get()) is not None:
+            yield chunk
+
+    async def aclose(self) -> None:
+        self.disconnected.set()
+        try:
+            await asyncio.wait_for(self.app_task, timeout=5)
+        except Exception:
+            pass
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    Como httpx.ASGITransport, pero entrega el cuerpo a medida que la aplicación lo genera. Al cerrar la respuesta se
+    comporta como un servidor ante la desconexión del cliente: 'receive' devuelve 'http.disconnect' y 'send' falla.
+    """
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = b"".join([chunk async for chunk in request.stream])
+        chunks: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+        started = asyncio.Event()
+        response: Dict[str, Any] = {}
+        request_sent = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                response.update(status=message["status"], headers=message.get("headers", []))
+                started.set()
+            elif message["type"] == "http.response.body":
+                if disconnected.is_set():
+                    raise OSError("Client disconnected")
+                chunks.put_nowait(message.get("body", b""))
+                if not message.get("more_body", False):
+                    chunks.put_nowait(None)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": request.method,
+            "headers": [(key.lower(), value) for key, value in request.headers.raw], "scheme": request.url.scheme,
+            "path": request.url.path, "raw_path": request.url.raw_path.split(b"?")[0], "query_string": request.url.query,
+            "server": (request.url.host, request.url.port), "client": ("127.0.0.1", 123), "root_path": "",
+        }
+        app_task = asyncio.create_task(self.app(scope, receive, send))
+        waiter = asyncio.create_task(started.wait())
+        await asyncio.wait({app_task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if not started.is_set():
+            waiter.cancel()
+            app_task.result() # Propaga el error de la aplicación
+        return httpx.Response(response["status"], headers=response["headers"], stream=_StreamedBody(chunks, disconnected, app_task))
+
+
+# ------GENERACIÓN SIMULADA------
+class FakeLLMStream:
+    """Sustituye a Router_chain.execute: un token cada pocos milisegundos, registrando si se cancela."""
+
+    def __init__(self, tokens: int = 500, delay: float = 0.005):
+        self.tokens = tokens
+        self.delay = delay
+        self.generated = 0
+        self.cancelled = False
+
+    async def execute(self, input, session, history, username, deadline):
+        try:
+            for index in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                self.generated += 1
+                yield {"type": "text", "content": f"token{index} "}
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def wait_for(condition, timeout: float = 3.0):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def llm(monkeypatch) -> FakeLLMStream:
+    fake = FakeLLMStream()
+    monkeypatch.setattr(chat.Router_chain, "execute", fake.execute, raising=False)
+    return fake
+
+
+@pytest.fixture
+def persisted(monkeypatch) -> List[Dict]:
+    turns: List[Dict] = []
+
+    async def update_session(session, request):
+        pass
+
+    async def update_messages(user_timestamp, input, answer, user_metadata, bot_metadata, request):
+        turns.append({"input": input, "answer": answer, "bot_metadata": bot_metadata})
+
+    monkeypatch.setattr(chat, "update_session", update_session)
+    monkeypatch.setattr(chat, "update_messages", update_messages)
+    return turns
+
+
+@pytest.fixture
+def app(monkeypatch, redis_cache) -> FastAPI:
+    monkeypatch.setattr(settings.turns, "disconnect_poll_interval", 0.01)
+    monkeypatch.setattr(settings.stream, "coalesce_window_ms", 0.0)
+    monkeypatch.setattr(TurnRegistry, "turns", {})
+
+    application = FastAPI()
+    application.include_router(chat.router)
+    application.state.redis_cache = redis_cache
+    application.dependency_overrides[combined_dependencies] = lambda: {
+        "session_context": SessionModel(_id=SESSION_ID), "messages_context": [],
+    }
+    return application
+
+
+async def test_closing_the_stream_cancels_generation_and_releases_the_turn(app, llm, persisted, redis_cache):
+    transport = StreamingASGITransport(app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async with client.stream("POST", "/chat", json={"type": "text", "content": "Busco un piso en Oviedo"}) as response:
+            assert response.status_code == 200
+            received = 0
+            async for line in response.aiter_lines():
+                if line.strip():
+                    received += 1
+                if received == 5:
+                    break # El cliente cierra la conexión a mitad de la respuesta
+
+    await wait_for(lambda: llm.cancelled)
+    assert llm.generated < llm.tokens
+
+    await wait_for(lambda: not chat.PERSIST_TASKS and not TurnRegistry.releases)
+    assert SESSION_ID not in TurnRegistry.turns
+    assert not await redis_cache.exists(f"{settings.turns.key_prefix}:{SESSION_ID}")
+
+    assert len(persisted) == 1
+    assert persisted[0]["bot_metadata"]["interrupted"] == "disconnect"
+    assert persisted[0]["answer"].startswith("token0 ")
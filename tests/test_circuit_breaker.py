@@ -0,0 +1,161 @@
+"""Circuit breaker de los endpoints de modelos y ruta local del modo degradado."""
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from langchain_core.outputs import LLMResult
+
+from src.logic.tool_config import llm_policy
+from src.logic.tool_config.llm_policy import CircuitBreakerCallback, is_provider_error
+from src.logic.tool_utilities.local_search import local_route, local_search
+from src.utils import circuit_breaker
+from src.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(llm_policy, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    return CircuitBreaker("model", window_size=10, min_calls=5, failure_rate_threshold=0.5, slow_call_seconds=1.0, open_seconds=30.0, half_open_max_calls=2)
+
+
+@pytest.fixture
+def callback(breaker) -> CircuitBreakerCallback:
+    return CircuitBreakerCallback(breaker)
+
+
+def call(callback: CircuitBreakerCallback, clock: Clock, latency: float = 0.1, error: BaseException = None):
+    """Una llamada con los mismos eventos que emite ChatOpenAI en streaming."""
+    run_id = uuid4()
+    callback.on_chat_model_start({}, [[]], run_id=run_id)
+    clock.now += latency
+    if error is not None:
+        callback.on_llm_error(error, run_id=run_id)
+    else:
+        callback.on_llm_new_token("token", run_id=run_id)
+        callback.on_llm_end(LLMResult(generations=[]), run_id=run_id)
+
+
+def open_circuit(callback, clock):
+    for _ in range(5):
+        call(callback, clock, error=TimeoutError("provider timeout"))
+
+
+def test_healthy_endpoint_stays_closed(callback, breaker, clock):
+    for _ in range(20):
+        call(callback, clock)
+    assert breaker.current_state() == CLOSED
+
+
+def test_failures_open_the_circuit_and_reject_calls(callback, breaker, clock):
+    open_circuit(callback, clock)
+    assert breaker.current_state() == OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        call(callback, clock)
+    assert breaker.rejected == 1
+
+
+def test_slow_first_token_counts_as_failure(callback, breaker, clock):
+    for _ in range(5):
+        call(callback, clock, latency=2.0)
+    assert breaker.current_state() == OPEN
+
+
+def test_half_open_probes_close_the_circuit(callback, breaker, clock):
+    open_circuit(callback, clock)
+    clock.now += 31
+    assert breaker.current_state() == HALF_OPEN
+
+    call(callback, clock)
+    assert breaker.current_state() == HALF_OPEN
+    call(callback, clock)
+    assert breaker.current_state() == CLOSED
+    assert breaker.failure_rate() == 0
+
+
+def test_half_open_admits_limited_probes(callback, breaker, clock):
+    open_circuit(callback, clock)
+    clock.now += 31
+    breaker.before_call()
+    breaker.before_call()
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit(callback, breaker, clock):
+    open_circuit(callback, clock)
+    clock.now += 31
+    call(callback, clock, error=TimeoutError("provider timeout"))
+    assert breaker.current_state() == OPEN
+
+
+@pytest.mark.parametrize("cancellation", [asyncio.CancelledError(), GeneratorExit()])
+def test_cancelled_probe_releases_its_slot(callback, breaker, clock, cancellation):
+    open_circuit(callback, clock)
+    clock.now += 31
+    for _ in range(2):
+        call(callback, clock, error=cancellation)
+
+    assert breaker.current_state() == HALF_OPEN
+    assert breaker.available()
+    call(callback, clock)
+    call(callback, clock)
+    assert breaker.current_state() == CLOSED
+
+
+@pytest.mark.parametrize("cancellation", [asyncio.CancelledError(), GeneratorExit()])
+def test_cancelled_calls_are_not_failures(callback, breaker, clock, cancellation):
+    for _ in range(10):
+        call(callback, clock, error=cancellation)
+    assert breaker.current_state() == CLOSED
+    assert len(breaker.outcomes) == 0
+
+
+def test_provider_errors_are_found_in_the_exception_chain(breaker):
+    try:
+        try:
+            raise CircuitOpenError("model")
+        except CircuitOpenError as e:
+            raise Exception("ERROR: chain failed") from e
+    except Exception as wrapped:
+        assert is_provider_error(wrapped)
+    assert not is_provider_error(ValueError("bad input"))
+
+
+# ------MODO DEGRADADO------
+@pytest.mark.parametrize("text, route", [
+    ("Busco un piso en alquiler en Oviedo", "busqueda"),
+    ("Quiero comprar una casa en Gijón de tres dormitorios por menos de 250.000 euros", "busqueda"),
+    ("¿Tenéis locales en venta en Avilés?", "busqueda"),
+    ("¿Cuál es el teléfono de vuestra oficina de Oviedo?", "contacto"),
+    ("¿Cómo funciona la fianza en un alquiler?", "info"),
+    ("¿Qué impuestos se pagan al comprar una vivienda?", "info"),
+])
+def test_local_route(text, route):
+    assert local_route(text) == route
+
+
+def test_local_search_applies_the_recognised_filters():
+    query, rows = local_search("Quiero comprar una casa en Gijón de tres dormitorios por menos de 250.000 euros")
+    assert query.filters["Operacion"] == "Venta"
+    assert query.filters["NumDormitorios"] == 3
+    assert query.filters["Precio"] == 250000
+    for row in rows:
+        assert row["Precio"] <= 250000 and row["NumDormitorios"] >= 3
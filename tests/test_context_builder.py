@@ -0,0 +1,72 @@
+"""Contexto del prompt de RAG: umbral de similitud, coincidencias léxicas, fusión de solapes y presupuesto de tokens."""
+import pytest
+from langchain_core.documents import Document
+
+from src.core.settings import settings
+from src.logic.tool_utilities.context_builder import build_context, split_sentences
+from src.utils.tokens import count_tokens
+
+SELLER = (
+    "El vendedor paga la plusvalía municipal. También corren de su cuenta los gastos de cancelación de la hipoteca. "
+    "El certificado energético lo encarga el propietario antes de anunciar la vivienda."
+)
+BUYER = "El comprador paga el impuesto de transmisiones patrimoniales (ITP). La notaría de la compraventa corre a su cargo."
+RENT = "La fianza de un alquiler de vivienda es de una mensualidad. Se deposita en el organismo autonómico."
+
+
+def document(text: str, source: str = "data/pdf/guía de los gastos del vendedor.pdf", page: int = 0, start: int = None) -> Document:
+    metadata = {"source": source, "page": page}
+    if start is not None:
+        metadata["start_index"] = start
+    return Document(page_content=text, metadata=metadata)
+
+
+@pytest.fixture(autouse=True)
+def context_settings(monkeypatch):
+    monkeypatch.setattr(settings.rag, "context_min_score", 0.75)
+    monkeypatch.setattr(settings.rag, "context_compression", True)
+    monkeypatch.setattr(settings.rag, "context_max_tokens", 500)
+
+
+def test_chunks_below_the_threshold_are_dropped():
+    context = build_context("¿Qué gastos tiene el vendedor?", [document(SELLER), document(RENT, "data/pdf/fianza.pdf")], [0.86, 0.71])
+    assert context.chunks == 1
+    assert "[guía de los gastos del vendedor]" in context.text and "fianza" not in context.text
+
+
+def test_nothing_relevant_gives_an_empty_context():
+    context = build_context("Recomiéndame una receta de fabada", [document(SELLER), document(RENT)], [0.70, 0.69])
+    assert context.empty and context.chunks == 0
+
+
+def test_lexical_hits_are_kept_below_the_threshold():
+    # "ITP" no se parece a nada en la búsqueda densa, pero BM25 lo encuentra literalmente
+    context = build_context("¿Quién paga el ITP?", [document(BUYER, "data/pdf/gastos del comprador.pdf"), document(RENT)], [0.72, 0.70], lexical=[True, False])
+    assert not context.empty and context.chunks == 1
+    assert "(ITP)" in context.text and "fianza" not in context.text
+
+
+def test_unknown_scores_are_not_dropped():
+    assert build_context("¿Qué gastos tiene el vendedor?", [document(SELLER)], [None]).chunks == 1
+
+
+def test_overlapping_chunks_are_merged_without_repeating_the_overlap(monkeypatch):
+    monkeypatch.setattr(settings.rag, "context_compression", False)
+    first, second = SELLER[:120], SELLER[90:]
+    context = build_context("gastos del vendedor", [document(first, start=0), document(second, start=90)], [0.9, 0.8])
+    assert context.merged == 1
+    assert context.text == f"[guía de los gastos del vendedor] {SELLER}"
+
+
+def test_near_duplicates_are_dropped():
+    context = build_context("gastos del vendedor", [document(SELLER), document(SELLER + " ", "data/pdf/copia.pdf", page=3)], [0.9, 0.85])
+    assert context.duplicates == 1
+
+
+def test_compression_keeps_the_relevant_sentences_within_budget(monkeypatch):
+    query = "¿Quién encarga el certificado energético?"
+    budget = count_tokens(split_sentences(SELLER)[2]) + 5
+    monkeypatch.setattr(settings.rag, "context_max_tokens", budget)
+    context = build_context(query, [document(SELLER), document(BUYER, "data/pdf/gastos del comprador.pdf")], [0.8, 0.8])
+    assert context.tokens <= budget and context.sentences == 1
+    assert context.text == f"[guía de los gastos del vendedor] {split_sentences(SELLER)[2]}"
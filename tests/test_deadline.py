@@ -0,0 +1,78 @@
+"""Presupuesto de tiempo por turno."""
+import asyncio
+
+import pytest
+
+from src.core.settings import settings
+from src.utils.deadline import Deadline, DeadlineExceeded
+
+
+class SlowStream:
+    """Stream que entrega un fragmento cada 'delay' segundos y registra si se ha cerrado."""
+
+    def __init__(self, chunks: int, delay: float):
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = False
+
+    async def __call__(self):
+        try:
+            for index in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                yield f"c{index}"
+        finally:
+            self.closed = True
+
+
+async def collect(deadline: Deadline, source: SlowStream, stage: str = "answer"):
+    return [chunk async for chunk in deadline.stream(source(), stage)]
+
+
+async def test_complete_stream_has_no_notice():
+    chunks = await collect(Deadline(5.0), SlowStream(3, 0.001))
+    assert chunks == ["c0", "c1", "c2"]
+
+
+async def test_truncated_stream_ends_with_notice():
+    deadline = Deadline(0.05)
+    source = SlowStream(100, 0.01)
+    chunks = await collect(deadline, source)
+
+    assert 0 < len(chunks) < 100
+    assert chunks[-1] == settings.deadline.truncation_notice
+    assert chunks.count(settings.deadline.truncation_notice) == 1
+    assert deadline.degradations == ["answer_truncated"]
+    assert source.closed
+
+
+async def test_expired_budget_only_yields_notice():
+    deadline = Deadline(0.0)
+    chunks = await collect(deadline, SlowStream(3, 0.001))
+    assert chunks == [settings.deadline.truncation_notice]
+
+
+async def test_notice_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(settings.deadline, "truncation_notice", "")
+    deadline = Deadline(0.03)
+    chunks = await collect(deadline, SlowStream(100, 0.01))
+    assert chunks and all(chunk.startswith("c") for chunk in chunks)
+    assert "answer_truncated" in deadline.degradations
+
+
+async def test_run_raises_when_budget_is_exhausted():
+    deadline = Deadline(0.02)
+    with pytest.raises(DeadlineExceeded):
+        await deadline.run(asyncio.sleep(1), "sql")
+    assert deadline.degradations == ["sql_timeout"]
+
+
+def test_pick_uses_fast_chain_when_time_is_short():
+    deadline = Deadline(1.0)
+    assert deadline.pick("large", "small", "rag", min_seconds=0.5) == "large"
+    assert deadline.pick("large", "small", "rag", min_seconds=5.0) == "small"
+    assert deadline.degradations == ["rag_small_model"]
+
+
+def test_unlimited_deadline():
+    deadline = Deadline.unlimited()
+    assert deadline.allows(10_000) and not deadline.expired
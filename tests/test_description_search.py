@@ -0,0 +1,170 @@
+"""
+Búsqueda semántica en las descripciones de los inmuebles dentro de los filtros SQL: consulta relajada, búsqueda restringida
+a los candidatos y la comprobación de resultados de 'QAChain.direct_execute' antes de ampliar la consulta.
+"""
+import time
+from typing import Any, AsyncGenerator, Dict, List
+
+import faiss
+import numpy as np
+import pytest
+
+from src.core.settings import settings
+from src.logic import qa_chain
+from src.logic.qa_chain import QAChain
+from src.logic.tool_utilities.description_search import DescriptionSearch, clean_description, relax_query, search_index
+from src.schemas.tools import QAToolModel
+
+DIMENSION = 16
+QUERY = "SELECT * FROM inmuebles WHERE Operacion = 'Venta' AND CheckLuz = 1 AND Estado_General = 'Reformado' AND Precio <= 200000 ORDER BY Precio LIMIT 5"
+
+
+# ------TEXTO INDEXADO------
+def test_clean_description_strips_html_and_shouting():
+    assert clean_description("<p>PISO&nbsp;LUMINOSO   Y REFORMADO</p>") == "piso luminoso y reformado"
+    assert clean_description("Piso <b>luminoso</b> en el Centro") == "Piso luminoso en el Centro"
+    assert clean_description(None) == ""
+
+
+# ------CONSULTA DE CANDIDATOS------
+def test_relax_query_keeps_only_the_hard_filters():
+    assert relax_query(QUERY, "Id") == "SELECT Id FROM inmuebles WHERE Operacion = 'Venta' AND Precio <= 200000"
+    assert relax_query(QUERY) == "SELECT * FROM inmuebles WHERE Operacion = 'Venta' AND Precio <= 200000"
+
+
+def test_relax_query_drops_or_conditions_on_soft_columns():
+    query = "SELECT * FROM inmuebles WHERE Tipo = 'Pisos' AND (CheckVistasMar = 1 OR Precio < 100000)"
+    assert relax_query(query) == "SELECT * FROM inmuebles WHERE Tipo = 'Pisos'"
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM inmuebles WHERE Operacion = 'Venta' AND Precio <= 200000", # Nada que relajar
+    "SELECT * FROM inmuebles",
+    "SELECT * FROM WHERE",
+])
+def test_relax_query_without_soft_conditions(query):
+    assert relax_query(query) is None
+
+
+# ------ÍNDICE------
+@pytest.fixture(scope="module")
+def index():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, DIMENSION)).astype("float32")
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(DIMENSION))
+    index.add_with_ids(vectors, np.arange(1000, 1500, dtype="int64"))
+    return index, vectors
+
+
+def exact(vectors: np.ndarray, query: np.ndarray, ids: List[int], k: int) -> List[int]:
+    similarities = {inm_id: float(vectors[inm_id - 1000] @ query) for inm_id in ids}
+    return sorted(similarities, key=similarities.get, reverse=True)[:k]
+
+
+@pytest.mark.parametrize("candidates", [5, 40, 450, 500])
+def test_search_is_restricted_to_the_candidates(index, candidates, monkeypatch):
+    monkeypatch.setattr(settings.description_search, "post_filter_ratio", 0.8)
+    index, vectors = index
+    query = vectors[7] + 0.1
+    faiss.normalize_L2(query.reshape(1, -1))
+    ids = [int(inm_id) for inm_id in np.random.default_rng(candidates).choice(np.arange(1000, 1500), candidates, replace=False)]
+    hits = search_index(index, query, ids, k=5)
+    assert [inm_id for inm_id, _ in hits] == exact(vectors, query, ids, 5)
+
+
+def test_search_without_candidates(index):
+    index, vectors = index
+    assert search_index(index, vectors[0], [], k=5) == []
+    assert search_index(index, vectors[0], None, k=1)[0][0] == 1000
+
+
+# ------BÚSQUEDA------
+class VectorEmbeddings:
+    """Embeddings que devuelven un vector fijo."""
+
+    def __init__(self, vector: np.ndarray):
+        self.vector = vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.vector.tolist()
+
+
+async def test_rank_drops_results_below_the_min_score(index, monkeypatch):
+    index, vectors = index
+    monkeypatch.setattr(DescriptionSearch, "index", index)
+    monkeypatch.setattr(DescriptionSearch, "embeddings", VectorEmbeddings(vectors[3]))
+    monkeypatch.setattr(DescriptionSearch, "checked_at", time.monotonic())
+    monkeypatch.setattr(settings.description_search, "min_score", 0.99)
+    assert await DescriptionSearch.rank("piso luminoso", [1003, 1004, 1005], k=3) == [(1003, pytest.approx(1.0))]
+
+
+async def test_rank_without_index_returns_nothing(monkeypatch):
+    monkeypatch.setattr(DescriptionSearch, "index", None)
+    monkeypatch.setattr(DescriptionSearch, "checked_at", time.monotonic())
+    assert await DescriptionSearch.rank("piso luminoso", [1, 2]) == []
+
+
+# ------COMPROBACIÓN DE RESULTADOS EN 'direct_execute'------
+class FakeChain:
+
+    async def astream(self, inputs: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        yield "Estos son los inmuebles."
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> str:
+        return f"{inputs['last_query']} -- ampliada"
+
+
+@pytest.fixture
+def database(monkeypatch) -> Dict[str, Any]:
+    """Base de datos falsa: solo la consulta con filtro geoespacial y orden tiene resultados."""
+    state: Dict[str, Any] = {"executed": [], "rows": {f"{QUERY} AND geo ORDER BY PrioridadRK": [{"Id": 1}, {"Id": 2}]}}
+
+    def execute_sql_query(query):
+        state["executed"].append(query)
+        return state["rows"].get(query, [])
+
+    async def schedule(ids, generate):
+        return None
+
+    monkeypatch.setattr(qa_chain, "execute_sql_query", execute_sql_query)
+    monkeypatch.setattr(qa_chain, "add_geospatial_filter", lambda query, localization: f"{query} AND geo")
+    monkeypatch.setattr(qa_chain, "modify_sql_prioridadrk", lambda query: f"{query} ORDER BY PrioridadRK")
+    monkeypatch.setattr(qa_chain, "general_presentation_dict", lambda results: {row["Id"]: row for row in results})
+    monkeypatch.setattr(qa_chain.PropertyPrefetcher, "schedule", schedule)
+    monkeypatch.setattr(QAChain, "generic_answer_chain", FakeChain())
+    monkeypatch.setattr(QAChain, "broad_query_chain", FakeChain())
+    monkeypatch.setattr(settings.affordability, "enabled", False)
+    return state
+
+
+async def test_precheck_runs_the_final_query(database, monkeypatch):
+    async def description_search(*args, **kwargs):
+        raise AssertionError("La consulta tiene resultados: no se relaja")
+
+    monkeypatch.setattr(QAChain, "description_search", description_search)
+    qa_tool = QAToolModel(last_modify_query=QUERY, inm_localization=(43.36, -5.85))
+    messages = [message async for message in QAChain.direct_execute("piso luminoso", qa_tool)]
+
+    # Una sola ejecución, con el filtro geoespacial y el orden: ni ampliación ni búsqueda semántica
+    assert database["executed"] == [f"{QUERY} AND geo ORDER BY PrioridadRK"]
+    assert qa_tool.last_results == [1, 2] and qa_tool.inm_localization is None
+    assert not any(message.get("key") == "description_search" for message in messages)
+
+
+async def test_without_results_the_description_search_uses_the_hard_filters(database, monkeypatch):
+    searched = []
+
+    async def description_search(input, query, qa_tool, deadline):
+        searched.append((query, qa_tool.inm_localization))
+        return relax_query(query), [{"Id": 7}]
+
+    monkeypatch.setattr(QAChain, "description_search", description_search)
+    database["rows"] = {}
+    qa_tool = QAToolModel(last_modify_query=QUERY, inm_localization=(43.36, -5.85))
+    messages = [message async for message in QAChain.direct_execute("piso luminoso", qa_tool)]
+
+    assert database["executed"] == [f"{QUERY} AND geo ORDER BY PrioridadRK"]
+    assert searched == [(QUERY, (43.36, -5.85))] # La búsqueda semántica añade la zona a los candidatos
+    assert qa_tool.last_results == [7] and qa_tool.inm_localization is None
+    assert any(message.get("key") == "description_search" for message in messages)
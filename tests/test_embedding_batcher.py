@@ -0,0 +1,90 @@
+"""Agrupación de las peticiones de embeddings concurrentes: lotes por ventana y tamaño, deadlines, cancelaciones y errores."""
+import asyncio
+from typing import List
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from src.logic.tool_utilities.embedding_batcher import EmbeddingBatcher, embedding_deadline
+from src.utils.deadline import Deadline
+
+
+class FakeEmbeddingServer(Embeddings):
+    """Cliente de un servidor de embeddings con latencia fija por petición que registra cada lote recibido."""
+
+    def __init__(self, latency_s: float = 0.02, error: Exception = None):
+        self.latency_s = latency_s
+        self.error = error
+        self.model = DeterministicFakeEmbedding(size=16)
+        self.batches: List[List[str]] = []
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(list(texts))
+        await asyncio.sleep(self.latency_s)
+        if self.error is not None:
+            raise self.error
+        return self.model.embed_documents(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(list(texts))
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+
+@pytest.fixture
+def server() -> FakeEmbeddingServer:
+    return FakeEmbeddingServer()
+
+
+async def test_concurrent_queries_share_one_request(server):
+    batcher = EmbeddingBatcher(server, window_ms=20, max_batch=64)
+    queries = [f"consulta {number}" for number in range(10)]
+    vectors = await asyncio.gather(*(batcher.aembed_query(query) for query in queries))
+    assert server.batches == [queries]
+    # Cada coroutine recibe el vector de su propio texto
+    assert vectors == [server.model.embed_query(query) for query in queries]
+
+
+async def test_max_batch_splits_the_requests(server):
+    batcher = EmbeddingBatcher(server, window_ms=20, max_batch=4)
+    await asyncio.gather(*(batcher.aembed_query(f"consulta {number}") for number in range(10)))
+    assert [len(batch) for batch in server.batches] == [4, 4, 2]
+
+
+async def test_no_request_waits_longer_than_the_window(server):
+    batcher = EmbeddingBatcher(server, window_ms=10, max_batch=64)
+    first = asyncio.create_task(batcher.aembed_query("primera"))
+    await asyncio.sleep(0.05)
+    await asyncio.gather(first, batcher.aembed_query("segunda"))
+    assert server.batches == [["primera"], ["segunda"]]
+
+
+async def test_short_deadline_sends_without_waiting(server):
+    batcher = EmbeddingBatcher(server, window_ms=1000, max_batch=64)
+    with embedding_deadline(Deadline(0.5)):
+        await asyncio.wait_for(batcher.aembed_query("turno con prisa"), timeout=0.5)
+    assert server.batches == [["turno con prisa"]]
+
+
+async def test_cancelled_requests_are_dropped_from_the_batch(server):
+    batcher = EmbeddingBatcher(server, window_ms=20, max_batch=64)
+    cancelled = asyncio.create_task(batcher.aembed_query("cancelada"))
+    kept = asyncio.create_task(batcher.aembed_query("viva"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    assert len(await kept) == 16
+    assert server.batches == [["viva"]]
+
+
+async def test_api_error_reaches_every_request_in_the_batch():
+    batcher = EmbeddingBatcher(FakeEmbeddingServer(error=RuntimeError("rate limit")), window_ms=20, max_batch=64)
+    results = await asyncio.gather(batcher.aembed_query("a"), batcher.aembed_query("b"), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_sync_calls_go_straight_to_the_model(server):
+    batcher = EmbeddingBatcher(server, window_ms=20, max_batch=2)
+    batcher.embed_documents(["a", "b", "c"])
+    assert server.batches == [["a", "b", "c"]]
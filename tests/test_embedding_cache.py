@@ -0,0 +1,100 @@
+"""Caché de embeddings de dos niveles: LRU del proceso y Redis compartido entre workers y con la ingesta."""
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.core.settings import settings
+from src.logic.tool_utilities.embedding_cache import LRU, REDIS, CachedEmbeddings, cache_key
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings deterministas que registran cada llamada al modelo."""
+    calls: List[List[str]] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+@pytest.fixture
+def model() -> CountingEmbeddings:
+    return CountingEmbeddings(size=16, calls=[])
+
+
+@pytest.fixture(autouse=True)
+def shared_redis(monkeypatch, redis_client_bytes):
+    monkeypatch.setattr(LRU, "items", OrderedDict())
+    monkeypatch.setattr(settings.embedding_cache, "redis", True)
+    monkeypatch.setattr(REDIS.redis, "_async_client", redis_client_bytes)
+    monkeypatch.setattr(REDIS.redis, "_client", redis_client_bytes.sync_client)
+    monkeypatch.setattr(REDIS.redis, "down_until", 0.0)
+    return redis_client_bytes
+
+
+def other_worker(monkeypatch) -> None:
+    """Otro proceso: LRU vacía, mismo Redis."""
+    monkeypatch.setattr(LRU, "items", OrderedDict())
+
+
+def test_near_identical_questions_share_the_key():
+    assert cache_key("m", "¿Qué gastos tiene el vendedor?") == cache_key("m", "  qué gastos tiene   el vendedor")
+    assert cache_key("m", "gastos del vendedor") != cache_key("otro", "gastos del vendedor")
+
+
+async def test_second_query_is_served_from_memory(model):
+    cached = CachedEmbeddings(model, "fake")
+    first = await cached.aembed_query("¿Qué gastos tiene el vendedor?")
+    second = await cached.aembed_query("qué gastos tiene el vendedor")
+    assert second == first
+    assert len(model.calls) == 1
+
+
+async def test_another_worker_reads_the_vector_from_redis(model, monkeypatch):
+    vector = await CachedEmbeddings(model, "fake").aembed_query("¿Qué es la plusvalía?")
+    other_worker(monkeypatch)
+    assert await CachedEmbeddings(model, "fake").aembed_query("¿Qué es la plusvalía?") == pytest.approx(vector)
+    assert len(model.calls) == 1
+
+
+def test_ingestion_reuses_query_vectors_and_deduplicates_the_batch(model, monkeypatch):
+    texts = ["La fianza es de una mensualidad.", "El ITP lo paga el comprador.", "La fianza es de una mensualidad."]
+    stored = np.asarray(model.embed_query(texts[1]), dtype="float32")
+    model.calls.clear()
+    REDIS.set_many({cache_key("fake", texts[1]): stored.tobytes()})
+
+    vectors = CachedEmbeddings(model, "fake").embed_documents(texts)
+    assert model.calls == [[texts[0]]] # El repetido se calcula una vez y el de Redis no se calcula
+    assert vectors[0] == vectors[2]
+    assert vectors[1] == pytest.approx(stored.tolist())
+
+    other_worker(monkeypatch)
+    CachedEmbeddings(model, "fake").embed_documents(texts)
+    assert len(model.calls) == 1
+
+
+async def test_models_do_not_share_vectors(model):
+    await CachedEmbeddings(model, "fake").aembed_query("gastos del vendedor")
+    await CachedEmbeddings(model, "otro").aembed_query("gastos del vendedor")
+    assert len(model.calls) == 2
+
+
+async def test_redis_failure_falls_back_to_the_model(model, monkeypatch, shared_redis):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("Redis down")
+
+    monkeypatch.setattr(shared_redis, "mget", broken)
+    monkeypatch.setattr(REDIS.redis, "retry_seconds", 30.0)
+    errors = REDIS.redis.errors
+    vector = await CachedEmbeddings(model, "fake").aembed_query("¿Qué es la plusvalía?")
+    assert len(vector) == 16 and len(model.calls) == 1
+    assert REDIS.redis.errors == errors + 1
+    # Durante la espera no se vuelve a intentar: ni un error más
+    other_worker(monkeypatch)
+    await CachedEmbeddings(model, "fake").aembed_query("¿Qué es la plusvalía?")
+    assert REDIS.redis.errors == errors + 1
@@ -0,0 +1,84 @@
+"""Agrupación de los fragmentos de texto en tramas del stream de '/chat'."""
+import asyncio
+import json
+
+import orjson
+import pytest
+
+from src.utils.frame_writer import encode_frame, write_frames
+
+CARDS = {"type": "function", "content": "generalPresentation", "input": [{"Id": 1, "Precio": 150000}]}
+
+
+async def llm_events(chunks: int = 40, burst: int = 10, token_delay: float = 0.005):
+    """Tarjetas, texto en ráfagas de 'burst' fragmentos y metadatos, como una presentación genérica."""
+    yield CARDS
+    for index in range(chunks):
+        if index % burst == 0:
+            await asyncio.sleep(token_delay)
+        yield {"type": "text", "content": f" tok{index}"}
+    yield {"type": "metadata", "key": "chain", "content": "generic_presentation_chain"}
+
+
+async def frames(events, **kwargs):
+    return [orjson.loads(frame) async for frame in write_frames(events, format="ndjson", **kwargs)]
+
+
+def text_of(decoded):
+    return "".join(event["content"] for event in decoded if event["type"] == "text")
+
+
+async def test_bursts_are_coalesced_without_losing_text():
+    decoded = await frames(llm_events(), window_ms=50, max_bytes=10_000)
+    assert text_of(decoded) == "".join(f" tok{index}" for index in range(40))
+    assert len([event for event in decoded if event["type"] == "text"]) < 40
+    assert decoded[0] == CARDS
+    assert decoded[-1]["type"] == "metadata"
+
+
+async def test_zero_window_sends_every_fragment():
+    decoded = await frames(llm_events(), window_ms=0)
+    assert len([event for event in decoded if event["type"] == "text"]) == 40
+
+
+async def test_max_bytes_flushes_the_buffer():
+    decoded = await frames(llm_events(chunks=20, burst=20), window_ms=10_000, max_bytes=20)
+    texts = [event["content"] for event in decoded if event["type"] == "text"]
+    assert len(texts) > 1
+    assert all(len(text) >= 20 for text in texts[:-1])
+
+
+async def test_structured_event_flushes_pending_text_first():
+    async def events():
+        yield {"type": "text", "content": "Hola"}
+        yield {"type": "text", "content": ", mira"}
+        yield {"type": "url", "content": "https://example.com"}
+        yield {"type": "text", "content": " esto"}
+
+    decoded = await frames(events(), window_ms=10_000)
+    assert decoded == [
+        {"type": "text", "content": "Hola, mira"},
+        {"type": "url", "content": "https://example.com"},
+        {"type": "text", "content": " esto"},
+    ]
+
+
+async def test_source_errors_are_raised_after_pending_text():
+    async def events():
+        yield {"type": "text", "content": "parcial"}
+        raise RuntimeError("upstream failed")
+
+    received = []
+    with pytest.raises(RuntimeError):
+        async for frame in write_frames(events(), window_ms=10_000, format="ndjson"):
+            received.append(orjson.loads(frame))
+    assert received == [{"type": "text", "content": "parcial"}]
+
+
+def test_encode_frame_formats():
+    event = {"type": "text", "content": "¡Hola!"}
+    ndjson = encode_frame(event, "ndjson")
+    assert ndjson.endswith(b"\n") and json.loads(ndjson) == event
+    sse = encode_frame(event, "sse")
+    assert sse.startswith(b"event: text\ndata: ") and sse.endswith(b"\n\n")
+    assert json.loads(sse.split(b"data: ", 1)[1]) == event
@@ -0,0 +1,85 @@
+"""Recuperación híbrida de RAG: BM25, fusión RRF, reordenación y fragmentos que solo coinciden por términos exactos."""
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.core.settings import settings
+from src.logic.rag_chain import RagChain
+from src.logic.tool_utilities.context_builder import build_context
+from src.logic.tool_utilities.hybrid_search import BM25Index, hybrid_rank, reciprocal_rank_fusion, rerank, tokenize
+
+TEXTS = [
+    "El vendedor paga la plusvalía municipal y la cancelación registral de la hipoteca.",
+    "El comprador paga el impuesto de transmisiones patrimoniales y los gastos de notaría.",
+    "La fianza de los alquileres de vivienda es de una mensualidad y se deposita en el organismo autonómico.",
+    "Para alquilar una vivienda hace falta la cédula de habitabilidad en vigor.",
+    "El inmueble con referencia RK4471 tiene la cédula de habitabilidad caducada y se vende sin ella.",
+    "El contrato de arras penitenciales permite desistir perdiendo la señal entregada.",
+]
+
+
+@pytest.fixture
+def bm25() -> BM25Index:
+    return BM25Index(TEXTS)
+
+
+# ------BM25------
+def test_tokenize_drops_stopwords_and_simple_plurals():
+    assert tokenize("¿Cuáles son los gastos de los alquileres?") == ["cual", "gasto", "alquiler"]
+
+
+def test_bm25_finds_exact_terms(bm25):
+    assert bm25.search("fianza del alquiler", k=3)[0][0] == 2
+    assert [position for position, _ in bm25.search("referencia RK4471", k=3)] == [4]
+    assert bm25.search("receta de fabada", k=3) == []
+
+
+def test_rrf_rewards_documents_in_both_lists():
+    fused = reciprocal_rank_fusion([([1, 2, 3], 1.0), ([3, 4], 1.0)], rrf_k=60)
+    assert fused[0][0] == 3
+    assert [position for position, _ in reciprocal_rank_fusion([([1, 2], 1.0), ([2, 1], 3.0)], rrf_k=60)] == [2, 1]
+
+
+def test_rerank_prefers_literal_phrases(bm25):
+    fused = [(3, 1.0), (4, 0.99)]
+    assert [position for position, _ in rerank("cédula de habitabilidad caducada", fused, bm25)] == [4, 3]
+
+
+def test_hybrid_rank_without_bm25_keeps_the_dense_order():
+    assert hybrid_rank("fianza", [5, -1, 2, 0], None, k=2) == [5, 2]
+
+
+# ------COINCIDENCIA SOLO LÉXICA------
+@pytest.fixture
+def rag_index(monkeypatch):
+    """RagChain con un índice en memoria. Los embeddings deterministas no se parecen entre sí: la similitud densa es baja."""
+    embeddings = DeterministicFakeEmbedding(size=64)
+    documents = [Document(page_content=text, metadata={"source": f"data/pdf/doc{position}.pdf", "page": 0}) for position, text in enumerate(TEXTS)]
+    monkeypatch.setattr(RagChain, "vector_db", FAISS.from_documents(documents, embeddings))
+    monkeypatch.setattr(RagChain, "vectors", None)
+    monkeypatch.setattr(RagChain, "bm25", BM25Index(TEXTS))
+    monkeypatch.setattr(settings.rag, "k", 3)
+    monkeypatch.setattr(settings.rag, "hybrid_candidates", 6)
+    monkeypatch.setattr(settings.rag, "context_min_score", 0.75)
+    return embeddings
+
+
+def test_reference_code_only_matched_by_bm25_reaches_the_context(rag_index):
+    query = "¿Qué pasa con el RK4471?"
+    documents, scores, lexical = RagChain.search(query, rag_index.embed_query(query))
+
+    position = [doc.page_content for doc in documents].index(TEXTS[4])
+    assert lexical[position]
+    assert scores[position] < settings.rag.context_min_score # La búsqueda densa no lo considera relevante
+
+    context = build_context(query, documents, scores, RagChain.bm25.idf, lexical)
+    assert not context.empty
+    assert "RK4471" in context.text
+
+
+def test_without_lexical_matches_the_threshold_still_applies(rag_index):
+    query = "Recomiéndame una receta de fabada"
+    documents, scores, lexical = RagChain.search(query, rag_index.embed_query(query))
+    assert not any(lexical)
+    assert build_context(query, documents, scores, RagChain.bm25.idf, lexical).empty
@@ -0,0 +1,44 @@
+"""Ejecución única de las tareas programadas entre los workers ('exclusive_job')."""
+import pytest
+
+from src.core.settings import settings
+from src.utils.job_lock import exclusive_job
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings.jobs, "lock_dir", str(tmp_path / "locks"))
+    monkeypatch.setattr(settings.jobs, "min_interval_s", 3600.0)
+
+
+def test_only_one_process_runs_a_job_at_a_time():
+    with exclusive_job("summaries") as run:
+        assert run
+        # Otro worker abre el mismo fichero de bloqueo mientras la tarea está en curso
+        with exclusive_job("summaries") as concurrent:
+            assert not concurrent
+
+
+def test_a_completed_job_is_not_repeated_within_the_interval(monkeypatch):
+    with exclusive_job("summaries") as run:
+        assert run
+    with exclusive_job("summaries") as late:
+        assert not late
+
+    monkeypatch.setattr(settings.jobs, "min_interval_s", 0.0)
+    with exclusive_job("summaries") as again:
+        assert again
+
+
+def test_a_failed_job_is_not_recorded_as_completed():
+    with pytest.raises(RuntimeError):
+        with exclusive_job("summaries") as run:
+            assert run
+            raise RuntimeError("LLM unavailable")
+    with exclusive_job("summaries") as retry:
+        assert retry
+
+
+def test_jobs_are_locked_independently():
+    with exclusive_job("summaries") as summaries, exclusive_job("rag_ingestion") as ingestion:
+        assert summaries and ingestion
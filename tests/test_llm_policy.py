@@ -0,0 +1,59 @@
+"""Política de modelos por cadena (config/llm_policy.json)."""
+import pytest
+
+from src.core.settings import settings
+from src.logic.tool_config.llm_policy import LLMPolicy, load_llm_policy
+from src.utils.general_utilities import open_json
+
+
+@pytest.fixture
+def policy() -> LLMPolicy:
+    return LLMPolicy.model_validate(open_json(settings.llm_policy.policy_path))
+
+
+@pytest.fixture
+def fresh_policy(monkeypatch):
+    """Recarga la política con los ajustes que fije cada test."""
+    load_llm_policy.cache_clear()
+    yield monkeypatch
+    load_llm_policy.cache_clear()
+
+
+def test_uniform_is_the_default_profile(policy):
+    assert policy.active_profile == "uniform"
+
+
+def test_uniform_uses_one_model_for_every_chain(policy):
+    tiers = {policy.chain_policy(chain, "uniform").tier for chain in policy.profiles["tiered"]}
+    assert tiers == {"large"}
+
+
+def test_sql_generation_stays_on_the_large_tier(policy):
+    for chain in ("text2sql_chain", "broad_query_chain"):
+        assert policy.chain_policy(chain, "tiered").tier == "large"
+
+
+def test_unknown_chain_falls_back_to_profile_default(policy):
+    assert policy.chain_policy("unknown_chain", "tiered") == policy.profiles["tiered"]["default"]
+
+
+def test_unknown_profile_and_tier_are_rejected(policy):
+    with pytest.raises(ValueError):
+        policy.chain_policy("rag_chain", "missing")
+    with pytest.raises(ValueError):
+        policy.tier("medium")
+
+
+def test_cost_uses_tier_prices(policy):
+    large = policy.tier("large")
+    assert policy.cost("large", 1_000_000, 0) == pytest.approx(large.input_cost_per_1m)
+    assert policy.cost("large", 0, 1_000_000) == pytest.approx(large.output_cost_per_1m)
+
+
+def test_profile_and_tier_models_from_settings(fresh_policy):
+    fresh_policy.setattr(settings.llm_policy, "profile", "tiered")
+    fresh_policy.setattr(settings.llm_policy, "tier_models", {"small": "small-model", "large": "large-model"})
+    policy = load_llm_policy()
+    assert policy.active_profile == "tiered"
+    assert policy.tier("small").model == "small-model"
+    assert policy.tier("large").model == "large-model"
@@ -0,0 +1,99 @@
+"""
+Precarga especulativa del detalle de inmuebles: datos compartidos en Redis entre workers y límites por sesión contados
+en Redis. Cada "worker" se simula vaciando el registro en memoria de PropertyPrefetcher, que es lo único propio del proceso.
+"""
+import asyncio
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.settings import settings
+from src.logic.tool_utilities import prefetch
+from src.logic.tool_utilities.prefetch import STORE, PropertyPrefetcher
+
+SESSION_ID = "session-prefetch"
+
+
+def fake_detail(inm_id: int):
+    return ({"id": inm_id, "precio": 100000 + inm_id}, f"https://inmuebles/{inm_id}", "main.jpg", ["a.jpg"], (43.36, -5.85))
+
+
+@pytest.fixture
+def redis_client(monkeypatch, redis_client_bytes):
+    client = redis_client_bytes
+    monkeypatch.setattr(STORE.redis, "_async_client", client)
+    monkeypatch.setattr(STORE.redis, "down_until", 0.0)
+    monkeypatch.setattr(settings.prefetch, "redis", True)
+    monkeypatch.setattr(settings.prefetch, "enabled", True)
+    monkeypatch.setattr(settings.prefetch, "validate_photos", False)
+    monkeypatch.setattr(settings.prefetch, "top_results", 3)
+    monkeypatch.setattr(settings.prefetch, "max_per_session", 4)
+    monkeypatch.setattr(prefetch, "load_property_detail", fake_detail)
+    monkeypatch.setattr(prefetch, "current_turn", lambda: SimpleNamespace(session_id=SESSION_ID))
+    monkeypatch.setattr(prefetch, "spawn_in_turn", asyncio.create_task)
+    monkeypatch.setattr(PropertyPrefetcher, "sessions", OrderedDict())
+    return client
+
+
+def other_worker(monkeypatch) -> None:
+    monkeypatch.setattr(PropertyPrefetcher, "sessions", OrderedDict())
+
+
+async def settle() -> None:
+    await asyncio.gather(*(entry.detail_task for session in PropertyPrefetcher.sessions.values() for entry in session.properties.values()))
+
+
+async def test_another_worker_serves_the_prefetched_detail_from_redis(redis_client, monkeypatch):
+    assert await PropertyPrefetcher.schedule([11, 22, 33]) == 3
+    await settle()
+
+    other_worker(monkeypatch)
+    detail, text = await PropertyPrefetcher.get(SESSION_ID, 22)
+    assert detail == fake_detail(22)
+    assert text is None
+
+
+async def test_session_cap_is_shared_between_workers(redis_client, monkeypatch):
+    assert await PropertyPrefetcher.schedule([1, 2, 3]) == 3
+    other_worker(monkeypatch)
+    assert await PropertyPrefetcher.schedule([4, 5, 6]) == 1 # Solo queda 1 de los 4 de la sesión
+    other_worker(monkeypatch)
+    assert await PropertyPrefetcher.schedule([7, 8, 9]) == 0
+    await settle()
+
+
+async def test_pregeneration_cap_is_shared_between_workers(redis_client, monkeypatch):
+    monkeypatch.setattr(settings.prefetch, "pregenerate", True)
+    monkeypatch.setattr(settings.prefetch, "max_pregenerations_per_session", 2)
+    monkeypatch.setattr(settings.prefetch, "max_per_session", 12)
+
+    async def generate_text(data, inm_id):
+        return f"Presentación de {inm_id}"
+
+    await PropertyPrefetcher.schedule([1], generate_text)
+    other_worker(monkeypatch)
+    await PropertyPrefetcher.schedule([2, 3], generate_text)
+    entries = PropertyPrefetcher.sessions[SESSION_ID].properties
+    assert entries[2].text_task is not None and entries[3].text_task is None
+    await settle()
+
+
+async def test_without_redis_the_cap_is_counted_in_the_worker(redis_client, monkeypatch):
+    monkeypatch.setattr(settings.prefetch, "redis", False)
+    assert await PropertyPrefetcher.schedule([1, 2, 3]) == 3
+    assert await PropertyPrefetcher.schedule([4, 5, 6]) == 1
+    await settle()
+    assert not redis_client.store
+
+
+async def test_redis_failure_falls_back_to_the_worker(redis_client, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("Redis down")
+
+    monkeypatch.setattr(redis_client, "hmget", broken)
+    monkeypatch.setattr(STORE.redis, "retry_seconds", 30.0)
+    errors = STORE.redis.errors
+    assert await PropertyPrefetcher.get(SESSION_ID, 99) == (None, None)
+    assert STORE.redis.errors == errors + 1
+    assert not STORE.redis.available()
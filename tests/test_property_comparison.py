@@ -0,0 +1,75 @@
+"""Comparación de inmuebles ya mostrados: detección de los inmuebles a comparar y tabla comparativa local."""
+import pytest
+
+from src.logic.tool_utilities.property_comparison import build_comparison, comparison_diff, comparison_targets
+
+ROWS = {
+    11: {"Tipo": "Pisos", "Operacion": "Venta", "Barrio": "Centro", "Poblacion": "Oviedo", "Precio": 180000,
+         "Metros_Utiles": 90, "NumDormitorios": 3, "NumAseos": 2, "CheckAscensor": 1, "CheckGaraje": 1, "Planta": "2"},
+    22: {"Tipo": "Pisos", "Operacion": "Venta", "Barrio": "La Playa", "Poblacion": "Gijon", "Precio": 150000,
+         "Metros_Utiles": 60, "NumDormitorios": 2, "NumAseos": 1, "CheckAscensor": 1, "Planta": "2"},
+    33: {"Tipo": "Pisos", "Operacion": "Venta", "Barrio": "El Coto", "Poblacion": "Gijon", "Precio": 240000,
+         "Metros_Utiles": 120, "NumDormitorios": 4, "NumAseos": 2, "Planta": "0", "ParqueCerca": "Parque Isabel la Católica"},
+}
+ORDER = [11, 22, 33]
+
+
+# ------DETECCIÓN------
+@pytest.mark.parametrize("text, expected", [
+    ("¿Cuál es más grande, el primero o el tercero?", [11, 33]),
+    ("Compárame el segundo y el tercero", [22, 33]),
+    ("compara los dos primeros", [11, 22]),
+    ("compara las dos primeras", [11, 22]),
+    ("¿cuál es más barato de los dos últimos?", [22, 33]),
+    ("compara los primeros 2", [11, 22]),
+    ("compara los tres primeros", [11, 22, 33]),
+    ("compara el 11 y el 33", [11, 33]),
+    ("diferencias entre el 22 y el 33", [22, 33]),
+    ("compara el 11 con el último", [11, 33]),
+    ("compara todos", [11, 22, 33]),
+    ("compara los tres", [11, 22, 33]),
+])
+def test_comparison_targets(text, expected):
+    assert comparison_targets(text, ROWS, ORDER) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "compara los dos", # Se mostraron tres: no se sabe cuáles
+    "¿cuál es más grande, el primero?",
+    "busca otros más baratos que el primero y el segundo",
+    "háblame del primero y del segundo",
+    "compara el de 180.000 con el segundo", # El importe no es un ID
+])
+def test_not_a_comparison_of_two_known_properties(text):
+    assert comparison_targets(text, ROWS, ORDER) == []
+
+
+def test_both_when_two_were_shown():
+    rows = {inm_id: ROWS[inm_id] for inm_id in (11, 22)}
+    assert comparison_targets("compara los dos", rows, [11, 22]) == [11, 22]
+    assert comparison_targets("¿cuál me conviene más de ambos?", rows, [11, 22]) == [11, 22]
+
+
+def test_at_most_max_properties():
+    assert comparison_targets("compara todos", ROWS, ORDER, max_properties=2) == []
+    assert comparison_targets("compara los tres primeros", ROWS, ORDER, max_properties=2) == [11, 22]
+
+
+# ------TABLA COMPARATIVA------
+def test_table_marks_the_best_value_of_each_row():
+    table = build_comparison(ROWS, [11, 22, 33])
+    rows = {row["key"]: row for row in table["rows"]}
+    assert table["titles"][0] == "Pisos en venta · Centro, Oviedo"
+    assert rows["price"]["values"] == ["180.000 €", "150.000 €", "240.000 €"] and rows["price"]["best"] == [22]
+    assert rows["useful_m2"]["best"] == [33]
+    assert rows["price_m2"]["values"][0] == "2.000 €/m²"
+    assert rows["floor"]["values"] == ["2", "2", "Bajo"] and rows["floor"]["best"] == []
+    assert rows["amenities"]["values"] == ["ascensor, garaje", "ascensor", None] and rows["amenities"]["best"] == [11]
+    assert "year" not in rows # Sin datos en ningún inmueble
+
+
+def test_diff_only_keeps_rows_that_differ():
+    diff = comparison_diff(build_comparison(ROWS, [11, 22]))
+    assert diff.splitlines()[0] == "Inmuebles: 11 (Pisos en venta · Centro, Oviedo) | 22 (Pisos en venta · La Playa, Gijon)"
+    assert "Precio: 180.000 € | 150.000 € (mejor: 22)" in diff
+    assert "Planta" not in diff
@@ -0,0 +1,134 @@
+"""
+Ingesta incremental de la base de conocimiento con embeddings deterministas locales, en un directorio temporal: se omiten
+los documentos sin cambios, cada ejecución publica un directorio de versión y el puntero 'rag_current' cambia de una vez.
+"""
+import os
+import shutil
+from typing import List
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.core.settings import settings
+from src.data_generation.rag_ingestion import RagIngestion
+from src.logic.tool_utilities import vector_store
+from src.logic.tool_utilities.vector_store import CURRENT_FILE, VERSIONS_DIR, current_index_dir, load_vector_store, read_manifest
+
+KNOWLEDGE_BASE = os.path.join("data", "pdf")
+DOCUMENTS = ["guía de los gastos del vendedor.pdf", "contratar un alquiler compartido.pdf"]
+NEW_DOCUMENT = "mejor estación del año para comprar una casa.pdf"
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings deterministas que registran los textos que se calculan."""
+    embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def pdf_dir(tmp_path) -> str:
+    directory = tmp_path / "pdf"
+    directory.mkdir()
+    for name in DOCUMENTS:
+        shutil.copy(os.path.join(KNOWLEDGE_BASE, name), directory / name)
+    return str(directory)
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch) -> str:
+    monkeypatch.setattr(settings.rag, "index_type", "flat")
+    monkeypatch.setattr(settings.rag, "keep_versions", 3)
+    return str(tmp_path / "index")
+
+
+def ingest(index_dir: str, pdf_dir: str, embeddings: CountingEmbeddings) -> dict:
+    embeddings.embedded = []
+    return RagIngestion(embeddings, "fake", index_dir, pdf_dir=pdf_dir, workers=1).run()
+
+
+def pointer(index_dir: str) -> str:
+    with open(os.path.join(index_dir, CURRENT_FILE), encoding="utf-8") as file:
+        return file.read()
+
+
+def versions(index_dir: str) -> List[str]:
+    return sorted(os.listdir(os.path.join(index_dir, VERSIONS_DIR)))
+
+
+def test_rerun_skips_unchanged_documents_and_publishes_a_new_version(index_dir, pdf_dir):
+    embeddings = CountingEmbeddings(size=64)
+    first = ingest(index_dir, pdf_dir, embeddings)
+    assert first["parsed_files"] == len(DOCUMENTS) and first["embedded"] == first["chunks"] > 0
+    first_version = pointer(index_dir)
+    assert versions(index_dir) == [first_version]
+
+    # Sin cambios: no se lee ningún PDF ni se calcula ningún embedding, pero se publica otra versión
+    second = ingest(index_dir, pdf_dir, embeddings)
+    assert second["parsed_files"] == 0 and second["embedded"] == 0 and second["reuse_ratio"] == 1.0
+    assert not embeddings.embedded
+    second_version = pointer(index_dir)
+    assert second_version != first_version
+    assert versions(index_dir) == [first_version, second_version]
+
+    # Un documento nuevo: solo se leen y calculan sus fragmentos
+    shutil.copy(os.path.join(KNOWLEDGE_BASE, NEW_DOCUMENT), os.path.join(pdf_dir, NEW_DOCUMENT))
+    third = ingest(index_dir, pdf_dir, embeddings)
+    assert third["parsed_files"] == 1
+    assert 0 < third["embedded"] == len(embeddings.embedded) < third["chunks"]
+    manifest = read_manifest(current_index_dir(index_dir))
+    assert set(manifest["files"]) == set(DOCUMENTS) | {NEW_DOCUMENT}
+    assert manifest["vectors"] == third["chunks"]
+
+    store = load_vector_store(index_dir, embeddings)
+    assert store.index.ntotal == third["chunks"]
+    assert {doc.metadata["source"] for doc in store.docstore._dict.values()} == {os.path.join(pdf_dir, name) for name in DOCUMENTS + [NEW_DOCUMENT]}
+
+
+def test_old_versions_are_pruned(index_dir, pdf_dir, monkeypatch):
+    monkeypatch.setattr(settings.rag, "keep_versions", 2)
+    embeddings = CountingEmbeddings(size=64)
+    for _ in range(3):
+        ingest(index_dir, pdf_dir, embeddings)
+    assert len(versions(index_dir)) == 2
+    assert pointer(index_dir) == versions(index_dir)[-1]
+
+
+def test_failed_publication_keeps_the_previous_version(index_dir, pdf_dir, monkeypatch):
+    embeddings = CountingEmbeddings(size=64)
+    ingest(index_dir, pdf_dir, embeddings)
+    published = pointer(index_dir)
+    chunks = load_vector_store(index_dir, embeddings).index.ntotal
+
+    def broken_write(index, path):
+        raise OSError("No space left on device")
+
+    shutil.copy(os.path.join(KNOWLEDGE_BASE, NEW_DOCUMENT), os.path.join(pdf_dir, NEW_DOCUMENT))
+    monkeypatch.setattr(vector_store.faiss, "write_index", broken_write)
+    with pytest.raises(OSError):
+        ingest(index_dir, pdf_dir, embeddings)
+
+    # El puntero no se ha tocado y no quedan directorios ni punteros temporales
+    assert pointer(index_dir) == published
+    assert versions(index_dir) == [published]
+    assert [name for name in os.listdir(index_dir) if name != VERSIONS_DIR] == [CURRENT_FILE]
+    assert load_vector_store(index_dir, embeddings).index.ntotal == chunks
+
+
+def test_pointer_is_replaced_in_one_step(index_dir, pdf_dir, monkeypatch):
+    embeddings = CountingEmbeddings(size=64)
+    ingest(index_dir, pdf_dir, embeddings)
+    replaced = []
+    original_replace = os.replace
+
+    def replace(source, target):
+        # En el momento del cambio la versión nueva ya está completa en su directorio definitivo
+        version_dir = os.path.join(index_dir, VERSIONS_DIR, open(source, encoding="utf-8").read())
+        replaced.append((target, sorted(os.listdir(version_dir))))
+        return original_replace(source, target)
+
+    monkeypatch.setattr(vector_store.os, "replace", replace)
+    ingest(index_dir, pdf_dir, embeddings)
+    assert replaced == [(os.path.join(index_dir, CURRENT_FILE), sorted(["index.faiss", "vectors.npy", settings.rag.docstore_file, "rag_manifest.json"]))]
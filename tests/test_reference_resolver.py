@@ -0,0 +1,76 @@
+"""Resolución local de referencias a inmuebles ya mostrados."""
+import pytest
+
+from src.logic.tool_utilities.reference_resolver import has_reference_cue, presentation_only, resolve_reference
+from src.utils.general_utilities import normalize_text
+
+CANDIDATES = {
+    4521: {"Direccion": "Calle Uría 12", "Barrio": "Centro", "Poblacion": "Oviedo", "Precio": 185000},
+    4630: {"Direccion": "Calle Ezcurdia 40", "Barrio": "La Playa", "Poblacion": "Gijon", "Precio": 210000},
+    4712: {"Direccion": "Avenida de la Costa 8", "Barrio": "El Coto", "Poblacion": "Gijon", "Precio": 320000},
+}
+ORDER = [4521, 4630, 4712]
+
+
+@pytest.mark.parametrize("text, expected, method", [
+    ("Háblame del 4630", 4630, "id"),
+    ("Quiero ver el segundo", 4630, "ordinal"),
+    ("¿Y el último?", 4712, "ordinal"),
+    ("cuéntame más del 3º", 4712, "ordinal"),
+    ("¿Cómo es el de la calle Uría?", 4521, "address"),
+    ("el de Oviedo", 4521, "poblacion"),
+    ("¿Cuál es el precio del de la playa?", 4630, "barrio"),
+    ("¿Tiene garaje el de El Coto?", 4712, "barrio"),
+    ("háblame más del de Oviedo", 4521, "poblacion"),
+    ("vamos con el de 320.000 €", 4712, "price"),
+])
+def test_resolves_explicit_references(text, expected, method):
+    resolution = resolve_reference(text, CANDIDATES, order=ORDER)
+    assert (resolution.inm_id, resolution.method) == (expected, method)
+
+
+@pytest.mark.parametrize("text", [
+    "¿Tenéis otro más barato?",
+    "Busco un piso en Gijón",
+    "quiero algo en Oviedo",
+    "¿Hay pisos de segunda mano?",
+])
+def test_search_requests_are_left_to_the_llm(text):
+    resolution = resolve_reference(text, CANDIDATES, order=ORDER)
+    assert not resolution.resolved
+    assert resolution.method == "new_search_cue"
+
+
+def test_ambiguous_reference_is_not_resolved():
+    assert not resolve_reference("el de Gijón", CANDIDATES, order=ORDER).resolved
+
+
+def test_visits_need_no_explicit_reference():
+    single = {4630: CANDIDATES[4630]}
+    assert resolve_reference("quiero visitarlo", single, allow_new_search=False).inm_id == 4630
+    assert not resolve_reference("quiero visitarlo", single).resolved
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("el precio del de la playa", True),
+    ("vamos al de Gijón", True),
+    ("ese piso", True),
+    ("la segunda", True),
+    ("un piso de segunda mano", False),
+    ("busco casa en Llanes", False),
+])
+def test_reference_cues(text, expected):
+    assert has_reference_cue(normalize_text(text)) is expected
+
+
+@pytest.mark.parametrize("text, data, expected", [
+    ("háblame del segundo", None, True),
+    ("¿cómo es el segundo?", None, True),
+    ("¿cómo es el de la calle Uría?", CANDIDATES[4521], True),
+    ("cuéntame más del de 320.000 €", None, True),
+    ("háblame del segundo, sobre todo de la terraza", None, False),
+    ("¿el de Oviedo tiene garaje?", CANDIDATES[4521], False),
+])
+def test_presentation_only(text, data, expected):
+    # Solo las peticiones de presentación reciben el resumen guardado o la presentación precargada
+    assert presentation_only(text, data) is expected
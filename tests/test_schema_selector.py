@@ -0,0 +1,90 @@
+"""Selección de columnas del esquema para text2sql."""
+import json
+import re
+
+import pytest
+
+from src.core.settings import settings
+from src.logic.tool_utilities import schema_selector
+from src.logic.tool_utilities.schema_selector import CORE_COLUMNS, SEARCH_COLUMNS, select_schema
+
+REPLAY_PATH = "data/json/text2sql_replay.jsonl"
+
+
+def load_replay():
+    with open(REPLAY_PATH, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def referenced_columns(query: str) -> set:
+    return {col["name"] for col in SEARCH_COLUMNS if re.search(rf"\b{col['name']}\b", query)}
+
+
+@pytest.fixture(autouse=True)
+def reset_caches(monkeypatch):
+    monkeypatch.setattr(schema_selector, "_location_cache", {"vocabulary": set(), "loaded_at": None})
+    monkeypatch.setattr(schema_selector, "_description_vectors", None)
+    monkeypatch.setattr(schema_selector, "_embeddings", None)
+
+
+@pytest.mark.parametrize("case", load_replay(), ids=lambda case: case["text"][:40])
+async def test_pruned_schema_covers_expected_query(case):
+    selection = await select_schema(case["text"], case.get("last_query"))
+    assert referenced_columns(case["expected_sql"]) <= set(selection.columns)
+    assert set(CORE_COLUMNS) <= set(selection.columns)
+
+
+async def test_previous_query_columns_are_kept():
+    selection = await select_schema("y que sea más barato", "SELECT * FROM inmuebles WHERE CheckPiscina = 1")
+    assert "CheckPiscina" in selection.columns
+
+
+def test_location_vocabulary_is_reloaded_after_ttl(monkeypatch):
+    catalog = [("Oviedo", "Oviedo", "Centro")]
+    monkeypatch.setattr(schema_selector, "execute_sql_query", lambda query: list(catalog))
+    clock = [1000.0]
+    monkeypatch.setattr(schema_selector.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(settings.schema_selection, "locations_ttl_s", 60.0)
+
+    assert "oviedo" in schema_selector._location_vocabulary()
+    catalog.append(("Llanes", "Llanes", "Poo"))
+    assert "llanes" not in schema_selector._location_vocabulary()
+
+    clock[0] += 61
+    assert {"llanes", "poo"} <= schema_selector._location_vocabulary()
+
+
+def test_location_vocabulary_survives_a_failed_reload(monkeypatch):
+    rows = [[("Gijon", "Gijon", "La Arena")]]
+    monkeypatch.setattr(schema_selector, "execute_sql_query", lambda query: rows[0])
+    clock = [1000.0]
+    monkeypatch.setattr(schema_selector.time, "monotonic", lambda: clock[0])
+
+    assert "gijon" in schema_selector._location_vocabulary()
+    rows[0] = None
+    clock[0] += settings.schema_selection.locations_ttl_s + 1
+    assert "gijon" in schema_selector._location_vocabulary()
+
+
+class FakeEmbeddings:
+    instances = 0
+
+    def __init__(self, **kwargs):
+        FakeEmbeddings.instances += 1
+
+    async def aembed_documents(self, texts):
+        return [[1.0, 0.0] if i == 0 else [0.0, 1.0] for i, _ in enumerate(texts)]
+
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+async def test_embedding_client_is_built_once(monkeypatch):
+    import langchain_openai
+    monkeypatch.setattr(langchain_openai, "OpenAIEmbeddings", FakeEmbeddings)
+    FakeEmbeddings.instances = 0
+
+    first = await schema_selector._embedding_matches("con vistas al mar")
+    second = await schema_selector._embedding_matches("cerca de la playa")
+    assert FakeEmbeddings.instances == 1
+    assert first == second == {SEARCH_COLUMNS[0]["name"]}
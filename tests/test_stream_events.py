@@ -0,0 +1,53 @@
+"""Orden de los eventos del stream: resultados estructurados antes del texto del LLM."""
+import asyncio
+
+import pytest
+
+from src.core.settings import settings
+from src.utils.stream_events import StreamTrace, layout, with_results
+
+CARDS = layout({"type": "function", "content": "generalPresentation", "input": [{"Id": 4521}]}, "cards")
+
+
+async def narrative(first_token: float = 0.05, tokens: int = 3):
+    """Texto del LLM simulado, con latencia hasta el primer token."""
+    await asyncio.sleep(first_token)
+    for index in range(tokens):
+        yield {"type": "text", "content": f"t{index} "}
+    yield {"type": "metadata", "key": "chain", "content": "generic_presentation_chain"}
+
+
+async def traced(results_first: bool, monkeypatch):
+    monkeypatch.setattr(settings.stream, "results_first", results_first)
+    trace = StreamTrace()
+    events = []
+    async for event in with_results([dict(CARDS)], narrative()):
+        trace.mark(event)
+        events.append(event)
+    return events, trace.report()
+
+
+def test_layout_hint():
+    assert CARDS["layout"] == {"slot": "cards", "position": "after_text"}
+
+
+async def test_results_first_sends_cards_before_the_text(monkeypatch):
+    events, report = await traced(True, monkeypatch)
+    assert [event["type"] for event in events] == ["function", "text", "text", "text", "metadata"]
+    assert report["results_first"] is True
+    assert report["first_structured_ms"] < 50 <= report["first_text_ms"]
+
+
+async def test_previous_order_sends_cards_after_the_text(monkeypatch):
+    events, report = await traced(False, monkeypatch)
+    assert [event["type"] for event in events] == ["text", "text", "text", "metadata", "function"]
+    assert report["first_structured_ms"] >= report["first_text_ms"] >= 50
+
+
+def test_trace_ignores_metadata():
+    trace = StreamTrace()
+    trace.mark({"type": "metadata", "key": "chain", "content": "x"})
+    assert trace.report()["first_event_ms"] is None
+    trace.mark({"type": "url", "content": "https://example.com"})
+    assert trace.report()["first_structured_ms"] is not None
+    assert trace.report()["first_text_ms"] is None
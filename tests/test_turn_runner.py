@@ -0,0 +1,148 @@
+"""Cancelación de turnos: desconexión del cliente, nuevo mensaje en la sesión y tareas hijas."""
+import asyncio
+
+import pytest
+
+from src.core.settings import settings
+from src.utils.turn_runner import TurnRegistry, done_key, run_turn, spawn_in_turn
+
+
+class FakeUpstream:
+    """Stream de LLM simulado que registra los tokens generados y si ha sido cancelado."""
+
+    def __init__(self, tokens: int = 200, delay: float = 0.005):
+        self.tokens = tokens
+        self.delay = delay
+        self.generated = 0
+        self.cancelled = False
+        self.child_cancelled = False
+
+    async def child(self):
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            self.child_cancelled = True
+            raise
+
+    async def stream(self, speculative: bool = False):
+        if speculative:
+            spawn_in_turn(self.child())
+        try:
+            for index in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                self.generated += 1
+                yield {"type": "text", "content": f"t{index} "}
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(settings.turns, "disconnect_poll_interval", 0.01)
+    monkeypatch.setattr(settings.turns, "supersede_wait_timeout", 0.5)
+    monkeypatch.setattr(TurnRegistry, "turns", {})
+
+
+async def consume(turn, upstream, stop_after=None, speculative=False):
+    """Lee el turno como lo haría la ruta /chat. Con 'stop_after' el cliente se desconecta tras esos fragmentos."""
+    received = 0
+    disconnected = False
+
+    async def is_disconnected() -> bool:
+        return disconnected
+
+    try:
+        async for _ in run_turn(turn, upstream.stream(speculative=speculative), is_disconnected):
+            received += 1
+            if received == stop_after:
+                disconnected = True
+    finally:
+        TurnRegistry.finish(turn) # Equivale a 'persist_turn' al terminar el stream
+    return received
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+
+async def test_complete_turn_is_not_cancelled():
+    upstream = FakeUpstream(tokens=5)
+    turn, superseded = await TurnRegistry.begin("s")
+    assert not superseded
+    assert await consume(turn, upstream) == 5
+    assert not turn.cancelled and not upstream.cancelled
+    assert "s" not in TurnRegistry.turns
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+async def test_disconnect_cancels_generation(speculative):
+    upstream = FakeUpstream()
+    turn, _ = await TurnRegistry.begin("s")
+    await consume(turn, upstream, stop_after=10, speculative=speculative)
+
+    assert turn.cancel_reason == "disconnect"
+    assert upstream.cancelled
+    assert upstream.generated < upstream.tokens
+    if speculative:
+        await wait_for(lambda: upstream.child_cancelled)
+
+
+async def test_server_cancel_cancels_generation():
+    upstream = FakeUpstream()
+    turn, _ = await TurnRegistry.begin("s")
+    task = asyncio.create_task(consume(turn, upstream))
+    await wait_for(lambda: upstream.generated >= 10)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    await wait_for(lambda: upstream.cancelled)
+    assert turn.cancel_reason == "disconnect"
+
+
+async def test_new_message_supersedes_running_turn():
+    upstream = FakeUpstream()
+    turn, _ = await TurnRegistry.begin("s")
+    task = asyncio.create_task(consume(turn, upstream))
+    await wait_for(lambda: upstream.generated >= 10)
+
+    new_turn, superseded = await TurnRegistry.begin("s")
+    await task
+    assert superseded
+    assert turn.cancel_reason == "superseded"
+    assert upstream.cancelled
+    assert TurnRegistry.turns["s"] is new_turn
+
+
+async def test_new_message_in_another_worker_supersedes_running_turn(redis_cache, monkeypatch):
+    upstream = FakeUpstream()
+    turn, _ = await TurnRegistry.begin("s", redis_cache)
+    assert await redis_cache.get(turn.marker_key) == turn.token
+    task = asyncio.create_task(consume(turn, upstream))
+    await wait_for(lambda: upstream.generated >= 10)
+
+    # Otro worker: registro local vacío y el mismo Redis
+    monkeypatch.setattr(TurnRegistry, "turns", {})
+    new_turn, superseded = await TurnRegistry.begin("s", redis_cache)
+    await task
+
+    assert superseded
+    assert turn.cancel_reason == "superseded"
+    assert upstream.cancelled
+    assert await redis_cache.exists(done_key(turn.token))
+    assert await redis_cache.get(new_turn.marker_key) == new_turn.token
+
+
+async def test_finished_turn_releases_redis_marker(redis_cache):
+    turn, _ = await TurnRegistry.begin("s", redis_cache)
+    await consume(turn, FakeUpstream(tokens=3))
+    await asyncio.gather(*TurnRegistry.releases)
+
+    assert not await redis_cache.exists(turn.marker_key)
+    next_turn, superseded = await TurnRegistry.begin("s", redis_cache)
+    assert not superseded
@@ -0,0 +1,65 @@
+"""Índice de RAG cargado sin pickle: docstore JSON, índice FAISS mapeado en memoria y migración del 'index.pkl'."""
+import os
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.core.settings import settings
+from src.logic.tool_utilities.vector_store import load_vector_store, migrate_pickle_docstore, read_index, write_docstore
+
+TEXTS = [
+    "El vendedor paga la plusvalía municipal y los gastos de cancelación de la hipoteca.",
+    "El comprador paga el impuesto de transmisiones patrimoniales y la notaría de la compraventa.",
+    "La fianza de un alquiler de vivienda es de una mensualidad.",
+    "El certificado energético es obligatorio para vender o alquilar un inmueble.",
+]
+QUERY = "¿Qué gastos tiene el vendedor al vender una vivienda?"
+
+
+@pytest.fixture
+def embeddings() -> DeterministicFakeEmbedding:
+    return DeterministicFakeEmbedding(size=32)
+
+
+@pytest.fixture
+def legacy_index(tmp_path, embeddings) -> str:
+    """Índice en el formato de LangChain ('index.faiss' e 'index.pkl'), como antes de la migración."""
+    documents = [Document(page_content=text, metadata={"page": page}) for page, text in enumerate(TEXTS)]
+    FAISS.from_documents(documents, embeddings).save_local(str(tmp_path))
+    return str(tmp_path)
+
+
+def test_migrated_index_answers_like_the_pickle_one(legacy_index, embeddings, monkeypatch):
+    monkeypatch.setattr(settings.rag, "mmap", True)
+    assert migrate_pickle_docstore(legacy_index) == len(TEXTS)
+    assert os.path.exists(os.path.join(legacy_index, settings.rag.docstore_file))
+
+    expected = FAISS.load_local(legacy_index, embeddings, allow_dangerous_deserialization=True).similarity_search(QUERY, k=2)
+    os.remove(os.path.join(legacy_index, "index.pkl")) # La carga ya no necesita el pickle
+    found = load_vector_store(legacy_index, embeddings).similarity_search(QUERY, k=2)
+    assert [(doc.page_content, doc.metadata) for doc in found] == [(doc.page_content, doc.metadata) for doc in expected]
+
+
+def test_index_is_memory_mapped_and_falls_back_to_memory(legacy_index, monkeypatch):
+    monkeypatch.setattr(settings.rag, "mmap", True)
+    mapped = read_index(legacy_index)
+    monkeypatch.setattr(settings.rag, "mmap", False)
+    loaded = read_index(legacy_index)
+    assert mapped.ntotal == loaded.ntotal == len(TEXTS)
+    query = np.random.default_rng(0).random((1, mapped.d), dtype="float32")
+    assert (mapped.search(query, 2)[1] == loaded.search(query, 2)[1]).all()
+
+
+def test_missing_docstore_asks_for_the_migration(legacy_index, embeddings):
+    with pytest.raises(Exception, match="--migrate"):
+        load_vector_store(legacy_index, embeddings)
+
+
+def test_index_and_docstore_must_match(legacy_index, embeddings):
+    documents = {str(position): Document(page_content=text) for position, text in enumerate(TEXTS[:2])}
+    write_docstore(legacy_index, documents, {position: str(position) for position in range(2)})
+    with pytest.raises(Exception, match="do not match"):
+        load_vector_store(legacy_index, embeddings)